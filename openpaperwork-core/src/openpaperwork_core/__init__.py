@@ -4,8 +4,11 @@ import importlib
 import itertools
 import logging
 import os
+import threading
 import time
 
+from . import manifest
+
 
 LOGGER = logging.getLogger(__name__)
 
@@ -34,6 +37,7 @@ RECOMMENDED_PLUGINS = [
     'openpaperwork_core.external_apps.windows',
     'openpaperwork_core.external_apps.xdg',
     'openpaperwork_core.flatpak',
+    'openpaperwork_core.fs.hash_cache',
     'openpaperwork_core.fs.memory',
     'openpaperwork_core.http',
     'openpaperwork_core.i18n.python',
@@ -41,7 +45,7 @@ RECOMMENDED_PLUGINS = [
     'openpaperwork_core.perfcheck.log',
     'openpaperwork_core.resources.frozen',
     'openpaperwork_core.resources.setuptools',
-    'openpaperwork_core.sqlite',
+    'openpaperwork_core.sqlite.worker',
     'openpaperwork_core.thread.pool',
     'openpaperwork_core.urls',
     'openpaperwork_core.work_queue.default',
@@ -79,6 +83,12 @@ class PluginBase(object):
     # to enable/disable this plugin in the UI.
     USER_VISIBLE = False
 
+    # Only used if the core loads plugins on demand (see
+    # `Core.enable_lazy_loading()`). True: the plugin is imported and
+    # initialized only when one of its callbacks or interfaces is first
+    # requested. None: automatic (see `manifest.is_lazy()`).
+    LAZY = None
+
     def __init__(self):
         """
         Called as soon as the module is loaded. Should be as minimal as
@@ -140,12 +150,31 @@ class Core(object):
         self._initialized = set()  # avoid double-init
         self.interfaces = collections.defaultdict(list)
         self.callbacks = collections.defaultdict(list)
+        # Dispatch tables, compiled from self.callbacks each time a plugin is
+        # initialized: callback name --> tuple of bound methods, sorted by
+        # priority. Callbacks provided by plugins not loaded yet (see
+        # enable_lazy_loading()) are never in the dispatch tables.
+        self._dispatch = {}
         self.auto_load_dependencies = auto_load_dependencies
 
+        # on-demand loading
+        self.manifest = None
+        self._lazy_lock = threading.RLock()
+        # module name --> manifest entry
+        self._lazy_plugins = {}
+        # interface --> [module names]
+        self._lazy_interfaces = collections.defaultdict(list)
+        # callback name --> {module names}
+        self._lazy_callbacks = {}
+        # module name --> stub (see add_lazy_stub())
+        self._lazy_stubs = {}
+
         self.log_all = bool(os.getenv("CORE_LOG_ALL", 0))
         self.count_limit_per_second = int(os.getenv("CORE_CALL_LIMIT", 0))
         self.counters_last_reset = 0
         self.counters = collections.defaultdict(lambda: 0)
+        # logging and call limits are only checked if enabled
+        self._debug_calls = self.log_all or self.count_limit_per_second > 0
 
     def load(self, module_name):
         """
@@ -161,10 +190,146 @@ class Core(object):
         """
         if module_name in self.plugins:
             return self.plugins[module_name]
+        if module_name in self._lazy_plugins:
+            return None
+
+        if self.manifest is not None:
+            entry = self.manifest.get(module_name)
+            if entry is not None and entry['lazy']:
+                self._load_lazy(module_name, entry)
+                return None
 
         LOGGER.info("Loading plugin '%s' ...", module_name)
         module = importlib.import_module(module_name)
-        return self._load_module(module_name, module)
+        plugin = self._load_module(module_name, module)
+        if self.manifest is not None:
+            self.manifest.update(module_name, plugin)
+        return plugin
+
+    def enable_lazy_loading(self, manifest):
+        """
+        Load plugins on demand: Plugins loaded from now on are only imported
+        and initialized when one of their callbacks or interfaces is first
+        requested. Observer callbacks ('on_*') never trigger the loading of a
+        plugin.
+
+        Only plugins found in the manifest (see `openpaperwork_core.manifest`)
+        and marked as lazy can be loaded on demand. Others are loaded
+        immediately (and added to the manifest).
+
+        With on-demand loading, `load()` returns None for plugins that are not
+        loaded yet. Dependencies loaded on demand are not initialized before
+        the plugins depending on them, but only when they are first used.
+        """
+        self.manifest = manifest
+
+    def _load_lazy(self, module_name, entry):
+        LOGGER.info("Plugin '%s' will be loaded on demand", module_name)
+        self._lazy_plugins[module_name] = entry
+        for interface in entry['interfaces']:
+            self._lazy_interfaces[interface].append(module_name)
+        for callback_name in entry['callbacks']:
+            if callback_name.startswith("on_"):
+                continue
+            self._lazy_callbacks.setdefault(callback_name, set()).add(
+                module_name
+            )
+            self._dispatch.pop(callback_name, None)
+
+    def add_lazy_stub(self, module_name, stub):
+        """
+        Some callbacks of a plugin not loaded yet (see
+        `enable_lazy_loading()`) can be provided by a light stub object
+        instead: calling them doesn't load the plugin. The stub can load
+        the plugin itself when required (see `get_by_name()`). Once the
+        plugin is loaded, the stub is dropped.
+
+        Returns False if the plugin is not waiting to be loaded.
+        """
+        with self._lazy_lock:
+            if module_name not in self._lazy_plugins:
+                return False
+            LOGGER.info("Plugin '%s': stub %s", module_name, type(stub))
+            self._lazy_stubs[module_name] = stub
+            for callback_name in manifest.get_callback_names(stub):
+                modules = self._lazy_callbacks.get(callback_name)
+                if modules is not None:
+                    modules.discard(module_name)
+                    if len(modules) <= 0:
+                        self._lazy_callbacks.pop(callback_name)
+            self._register_plugin(stub)
+            return True
+
+    def _drop_lazy_stub(self, module_name):
+        stub = self._lazy_stubs.pop(module_name, None)
+        if stub is None:
+            return
+        for callback_name in manifest.get_callback_names(stub):
+            self.callbacks[callback_name] = [
+                c for c in self.callbacks[callback_name]
+                if c[2].__self__ is not stub
+            ]
+            self._compile_dispatch(callback_name)
+
+    def _drop_lazy(self, module_name):
+        self._drop_lazy_stub(module_name)
+        entry = self._lazy_plugins.pop(module_name)
+        for interface in entry['interfaces']:
+            self._lazy_interfaces[interface].remove(module_name)
+        for callback_name in entry['callbacks']:
+            modules = self._lazy_callbacks.get(callback_name)
+            if modules is None:
+                continue
+            modules.discard(module_name)
+            if len(modules) <= 0:
+                self._lazy_callbacks.pop(callback_name)
+                self._compile_dispatch(callback_name)
+
+    def _load_on_demand(self, module_name):
+        """
+        Actually import and initialize a plugin that was loaded lazily.
+        """
+        with self._lazy_lock:
+            if module_name not in self._lazy_plugins:
+                # already loaded by another thread
+                return
+            if module_name in self.plugins:
+                # being loaded (dependency of one of its dependencies)
+                return
+            LOGGER.info("Loading plugin '%s' on demand ...", module_name)
+            # the callbacks of the stub must not be called anymore once
+            # those of the plugin are registered
+            self._drop_lazy_stub(module_name)
+            module = importlib.import_module(module_name)
+            initialized = self.initialized
+            plugin = self._load_module(module_name, module)
+            try:
+                self._init(plugin)
+            finally:
+                self._to_initialize.discard(plugin)
+                self.initialized = initialized
+                # callbacks of this plugin are added to the dispatch tables
+                # only now, once the plugin is fully initialized
+                self._drop_lazy(module_name)
+
+    def _load_interface_on_demand(self, interface):
+        modules = self._lazy_interfaces.get(interface)
+        if not modules:
+            return
+        for module_name in list(modules):
+            self._load_on_demand(module_name)
+
+    def _load_callback_on_demand(self, callback_name):
+        """
+        Load the plugins providing a callback that are not loaded yet.
+        Returns the callbacks, or None if there are none.
+        """
+        modules = self._lazy_callbacks.get(callback_name)
+        if modules is None:
+            return None
+        for module_name in sorted(modules):
+            self._load_on_demand(module_name)
+        return self._dispatch.get(callback_name)
 
     def _load_module(self, module_name, module):
         """
@@ -188,25 +353,36 @@ class Core(object):
         LOGGER.info("Plugin '%s' loaded", module_name)
         return plugin
 
+    def _has_interface(self, interface):
+        return (
+            len(self.interfaces[interface]) > 0
+            or len(self._lazy_interfaces.get(interface, ())) > 0
+        )
+
+    def _get_plugin_deps(self, plugin_name):
+        if plugin_name in self._lazy_plugins:
+            return self._lazy_plugins[plugin_name]['deps']
+        return self.plugins[plugin_name].get_deps()
+
     def _check_deps(self):
-        to_examine = [
-            (plugin_name, plugin)
-            for (plugin_name, plugin) in self.plugins.items()
-        ]
+        to_examine = (
+            list(self.plugins.keys()) + list(self._lazy_plugins.keys())
+        )
 
         while len(to_examine) > 0:
-            (plugin_name, plugin) = to_examine[0]
+            plugin_name = to_examine[0]
             to_examine = to_examine[1:]
 
             LOGGER.info("Examining dependencies of '%s' ...", plugin_name)
 
-            deps = plugin.get_deps()
+            deps = self._get_plugin_deps(plugin_name)
             for dep in deps:
                 interface = dep['interface']
-                if len(self.interfaces[interface]) > 0:
+                if self._has_interface(interface):
                     LOGGER.debug(
                         "- Interface '%s' already provided by %d plugins",
                         interface, len(self.interfaces[interface])
+                        + len(self._lazy_interfaces.get(interface, ()))
                     )
                     continue
 
@@ -226,8 +402,11 @@ class Core(object):
                             plugin_name, interface, defaults, plugin_name
                         )
                     )
-                    plugin = self.plugins.pop(plugin_name)
-                    self._to_initialize.remove(plugin)
+                    if plugin_name in self._lazy_plugins:
+                        self._drop_lazy(plugin_name)
+                    else:
+                        plugin = self.plugins.pop(plugin_name)
+                        self._to_initialize.remove(plugin)
                     # return False to indicate we actually dropped a plugin
                     # and need to reevaluate all the dependencies again.
                     return False
@@ -235,27 +414,35 @@ class Core(object):
                     LOGGER.info(
                         "Loading plugins %s to satisfy dependency."
                         " Required by '%s' for interface '%s'",
-                        defaults, type(plugin), interface
+                        defaults, plugin_name, interface
                     )
                     for default in defaults:
-                        to_examine.append((default, self.load(default)))
+                        self.load(default)
+                        to_examine.append(default)
 
         return True
 
+    def _compile_dispatch(self, callback_name):
+        if callback_name in self._lazy_callbacks:
+            # will be compiled once all the plugins providing this callback
+            # are loaded
+            return
+        callbacks = self.callbacks.get(callback_name)
+        if not callbacks:
+            self._dispatch.pop(callback_name, None)
+            return
+        self._dispatch[callback_name] = tuple(c[2] for c in callbacks)
+
     def _register_plugin(self, plugin):
-        for attr_name in dir(plugin):
-            if attr_name[0] == "_":
-                continue
-            if attr_name in dir(PluginBase):  # ignore base methods of plugins
-                continue
+        for attr_name in manifest.get_callback_names(plugin):
             callback = getattr(plugin, attr_name)
-            if not hasattr(callback, '__call__'):
-                continue
             LOGGER.debug("- %s.%s()", str(type(plugin)), attr_name)
             self.callbacks[attr_name].append((
                 plugin.PRIORITY, str(type(plugin)), callback
             ))
-            self.callbacks[attr_name].sort(reverse=True)
+            # stubs of different plugins may have the same type
+            self.callbacks[attr_name].sort(key=lambda c: c[:2], reverse=True)
+            self._compile_dispatch(attr_name)
 
     def _init(self, plugin, stack=list()):
         nb = 0
@@ -278,6 +465,8 @@ class Core(object):
 
         deps = plugin.get_deps()
         for dep in deps:
+            # dependencies loaded on demand (see enable_lazy_loading()) are
+            # only loaded and initialized when they are first used
             dep_plugins = self.interfaces[dep['interface']]
             for dep_plugin in dep_plugins:
                 nb += self._init(dep_plugin, stack)
@@ -307,6 +496,8 @@ class Core(object):
         for plugin in self._to_initialize:
             nb += self._init(plugin)
         self._to_initialize = set()
+        # all the plugins may be loaded on demand
+        self.initialized = True
         LOGGER.info("%d plugins initialized", nb)
 
     def get_by_name(self, module_name):
@@ -318,9 +509,12 @@ class Core(object):
         - unit tests
         - configuration (see cmd.plugins)
         """
+        if module_name in self._lazy_plugins:
+            self._load_on_demand(module_name)
         return self.plugins[module_name]
 
     def get_by_interface(self, interface_name):
+        self._load_interface_on_demand(interface_name)
         return self.interfaces[interface_name]
 
     def get_plugins(self):
@@ -331,6 +525,14 @@ class Core(object):
         """
         return dict(self.plugins)
 
+    def get_lazy_plugins(self):
+        """
+        Returns the plugins that will be loaded on demand and are not loaded
+        yet (see `enable_lazy_loading()`): module name --> manifest entry.
+        """
+        with self._lazy_lock:
+            return dict(self._lazy_plugins)
+
     def _check_call_limit(self, callback_name):
         if self.count_limit_per_second <= 0:
             return
@@ -372,38 +574,21 @@ class Core(object):
            Core <- "Plugin C": returns "something_c"
            Caller <- Core: returns 3
         """
-        if self.log_all:
-            print(
-                "[{}] call_all({}, args={}, kwargs={})".format(
-                    time.time(), callback_name, args, kwargs
-                )
-            )
+        if self._debug_calls:
+            return self._call_all_debug(callback_name, *args, **kwargs)
 
         assert \
             self.initialized, \
             "A plugin has been loaded without being initialized." \
             " Call core.init() first"
 
-        self._check_call_limit(callback_name)
-
-        callbacks = self.callbacks[callback_name]
-        if len(callbacks) <= 0:
-            if callback_name.startswith("on_"):
-                # those are 'observer' callback. If nobody is observing,
-                # it's usually fine.
-                log_method = LOGGER.debug
-            else:
-                log_method = LOGGER.warning
-            log_method("No method '%s' found", callback_name)
+        callbacks = self._dispatch.get(callback_name)
+        if callbacks is None:
+            callbacks = self._load_callback_on_demand(callback_name)
+        if callbacks is None:
+            self._log_missing(callback_name)
             return 0
-        for (priority, plugin, callback) in callbacks:
-            if self.log_all:
-                print(
-                    "[{}] call_all({}, args={}, kwargs={}) -> {}:{}".format(
-                        time.time(), callback_name, args, kwargs,
-                        priority, callback
-                    )
-                )
+        for callback in callbacks:
             callback(*args, **kwargs)
         return len(callbacks)
 
@@ -428,31 +613,22 @@ class Core(object):
         when you're fairly sure there should be only one plugin with such
         callback (example: mainloop plugins).
         """
+        if self._debug_calls:
+            return self._call_one_debug(callback_name, *args, **kwargs)
+
         assert \
             self.initialized, \
             "A plugin has been loaded without being initialized." \
             " Call core.init() first"
 
-        self._check_call_limit(callback_name)
-        if self.log_all:
-            print(
-                "[{}] call_one({}, args={}, kwargs={})".format(
-                    time.time(), callback_name, args, kwargs
-                )
-            )
-        callbacks = self.callbacks[callback_name]
-        if len(callbacks) <= 0:
+        callbacks = self._dispatch.get(callback_name)
+        if callbacks is None:
+            callbacks = self._load_callback_on_demand(callback_name)
+        if callbacks is None:
             raise IndexError(
                 "No method '{}' found !".format(callback_name)
             )
-        if self.log_all:
-            print(
-                "[{}] call_one({}, args={}, kwargs={}) -> {}:{}".format(
-                    time.time(), callback_name, args, kwargs,
-                    callbacks[0][0], callbacks[0][2]
-                )
-            )
-        return callbacks[0][2](*args, **kwargs)
+        return callbacks[0](*args, **kwargs)
 
     def call_success(self, callback_name, *args, **kwargs):
         """
@@ -479,12 +655,108 @@ class Core(object):
            Core <- "Plugin C": returns "something"
            Caller <- Core: returns "something"
         """
+        if self._debug_calls:
+            return self._call_success_debug(callback_name, *args, **kwargs)
+
+        assert \
+            self.initialized, \
+            "A plugin has been loaded without being initialized." \
+            " Call core.init() first"
+
+        callbacks = self._dispatch.get(callback_name)
+        if callbacks is None:
+            callbacks = self._load_callback_on_demand(callback_name)
+        if callbacks is None:
+            LOGGER.warning("No method '%s' found", callback_name)
+            return None
+        if len(callbacks) == 1:
+            return callbacks[0](*args, **kwargs)
+        for callback in callbacks:
+            r = callback(*args, **kwargs)
+            if r is not None:
+                return r
+        return None
+
+    @staticmethod
+    def _log_missing(callback_name):
+        if callback_name.startswith("on_"):
+            # those are 'observer' callback. If nobody is observing,
+            # it's usually fine.
+            log_method = LOGGER.debug
+        else:
+            log_method = LOGGER.warning
+        log_method("No method '%s' found", callback_name)
+
+    # Slow versions of call_all(), call_one() and call_success(), only used
+    # when debugging options are enabled (CORE_LOG_ALL, CORE_CALL_LIMIT).
+
+    def _call_all_debug(self, callback_name, *args, **kwargs):
+        if self.log_all:
+            print(
+                "[{}] call_all({}, args={}, kwargs={})".format(
+                    time.time(), callback_name, args, kwargs
+                )
+            )
+
+        assert \
+            self.initialized, \
+            "A plugin has been loaded without being initialized." \
+            " Call core.init() first"
+
+        self._check_call_limit(callback_name)
+        self._load_callback_on_demand(callback_name)
+
+        callbacks = self.callbacks[callback_name]
+        if len(callbacks) <= 0:
+            self._log_missing(callback_name)
+            return 0
+        for (priority, plugin, callback) in callbacks:
+            if self.log_all:
+                print(
+                    "[{}] call_all({}, args={}, kwargs={}) -> {}:{}".format(
+                        time.time(), callback_name, args, kwargs,
+                        priority, callback
+                    )
+                )
+            callback(*args, **kwargs)
+        return len(callbacks)
+
+    def _call_one_debug(self, callback_name, *args, **kwargs):
+        assert \
+            self.initialized, \
+            "A plugin has been loaded without being initialized." \
+            " Call core.init() first"
+
+        self._check_call_limit(callback_name)
+        self._load_callback_on_demand(callback_name)
+        if self.log_all:
+            print(
+                "[{}] call_one({}, args={}, kwargs={})".format(
+                    time.time(), callback_name, args, kwargs
+                )
+            )
+        callbacks = self.callbacks[callback_name]
+        if len(callbacks) <= 0:
+            raise IndexError(
+                "No method '{}' found !".format(callback_name)
+            )
+        if self.log_all:
+            print(
+                "[{}] call_one({}, args={}, kwargs={}) -> {}:{}".format(
+                    time.time(), callback_name, args, kwargs,
+                    callbacks[0][0], callbacks[0][2]
+                )
+            )
+        return callbacks[0][2](*args, **kwargs)
+
+    def _call_success_debug(self, callback_name, *args, **kwargs):
         assert \
             self.initialized, \
             "A plugin has been loaded without being initialized." \
             " Call core.init() first"
 
         self._check_call_limit(callback_name)
+        self._load_callback_on_demand(callback_name)
         if self.log_all:
             print(
                 "[{}] call_one({}, args={}, kwargs={})".format(
@@ -532,4 +804,4 @@ class Core(object):
             }
 
     def get_active_plugins(self):
-        return self.plugins.keys()
+        return list(self.plugins.keys()) + list(self._lazy_plugins.keys())
@@ -0,0 +1,123 @@
+"""
+Measure the latency of chains of ThreadedPromise while the main loop is
+busy, with and without running consecutive threaded steps in the same
+thread (see `ThreadedPromise`).
+
+To use it:
+
+```sh
+paperwork-cli plugins add openpaperwork_core.cmd.benchmark_promise
+paperwork-cli benchmark_promise --steps 6 --runs 20 --busy 0.02
+```
+"""
+
+import statistics
+import time
+
+from .. import PluginBase
+from .. import promise
+
+
+DEFAULT_NB_STEPS = 6
+DEFAULT_NB_RUNS = 20
+# time (seconds) taken by each callback keeping the main loop busy
+DEFAULT_BUSY_TIME = 0.02
+
+
+class Plugin(PluginBase):
+    def __init__(self):
+        super().__init__()
+        self.interactive = False
+
+    def get_interfaces(self):
+        return ['shell']
+
+    def get_deps(self):
+        return [
+            {
+                'interface': 'mainloop',
+                'defaults': ['openpaperwork_core.mainloop.asyncio'],
+            },
+            {
+                'interface': 'thread',
+                'defaults': ['openpaperwork_core.thread.simple'],
+            },
+        ]
+
+    def cmd_set_interactive(self, interactive):
+        self.interactive = interactive
+
+    def cmd_complete_argparse(self, parser):
+        p = parser.add_parser('benchmark_promise')
+        p.add_argument(
+            '--steps', '-s', type=int, default=DEFAULT_NB_STEPS,
+            help="Number of ThreadedPromise in each chain"
+        )
+        p.add_argument(
+            '--runs', '-r', type=int, default=DEFAULT_NB_RUNS,
+            help="Number of chains to run for each mode"
+        )
+        p.add_argument(
+            '--busy', '-b', type=float, default=DEFAULT_BUSY_TIME,
+            help="Time (seconds) taken by each main loop callback"
+        )
+
+    def _run_chains(self, nb_steps, nb_runs, chain_on_thread, busy_time):
+        timings = []
+
+        def keep_busy():
+            if len(timings) >= nb_runs:
+                return
+            time.sleep(busy_time)
+            self.core.call_one("mainloop_schedule", keep_busy)
+
+        def on_done(start):
+            timings.append(time.time() - start)
+            if len(timings) < nb_runs:
+                run_chain()
+            else:
+                self.core.call_all("mainloop_quit_graceful")
+
+        def run_chain():
+            start = time.time()
+            p = promise.ThreadedPromise(
+                self.core, lambda *args, **kwargs: None,
+                chain_on_thread=chain_on_thread
+            )
+            for _ in range(1, nb_steps):
+                p = p.then(promise.ThreadedPromise(
+                    self.core, lambda *args, **kwargs: None,
+                    chain_on_thread=chain_on_thread
+                ))
+            p = p.then(lambda *args, **kwargs: on_done(start))
+            p.schedule()
+
+        self.core.call_one("mainloop_schedule", run_chain)
+        self.core.call_one("mainloop_schedule", keep_busy)
+        self.core.call_one("mainloop")
+        return timings
+
+    def cmd_run(self, args):
+        if args.command != 'benchmark_promise':
+            return None
+
+        out = {}
+        for chain_on_thread in (False, True):
+            timings = self._run_chains(
+                args.steps, args.runs, chain_on_thread, args.busy
+            )
+            mode = "same thread" if chain_on_thread else "main loop"
+            out[mode] = {
+                'median': statistics.median(timings),
+                'max': max(timings),
+            }
+            if self.interactive:
+                print(
+                    "{}: {} steps: median latency {:.1f}ms (max {:.1f}ms)"
+                    .format(
+                        mode, args.steps,
+                        out[mode]['median'] * 1000,
+                        out[mode]['max'] * 1000
+                    )
+                )
+        return out
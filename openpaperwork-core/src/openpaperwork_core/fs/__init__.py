@@ -10,6 +10,10 @@ import openpaperwork_core
 
 LOGGER = logging.getLogger(__name__)
 
+# Files are hashed chunk by chunk so we never have to load a whole file
+# in memory
+HASH_CHUNK_SIZE = 1024 * 1024
+
 
 class CommonFsPluginBase(openpaperwork_core.PluginBase):
     def __init__(self):
@@ -77,10 +81,18 @@ class CommonFsPluginBase(openpaperwork_core.PluginBase):
         # dir name should not be unquoted. It could mess up the URI
         return os.path.dirname(url)
 
-    def fs_hash(self, url):
+    def fs_hash(self, url, **kwargs):
+        """
+        Returns the SHA-256 of the file content, as an integer.
+        """
+        h = hashlib.sha256()
         with self.core.call_success("fs_open", url, 'rb') as fd:
-            content = fd.read()
-        return int(hashlib.sha256(content).hexdigest(), 16)
+            while True:
+                chunk = fd.read(HASH_CHUNK_SIZE)
+                if not chunk:
+                    break
+                h.update(chunk)
+        return int(h.hexdigest(), 16)
 
     def fs_copy(self, origin_url, dest_url):
         """
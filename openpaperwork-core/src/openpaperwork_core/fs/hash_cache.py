@@ -0,0 +1,246 @@
+"""
+Keeps the results of `fs_hash()` in a database in the data directory, so
+files that haven't changed (same size, same mtime, same inode) are never
+read again, even across restarts.
+
+Entries are dropped when files are deleted and moved when files are renamed
+(see `fs_unlink()`, `fs_rm_rf()` and `fs_rename()`).
+"""
+
+import logging
+import os
+import threading
+
+from .. import PluginBase
+
+
+LOGGER = logging.getLogger(__name__)
+
+CREATE_TABLES = [
+    (
+        "CREATE TABLE IF NOT EXISTS hashes ("
+        " url TEXT PRIMARY KEY,"
+        " size INTEGER NOT NULL,"
+        " mtime INTEGER NOT NULL,"
+        " inode INTEGER NOT NULL,"
+        " hash TEXT NOT NULL"
+        ")"
+    ),
+]
+
+# Number of new hashes kept in memory before writing them to the database
+FLUSH_THRESHOLD = 1000
+
+
+class Plugin(PluginBase):
+    # must be called before the fs plugins
+    PRIORITY = 10000
+
+    def __init__(self):
+        super().__init__()
+        self.sql = None
+        self.lock = threading.RLock()
+        # url --> (size, mtime, inode, hash)
+        self.cache = None
+        self.pending = {}
+        # urls (files or directories) to remove from the database
+        self.deleted = set()
+
+    def get_interfaces(self):
+        return ['fs_hash_cache']
+
+    def get_deps(self):
+        return [
+            {
+                'interface': 'fs',
+                'defaults': ['openpaperwork_core.fs.python'],
+            },
+            {
+                'interface': 'paths',
+                'defaults': ['openpaperwork_core.paths.xdg'],
+            },
+            {
+                'interface': 'sqlite',
+                'defaults': ['openpaperwork_core.sqlite'],
+            },
+        ]
+
+    def init(self, core):
+        super().init(core)
+        data_dir = self.core.call_success("paths_get_data_dir")
+        sql_file = self.core.call_success(
+            "fs_join", data_dir, 'fs_hash_cache.db'
+        )
+        self.sql = self.core.call_one(
+            "sqlite_execute",
+            self.core.call_success,
+            "sqlite_open", sql_file
+        )
+        for query in CREATE_TABLES:
+            self.core.call_one("sqlite_execute", self.sql.execute, query)
+
+    def _get_cache(self):
+        # Beware: sqlite_execute() may have to wait for the main loop
+        # --> we must never hold the lock while calling it.
+        if self.cache is not None:
+            return self.cache
+
+        rows = self.core.call_one(
+            "sqlite_execute", self.sql.execute,
+            "SELECT url, size, mtime, inode, hash FROM hashes"
+        )
+        rows = self.core.call_one("sqlite_execute", list, rows)
+        cache = {
+            row[0]: (row[1], row[2], row[3], int(row[4], 16))
+            for row in rows
+        }
+        LOGGER.info("%d file hashes loaded from cache", len(cache))
+
+        with self.lock:
+            if self.cache is None:
+                self.cache = cache
+            return self.cache
+
+    def _get_file_id(self, url):
+        """
+        Returns (size, mtime, inode). The inode is only available for local
+        files (0 otherwise).
+        """
+        if url.lower().startswith("file://"):
+            try:
+                st = os.stat(self.core.call_success("fs_unsafe", url))
+            except OSError:
+                return None
+            return (st.st_size, st.st_mtime_ns, st.st_ino)
+        size = self.core.call_success("fs_getsize", url)
+        mtime = self.core.call_success("fs_get_mtime", url)
+        if size is None or mtime is None:
+            return None
+        return (size, mtime, 0)
+
+    def _forget(self, url):
+        """
+        Drop the entries of the file or directory `url` from the cache.
+        Returns the dropped entries: {url: (size, mtime, inode, hash)}.
+        Lock must be held.
+        """
+        prefix = url + "/"
+        dropped = {
+            k: v for (k, v) in self.cache.items()
+            if k == url or k.startswith(prefix)
+        }
+        for k in dropped.keys():
+            self.cache.pop(k)
+            self.pending.pop(k, None)
+        self.deleted.add(url)
+        return dropped
+
+    def _flush(self):
+        with self.lock:
+            pending = self.pending
+            self.pending = {}
+            deleted = self.deleted
+            self.deleted = set()
+        if self.sql is None:
+            return
+        if len(deleted) > 0:
+            LOGGER.info("Removing %d paths from hash cache", len(deleted))
+            self.core.call_one(
+                "sqlite_execute", self.sql.executemany,
+                "DELETE FROM hashes WHERE url = ? OR substr(url, 1, ?) = ?",
+                [(url, len(url) + 1, url + "/") for url in deleted]
+            )
+        if len(pending) <= 0:
+            if len(deleted) > 0:
+                self.core.call_one("sqlite_execute", self.sql.commit)
+            return
+        pending = [
+            (url, size, mtime, inode, format(h, 'x'))
+            for (url, (size, mtime, inode, h)) in pending.items()
+        ]
+        LOGGER.info("Writing %d file hashes to cache", len(pending))
+        self.core.call_one(
+            "sqlite_execute", self.sql.executemany,
+            "INSERT OR REPLACE INTO hashes (url, size, mtime, inode, hash)"
+            " VALUES (?, ?, ?, ?, ?)",
+            pending
+        )
+        self.core.call_one("sqlite_execute", self.sql.commit)
+
+    def fs_hash(self, url, cache=True, **kwargs):
+        if not cache or self.sql is None:
+            return None
+
+        file_id = self._get_file_id(url)
+        if file_id is None:
+            return None
+
+        cached = self._get_cache().get(url)
+        if cached is not None and cached[:3] == file_id:
+            return cached[3]
+
+        h = self.core.call_success("fs_hash", url, cache=False, **kwargs)
+        if h is None:
+            return None
+
+        with self.lock:
+            if self.cache is None:  # on_quit() has been called
+                return h
+            self.cache[url] = file_id + (h,)
+            self.pending[url] = file_id + (h,)
+            need_flush = len(self.pending) >= FLUSH_THRESHOLD
+        if need_flush:
+            self._flush()
+        return h
+
+    def fs_unlink(self, uri, **kwargs):
+        # called before the fs plugins. Returns None so that the file is
+        # actually deleted by them.
+        self.fs_rm_rf(uri)
+        return None
+
+    def fs_rm_rf(self, uri, **kwargs):
+        if self.sql is None:
+            return None
+        self._get_cache()
+        with self.lock:
+            if self.cache is not None:
+                self._forget(uri)
+        return None
+
+    def fs_rename(self, old_uri, new_uri):
+        if self.sql is None:
+            return None
+        self._get_cache()
+        with self.lock:
+            if self.cache is None:
+                return None
+            # renaming doesn't change the size, the mtime or the inode:
+            # the hashes remain valid
+            moved = self._forget(old_uri)
+            self._forget(new_uri)
+            self.deleted.discard(new_uri)
+            for (url, entry) in moved.items():
+                url = new_uri + url[len(old_uri):]
+                self.cache[url] = entry
+                self.pending[url] = entry
+        return None
+
+    def fs_hash_cache_flush(self):
+        self._flush()
+        return True
+
+    def on_quit(self):
+        if self.sql is None:
+            return
+        self._flush()
+        self.core.call_one(
+            "sqlite_execute",
+            self.core.call_success,
+            "sqlite_close", self.sql
+        )
+        self.sql = None
+        self.cache = None
+
+    def tests_cleanup(self):
+        self.on_quit()
@@ -1,3 +1,4 @@
+import threading
 import unittest
 
 from .. import (Core, promise)
@@ -124,3 +125,72 @@ class AbstractTestPromise(unittest.TestCase):
         self.assertTrue(self.beta_called)
         self.assertFalse(self.stop_called)
         self.assertTrue(self.exc_raised)
+
+    def test_threaded_chain(self):
+        self.core.load("openpaperwork_core.thread.simple")
+        self.core.init()
+
+        main_thread = threading.current_thread().ident
+        threads = []
+
+        def step(previous=None):
+            self.assertEqual(previous, len(threads) if threads else None)
+            threads.append(threading.current_thread().ident)
+            return len(threads)
+
+        p = promise.ThreadedPromise(self.core, step)
+        p = p.then(promise.ThreadedPromise(self.core, step))
+        p = p.then(promise.ThreadedPromise(self.core, step))
+        p = p.then(step)
+        p = p.then(promise.ThreadedPromise(self.core, step))
+        p = p.then(
+            promise.ThreadedPromise(self.core, step, chain_on_thread=False)
+        )
+        p.schedule()
+        self.core.call_all("mainloop_quit_graceful")
+
+        self.core.call_one("mainloop")
+        self.assertEqual(len(threads), 6)
+        # consecutive threaded promises are run in the same thread
+        self.assertNotEqual(threads[0], main_thread)
+        self.assertEqual(threads[1], threads[0])
+        self.assertEqual(threads[2], threads[0])
+        # other promises are run on the main loop
+        self.assertEqual(threads[3], main_thread)
+        self.assertNotEqual(threads[4], main_thread)
+        self.assertNotEqual(threads[5], main_thread)
+
+    def test_threaded_chain_catch(self):
+        self.core.load("openpaperwork_core.thread.simple")
+        self.core.init()
+
+        def alpha():
+            self.alpha_called = True
+
+        def beta():
+            self.beta_called = True
+            raise Exception("paf")
+
+        def stop():
+            self.stop_called = True
+
+        def on_exc(exc):
+            self.assertEqual(
+                threading.current_thread().ident,
+                self.core.call_success("mainloop_get_thread_id")
+            )
+            self.exc_raised = True
+
+        p = promise.ThreadedPromise(self.core, alpha)
+        p = p.then(promise.ThreadedPromise(self.core, beta))
+        p = p.then(promise.ThreadedPromise(self.core, stop))
+        p = p.catch(on_exc)
+        p.hide_caught_exceptions = True
+        p.schedule()
+        self.core.call_all("mainloop_quit_graceful")
+
+        self.core.call_one("mainloop")
+        self.assertTrue(self.alpha_called)
+        self.assertTrue(self.beta_called)
+        self.assertFalse(self.stop_called)
+        self.assertTrue(self.exc_raised)
@@ -0,0 +1,190 @@
+"""
+Plugin manifest: for each plugin module, the interfaces it provides, its
+dependencies and the names of its callbacks. It allows the core to load
+plugins on demand (see `Core.enable_lazy_loading()`): plugins are only
+imported and initialized when they are actually needed.
+
+The manifest is generated the first time a plugin is loaded (the plugin
+module has to be imported once) and cached in a JSON file. Entries are
+invalidated when the modification time of the plugin module changes.
+"""
+
+import importlib
+import importlib.util
+import json
+import logging
+import os
+
+
+LOGGER = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+
+
+def get_callback_names(plugin):
+    """
+    Names of the methods of the plugin that the core registers as
+    callbacks.
+    """
+    # avoid an import loop
+    from . import PluginBase
+
+    out = []
+    for attr_name in dir(plugin):
+        if attr_name[0] == "_":
+            continue
+        if attr_name in dir(PluginBase):  # ignore base methods of plugins
+            continue
+        if not hasattr(getattr(plugin, attr_name), '__call__'):
+            continue
+        out.append(attr_name)
+    return out
+
+
+def is_lazy(plugin, callback_names):
+    """
+    Plugins can explicitly say if they can be loaded on demand
+    (`PluginBase.LAZY`). By default, plugins are loaded on demand only if
+    they don't have to do anything on initialization and don't observe
+    any event (their observer callbacks -- 'on_*' -- would never be
+    called otherwise).
+    """
+    # avoid an import loop
+    from . import PluginBase
+
+    if plugin.LAZY is not None:
+        return bool(plugin.LAZY)
+    if type(plugin).init is not PluginBase.init:
+        return False
+    for callback_name in callback_names:
+        if callback_name.startswith("on_"):
+            return False
+    return True
+
+
+def _get_module_mtime(module_name):
+    try:
+        spec = importlib.util.find_spec(module_name)
+    except (ImportError, ValueError):
+        return None
+    if spec is None or spec.origin is None:
+        return None
+    try:
+        return os.stat(spec.origin).st_mtime
+    except OSError:
+        # frozen or builtin module
+        return None
+
+
+class PluginManifest(object):
+    def __init__(self, file_path=None):
+        """
+        Arguments:
+            file_path -- JSON file where the manifest is cached. If None,
+                the manifest is only kept in memory.
+        """
+        self.file_path = file_path
+        self.entries = {}
+        self.modified = False
+        self.load()
+
+    def load(self):
+        if self.file_path is None or not os.path.exists(self.file_path):
+            return
+        try:
+            with open(self.file_path, "r") as fd:
+                content = json.load(fd)
+        except (OSError, ValueError) as exc:
+            LOGGER.warning(
+                "Failed to load plugin manifest %s", self.file_path,
+                exc_info=exc
+            )
+            return
+        if content.get('version') != MANIFEST_VERSION:
+            LOGGER.info("Plugin manifest is outdated. Ignoring it")
+            return
+        self.entries = content['plugins']
+
+    def save(self):
+        if self.file_path is None or not self.modified:
+            return
+        LOGGER.info(
+            "Saving plugin manifest (%d plugins) to %s",
+            len(self.entries), self.file_path
+        )
+        tmp_path = self.file_path + ".tmp"
+        try:
+            with open(tmp_path, "w") as fd:
+                json.dump(
+                    {'version': MANIFEST_VERSION, 'plugins': self.entries},
+                    fd, indent=1, sort_keys=True
+                )
+            os.replace(tmp_path, self.file_path)
+        except OSError as exc:
+            # it's only a cache
+            LOGGER.warning(
+                "Failed to save plugin manifest %s", self.file_path,
+                exc_info=exc
+            )
+            return
+        self.modified = False
+
+    def get(self, module_name):
+        """
+        Returns the manifest entry of the module, or None if the manifest
+        doesn't know this module (or its entry is outdated).
+        """
+        entry = self.entries.get(module_name)
+        if entry is None:
+            return None
+        mtime = _get_module_mtime(module_name)
+        if mtime is None or mtime != entry['mtime']:
+            return None
+        return entry
+
+    def update(self, module_name, plugin):
+        """
+        Generate the manifest entry of a plugin that has just been
+        instantiated.
+        """
+        mtime = _get_module_mtime(module_name)
+        if mtime is None:
+            # can't be invalidated --> can't be cached
+            return None
+        callback_names = get_callback_names(plugin)
+        entry = {
+            'mtime': mtime,
+            'interfaces': list(plugin.get_interfaces()),
+            'deps': list(plugin.get_deps()),
+            'callbacks': callback_names,
+            'lazy': is_lazy(plugin, callback_names),
+        }
+        previous = self.entries.get(module_name)
+        if previous is not None and previous['mtime'] == mtime:
+            if 'data' in previous:
+                entry['data'] = previous['data']
+            if entry == previous:
+                return previous
+        self.entries[module_name] = entry
+        self.modified = True
+        return entry
+
+    def set_data(self, module_name, key, value):
+        """
+        Attach extra data to the entry of a module (for instance the command
+        line arguments of a command plugin). `value` must be serializable in
+        JSON. The data are dropped with the entry when the module is
+        modified.
+        """
+        entry = self.get(module_name)
+        if entry is None:
+            return False
+        entry.setdefault('data', {})[key] = value
+        self.modified = True
+        return True
+
+    def get_data(self, module_name, key):
+        entry = self.get(module_name)
+        if entry is None:
+            return None
+        return entry.get('data', {}).get(key)
@@ -31,3 +31,16 @@ class Plugin(PluginBase):
                 "Task '%s' took %dms (> %dms) ! (%s)",
                 task_name, (stop - start) * 1000, MIN_TIME_MS, extras
             )
+
+    def perfcheck_get_counters(self, out: dict):
+        """
+        Other plugins can implement this method to provide performance
+        counters (cache hits and misses, etc): {counter name: value}.
+        """
+        pass
+
+    def on_quit(self):
+        counters = {}
+        self.core.call_all("perfcheck_get_counters", counters)
+        for (counter, value) in sorted(counters.items()):
+            LOGGER.info("Performance counter '%s': %s", counter, value)
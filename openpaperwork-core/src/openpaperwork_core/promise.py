@@ -213,35 +213,81 @@ class ThreadedPromise(BasePromise):
     Requires a plugin implementing the interface 'mainloop' and a plugin
     implementing the interface 'thread'.
 
+    When a ThreadedPromise is directly followed by another ThreadedPromise
+    (and nothing else), the next one is run right away in the same thread:
+    there is no need to go through the main loop (which may be busy) between
+    them. Only the other promises are scheduled in the main loop. Use
+    `chain_on_thread=False` if a ThreadedPromise must not be run this way.
+
+    `priority` is the priority class of the task (see PRIORITIES in
+    `openpaperwork_core.thread`). If None, the thread plugin picks the
+    default one.
+
     IMPORTANT: This should ONLY be used for long-lasting tasks that cannot
     be split in small tasks (image processing, OCR, etc). The callback provided
     must be really careful regarding thread-safety.
     """
 
+    def __init__(self, *args, chain_on_thread=True, priority=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.chain_on_thread = chain_on_thread
+        self.priority = priority
+
     def __str__(self):
         return "ThreadedPromise<{}>({})".format(str(self.func), id(self))
 
-    def _threaded_do(self, parent_r):
+    def _get_next_on_thread(self):
+        if len(self._then) != 1:
+            return None
+        next_promise = self._then[0]
+        if not isinstance(next_promise, ThreadedPromise):
+            return None
+        if not next_promise.chain_on_thread:
+            return None
+        if next_promise.priority != self.priority:
+            return None
+        return next_promise
+
+    def _run(self, parent_r):
+        """
+        Run the callback in the current thread. Returns the next promise
+        to run in this same thread (if any).
+        """
+        self.scheduled = False
+        self.parent_promise_return = parent_r
         try:
-            if parent_r is None:
-                args = self.args
+            if self.func is None:
+                our_r = None
             else:
-                args = (parent_r,) + self.args
+                if parent_r is None:
+                    args = self.args
+                else:
+                    args = (parent_r,) + self.args
 
-            LOGGER.debug(
-                "Threaded promise: Begin: %s(%s, %s)",
-                self.func, args, self.kwargs
-            )
-            our_r = self.func(*args, **self.kwargs)
-            LOGGER.debug(
-                "Threaded promise: end: %s(%s, %s)",
-                self.func, args, self.kwargs
-            )
+                LOGGER.debug(
+                    "Threaded promise: Begin: %s(%s, %s)",
+                    self.func, args, self.kwargs
+                )
+                our_r = self.func(*args, **self.kwargs)
+                LOGGER.debug(
+                    "Threaded promise: end: %s(%s, %s)",
+                    self.func, args, self.kwargs
+                )
+
+            next_promise = self._get_next_on_thread()
+            if next_promise is not None:
+                return (next_promise, our_r)
 
             for t in self._then:
                 self.core.call_one("mainloop_schedule", t._do, our_r)
         except Exception as exc:
             self.core.call_one("mainloop_schedule", self.on_error, exc)
+        return (None, None)
+
+    def _threaded_do(self, parent_r):
+        promise = self
+        while promise is not None:
+            (promise, parent_r) = promise._run(parent_r)
 
     def do(self, parent_r=None):
         self.parent_promise_return = parent_r
@@ -252,7 +298,15 @@ class ThreadedPromise(BasePromise):
                     self.core.call_one("mainloop_schedule", t._do, None)
                 return
 
-            self.core.call_one("thread_start", self._threaded_do, parent_r)
+            if self.priority is None:
+                self.core.call_one(
+                    "thread_start", self._threaded_do, parent_r
+                )
+            else:
+                self.core.call_one(
+                    "thread_start_prio", self.priority,
+                    self._threaded_do, parent_r
+                )
         except Exception as exc:
             self.on_error(exc)
             return
@@ -0,0 +1,109 @@
+import itertools
+import logging
+import os
+import sqlite3
+import threading
+
+from .. import PluginBase
+
+LOGGER = logging.getLogger(__name__)
+
+# Beware that we use Sqlite, but sqlite python module is not thread-safe
+# --> all the calls to sqlite module functions must happen on the main loop,
+# even those in the transactions (which are run in a thread)
+
+# Default number of write queries buffered by WriteBatch before they are
+# actually run
+DEFAULT_BATCH_SIZE = 500
+
+
+class WriteBatch(object):
+    """
+    Buffers write queries (INSERT, DELETE, etc) and runs them in bulk with
+    `executemany()`, in a single call to `sqlite_execute()` (so in a single
+    round trip to the main loop). Queries are run in the order in which they
+    were added.
+    """
+    def __init__(self, core, sql, batch_size=DEFAULT_BATCH_SIZE):
+        self.core = core
+        self.sql = sql  # connection or cursor
+        self.batch_size = batch_size
+        self.pending = []  # [(query, params), ...]
+        # Beware: sqlite_execute() may have to wait for the main loop
+        # --> we must never hold the lock while calling it.
+        self.lock = threading.Lock()
+
+    def execute(self, query, params=()):
+        with self.lock:
+            self.pending.append((query, params))
+            need_flush = len(self.pending) >= self.batch_size
+        if need_flush:
+            self.flush()
+
+    def _run(self, pending, cb, args):
+        for (query, queries) in itertools.groupby(pending, lambda q: q[0]):
+            self.sql.executemany(query, [q[1] for q in queries])
+        if cb is None:
+            return None
+        return cb(*args)
+
+    def flush(self, cb=None, *args):
+        """
+        Run all the pending queries. If `cb` is not None, it is called
+        right after them, in the same call to `sqlite_execute()`, and its
+        return value is returned.
+        """
+        with self.lock:
+            pending = self.pending
+            self.pending = []
+        if len(pending) <= 0 and cb is None:
+            return None
+        return self.core.call_one(
+            "sqlite_execute", self._run, pending, cb, args
+        )
+
+    def clear(self):
+        """
+        Drop all the pending queries (for instance, on rollback).
+        """
+        with self.lock:
+            self.pending = []
+
+
+class Plugin(PluginBase):
+    def get_interfaces(self):
+        return ['sqlite']
+
+    def get_deps(self):
+        return [
+            {
+                'interface': 'mainloop',
+                'defaults': ['openpaperwork_core.mainloop.asyncio'],
+            },
+        ]
+
+    def sqlite_open(self, db_url, *args, **kwargs):
+        LOGGER.info("Opening DB %s ...", db_url)
+        db_path = self.core.call_success("fs_unsafe", db_url)
+        if 'timeout' not in kwargs:
+            kwargs['timeout'] = 60
+        sql = sqlite3.connect(db_path, *args, **kwargs)
+        sql.execute("pragma journal_mode = wal;")
+        sql.execute("pragma synchronous = normal;")
+        sql.execute("pragma temp_store = memory;")
+        if os.name == "posix":
+            sql.execute("pragma mmap_size = 30000000000;")
+        return sql
+
+    def sqlite_execute(self, cb, *args, **kwargs):
+        return self.core.call_one("mainloop_execute", cb, *args, **kwargs)
+
+    def sqlite_schedule(self, cb, *args, **kwargs):
+        return self.core.call_one("mainloop_schedule", cb, *args, **kwargs)
+
+    def sqlite_close(self, db, optimize=True):
+        if optimize:
+            LOGGER.info("Optimizing database ...")
+            db.execute("pragma optimize;")
+        db.close()
+        return True
@@ -0,0 +1,136 @@
+"""
+Alternative implementation of the 'sqlite' interface: instead of running all
+the calls to the sqlite module on the main loop, they are all run on a
+dedicated thread. Therefore database accesses made by the transactions never
+have to wait for the main loop (and the main loop never has to wait for
+them).
+
+Connections are opened with `check_same_thread=False`: most of the time they
+are only used on the database thread, but some plugins also use them
+directly (for instance from the main loop).
+"""
+
+import concurrent.futures
+import logging
+import queue
+import threading
+
+from . import Plugin as MainloopPlugin
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Maximum number of requests run each time the database thread wakes up
+MAX_BATCH_SIZE = 100
+
+
+class Request(object):
+    def __init__(self, core, cb, args, kwargs, ref=False):
+        self.core = core
+        self.cb = cb
+        self.args = args
+        self.kwargs = kwargs
+        self.future = concurrent.futures.Future()
+        self.ref = ref
+        if ref:
+            # The request is not waited for. If there is a graceful shutdown
+            # waiting, we don't want it to stop the main loop before the
+            # request is done.
+            core.call_all("mainloop_ref", self)
+
+    def __str__(self):
+        return "Request<{}>({}, {})".format(self.cb, self.args, self.kwargs)
+
+    def do(self):
+        try:
+            self.future.set_result(self.cb(*self.args, **self.kwargs))
+        except Exception as exc:
+            if self.ref:
+                LOGGER.error(
+                    "Uncaught exception in sqlite request %s",
+                    self, exc_info=exc
+                )
+            self.future.set_exception(exc)
+        finally:
+            if self.ref:
+                self.core.call_all("mainloop_unref", self)
+
+
+class Thread(threading.Thread):
+    def __init__(self):
+        super().__init__(name="openpaperwork_sqlite")
+        self.daemon = True
+        self.requests = queue.Queue()
+
+    def run(self):
+        LOGGER.info("Database thread ready")
+        running = True
+        while running:
+            batch = [self.requests.get()]
+            try:
+                while len(batch) < MAX_BATCH_SIZE:
+                    batch.append(self.requests.get_nowait())
+            except queue.Empty:
+                pass
+            for request in batch:
+                if request is None:
+                    running = False
+                    continue
+                request.do()
+        LOGGER.info("Database thread stopped")
+
+
+class Plugin(MainloopPlugin):
+    # must be preferred over openpaperwork_core.sqlite if both are loaded
+    PRIORITY = 100
+
+    def __init__(self):
+        super().__init__()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def get_deps(self):
+        return []
+
+    def _submit(self, request):
+        with self.lock:
+            if self.thread is None:
+                self.thread = Thread()
+                self.thread.start()
+            self.thread.requests.put(request)
+
+    def sqlite_open(self, db_url, *args, **kwargs):
+        if 'check_same_thread' not in kwargs:
+            kwargs['check_same_thread'] = False
+        return super().sqlite_open(db_url, *args, **kwargs)
+
+    def sqlite_execute(self, cb, *args, **kwargs):
+        """
+        Run the callback on the database thread and wait for its result.
+        """
+        if isinstance(threading.current_thread(), Thread):
+            return cb(*args, **kwargs)
+        request = Request(self.core, cb, args, kwargs)
+        self._submit(request)
+        return request.future.result()
+
+    def sqlite_schedule(self, cb, *args, **kwargs):
+        """
+        Run the callback on the database thread. Returns immediately.
+        """
+        self._submit(Request(self.core, cb, args, kwargs, ref=True))
+        return True
+
+    def on_quit(self):
+        with self.lock:
+            thread = self.thread
+            self.thread = None
+            if thread is None:
+                return
+            # pending requests are run before the thread stops. If another
+            # request comes later, a new thread is started.
+            thread.requests.put(None)
+        thread.join()
+
+    def tests_cleanup(self):
+        self.on_quit()
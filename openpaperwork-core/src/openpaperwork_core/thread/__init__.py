@@ -1,8 +1,21 @@
 import logging
+import threading
 
 
 LOGGER = logging.getLogger(__name__)
 
+# Priority classes of the tasks run in threads (see 'thread_start_prio'),
+# from the most urgent to the least urgent.
+# - interactive: the user is waiting for the result (thumbnails, search,
+#   page rendering, etc)
+# - background: default
+# - bulk: long tasks on many documents (synchronization, OCR, label
+#   training, export, etc)
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BACKGROUND = "background"
+PRIORITY_BULK = "bulk"
+PRIORITIES = [PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND, PRIORITY_BULK]
+
 
 class Task(object):
     def __init__(self, core, func, args, kwargs):
@@ -31,3 +44,91 @@ class Task(object):
             )
         finally:
             self.core.call_all("mainloop_unref", self)
+
+
+class CancelledError(Exception):
+    pass
+
+
+class Future(object):
+    """
+    Result of a function run by the threads of the 'thread' plugin (see
+    `submit()`).
+
+    If the function hasn't been started yet when its result is requested,
+    the thread requesting it runs it instead. A task can therefore wait
+    for the tasks it has submitted even when they belong to its own
+    priority class and the concurrency limit of this class is reached.
+    """
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    CANCELLED = "cancelled"
+
+    def __init__(self, func, args, kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.cond = threading.Condition()
+        self.state = self.PENDING
+        self._result = None
+        self._exc = None
+
+    def _run(self):
+        with self.cond:
+            if self.state != self.PENDING:
+                return
+            self.state = self.RUNNING
+        try:
+            result = self.func(*self.args, **self.kwargs)
+            exc = None
+        except Exception as e:
+            result = None
+            exc = e
+        with self.cond:
+            self._result = result
+            self._exc = exc
+            self.state = self.DONE
+            self.cond.notify_all()
+
+    def cancel(self):
+        """
+        Returns True if the function won't be run at all.
+        """
+        with self.cond:
+            if self.state == self.PENDING:
+                self.state = self.CANCELLED
+            return self.state == self.CANCELLED
+
+    def done(self):
+        with self.cond:
+            return self.state in (self.DONE, self.CANCELLED)
+
+    def wait(self):
+        self._run()
+        with self.cond:
+            while self.state == self.RUNNING:
+                self.cond.wait()
+
+    def result(self):
+        """
+        Wait for the function to be done and return its result (or raise
+        its exception).
+        """
+        self.wait()
+        with self.cond:
+            if self.state == self.CANCELLED:
+                raise CancelledError()
+            if self._exc is not None:
+                raise self._exc
+            return self._result
+
+
+def submit(core, priority, func, *args, **kwargs):
+    """
+    Run `func` in a thread with the given priority class (see
+    'thread_start_prio') and return a `Future`.
+    """
+    future = Future(func, args, kwargs)
+    core.call_one("thread_start_prio", priority, future._run)
+    return future
@@ -1,38 +1,182 @@
+"""
+Thread pool with priority classes (see PRIORITIES in `thread`).
+
+All the worker threads share one scheduler: a worker that becomes available
+always takes the most urgent task, whatever the subsystem that queued it
+(workers are never dedicated to a priority class). Each priority class has a
+concurrency limit so that long bulk tasks (OCR, label training, export, etc)
+can never use all the threads and starve the interactive ones.
+
+Threads are started on demand (up to the maximum) and stop after some time
+without any task.
+"""
+
+import collections
 import logging
 import multiprocessing
-import queue
 import threading
+import time
 
-from . import Task
+from . import (
+    PRIORITIES,
+    PRIORITY_BACKGROUND,
+    PRIORITY_BULK,
+    PRIORITY_INTERACTIVE,
+    Task
+)
 from .. import PluginBase
 
 
 LOGGER = logging.getLogger(__name__)
 
+# seconds without any task before a thread stops
+IDLE_TIMEOUT = 30
+
+
+def get_default_limits(max_threads):
+    return {
+        PRIORITY_INTERACTIVE: max_threads,
+        # always keep one thread available for interactive tasks
+        PRIORITY_BACKGROUND: max(1, max_threads - 1),
+        PRIORITY_BULK: max(1, max_threads // 2),
+    }
+
+
+class Stats(object):
+    """
+    Counters kept across restarts of the main loop (and therefore of the
+    schedulers).
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = collections.Counter()
+
+    def add(self, priority, counter, value=1):
+        with self.lock:
+            self.counters[priority + "_" + counter] += value
+
+    def get(self):
+        with self.lock:
+            return dict(self.counters)
+
 
-class Thread(threading.Thread):
-    def __init__(self, plugin, thread_id):
-        super().__init__(name="paperwork_thread_{}".format(thread_id))
-        self.daemon = True
-        self.task_queue = plugin.queue
-        self.core = plugin.core
-        self.running = True
+class Scheduler(object):
+    def __init__(self, max_threads, limits, stats):
+        self.max_threads = max_threads
+        self.limits = limits
+        self.stats = stats
 
-    def run(self):
-        LOGGER.info("Thread %s ready", self.name)
+        self.cond = threading.Condition()
+        self.queues = {
+            priority: collections.deque() for priority in PRIORITIES
+        }
+        self.running = collections.Counter()
+        self.threads = set()
+        self.nb_idle = 0
+        self.thread_id = 0
+        self.stopping = False
+
+    def _start_thread(self):
+        self.thread_id += 1
+        thread = threading.Thread(
+            target=self._run,
+            name="paperwork_thread_{}".format(self.thread_id)
+        )
+        thread.daemon = True
+        self.threads.add(thread)
+        thread.start()
+
+    def submit(self, priority, task):
+        with self.cond:
+            task.queued_at = time.monotonic()
+            self.queues[priority].append(task)
+            self.stats.add(priority, "queued")
+            if self.nb_idle > 0:
+                self.nb_idle -= 1
+                self.cond.notify()
+            elif len(self.threads) < self.max_threads:
+                self._start_thread()
+            # else the task will be picked up by the next thread done with
+            # its current task
+
+    def _pick(self):
+        for priority in PRIORITIES:
+            queue = self.queues[priority]
+            if len(queue) <= 0:
+                continue
+            if self.running[priority] >= self.limits[priority]:
+                continue
+            return (priority, queue.popleft())
+        return None
+
+    def _get_next_task(self):
+        with self.cond:
+            while True:
+                task = self._pick()
+                if task is not None:
+                    break
+                # queued tasks are always run before stopping
+                if self.stopping:
+                    task = None
+                    break
+                self.nb_idle += 1
+                if not self.cond.wait(IDLE_TIMEOUT):
+                    # timeout: not notified (or notified just when the
+                    # timeout expired)
+                    self.nb_idle = max(0, self.nb_idle - 1)
+                    task = self._pick()
+                    break
+            if task is None:
+                self.threads.discard(threading.current_thread())
+                return None
+            (priority, task) = task
+            self.running[priority] += 1
+            self.stats.add(
+                priority, "wait_time", time.monotonic() - task.queued_at
+            )
+            return (priority, task)
+
+    def _run(self):
+        LOGGER.info("Thread %s ready", threading.current_thread().name)
         while True:
-            task = self.task_queue.get()
+            task = self._get_next_task()
             if task is None:
                 break
+            (priority, task) = task
+            start = time.monotonic()
             task.do()
-        LOGGER.info("Thread %s stopped", self.name)
+            self.stats.add(priority, "busy_time", time.monotonic() - start)
+            self.stats.add(priority, "done")
+            with self.cond:
+                self.running[priority] -= 1
+        LOGGER.info("Thread %s stopped", threading.current_thread().name)
+
+    def stop(self):
+        with self.cond:
+            self.stopping = True
+            self.cond.notify_all()
+
+    def get_counters(self):
+        with self.cond:
+            out = {
+                'threads': len(self.threads),
+                'threads_idle': self.nb_idle,
+            }
+            for priority in PRIORITIES:
+                out[priority + "_pending"] = len(self.queues[priority])
+                out[priority + "_running"] = self.running[priority]
+            return out
 
 
 class Plugin(PluginBase):
     def __init__(self):
         super().__init__()
-        self.queue = queue.Queue()
-        self.pool = None
+        self.max_threads = max(4, multiprocessing.cpu_count())
+        self.limits = get_default_limits(self.max_threads)
+        self.stats = Stats()
+        self.start_time = None
+        self.scheduler = None
+        self.lock = threading.Lock()
 
     def get_interfaces(self):
         return ['thread']
@@ -46,24 +190,60 @@ class Plugin(PluginBase):
         ]
 
     def on_mainloop_start(self):
-        if self.pool is None:
-            self.pool = [
-                Thread(self, x)
-                for x in range(0, max(4, multiprocessing.cpu_count()))
-            ]
-            for t in self.pool:
-                t.start()
+        with self.lock:
+            if self.scheduler is None:
+                if self.start_time is None:
+                    self.start_time = time.monotonic()
+                self.scheduler = Scheduler(
+                    self.max_threads, self.limits, self.stats
+                )
+            return self.scheduler
 
     def on_mainloop_quit(self):
-        if self.pool is not None:
-            for t in self.pool:
-                self.queue.put(None)
+        with self.lock:
+            scheduler = self.scheduler
             # in case the mainloop is restarted later:
-            self.queue = queue.Queue()
-            self.pool = None
+            self.scheduler = None
+        if scheduler is not None:
+            scheduler.stop()
 
     def thread_start(self, func, *args, **kwargs):
-        if self.pool is None:
-            self.on_mainloop_start()
+        return self.thread_start_prio(
+            PRIORITY_BACKGROUND, func, *args, **kwargs
+        )
+
+    def thread_start_prio(self, priority, func, *args, **kwargs):
+        """
+        Run a task in a thread of the pool. `priority` must be one of the
+        priority classes (see PRIORITIES in `thread`).
+        """
+        assert priority in PRIORITIES
+        scheduler = self.scheduler
+        if scheduler is None:
+            scheduler = self.on_mainloop_start()
         task = Task(self.core, func, args, kwargs)
-        self.queue.put(task)
+        scheduler.submit(priority, task)
+        return True
+
+    def perfcheck_get_counters(self, out: dict):
+        with self.lock:
+            scheduler = self.scheduler
+            start_time = self.start_time
+        if scheduler is not None:
+            for (k, v) in scheduler.get_counters().items():
+                out["thread_pool_" + k] = v
+        busy_time = 0
+        for (k, v) in self.stats.get().items():
+            if k.endswith("_time"):
+                v = round(v, 3)
+            out["thread_pool_" + k] = v
+            if k.endswith("_busy_time"):
+                busy_time += v
+        if start_time is not None:
+            # percentage of the pool capacity actually used since the first
+            # task
+            elapsed = time.monotonic() - start_time
+            if elapsed > 0:
+                out['thread_pool_utilization'] = round(
+                    busy_time * 100 / (elapsed * self.max_threads), 1
+                )
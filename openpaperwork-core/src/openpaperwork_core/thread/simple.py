@@ -26,3 +26,7 @@ class Plugin(PluginBase):
         thread.daemon = True
         thread.start()
         return True
+
+    def thread_start_prio(self, priority, func, *args, **kwargs):
+        # no scheduling: all the tasks get their own thread right away
+        return self.thread_start(func, *args, **kwargs)
@@ -1,9 +1,22 @@
 import threading
 import unittest
 
+from . import (PRIORITY_BULK, PRIORITY_INTERACTIVE, submit)
 from .. import (Core, PluginBase)
 
 
+class DummyMainloop(object):
+    class Plugin(PluginBase):
+        def get_interfaces(s):
+            return ['mainloop']
+
+        def mainloop_ref(s, r):
+            pass
+
+        def mainloop_unref(s, r):
+            pass
+
+
 class AbstractTestThread(unittest.TestCase):
     def get_plugin_name(self):
         """
@@ -12,17 +25,6 @@ class AbstractTestThread(unittest.TestCase):
         assert False
 
     def setUp(self):
-        class DummyMainloop(object):
-            class Plugin(PluginBase):
-                def get_interfaces(s):
-                    return ['mainloop']
-
-                def mainloop_ref(s, r):
-                    pass
-
-                def mainloop_unref(s, r):
-                    pass
-
         self.core = Core(auto_load_dependencies=True)
         self.core._load_module("dummy_mainloop", DummyMainloop())
         self.core.load(self.get_plugin_name())
@@ -80,3 +82,56 @@ class AbstractTestThread(unittest.TestCase):
             sem.acquire()
         self.assertTrue(out['task_a_done'])
         self.core.call_all("on_mainloop_quit")
+
+    def test_prio(self):
+        out = []
+        sem = threading.Semaphore(value=0)
+
+        def task(name):
+            out.append(name)
+            sem.release()
+
+        self.core.call_all("on_mainloop_start")
+        self.core.call_one(
+            "thread_start_prio", PRIORITY_INTERACTIVE, task, "a"
+        )
+        self.core.call_one("thread_start_prio", PRIORITY_BULK, task, "b")
+        for _ in range(0, 2):
+            sem.acquire()
+        self.assertCountEqual(out, ["a", "b"])
+        self.core.call_all("on_mainloop_quit")
+
+    def test_submit(self):
+        def task(a, b=0):
+            return a + b
+
+        def failing_task():
+            raise ValueError("test")
+
+        self.core.call_all("on_mainloop_start")
+        future = submit(self.core, PRIORITY_BULK, task, 1, b=2)
+        failing = submit(self.core, PRIORITY_BULK, failing_task)
+        self.assertEqual(future.result(), 3)
+        self.assertTrue(future.done())
+        self.assertRaises(ValueError, failing.result)
+        self.core.call_all("on_mainloop_quit")
+
+    def test_submit_nested(self):
+        # a bulk task waiting for other bulk tasks must not wait for
+        # a bulk thread to become available
+        out = []
+
+        def subtask(value):
+            return value * 2
+
+        def task():
+            futures = [
+                submit(self.core, PRIORITY_BULK, subtask, value)
+                for value in range(0, 8)
+            ]
+            out.extend(future.result() for future in futures)
+
+        self.core.call_all("on_mainloop_start")
+        self.assertEqual(submit(self.core, PRIORITY_BULK, task).result(), None)
+        self.assertEqual(out, [0, 2, 4, 6, 8, 10, 12, 14])
+        self.core.call_all("on_mainloop_quit")
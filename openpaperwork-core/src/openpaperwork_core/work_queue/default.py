@@ -1,31 +1,55 @@
+import json
 import logging
 import heapq
+import os
 import threading
+import time
 import traceback
 
-from .. import PluginBase
+from .. import (_, PluginBase)
 
 
 LOGGER = logging.getLogger(__name__)
 
+# Capturing the stack of the caller each time a promise is queued is
+# expensive (thousands of promises are queued when opening a large document
+# list). It is only useful to find out who queued a failing promise, so by
+# default it is not done.
+# WORK_QUEUE_PROVENANCE=N --> the stack is captured for one task out of N
+# (1 = all the tasks).
+DEFAULT_PROVENANCE_SAMPLING = int(os.getenv("WORK_QUEUE_PROVENANCE", 0))
+
 
 class Task(object):
-    def __init__(self, work_queue, priority, insert_number, promise):
+    def __init__(
+            self, work_queue, priority, insert_number, promise,
+            created_by=None):
         self.work_queue = work_queue
         self.priority = priority
         self.insert_number = insert_number
         self.promise = promise
         self.active = True
-        self.created_by = traceback.extract_stack()
+        self.created_by = created_by
+        self.queued_at = time.monotonic()
+        self.started_at = None
+        self.failed = False
 
     def _on_error(self, exc, hide_error):
         if not hide_error:
-            LOGGER.error("=== Promise was queued by ===")
-            for (idx, stack_el) in enumerate(self.created_by):
+            if self.created_by is None:
                 LOGGER.error(
-                    "%2d: %20s: L%5d: %s",
-                    idx, stack_el[0], stack_el[1], stack_el[2]
+                    "Promise queued in [%s] failed (set"
+                    " WORK_QUEUE_PROVENANCE=1 to know where it was"
+                    " queued)", self.work_queue.name
                 )
+            else:
+                LOGGER.error("=== Promise was queued by ===")
+                for (idx, stack_el) in enumerate(self.created_by):
+                    LOGGER.error(
+                        "%2d: %20s: L%5d: %s",
+                        idx, stack_el[0], stack_el[1], stack_el[2]
+                    )
+        self.failed = True
         self.work_queue._run_next_promise_locked()
         raise exc
 
@@ -42,7 +66,9 @@ class Task(object):
 
 
 class WorkQueue(object):
-    def __init__(self, name, stop_on_quit, hide_uncatched):
+    def __init__(
+            self, name, stop_on_quit, hide_uncatched,
+            provenance_sampling=DEFAULT_PROVENANCE_SAMPLING):
         self.insert_number = 0
 
         self.name = name
@@ -50,15 +76,42 @@ class WorkQueue(object):
         self.queue = []
         self.all_tasks = {}
         self.running = False
+        self.current_task = None
         self.stop_on_quit = stop_on_quit
         self.hide_uncatched = hide_uncatched
+        self.provenance_sampling = provenance_sampling
+
+        # tasks in self.queue that haven't been cancelled yet
+        self.depth = 0
+        self.stats = {
+            'queued': 0,
+            'done': 0,
+            'failed': 0,
+            'cancelled': 0,
+            'max_depth': 0,
+            'wait_time': 0.0,
+            'max_wait_time': 0.0,
+            'run_time': 0.0,
+            'max_run_time': 0.0,
+        }
 
     def add_promise(self, promise, priority=0):
         self.insert_number += 1
 
-        task = Task(self, -1 * priority, self.insert_number, promise)
+        created_by = None
+        if (self.provenance_sampling > 0 and
+                self.insert_number % self.provenance_sampling == 0):
+            created_by = traceback.extract_stack()
+
+        task = Task(
+            self, -1 * priority, self.insert_number, promise, created_by
+        )
 
         with self.lock:
+            self.depth += 1
+            self.stats['queued'] += 1
+            self.stats['max_depth'] = max(self.stats['max_depth'], self.depth)
+
             heapq.heappush(self.queue, task)
             assert (
                 promise not in self.all_tasks or
@@ -82,18 +135,39 @@ class WorkQueue(object):
             self.running = False
             return
 
+        self.depth -= 1
+        task.started_at = time.monotonic()
+        wait_time = task.started_at - task.queued_at
+        self.stats['wait_time'] += wait_time
+        self.stats['max_wait_time'] = max(
+            self.stats['max_wait_time'], wait_time
+        )
+        self.current_task = task
+
         promise = task.promise.then(self._run_next_promise_locked)
         promise.catch(task._on_error, self.hide_uncatched)
         promise.schedule()
 
+    def _on_task_done(self, task):
+        run_time = time.monotonic() - task.started_at
+        self.stats['failed' if task.failed else 'done'] += 1
+        self.stats['run_time'] += run_time
+        self.stats['max_run_time'] = max(self.stats['max_run_time'], run_time)
+
     def _run_next_promise_locked(self, *args, **kwargs):
         with self.lock:
+            if self.current_task is not None:
+                self._on_task_done(self.current_task)
+                self.current_task = None
             self._run_next_promise()
 
     def cancel(self, promise):
         try:
             with self.lock:
                 task = self.all_tasks[promise]
+                if task.active:
+                    self.depth -= 1
+                    self.stats['cancelled'] += 1
                 task.active = False
         except KeyError:
             LOGGER.debug(
@@ -103,19 +177,35 @@ class WorkQueue(object):
     def cancel_all(self):
         # reset the queue
         with self.lock:
+            self.stats['cancelled'] += self.depth
+            self.depth = 0
             self.queue = []
             self.all_tasks = {}
 
+    def get_stats(self):
+        with self.lock:
+            out = dict(self.stats)
+            out['depth'] = self.depth
+            out['running'] = self.running
+        return out
+
 
 class Plugin(PluginBase):
     def __init__(self):
         self.queues = {}
 
     def get_interfaces(self):
-        return ['work_queue']
+        return [
+            'bug_report_attachments',
+            'work_queue',
+        ]
 
     def get_deps(self):
         return [
+            {
+                'interface': 'fs',
+                'defaults': ['openpaperwork_core.fs.python'],
+            },
             {
                'interface': 'mainloop',
                'defaults': ['openpaperwork_core.mainloop.asyncio'],
@@ -151,6 +241,61 @@ class Plugin(PluginBase):
         self.queues[queue_name].cancel_all()
         return True
 
+    def work_queue_set_provenance(self, sampling, queue_name=None):
+        """
+        Capture the stack of the caller for one task out of `sampling`
+        queued in the given queue (or in all the queues if queue_name is
+        None). 0 = never, 1 = always.
+        """
+        if queue_name is None:
+            queues = self.queues.values()
+        elif queue_name in self.queues:
+            queues = [self.queues[queue_name]]
+        else:
+            return None
+        for queue in queues:
+            queue.provenance_sampling = sampling
+        return True
+
+    def work_queue_get_stats(self, out: dict):
+        """
+        For each work queue: number of tasks queued, done, failed and
+        cancelled, current and maximum depth of the queue, and time spent
+        by the tasks waiting in the queue and running (seconds).
+        """
+        for (queue_name, queue) in self.queues.items():
+            out[queue_name] = queue.get_stats()
+        return out
+
+    def bug_report_get_attachments(self, out: dict):
+        out['work_queues'] = {
+            'include_by_default': False,
+            'date': None,
+            'file_type': _("Work queues statistics"),
+            'file_url': _("Select to generate"),
+            'file_size': 0,
+        }
+
+    def on_bug_report_attachment_selected(self, attachment_id, *args):
+        if attachment_id != 'work_queues':
+            return
+        stats = json.dumps(
+            self.work_queue_get_stats({}),
+            indent=4, separators=(",", ": "), sort_keys=True
+        )
+        (file_url, fd) = self.core.call_success(
+            "fs_mktemp", prefix="work_queues_", suffix=".json", mode="w",
+            on_disk=True
+        )
+        with fd:
+            fd.write(stats)
+        self.core.call_all(
+            "bug_report_update_attachment", attachment_id, {
+                'file_url': file_url,
+                'file_size': self.core.call_success("fs_getsize", file_url),
+            }, *args
+        )
+
     def mainloop_quit(self):
         # violent quit (does it ever happen ?)
         for queue in self.queues.values():
@@ -0,0 +1,121 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import openpaperwork_core
+import openpaperwork_core.fs
+
+
+class TestHashCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="openpaperwork_core_tests")
+
+        class FakeModule(object):
+            class Plugin(openpaperwork_core.PluginBase):
+                PRIORITY = 999999999999999999999
+
+                def get_interfaces(s):
+                    return ['paths']
+
+                def paths_get_data_dir(s):
+                    return openpaperwork_core.fs.CommonFsPluginBase.fs_safe(
+                        self.tmp_dir
+                    )
+
+        self.fake_module = FakeModule
+        self.core = self._make_core(FakeModule)
+
+        self.file_path = os.path.join(self.tmp_dir, "some_file.txt")
+        self.file_url = self.core.call_success("fs_safe", self.file_path)
+        with open(self.file_path, "w") as fd:
+            fd.write("some content")
+
+    def _make_core(self, fake_module):
+        core = openpaperwork_core.Core(auto_load_dependencies=True)
+        core._load_module("fake_module", fake_module)
+        core.load("openpaperwork_core.fs.python")
+        core.load("openpaperwork_core.mainloop.asyncio")
+        core.load("openpaperwork_core.fs.hash_cache")
+        core.init()
+        return core
+
+    def tearDown(self):
+        self.core.call_all("tests_cleanup")
+        shutil.rmtree(self.tmp_dir)
+
+    def test_hash(self):
+        h = self.core.call_success("fs_hash", self.file_url)
+        self.assertEqual(
+            h, self.core.call_success("fs_hash", self.file_url, cache=False)
+        )
+
+    def test_cached(self):
+        h = self.core.call_success("fs_hash", self.file_url)
+        self.core.call_all("tests_cleanup")
+
+        # same size, same mtime, same inode --> the file must not be read
+        # again, even after a restart
+        st = os.stat(self.file_path)
+        with open(self.file_path, "w") as fd:
+            fd.write("SOME CONTENT")
+        os.utime(self.file_path, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+        self.core = self._make_core(self.fake_module)
+        self.assertEqual(self.core.call_success("fs_hash", self.file_url), h)
+
+    def test_modified(self):
+        h = self.core.call_success("fs_hash", self.file_url)
+        with open(self.file_path, "w") as fd:
+            fd.write("some other content")
+        self.assertNotEqual(
+            self.core.call_success("fs_hash", self.file_url), h
+        )
+
+    def _get_db_urls(self):
+        plugin = self.core.get_by_name("openpaperwork_core.fs.hash_cache")
+        plugin._flush()
+        return [
+            r[0] for r in plugin.sql.execute("SELECT url FROM hashes")
+        ]
+
+    def test_unlink(self):
+        self.core.call_success("fs_hash", self.file_url)
+        self.assertEqual(self._get_db_urls(), [self.file_url])
+
+        self.core.call_success("fs_unlink", self.file_url)
+        self.assertFalse(os.path.exists(self.file_path))
+        self.assertEqual(self._get_db_urls(), [])
+
+    def test_rm_rf(self):
+        dir_path = os.path.join(self.tmp_dir, "some_dir")
+        os.mkdir(dir_path)
+        file_path = os.path.join(dir_path, "some_file.txt")
+        with open(file_path, "w") as fd:
+            fd.write("some content")
+        file_url = self.core.call_success("fs_safe", file_path)
+        self.core.call_success("fs_hash", file_url)
+        self.core.call_success("fs_hash", self.file_url)
+
+        self.core.call_success(
+            "fs_rm_rf", self.core.call_success("fs_safe", dir_path)
+        )
+        self.assertFalse(os.path.exists(dir_path))
+        self.assertEqual(self._get_db_urls(), [self.file_url])
+
+    def test_rename(self):
+        h = self.core.call_success("fs_hash", self.file_url)
+        self._get_db_urls()  # make sure the old entry is in the database
+
+        new_path = os.path.join(self.tmp_dir, "some_other_file.txt")
+        new_url = self.core.call_success("fs_safe", new_path)
+        self.core.call_success("fs_rename", self.file_url, new_url)
+        self.assertEqual(self._get_db_urls(), [new_url])
+
+        # the entry has been moved: same size, same mtime, same inode -->
+        # the file must not be read again
+        st = os.stat(new_path)
+        with open(new_path, "w") as fd:
+            fd.write("SOME CONTENT")
+        os.utime(new_path, ns=(st.st_atime_ns, st.st_mtime_ns))
+        self.assertEqual(self.core.call_success("fs_hash", new_url), h)
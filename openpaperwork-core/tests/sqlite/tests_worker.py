@@ -0,0 +1,101 @@
+import shutil
+import tempfile
+import threading
+import unittest
+
+import openpaperwork_core
+import openpaperwork_core.fs
+
+
+class TestSqliteWorker(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="openpaperwork_core_tests")
+
+        self.core = openpaperwork_core.Core(auto_load_dependencies=True)
+        self.core.load("openpaperwork_core.fs.python")
+        self.core.load("openpaperwork_core.sqlite.worker")
+        self.core.init()
+
+        self.db_url = self.core.call_success(
+            "fs_join",
+            openpaperwork_core.fs.CommonFsPluginBase.fs_safe(self.tmp_dir),
+            "test.db"
+        )
+        self.sql = self.core.call_one(
+            "sqlite_execute", self.core.call_success, "sqlite_open",
+            self.db_url
+        )
+        self.core.call_one(
+            "sqlite_execute", self.sql.execute,
+            "CREATE TABLE test (key TEXT PRIMARY KEY, value INTEGER)"
+        )
+
+    def tearDown(self):
+        self.core.call_one(
+            "sqlite_execute", self.core.call_success, "sqlite_close", self.sql
+        )
+        self.core.call_all("tests_cleanup")
+        shutil.rmtree(self.tmp_dir)
+
+    def _get_all(self):
+        return self.core.call_one(
+            "sqlite_execute",
+            lambda: list(self.sql.execute(
+                "SELECT key, value FROM test ORDER BY key"
+            ))
+        )
+
+    def test_execute(self):
+        main_thread = threading.current_thread()
+        threads = []
+
+        def insert(key, value):
+            threads.append(threading.current_thread())
+            self.sql.execute(
+                "INSERT INTO test (key, value) VALUES (?, ?)", (key, value)
+            )
+            return value
+
+        r = self.core.call_one("sqlite_execute", insert, "a", 1)
+        self.assertEqual(r, 1)
+        r = self.core.call_one("sqlite_execute", insert, key="b", value=2)
+        self.assertEqual(r, 2)
+
+        self.assertEqual(self._get_all(), [("a", 1), ("b", 2)])
+        self.assertEqual(len(threads), 2)
+        self.assertIs(threads[0], threads[1])
+        self.assertIsNot(threads[0], main_thread)
+
+    def test_exception(self):
+        with self.assertRaises(Exception):
+            self.core.call_one(
+                "sqlite_execute", self.sql.execute, "SELECT * FROM nope"
+            )
+        # the database thread must still be usable
+        self.assertEqual(self._get_all(), [])
+
+    def test_schedule(self):
+        for x in range(0, 10):
+            self.core.call_one(
+                "sqlite_schedule", self.sql.execute,
+                "INSERT INTO test (key, value) VALUES (?, ?)",
+                ("key{}".format(x), x)
+            )
+        # requests are run in order: this one can only run once all the
+        # others have been run
+        self.assertEqual(len(self._get_all()), 10)
+
+    def test_other_threads(self):
+        # connections must be usable from other threads too
+        self.sql.execute(
+            "INSERT INTO test (key, value) VALUES (?, ?)", ("a", 1)
+        )
+        self.assertEqual(self._get_all(), [("a", 1)])
+
+    def test_restart(self):
+        self.core.call_all("on_quit")
+        self.core.call_one(
+            "sqlite_execute", self.sql.execute,
+            "INSERT INTO test (key, value) VALUES (?, ?)", ("a", 1)
+        )
+        self.assertEqual(self._get_all(), [("a", 1)])
@@ -1,3 +1,5 @@
+import os
+import time
 import unittest
 import unittest.mock
 
@@ -378,3 +380,78 @@ class TestDependencies(unittest.TestCase):
         self.assertFalse(self.init_called)
         self.assertRaises(KeyError, core.get_by_name, 'module_a')
         self.assertRaises(KeyError, core.get_by_name, 'module_b')
+
+
+class TestDispatch(unittest.TestCase):
+    NB_CALLS = 100000
+
+    def _get_core(self, debug):
+        class TestModuleA(object):
+            class Plugin(openpaperwork_core.PluginBase):
+                PRIORITY = 10
+
+                def single(s, value):
+                    return value + 1
+
+                def multiple(s, value):
+                    return None
+
+                def observed(s, out: list):
+                    out.append('a')
+
+        class TestModuleB(object):
+            class Plugin(openpaperwork_core.PluginBase):
+                def multiple(s, value):
+                    return value + 2
+
+                def observed(s, out: list):
+                    out.append('b')
+
+        core = openpaperwork_core.Core(auto_load_dependencies=True)
+        core._load_module('module_a', TestModuleA())
+        core._load_module('module_b', TestModuleB())
+        core.init()
+        if debug:
+            # enable the call limit (without really limiting anything):
+            # the core will use the slow path
+            core.count_limit_per_second = self.NB_CALLS * 10
+            core._debug_calls = True
+        return core
+
+    def test_same_results(self):
+        for debug in (False, True):
+            core = self._get_core(debug)
+            self.assertEqual(core.call_success("single", 1), 2)
+            self.assertEqual(core.call_one("single", 1), 2)
+            self.assertEqual(core.call_success("multiple", 1), 3)
+            self.assertIsNone(core.call_one("multiple", 1))
+            out = []
+            self.assertEqual(core.call_all("observed", out), 2)
+            self.assertEqual(out, ['a', 'b'])
+            self.assertEqual(core.call_all("on_nothing"), 0)
+            self.assertIsNone(core.call_success("nothing"))
+            self.assertRaises(IndexError, core.call_one, "nothing")
+
+    def _benchmark(self, core):
+        start = time.perf_counter()
+        for _ in range(0, self.NB_CALLS):
+            core.call_success("single", 1)
+            core.call_success("multiple", 1)
+            core.call_one("single", 1)
+        return time.perf_counter() - start
+
+    @unittest.skipUnless(
+        os.environ.get("OPENPAPERWORK_BENCHMARK"),
+        reason="Benchmark: set OPENPAPERWORK_BENCHMARK=1 to run it"
+    )
+    def test_benchmark(self):
+        # micro-benchmark: the compiled dispatch tables must be faster than
+        # the debug path (that looks up the callbacks on each call)
+        fast = min(self._benchmark(self._get_core(False)) for _ in range(3))
+        slow = min(self._benchmark(self._get_core(True)) for _ in range(3))
+        print(
+            "Dispatch: {} calls: {:.3f}s (debug path: {:.3f}s)".format(
+                3 * self.NB_CALLS, fast, slow
+            )
+        )
+        self.assertLess(fast, slow)
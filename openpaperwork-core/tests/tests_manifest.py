@@ -0,0 +1,253 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import openpaperwork_core
+import openpaperwork_core.manifest
+
+
+MODULES = {
+    # lazy: nothing to initialize
+    "lazy_test_a": """
+import openpaperwork_core
+
+INIT_CALLED = []
+
+
+class Plugin(openpaperwork_core.PluginBase):
+    def get_interfaces(self):
+        return ['interface_a']
+
+    def get_deps(self):
+        return [
+            {
+                'interface': 'interface_b',
+                'defaults': ['lazy_test_b'],
+            },
+        ]
+
+    def test_method_a(self):
+        return self.core.call_success("test_method_b") + 1
+""",
+    # not lazy: does something on init
+    "lazy_test_b": """
+import openpaperwork_core
+
+INIT_CALLED = []
+
+
+class Plugin(openpaperwork_core.PluginBase):
+    def get_interfaces(self):
+        return ['interface_b']
+
+    def init(self, core):
+        super().init(core)
+        INIT_CALLED.append(True)
+
+    def test_method_b(self):
+        return 1
+""",
+    # explicitly lazy, even though it does something on init
+    "lazy_test_c": """
+import openpaperwork_core
+
+INIT_CALLED = []
+
+
+class Plugin(openpaperwork_core.PluginBase):
+    LAZY = True
+
+    def get_interfaces(self):
+        return ['interface_c']
+
+    def get_deps(self):
+        return [
+            {
+                'interface': 'interface_a',
+                'defaults': ['lazy_test_a'],
+            },
+        ]
+
+    def init(self, core):
+        super().init(core)
+        INIT_CALLED.append(True)
+
+    def test_method_c(self):
+        return 3
+""",
+    # not lazy: observer
+    "lazy_test_d": """
+import openpaperwork_core
+
+OBSERVED = []
+
+
+class Plugin(openpaperwork_core.PluginBase):
+    def on_something(self):
+        OBSERVED.append(True)
+""",
+}
+
+
+class TestLazyLoading(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="openpaperwork_core_tests")
+        for (module_name, content) in MODULES.items():
+            path = os.path.join(self.tmp_dir, module_name + ".py")
+            with open(path, "w") as fd:
+                fd.write(content)
+        sys.path.insert(0, self.tmp_dir)
+        self.manifest_path = os.path.join(self.tmp_dir, "manifest.json")
+
+    def tearDown(self):
+        sys.path.remove(self.tmp_dir)
+        self._unload_modules()
+        shutil.rmtree(self.tmp_dir)
+
+    def _unload_modules(self):
+        for module_name in MODULES.keys():
+            sys.modules.pop(module_name, None)
+
+    def _get_core(self):
+        core = openpaperwork_core.Core()
+        core.enable_lazy_loading(
+            openpaperwork_core.manifest.PluginManifest(self.manifest_path)
+        )
+        for module_name in sorted(MODULES.keys()):
+            core.load(module_name)
+        core.init()
+        core.manifest.save()
+        return core
+
+    def test_manifest(self):
+        self._get_core()
+        manifest = openpaperwork_core.manifest.PluginManifest(
+            self.manifest_path
+        )
+        self.assertTrue(manifest.get("lazy_test_a")['lazy'])
+        self.assertFalse(manifest.get("lazy_test_b")['lazy'])
+        self.assertTrue(manifest.get("lazy_test_c")['lazy'])
+        self.assertFalse(manifest.get("lazy_test_d")['lazy'])
+        self.assertEqual(
+            manifest.get("lazy_test_a")['interfaces'], ['interface_a']
+        )
+        self.assertEqual(
+            manifest.get("lazy_test_a")['callbacks'], ['test_method_a']
+        )
+
+        # the module has been modified --> entry is outdated
+        path = os.path.join(self.tmp_dir, "lazy_test_a.py")
+        st = os.stat(path)
+        os.utime(path, (st.st_atime + 10, st.st_mtime + 10))
+        self.assertIsNone(manifest.get("lazy_test_a"))
+
+    def test_first_run(self):
+        # no manifest yet: everything must be loaded as usual
+        core = self._get_core()
+        for module_name in MODULES.keys():
+            self.assertIn(module_name, sys.modules)
+        self.assertEqual(core.call_success("test_method_a"), 2)
+        self.assertEqual(sys.modules['lazy_test_c'].INIT_CALLED, [True])
+
+    def test_on_demand(self):
+        self._get_core()
+        self._unload_modules()
+
+        core = self._get_core()
+        self.assertNotIn("lazy_test_a", sys.modules)
+        self.assertIn("lazy_test_b", sys.modules)
+        self.assertNotIn("lazy_test_c", sys.modules)
+        self.assertIn("lazy_test_d", sys.modules)
+        self.assertEqual(sys.modules['lazy_test_b'].INIT_CALLED, [True])
+        self.assertCountEqual(core.get_active_plugins(), MODULES.keys())
+
+        # observers are still called
+        core.call_all("on_something")
+        self.assertEqual(sys.modules['lazy_test_d'].OBSERVED, [True])
+
+        # calling a callback loads the plugin
+        self.assertEqual(core.call_success("test_method_a"), 2)
+        self.assertIn("lazy_test_a", sys.modules)
+        self.assertNotIn("lazy_test_c", sys.modules)
+        self.assertEqual(core.call_one("test_method_a"), 2)
+
+        # requesting an interface loads the plugin
+        plugins = core.get_by_interface("interface_c")
+        self.assertEqual(len(plugins), 1)
+        self.assertEqual(sys.modules['lazy_test_c'].INIT_CALLED, [True])
+        self.assertEqual(core.call_all("test_method_c"), 1)
+
+    def test_lazy_dependency(self):
+        self._get_core()
+        self._unload_modules()
+
+        core = self._get_core()
+        # the dependencies loaded on demand are only loaded once used
+        plugins = core.get_by_interface("interface_c")
+        self.assertEqual(len(plugins), 1)
+        self.assertEqual(sys.modules['lazy_test_c'].INIT_CALLED, [True])
+        self.assertNotIn("lazy_test_a", sys.modules)
+        self.assertEqual(core.call_success("test_method_a"), 2)
+        self.assertIn("lazy_test_a", sys.modules)
+
+    def test_stub(self):
+        self._get_core()
+        self._unload_modules()
+
+        core = self._get_core()
+
+        class Stub(openpaperwork_core.PluginBase):
+            def test_method_a(s):
+                return 42
+
+        self.assertTrue(core.add_lazy_stub("lazy_test_a", Stub()))
+        self.assertFalse(core.add_lazy_stub("lazy_test_b", Stub()))
+        self.assertIn("lazy_test_a", core.get_lazy_plugins())
+
+        # the stub is called instead of the plugin
+        self.assertEqual(core.call_success("test_method_a"), 42)
+        self.assertNotIn("lazy_test_a", sys.modules)
+
+        # once the plugin is loaded, the stub is dropped
+        core.get_by_name("lazy_test_a")
+        self.assertNotIn("lazy_test_a", core.get_lazy_plugins())
+        self.assertEqual(core.call_all("test_method_a"), 1)
+        self.assertEqual(core.call_success("test_method_a"), 2)
+
+    def test_data(self):
+        self._get_core()
+        manifest = openpaperwork_core.manifest.PluginManifest(
+            self.manifest_path
+        )
+        self.assertIsNone(manifest.get_data("lazy_test_a", "test"))
+        self.assertTrue(manifest.set_data("lazy_test_a", "test", [1, 2]))
+        manifest.save()
+
+        manifest = openpaperwork_core.manifest.PluginManifest(
+            self.manifest_path
+        )
+        self.assertEqual(manifest.get_data("lazy_test_a", "test"), [1, 2])
+
+        # the module has been modified --> data are outdated
+        path = os.path.join(self.tmp_dir, "lazy_test_a.py")
+        st = os.stat(path)
+        os.utime(path, (st.st_atime + 10, st.st_mtime + 10))
+        self.assertIsNone(manifest.get_data("lazy_test_a", "test"))
+
+    def test_missing_dependency(self):
+        self._get_core()
+        self._unload_modules()
+
+        core = openpaperwork_core.Core()
+        core.enable_lazy_loading(
+            openpaperwork_core.manifest.PluginManifest(self.manifest_path)
+        )
+        # 'lazy_test_a' is missing
+        core.load("lazy_test_c")
+        core.load("lazy_test_d")
+        core.init()
+        self.assertNotIn("lazy_test_c", core.get_active_plugins())
+        self.assertIsNone(core.call_success("test_method_c"))
+        self.assertNotIn("lazy_test_c", sys.modules)
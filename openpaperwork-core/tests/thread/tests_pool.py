@@ -1,6 +1,118 @@
+import collections
+import threading
+import unittest
+
+import openpaperwork_core
+import openpaperwork_core.thread.pool
 import openpaperwork_core.thread.tests
 
+from openpaperwork_core.thread import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_BULK,
+    PRIORITY_INTERACTIVE
+)
+
 
 class TestThread(openpaperwork_core.thread.tests.AbstractTestThread):
     def get_plugin_name(self):
         return "openpaperwork_core.thread.pool"
+
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        self.core = openpaperwork_core.Core(auto_load_dependencies=True)
+        self.core._load_module(
+            "dummy_mainloop", openpaperwork_core.thread.tests.DummyMainloop()
+        )
+        self.core.load("openpaperwork_core.thread.pool")
+        self.core.init()
+        self.plugin = self.core.get_by_name("openpaperwork_core.thread.pool")
+
+        self.lock = threading.Lock()
+        self.running = collections.Counter()
+        self.max_running = collections.Counter()
+        self.order = []
+        self.started = threading.Semaphore(value=0)
+        self.done = threading.Semaphore(value=0)
+
+    def tearDown(self):
+        self.core.call_all("on_mainloop_quit")
+
+    def _task(self, priority, name, event=None):
+        with self.lock:
+            self.order.append(name)
+            self.running[priority] += 1
+            self.max_running[priority] = max(
+                self.max_running[priority], self.running[priority]
+            )
+        self.started.release()
+        if event is not None:
+            event.wait()
+        with self.lock:
+            self.running[priority] -= 1
+        self.done.release()
+
+    def _start(self, priority, name, event=None):
+        self.core.call_one(
+            "thread_start_prio", priority, self._task, priority, name, event
+        )
+
+    def test_limits(self):
+        self.plugin.max_threads = 4
+        self.plugin.limits = openpaperwork_core.thread.pool.get_default_limits(
+            4
+        )
+        bulk_event = threading.Event()
+        interactive_event = threading.Event()
+
+        for idx in range(0, 6):
+            self._start(PRIORITY_BULK, "bulk_{}".format(idx), bulk_event)
+        for _ in range(0, 2):
+            self.started.acquire()
+        # bulk tasks can't use all the threads: the interactive ones can
+        # still run
+        for idx in range(0, 2):
+            self._start(
+                PRIORITY_INTERACTIVE, "interactive_{}".format(idx),
+                interactive_event
+            )
+        interactive_event.set()
+        for _ in range(0, 2):
+            self.done.acquire()
+
+        counters = {}
+        self.core.call_all("perfcheck_get_counters", counters)
+        self.assertEqual(counters['thread_pool_bulk_running'], 2)
+        self.assertEqual(counters['thread_pool_bulk_pending'], 4)
+        self.assertEqual(counters['thread_pool_interactive_done'], 2)
+
+        bulk_event.set()
+        for _ in range(0, 6):
+            self.done.acquire()
+
+        self.assertEqual(self.max_running[PRIORITY_BULK], 2)
+        counters = {}
+        self.core.call_all("perfcheck_get_counters", counters)
+        self.assertEqual(counters['thread_pool_bulk_done'], 6)
+        self.assertEqual(counters['thread_pool_bulk_queued'], 6)
+        self.assertIn('thread_pool_utilization', counters)
+
+    def test_priorities(self):
+        self.plugin.max_threads = 1
+        self.plugin.limits = openpaperwork_core.thread.pool.get_default_limits(
+            1
+        )
+        event = threading.Event()
+
+        # keep the only thread busy while we queue the other tasks
+        self._start(PRIORITY_INTERACTIVE, "first", event)
+        self._start(PRIORITY_BULK, "bulk")
+        self._start(PRIORITY_BACKGROUND, "background")
+        self._start(PRIORITY_INTERACTIVE, "interactive")
+        event.set()
+        for _ in range(0, 4):
+            self.done.acquire()
+
+        self.assertEqual(
+            self.order, ["first", "interactive", "background", "bulk"]
+        )
@@ -189,3 +189,94 @@ class TestQueue(unittest.TestCase):
         self.assertTrue(self.task_a_done)
         self.assertTrue(self.task_b_done)
         self.assertTrue(self.task_d_done)
+
+    def test_stats(self):
+        def do_task():
+            pass
+
+        def do_failing_task():
+            raise Exception("Test exception. May be normal. Do not panic :-)")
+
+        def do_cancelled_task():
+            self.assertTrue(False)
+
+        cancelled = openpaperwork_core.promise.Promise(
+            self.core, do_cancelled_task
+        )
+
+        self.core.call_all(
+            "work_queue_create", "some_work_queue", hide_uncatched=True
+        )
+        self.core.call_one(
+            "work_queue_add_promise", "some_work_queue",
+            openpaperwork_core.promise.Promise(self.core, do_task)
+        )
+        self.core.call_one(
+            "work_queue_add_promise", "some_work_queue",
+            openpaperwork_core.promise.Promise(
+                self.core, do_failing_task, hide_caught_exceptions=True
+            )
+        )
+        self.core.call_one(
+            "work_queue_add_promise", "some_work_queue", cancelled
+        )
+        self.core.call_one(
+            "work_queue_add_promise", "some_work_queue",
+            openpaperwork_core.promise.Promise(self.core, do_task)
+        )
+        self.core.call_all("work_queue_cancel", "some_work_queue", cancelled)
+
+        stats = self.core.call_success("work_queue_get_stats", {})
+        stats = stats['some_work_queue']
+        self.assertEqual(stats['queued'], 4)
+        self.assertEqual(stats['cancelled'], 1)
+        # the first task has already been popped
+        self.assertEqual(stats['depth'], 2)
+        self.assertEqual(stats['max_depth'], 3)
+
+        self.core.call_all("mainloop_quit_graceful")
+        self.core.call_one(
+            "mainloop", halt_on_uncaught_exception=False, log_uncaught=False
+        )
+
+        stats = self.core.call_success("work_queue_get_stats", {})
+        stats = stats['some_work_queue']
+        self.assertEqual(stats['queued'], 4)
+        self.assertEqual(stats['done'], 2)
+        self.assertEqual(stats['failed'], 1)
+        self.assertEqual(stats['cancelled'], 1)
+        self.assertEqual(stats['depth'], 0)
+        self.assertFalse(stats['running'])
+        self.assertGreater(stats['wait_time'], 0)
+        self.assertGreater(stats['run_time'], 0)
+
+    def test_provenance(self):
+        self.core.call_all("work_queue_create", "some_work_queue")
+        queue = self.core.get_by_name(
+            "openpaperwork_core.work_queue.default"
+        ).queues['some_work_queue']
+
+        # not captured by default
+        promise_a = openpaperwork_core.promise.Promise(self.core, lambda: 0)
+        queue.running = True  # keep the tasks in the queue
+        self.core.call_one(
+            "work_queue_add_promise", "some_work_queue", promise_a
+        )
+        self.assertIsNone(queue.all_tasks[promise_a].created_by)
+
+        self.core.call_all("work_queue_set_provenance", 2)
+        promises = [
+            openpaperwork_core.promise.Promise(self.core, lambda: 0)
+            for _ in range(0, 4)
+        ]
+        for promise in promises:
+            self.core.call_one(
+                "work_queue_add_promise", "some_work_queue", promise
+            )
+        self.assertEqual(
+            [
+                queue.all_tasks[promise].created_by is not None
+                for promise in promises
+            ],
+            [True, False, True, False]
+        )
@@ -69,6 +69,7 @@ DEFAULT_PLUGINS = (
         'paperwork_backend.model.img',
         'paperwork_backend.model.img_overlay',
         'paperwork_backend.model.labels',
+        'paperwork_backend.model.labels_catalogue',
         'paperwork_backend.model.pdf',
         'paperwork_backend.model.thumbnail',
         'paperwork_backend.model.workdir',
@@ -34,6 +34,7 @@ There are pipes dedicated to expanding unexpanded data (see docexport.generic).
 import enum
 
 import openpaperwork_core
+import openpaperwork_core.thread
 
 
 class ExportDataType(enum.Enum):
@@ -256,7 +257,10 @@ class AbstractSimpleTransformExportPipe(AbstractExportPipe):
 
             return input_data
 
-        return openpaperwork_core.promise.ThreadedPromise(self.core, func=do)
+        return openpaperwork_core.promise.ThreadedPromise(
+            self.core, func=do,
+            priority=openpaperwork_core.thread.PRIORITY_BULK
+        )
 
 
 class AbstractExportPipePlugin(openpaperwork_core.PluginBase):
@@ -0,0 +1,152 @@
+"""
+Measure the PDF export throughput (pages/minute) depending on the number of
+threads loading and resizing the pages. A temporary document is generated
+with pages looking like real scans (text and noise, see
+`docscan.fake.generate_page()`).
+
+To use it:
+
+```sh
+paperwork-cli plugins add paperwork_backend.docexport.benchmark
+paperwork-cli benchmark_export --pages 50 --workers 1,2,4
+```
+"""
+
+import shutil
+import tempfile
+import time
+
+import openpaperwork_core
+import openpaperwork_core.promise
+
+from . import ExportData
+from ..docscan import fake
+
+
+DEFAULT_NB_PAGES = 20
+DEFAULT_WORKERS = "1,2,4"
+# A4 at 300dpi
+DEFAULT_PAGE_SIZE = "2480x3508"
+
+
+class Plugin(openpaperwork_core.PluginBase):
+    def __init__(self):
+        super().__init__()
+        self.interactive = False
+
+    def get_interfaces(self):
+        return [
+            'shell',
+        ]
+
+    def get_deps(self):
+        return [
+            {
+                'interface': 'export_pipes',
+                'defaults': [
+                    'paperwork_backend.docexport.img',
+                    'paperwork_backend.docexport.pdf',
+                ],
+            },
+            {
+                'interface': 'page_img',
+                'defaults': ['paperwork_backend.model.img'],
+            },
+            {
+                'interface': 'pillow',
+                'defaults': ['openpaperwork_core.pillow.img'],
+            },
+        ]
+
+    def cmd_set_interactive(self, interactive):
+        self.interactive = interactive
+
+    def cmd_complete_argparse(self, parser):
+        p = parser.add_parser('benchmark_export')
+        p.add_argument(
+            '--pages', '-p', type=int, default=DEFAULT_NB_PAGES,
+            help="Number of pages to export for each worker count"
+        )
+        p.add_argument(
+            '--workers', '-w', type=str, default=DEFAULT_WORKERS,
+            help="Comma-separated list of worker counts to try"
+        )
+        p.add_argument(
+            '--size', '-s', type=str, default=DEFAULT_PAGE_SIZE,
+            help="Size of the pages (WIDTHxHEIGHT)"
+        )
+
+    def _make_doc(self, doc_url, nb_pages, size):
+        img = fake.generate_page(size)
+        for page_idx in range(0, nb_pages):
+            page_url = self.core.call_success(
+                "page_get_img_url", doc_url, page_idx, write=True
+            )
+            self.core.call_success("pillow_to_url", img, page_url)
+
+    def _export(self, doc_url, nb_pages, target_file_url):
+        result = []
+
+        def origin():
+            return ExportData.build_pages(
+                "benchmark", doc_url, range(0, nb_pages)
+            )
+
+        promise = openpaperwork_core.promise.Promise(self.core, origin)
+        for pipe_name in ("img_boxes", "generated_pdf"):
+            pipe = self.core.call_success("export_get_pipe_by_name", pipe_name)
+            promise = promise.then(
+                pipe.get_promise(
+                    result='final', target_file_url=target_file_url
+                )
+            )
+        promise = promise.then(result.extend)
+        self.core.call_one("mainloop_schedule", promise.schedule)
+        self.core.call_all("mainloop_quit_graceful")
+        self.core.call_one("mainloop")
+        return result
+
+    def cmd_run(self, args):
+        if args.command != 'benchmark_export':
+            return None
+
+        size = tuple(int(x) for x in args.size.split("x"))
+        workers = [int(w) for w in args.workers.split(",")]
+        pipe = self.core.call_success(
+            "export_get_pipe_by_name", "generated_pdf"
+        )
+
+        out = {}
+        tmp_dir = tempfile.mkdtemp(prefix="paperwork_benchmark_export")
+        try:
+            doc_url = self.core.call_success(
+                "fs_join", self.core.call_success("fs_safe", tmp_dir), "doc"
+            )
+            self._make_doc(doc_url, args.pages, size)
+            target_file_url = self.core.call_success(
+                "fs_join", self.core.call_success("fs_safe", tmp_dir),
+                "out.pdf"
+            )
+
+            for nb_workers in workers:
+                pipe.nb_workers = nb_workers
+                pipe.max_prefetch = 2 * nb_workers
+                start = time.time()
+                files = self._export(doc_url, args.pages, target_file_url)
+                stop = time.time()
+                assert len(files) == 1
+
+                pages_per_minute = args.pages * 60 / (stop - start)
+                out[nb_workers] = pages_per_minute
+                if self.interactive:
+                    print(
+                        "{} workers: {} pages in {:.3f}s: {:.1f} pages/min"
+                        .format(
+                            nb_workers, args.pages, stop - start,
+                            pages_per_minute
+                        )
+                    )
+        finally:
+            shutil.rmtree(tmp_dir)
+
+        return out
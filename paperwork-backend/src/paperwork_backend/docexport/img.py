@@ -1,7 +1,9 @@
 import logging
+import threading
 
 import openpaperwork_core
 import openpaperwork_core.promise
+import openpaperwork_core.thread
 
 
 from . import (
@@ -17,12 +19,47 @@ from .. import _
 LOGGER = logging.getLogger(__name__)
 
 
+class ExportProgress(object):
+    """
+    Progress of the export of a set of pages. Pages may be loaded in
+    parallel and out of order (see `docexport.pdf`): the progression only
+    reports the number of pages already loaded, so it never goes backward,
+    and the export is reported as done once all of them are loaded.
+    """
+    def __init__(self, core, total_pages):
+        self.core = core
+        self.total_pages = total_pages
+        self.nb_done = 0
+        self.lock = threading.Lock()
+
+    def _notify(self, *args):
+        self.core.call_success(
+            "mainloop_schedule", self.core.call_all,
+            "on_progress", "export", *args
+        )
+
+    def page_start(self, doc_id, page_idx):
+        with self.lock:
+            self._notify(
+                self.nb_done / self.total_pages,
+                _("Exporting {doc_id} p{page_idx} ...").format(
+                    doc_id=doc_id, page_idx=(page_idx + 1)
+                )
+            )
+
+    def page_done(self):
+        with self.lock:
+            self.nb_done += 1
+            if self.nb_done >= self.total_pages:
+                self._notify(1.0)
+
+
 class ExportDataPage(ExportData):
     """
     Page images takes a lot of memory --> we only load them when actually
     requested.
     """
-    def __init__(self, core, doc_id, doc_url, page_idx, progress, final=False):
+    def __init__(self, core, doc_id, doc_url, page_idx, progress):
         super().__init__(ExportDataType.PAGE, page_idx)
         self.expanded = True
 
@@ -31,17 +68,9 @@ class ExportDataPage(ExportData):
         self.doc_url = doc_url
         self.page_idx = page_idx
         self.progress = progress
-        self.final = final
 
     def get_children(self):
-        # ASSSUMPTION(Jflesch): pages are always requested sequentially
-        self.core.call_success(
-            "mainloop_schedule", self.core.call_all,
-            "on_progress", "export", self.progress,
-            _("Exporting {doc_id} p{page_idx} ...").format(
-                doc_id=self.doc_id, page_idx=(self.page_idx + 1)
-            )
-        )
+        self.progress.page_start(self.doc_id, self.page_idx)
 
         page_url = (self.core.call_success(
             "page_get_img_url", self.doc_url, self.page_idx
@@ -54,11 +83,7 @@ class ExportDataPage(ExportData):
 
         yield ExportData(ExportDataType.IMG_BOXES, (img, boxes))
 
-        if self.final:
-            self.core.call_success(
-                "mainloop_schedule", self.core.call_all,
-                "on_progress", "export", 1.0
-            )
+        self.progress.page_done()
 
 
 class DocToPillowBoxesExportPipe(AbstractExportPipe):
@@ -91,29 +116,25 @@ class DocToPillowBoxesExportPipe(AbstractExportPipe):
                 assert doc.expanded
                 total_pages += len(doc.get_children())
 
-            nb_pages = 0
-            last_page = None
+            progress = ExportProgress(self.core, total_pages)
             for (doc_set, doc) in docs:
                 assert doc.expanded
 
                 # replace the document page list by objects that will
                 # generate their children (img+boxes) on-the-fly.
-                new_pages = [
+                doc.set_children([
                     ExportDataPage(
                         self.core, doc.data[0], doc.data[1], page.data,
-                        (nb_pages + idx) / total_pages
+                        progress
                     )
-                    for (idx, page) in enumerate(doc.get_children())
-                ]
-                doc.set_children(new_pages)
-                nb_pages += len(new_pages)
-                last_page = new_pages[-1]
-            last_page.final = True
+                    for page in doc.get_children()
+                ])
 
             return input_data
 
         promise = openpaperwork_core.promise.ThreadedPromise(
-            self.core, to_img_and_boxes
+            self.core, to_img_and_boxes,
+            priority=openpaperwork_core.thread.PRIORITY_BULK
         )
         return promise
 
@@ -161,7 +182,8 @@ class PageToImageExportPipe(AbstractExportPipe):
 
         return openpaperwork_core.promise.ThreadedPromise(
             self.core, page_to_image,
-            kwargs={'target_file_url': target_file_url}
+            kwargs={'target_file_url': target_file_url},
+            priority=openpaperwork_core.thread.PRIORITY_BULK
         )
 
     def get_output_mime(self):
@@ -1,5 +1,6 @@
+import collections
 import logging
-import time
+import os
 
 import PIL
 import PIL.Image
@@ -7,6 +8,7 @@ import PIL.Image
 import openpaperwork_core
 import openpaperwork_core.deps
 import openpaperwork_core.promise
+import openpaperwork_core.thread
 
 from . import (
     AbstractExportPipe,
@@ -46,6 +48,12 @@ if GI_AVAILABLE:
 
 LOGGER = logging.getLogger(__name__)
 
+# Maximum number of pages being loaded and resized at the same time (the
+# bulk priority class of the thread pool may further limit it)
+DEFAULT_NB_WORKERS = min(4, os.cpu_count() or 1)
+# Maximum number of pages loaded in memory but not yet written in the PDF
+DEFAULT_MAX_PREFETCH = 2 * DEFAULT_NB_WORKERS
+
 
 class PdfDocUrlToPdfUrlExportPipe(AbstractExportPipe):
     """
@@ -216,77 +224,115 @@ class PagesToPdfUrlExportPipe(AbstractExportPipe):
         self.core = core
         self.can_change_quality = True
         self.can_change_page_format = True
+        self.nb_workers = DEFAULT_NB_WORKERS
+        self.max_prefetch = DEFAULT_MAX_PREFETCH
 
     def set_page_format(self, page_format):
         self.page_format = page_format
 
-    def get_promise(self, result='final', target_file_url=None):
-        def do(input_data, target_file_url):
-            if target_file_url is None:
-                (target_file_url, file_desc) = self.core.call_success(
-                    "fs_mktemp", prefix="paperwork-export-", suffix=".pdf",
-                    mode="w", on_disk=True
-                )
-                # we need the file name, not the file descriptor
-                file_desc.close()
-
-            last_doc = None
-            doc_idx = 0
-            out = target_file_url
-            list_img_boxes = input_data.iter(ExportDataType.IMG_BOXES)
-
-            creator = self.core.call_one(
-                "mainloop_execute", PdfCreator,
-                self.core, target_file_url, self.page_format, self.quality
+    def _load_page(self, page):
+        """
+        Run in the thread pool: load the page image and text, and resize
+        the image.
+        """
+        out = []
+        for img_boxes in page.get_children():
+            (img, boxes) = img_boxes.data
+            original_size = img.size
+            img_size = (
+                int(self.quality * original_size[0]),
+                int(self.quality * original_size[1])
+            )
+            img = img.resize(
+                img_size,
+                getattr(PIL.Image, 'Resampling', PIL.Image).LANCZOS
+            )
+            out.append((original_size, img, boxes))
+        return out
+
+    def _iter_loaded_pages(self, list_pages):
+        """
+        Load the pages in bulk tasks of the thread pool, a few pages ahead
+        of the ones being written, and return them in order.
+        """
+        nb_workers = max(1, self.nb_workers)
+        max_prefetch = max(1, self.max_prefetch)
+        pending = collections.deque()
+        try:
+            for (doc_set, (doc, page)) in list_pages:
+                loading = [f for (d, f) in pending if not f.done()]
+                if len(loading) >= nb_workers:
+                    loading[0].wait()
+                pending.append((doc, openpaperwork_core.thread.submit(
+                    self.core, openpaperwork_core.thread.PRIORITY_BULK,
+                    self._load_page, page
+                )))
+                if len(pending) < max_prefetch:
+                    continue
+                (doc, future) = pending.popleft()
+                yield (doc, future.result())
+            while len(pending) > 0:
+                (doc, future) = pending.popleft()
+                yield (doc, future.result())
+        finally:
+            for (doc, future) in pending:
+                future.cancel()
+            for (doc, future) in pending:
+                future.wait()
+
+    def export(self, input_data, target_file_url=None):
+        """
+        Pages are loaded and resized by bulk tasks of the thread pool, while
+        the calling thread writes them in the PDF file(s). Cairo surfaces
+        are only ever used by the calling thread.
+        """
+        if target_file_url is None:
+            (target_file_url, file_desc) = self.core.call_success(
+                "fs_mktemp", prefix="paperwork-export-", suffix=".pdf",
+                mode="w", on_disk=True
             )
+            # we need the file name, not the file descriptor
+            file_desc.close()
 
-            out_files = []
+        last_doc = None
+        doc_idx = 0
+        out = target_file_url
+        list_pages = input_data.iter(ExportDataType.PAGE)
 
-            for (doc_set, (doc, (page, img_boxes))) in list_img_boxes:
+        creator = PdfCreator(
+            self.core, target_file_url, self.page_format, self.quality
+        )
 
-                if doc.data[1] != last_doc and last_doc is not None:
-                    # another doc, another output file, another PDFCreator
-                    self.core.call_one("mainloop_execute", creator.finish)
-                    out_files.append(out)
-                    doc_idx += 1
-                    out = target_file_url.rsplit(".", 1)
-                    out = "{}_{}.{}".format(out[0], doc_idx, out[1])
-                    creator = self.core.call_one(
-                        "mainloop_execute", PdfCreator,
-                        self.core, out, self.page_format, self.quality
-                    )
-                last_doc = doc.data[1]
-
-                # PDFCreator is not thread-safe. We can not keep
-                # the UI blocked for so long --> give some CPU time back to
-                # the UI
-                time.sleep(0.1)
-                (img, boxes) = img_boxes.data
-                self.core.call_one(
-                    "mainloop_execute", creator.set_page_size, img.size
-                )
-                self.core.call_one(
-                    "mainloop_execute", creator.paint_txt, boxes,
-                    img.size
-                )
-                img_size = img.size
-                img_size = (
-                    int(self.quality * img_size[0]),
-                    int(self.quality * img_size[1])
-                )
-                img = img.resize(
-                    img_size,
-                    getattr(PIL.Image, 'Resampling', PIL.Image).LANCZOS
+        out_files = []
+
+        for (doc, page) in self._iter_loaded_pages(list_pages):
+            if doc.data[1] != last_doc and last_doc is not None:
+                # another doc, another output file, another PDFCreator
+                creator.finish()
+                out_files.append(out)
+                doc_idx += 1
+                out = target_file_url.rsplit(".", 1)
+                out = "{}_{}.{}".format(out[0], doc_idx, out[1])
+                creator = PdfCreator(
+                    self.core, out, self.page_format, self.quality
                 )
-                self.core.call_one("mainloop_execute", creator.paint_img, img)
-                self.core.call_one("mainloop_execute", creator.next_page)
+            last_doc = doc.data[1]
 
-            self.core.call_one("mainloop_execute", creator.finish)
-            out_files.append(out)
-            return out_files
+            for (img_size, img, boxes) in page:
+                creator.set_page_size(img_size)
+                creator.paint_txt(boxes, img_size)
+                creator.paint_img(img)
+                creator.next_page()
 
+        creator.finish()
+        out_files.append(out)
+        return out_files
+
+    def get_promise(self, result='final', target_file_url=None):
         return openpaperwork_core.promise.ThreadedPromise(
-            self.core, do, kwargs={'target_file_url': target_file_url}
+            self.core, self.export,
+            kwargs={'target_file_url': target_file_url},
+            priority=openpaperwork_core.thread.PRIORITY_BULK
         )
 
     def get_output_mime(self):
@@ -1,8 +1,12 @@
 import collections
+import logging
 
 import openpaperwork_core.promise
 
 
+LOGGER = logging.getLogger(__name__)
+
+
 class FileImport(object):
     """
     Used as both input and output for importer objects.
@@ -74,14 +78,21 @@ class BaseFileImporter(object):
         return transactions
 
     def _do_transactions(self, transactions, file_import):
-        for doc_id in file_import.new_doc_ids:
+        try:
+            # see sync.BaseTransaction.flush()
+            for transaction in transactions:
+                for doc_id in file_import.new_doc_ids:
+                    transaction.add_doc(doc_id)
+                for doc_id in file_import.upd_doc_ids:
+                    transaction.upd_doc(doc_id)
+                transaction.flush()
             for transaction in transactions:
-                transaction.add_doc(doc_id)
-        for doc_id in file_import.upd_doc_ids:
+                transaction.commit()
+        except Exception as exc:
+            LOGGER.error("Transactions have failed", exc_info=exc)
             for transaction in transactions:
-                transaction.upd_doc(doc_id)
-        for transaction in transactions:
-            transaction.commit()
+                transaction.cancel()
+            raise
 
     def get_import_promise(self, data=None):
         """
@@ -0,0 +1,133 @@
+"""
+Measure the scan-to-disk throughput (pages/minute) depending on the number
+of threads encoding the scanned pages. Pages are generated to look like real
+scans (text and noise, see `fake.generate_page()`), or loaded from an image
+file.
+
+To use it:
+
+```sh
+paperwork-cli plugins add paperwork_backend.docscan.benchmark
+paperwork-cli benchmark_scan --pages 50 --encoders 0,1,2,4 --delay 0.5
+```
+
+0 encoders means pages are written by the thread reading them from the
+scanner (no pipeline).
+"""
+
+import shutil
+import tempfile
+import time
+
+import PIL.Image
+
+import openpaperwork_core
+
+from . import (fake, scan2doc)
+
+
+DEFAULT_NB_PAGES = 20
+DEFAULT_ENCODERS = "0,1,2,4"
+# A4 at 300dpi
+DEFAULT_PAGE_SIZE = "2480x3508"
+
+
+class Plugin(openpaperwork_core.PluginBase):
+    def __init__(self):
+        super().__init__()
+        self.interactive = False
+
+    def get_interfaces(self):
+        return [
+            'shell',
+        ]
+
+    def get_deps(self):
+        return [
+            {
+                'interface': 'fs',
+                'defaults': ['openpaperwork_core.fs.python'],
+            },
+            {
+                'interface': 'page_img',
+                'defaults': ['paperwork_backend.model.img'],
+            },
+            {
+                'interface': 'pillow',
+                'defaults': ['openpaperwork_core.pillow.img'],
+            },
+        ]
+
+    def cmd_set_interactive(self, interactive):
+        self.interactive = interactive
+
+    def cmd_complete_argparse(self, parser):
+        p = parser.add_parser('benchmark_scan')
+        p.add_argument(
+            '--pages', '-p', type=int, default=DEFAULT_NB_PAGES,
+            help="Number of pages to scan for each encoder count"
+        )
+        p.add_argument(
+            '--encoders', '-e', type=str, default=DEFAULT_ENCODERS,
+            help="Comma-separated list of encoder counts to try"
+        )
+        p.add_argument(
+            '--size', '-s', type=str, default=DEFAULT_PAGE_SIZE,
+            help="Size of the generated pages (WIDTHxHEIGHT)"
+        )
+        p.add_argument(
+            '--delay', '-d', type=float, default=0.0,
+            help="Time (seconds) the fake scanner takes to scan a page"
+        )
+        p.add_argument(
+            '--image', '-i', type=str, default=None,
+            help="Image to use instead of the generated pages"
+        )
+
+    def _get_page(self, size, img_path=None):
+        if img_path is None:
+            return fake.generate_page(size)
+        img = PIL.Image.open(img_path)
+        img.load()
+        return img.convert("RGB")
+
+    @staticmethod
+    def _scan(page, nb_pages, delay):
+        for _ in range(0, nb_pages):
+            if delay > 0:
+                time.sleep(delay)
+            # each page is a distinct image, like real scans
+            yield page.copy()
+
+    def cmd_run(self, args):
+        if args.command != 'benchmark_scan':
+            return None
+
+        size = tuple(int(x) for x in args.size.split("x"))
+        page = self._get_page(size, args.image)
+        encoders = [int(e) for e in args.encoders.split(",")]
+
+        out = {}
+        for nb_encoders in encoders:
+            tmp_dir = tempfile.mkdtemp(prefix="paperwork_benchmark_scan")
+            try:
+                doc_url = self.core.call_success("fs_safe", tmp_dir)
+                pipeline = scan2doc.ScanPipeline(
+                    self.core, None, "benchmark", doc_url,
+                    nb_encoders=nb_encoders
+                )
+                start = time.time()
+                nb = pipeline.run(self._scan(page, args.pages, args.delay))
+                stop = time.time()
+            finally:
+                shutil.rmtree(tmp_dir)
+
+            pages_per_minute = nb * 60 / (stop - start)
+            out[nb_encoders] = pages_per_minute
+            if self.interactive:
+                print(
+                    "{} encoders: {} pages in {:.3f}s: {:.1f} pages/min"
+                    .format(nb_encoders, nb, stop - start, pages_per_minute)
+                )
+
+        return out
@@ -1,6 +1,10 @@
 import itertools
+import random
 
 import PIL.Image
+import PIL.ImageChops
+import PIL.ImageDraw
+import PIL.ImageFont
 
 import openpaperwork_core
 import openpaperwork_core.promise
@@ -8,6 +12,45 @@ import openpaperwork_core.promise
 
 SCAN_ID_GENERATOR = itertools.count()
 
+WORDS = (
+    "the invoice amount due payment date account customer number total"
+    " reference contract insurance tax bank statement period address"
+    " services description quantity price balance monthly annual"
+).split()
+
+
+def generate_page(size, seed=0):
+    """
+    Generate an image looking like a scanned page (lines of text, paper
+    and sensor noise), for benchmarks. Uniform pages are compressed and
+    OCR'ed almost for free and don't tell anything about real scans.
+    """
+    rng = random.Random(seed)
+    (width, height) = size
+    font_size = max(height // 70, 8)
+    try:
+        font = PIL.ImageFont.load_default(size=font_size)
+    except TypeError:
+        # Pillow < 10.1: bitmap font only
+        font = PIL.ImageFont.load_default()
+
+    img = PIL.Image.new("RGB", size, (238, 236, 230))
+    draw = PIL.ImageDraw.Draw(img)
+    margin = width // 12
+    y = margin
+    while y < height - margin - font_size:
+        line = " ".join(
+            rng.choice(WORDS) for _ in range(rng.randint(6, 12))
+        )
+        draw.text((margin, y), line, fill=(30, 30, 30), font=font)
+        y += font_size * 3 // 2
+        if rng.random() < 0.1:
+            y += font_size * 2  # paragraph
+
+    # effect_noise() is centered on 128
+    noise = PIL.Image.effect_noise(size, 6).convert("RGB")
+    return PIL.ImageChops.add(img, noise, offset=-128)
+
 
 class Source(object):
     def __init__(self, core, scanner, source_id):
@@ -84,7 +84,7 @@ def raw_to_img(params, img_bytes):
 class ImageAssembler(object):
     MIN_CHUNK_SIZE = 64 * 1024
 
-    def __init__(self, line_width):
+    def __init__(self, line_width, expected_size=0):
         # 'Pieces' are pieces of the images that may or may not contain
         # full lines of pixels (or even partial pixel)
 
@@ -96,33 +96,54 @@ class ImageAssembler(object):
 
         self.w = line_width  # in bytes
 
-        self.current_piece = []
-        self.all_chunks = []
+        # All the pieces are written in a single buffer, allocated once
+        # based on the size announced by the scanner. Chunks and the final
+        # image are memoryviews on this buffer: pieces are never joined.
+        # raw_to_img() still copies them once (PIL stores RGB pixels on 4
+        # bytes, so it can't use a 24 bits RGB buffer as is).
+        self.expected_size = max(expected_size, 0)
+        self.buffer = bytearray(self.expected_size)
+        self.size = 0  # number of bytes actually written in the buffer
+        self.chunk_end = 0  # end of the last chunk (always a full line)
+        self.last_chunk = None
+
+    def _grow(self, min_size):
+        # The scanner sent more than it announced. We can't resize the
+        # buffer in place (the last chunk may still be a memoryview on it),
+        # so we copy it into a bigger one instead.
+        new_size = max(min_size, 2 * len(self.buffer), self.MIN_CHUNK_SIZE)
+        if self.expected_size > 0:
+            LOGGER.warning(
+                "Scan is bigger than expected (%d > %d bytes):"
+                " growing image buffer to %d bytes",
+                min_size, self.expected_size, new_size
+            )
+        buf = bytearray(new_size)
+        buf[:self.size] = memoryview(self.buffer)[:self.size]
+        self.buffer = buf
 
     def add_piece(self, piece):
-        self.current_piece.append(piece)
-        lcurrent_piece = sum((len(c) for c in self.current_piece))
-        if lcurrent_piece < self.w or lcurrent_piece < self.MIN_CHUNK_SIZE:
+        end = self.size + len(piece)
+        if end > len(self.buffer):
+            self._grow(end)
+        self.buffer[self.size:end] = piece
+        self.size = end
+
+        pending = self.size - self.chunk_end
+        if pending < self.w or pending < self.MIN_CHUNK_SIZE:
             return
 
-        current_piece = b"".join(self.current_piece)
-        chunkable = lcurrent_piece - (lcurrent_piece % self.w)
-        new_chunk = current_piece[:chunkable]
-        new_piece = current_piece[chunkable:]
-
-        self.all_chunks.append(new_chunk)
-        if len(new_piece) <= 0:
-            self.current_piece = []
-        else:
-            self.current_piece = [new_piece]
+        chunkable = pending - (pending % self.w)
+        self.last_chunk = memoryview(self.buffer)[
+            self.chunk_end:self.chunk_end + chunkable
+        ]
+        self.chunk_end += chunkable
 
     def get_last_chunk(self):
-        if len(self.all_chunks) <= 0:
-            return None
-        return self.all_chunks[-1]
+        return self.last_chunk
 
     def get_image(self):
-        return b"".join(self.all_chunks) + b"".join(self.current_piece)
+        return memoryview(self.buffer)[:self.size]
 
 
 class Source(object):
@@ -259,7 +280,10 @@ class Source(object):
                     scan_params.get_format()
                     == Libinsane.ImgFormat.RAW_RGB_24
                 )
-                image = ImageAssembler(scan_params.get_width() * 3)
+                image = ImageAssembler(
+                    scan_params.get_width() * 3,
+                    scan_params.get_image_size()
+                )
                 last_chunk = None
                 nb_lines = 0
                 total_lines = scan_params.get_height()
@@ -1,16 +1,177 @@
+import collections
 import logging
+import queue
+import threading
 
 import openpaperwork_core
 import openpaperwork_core.promise
+import openpaperwork_core.thread
 
 
 LOGGER = logging.getLogger(__name__)
 
+# Maximum number of scanned pages being encoded and written at the same time
+# (in bulk tasks of the thread pool). 0 means pages are written by the thread
+# reading them from the scanner (no pipeline).
+DEFAULT_NB_ENCODERS = 2
+# Maximum number of scanned pages waiting to be written. Each of them can
+# be quite big in memory (~26MB for an A4 page scanned at 300dpi in color)
+DEFAULT_MAX_PENDING_PAGES = 4
+
+
+class ScanPipeline(object):
+    """
+    Write scanned pages to a document.
+
+    Acquisition (reading the pages from the scanner), encoding (writing
+    them to disk) and registration (notifying the other plugins, in page
+    order) run in separate stages, so the scanner doesn't have to wait for
+    the disk. The number of pages in-between is bounded: when the encoders
+    fall behind, acquisition waits.
+    """
+    def __init__(
+            self, core, scan_id, doc_id, doc_url,
+            nb_encoders=DEFAULT_NB_ENCODERS,
+            max_pending=DEFAULT_MAX_PENDING_PAGES):
+        self.core = core
+        self.scan_id = scan_id
+        self.doc_id = doc_id
+        self.doc_url = doc_url
+        self.nb_encoders = nb_encoders
+        self.max_pending = max(1, max_pending)
+        self.error = None
+
+    def _get_first_page_idx(self):
+        nb_pages = self.core.call_success(
+            "doc_get_nb_pages_by_url", self.doc_url
+        )
+        if nb_pages is None:
+            nb_pages = 0
+        return nb_pages
+
+    def _encode(self, img, page_idx):
+        page_url = self.core.call_success(
+            "page_get_img_url", self.doc_url, page_idx, write=True
+        )
+        self.core.call_success("pillow_to_url", img, page_url)
+        return page_url
+
+    def _register(self, page_idx):
+        self.core.call_all(
+            "mainloop_schedule", self.core.call_all,
+            "on_scan2doc_page_scanned",
+            self.scan_id, self.doc_id, self.doc_url, page_idx
+        )
+
+    def _delete(self, page_url):
+        LOGGER.info("Removing unregistered page %s", page_url)
+        self.core.call_success("fs_unlink", page_url, trash=False)
+
+    def _discard(self, page_idx, future):
+        """
+        A previous page couldn't be written: this one must not be written
+        either, or it would remain in the document without being registered
+        (and with a hole before it).
+        """
+        if future.cancel():
+            return
+        try:
+            page_url = future.result()
+        except Exception as exc:
+            LOGGER.warning(
+                "Failed to write page %d of %s",
+                page_idx, self.doc_url, exc_info=exc
+            )
+            page_url = self.core.call_success(
+                "page_get_img_url", self.doc_url, page_idx
+            )
+            if page_url is None:
+                return
+        self._delete(page_url)
+
+    def _run_registration(self, pending):
+        while True:
+            item = pending.get()
+            if item is None:
+                break
+            (page_idx, future) = item
+            if self.error is not None:
+                self._discard(page_idx, future)
+                continue
+            try:
+                future.result()
+            except Exception as exc:
+                LOGGER.error(
+                    "Failed to write page %d of %s",
+                    page_idx, self.doc_url, exc_info=exc
+                )
+                self.error = exc
+                # the page may have been partially written
+                page_url = self.core.call_success(
+                    "page_get_img_url", self.doc_url, page_idx
+                )
+                if page_url is not None:
+                    self._delete(page_url)
+                continue
+            self._register(page_idx)
+
+    def _run_serial(self, imgs):
+        nb = 0
+        for img in imgs:
+            page_idx = self._get_first_page_idx()
+            self._encode(img, page_idx)
+            self._register(page_idx)
+            nb += 1
+        return nb
+
+    def run(self, imgs):
+        """
+        Returns the number of pages written
+        """
+        if self.nb_encoders <= 0:
+            return self._run_serial(imgs)
+
+        first_page_idx = self._get_first_page_idx()
+        pending = queue.Queue(maxsize=self.max_pending)
+        registration = threading.Thread(
+            target=self._run_registration, args=(pending,),
+            name="scan2doc_registration", daemon=True
+        )
+        registration.start()
+        encoding = collections.deque()
+        nb = 0
+        try:
+            for img in imgs:
+                if self.error is not None:
+                    break
+                encoding = collections.deque(
+                    f for f in encoding if not f.done()
+                )
+                if len(encoding) >= self.nb_encoders:
+                    encoding.popleft().wait()
+                page_idx = first_page_idx + nb
+                future = openpaperwork_core.thread.submit(
+                    self.core, openpaperwork_core.thread.PRIORITY_BULK,
+                    self._encode, img, page_idx
+                )
+                encoding.append(future)
+                # blocks if too many pages are waiting
+                pending.put((page_idx, future))
+                nb += 1
+        finally:
+            pending.put(None)
+            registration.join()
+        if self.error is not None:
+            raise self.error
+        return nb
+
 
 class Plugin(openpaperwork_core.PluginBase):
     def __init__(self):
         self.scan_id_to_doc_id = {}
         self.doc_id_to_scan_id = {}
+        self.nb_encoders = DEFAULT_NB_ENCODERS
+        self.max_pending_pages = DEFAULT_MAX_PENDING_PAGES
 
     def get_interfaces(self):
         return ['scan2doc']
@@ -94,24 +255,11 @@ class Plugin(openpaperwork_core.PluginBase):
 
         def add_scans_to_doc(args):
             (source, scan_id, imgs) = args
-            nb = 0
-            for img in imgs:
-                nb += 1
-                nb_pages = self.core.call_success(
-                    "doc_get_nb_pages_by_url", doc_url
-                )
-                if nb_pages is None:
-                    nb_pages = 0
-                page_url = self.core.call_success(
-                    "page_get_img_url", doc_url, nb_pages, write=True
-                )
-                self.core.call_success("pillow_to_url", img, page_url)
-                self.core.call_all(
-                    "mainloop_schedule", self.core.call_all,
-                    "on_scan2doc_page_scanned",
-                    scan_id, doc_id, doc_url, nb_pages
-                )
-            return nb
+            pipeline = ScanPipeline(
+                self.core, scan_id, doc_id, doc_url,
+                self.nb_encoders, self.max_pending_pages
+            )
+            return pipeline.run(imgs)
 
         def drop_scan_id(scan_id, doc_id):
             self.scan_id_to_doc_id.pop(scan_id, None)
@@ -8,6 +8,8 @@ import datetime
 import logging
 
 import openpaperwork_core
+import openpaperwork_core.sqlite
+import openpaperwork_core.thread
 
 from . import (_, sync)
 
@@ -21,16 +23,31 @@ CREATE_TABLES = [
         " mtime INTEGER NOT NULL"
         ")"
     ),
+    (
+        "CREATE TABLE IF NOT EXISTS doc_fingerprints ("
+        " doc_id TEXT PRIMARY KEY,"
+        " fingerprint TEXT NOT NULL,"
+        " mtime INTEGER NOT NULL"
+        ")"
+    ),
 ]
 
 ID = "doctracker"
 
 
 class DocTrackerTransaction(sync.BaseTransaction):
-    def __init__(self, plugin, sql, total_expected=-1):
+    def __init__(
+            self, plugin, sql, total_expected=-1, fingerprints=None,
+            batch_size=openpaperwork_core.sqlite.DEFAULT_BATCH_SIZE):
         super().__init__(plugin.core, total_expected)
         self.priority = -10000
 
+        # fingerprints computed while comparing the documents (see
+        # sync.StorageDoc)
+        self.fingerprints = fingerprints
+        # documents for which we already have up-to-date fingerprints
+        self.fingerprinted = set()
+
         self.sql = self.core.call_one(
             "sqlite_execute", sql.cursor
         )
@@ -39,6 +56,12 @@ class DocTrackerTransaction(sync.BaseTransaction):
             "sqlite_execute", self.sql.execute, "BEGIN TRANSACTION"
         )
 
+        # writes are buffered and only run when the batch is full or on
+        # commit
+        self.batch = openpaperwork_core.sqlite.WriteBatch(
+            self.core, self.sql, batch_size
+        )
+
     def _get_actual_doc_data(self, doc_id, doc_url):
         if (
                     doc_url is not None
@@ -75,20 +98,42 @@ class DocTrackerTransaction(sync.BaseTransaction):
         doc_url = self.core.call_success("doc_id_to_url", doc_id)
         actual = self._get_actual_doc_data(doc_id, doc_url)
 
-        self.core.call_one(
-            "sqlite_execute", self.sql.execute,
+        self.batch.execute(
             "INSERT OR REPLACE INTO documents (doc_id, text, mtime)"
             " VALUES (?, ?, ?)",
             (doc_id, actual['text'], actual['mtime'])
         )
 
+        # other transactions may have modified the document in the meantime
+        # --> we recompute its fingerprint
+        fingerprint = None
+        if doc_url is not None:
+            fingerprint = sync.get_doc_fingerprint(self.core, doc_url)
+        if fingerprint is None:
+            self.batch.execute(
+                "DELETE FROM doc_fingerprints WHERE doc_id = ?",
+                (doc_id,)
+            )
+        else:
+            self.batch.execute(
+                "INSERT OR REPLACE INTO doc_fingerprints"
+                " (doc_id, fingerprint, mtime)"
+                " VALUES (?, ?, ?)",
+                (doc_id, fingerprint, actual['mtime'])
+            )
+        self.fingerprinted.add(doc_id)
+
     def del_doc(self, doc_id):
         self.notify_progress(ID, _("Document %s deleted") % (doc_id))
-        self.core.call_one(
-            "sqlite_execute", self.sql.execute,
+        self.batch.execute(
             "DELETE FROM documents WHERE doc_id = ?",
             (doc_id,)
         )
+        self.batch.execute(
+            "DELETE FROM doc_fingerprints WHERE doc_id = ?",
+            (doc_id,)
+        )
+        self.fingerprinted.add(doc_id)
         super().del_doc(doc_id)
 
     def unchanged_doc(self, doc_id):
@@ -99,13 +144,27 @@ class DocTrackerTransaction(sync.BaseTransaction):
 
     def cancel(self):
         self.notify_progress(ID, _("Rolling back changes"))
+        self.batch.clear()
         self.core.call_one("sqlite_execute", self.sql.execute, "ROLLBACK")
         self.core.call_one("sqlite_execute", self.sql.close)
         self.notify_done(ID)
 
     def commit(self):
         self.notify_progress(ID, _("Committing changes"))
-        self.core.call_one("sqlite_execute", self.sql.execute, "COMMIT")
+        if self.fingerprints is not None:
+            updates = [
+                update for update in self.fingerprints.updates
+                if update[0] not in self.fingerprinted
+            ]
+            LOGGER.info("Storing %d document fingerprints", len(updates))
+            for update in updates:
+                self.batch.execute(
+                    "INSERT OR REPLACE INTO doc_fingerprints"
+                    " (doc_id, fingerprint, mtime)"
+                    " VALUES (?, ?, ?)",
+                    update
+                )
+        self.batch.flush(self.sql.execute, "COMMIT")
         self.core.call_one("sqlite_execute", self.sql.close)
         self.notify_done(ID)
 
@@ -216,6 +275,21 @@ class Plugin(openpaperwork_core.PluginBase):
             return None
         return text[0][0]
 
+    def doc_tracker_get_fingerprints(self):
+        """
+        Returns the last-known document fingerprints and the document mtimes
+        that were computed along with them:
+        {doc_id: (fingerprint, mtime), ...}
+        """
+        fingerprints = self.core.call_one(
+            "sqlite_execute", self.sql.execute,
+            "SELECT doc_id, fingerprint, mtime FROM doc_fingerprints"
+        )
+        fingerprints = self.core.call_one(
+            "sqlite_execute", list, fingerprints
+        )
+        return {r[0]: (r[1], r[2]) for r in fingerprints}
+
     def doc_transaction_start(self, out: list, total_expected=-1):
         for (name, transaction_factory) in self.transaction_factories:
             out.append(transaction_factory(
@@ -228,49 +302,85 @@ class Plugin(openpaperwork_core.PluginBase):
         names = [t[0] for t in self.transaction_factories]
         names.append('doc_tracker')
 
+        # All the steps are run in the same worker thread, one after the
+        # other (see ThreadedPromise): they never have to wait for the main
+        # loop. Database accesses go through 'sqlite_execute'.
         promise = openpaperwork_core.promise.ThreadedPromise(
             self.core, self.core.call_all,
-            args=("storage_get_all_docs", storage_all_docs,)
+            args=("storage_get_all_docs", storage_all_docs,),
+            priority=openpaperwork_core.thread.PRIORITY_BULK
         )
-        promise = promise.then(lambda *args, **kwargs: None)
-        promise = promise.then(storage_all_docs.sort)
+        promise = promise.then(openpaperwork_core.promise.ThreadedPromise(
+            self.core, lambda *args, **kwargs: storage_all_docs.sort(),
+            priority=openpaperwork_core.thread.PRIORITY_BULK
+        ))
 
         class DbDoc(object):
             def __init__(self, result):
                 self.key = result[0]
                 self.extra = datetime.datetime.fromtimestamp(result[1])
 
-        promise = promise.then(self.sql.cursor)
-        promise = promise.then(lambda cursor: (
-            [
-                sync.StorageDoc(self.core, doc[0], doc[1])
-                for doc in storage_all_docs
-            ],
-            [
-                DbDoc(r)
-                for r in cursor.execute("SELECT doc_id, mtime FROM documents")
-            ],
+        # must be evaluated now: the sync mode is only known during the
+        # call to transaction_sync_all()
+        incremental = self.core.call_success("transaction_sync_is_full")
+        incremental = (incremental is not None and not incremental)
+        fingerprints = []
+
+        def get_db_docs():
+            fingerprints.append(sync.Fingerprints(
+                self.doc_tracker_get_fingerprints(), incremental=incremental
+            ))
+            db_docs = self.core.call_one(
+                "sqlite_execute", self.sql.execute,
+                "SELECT doc_id, mtime FROM documents"
+            )
+            db_docs = self.core.call_one("sqlite_execute", list, db_docs)
+            return (
+                [
+                    sync.StorageDoc(
+                        self.core, doc[0], doc[1], fingerprints[0]
+                    )
+                    for doc in storage_all_docs
+                ],
+                [DbDoc(r) for r in db_docs],
+            )
+
+        promise = promise.then(openpaperwork_core.promise.ThreadedPromise(
+            self.core, get_db_docs,
+            priority=openpaperwork_core.thread.PRIORITY_BULK
         ))
-        promise = promise.then(lambda args: (
-            *args,
-            sorted([
+
+        def make_transactions(args):
+            total_expected = max(len(storage_all_docs), len(args[1]))
+            transactions = []
+            # the page trackers created by the transactions share a session
+            # (see pagetracker) ended with this batch of transactions
+            self.core.call_all(
+                "page_tracker_session_start", transactions, total_expected
+            )
+            transactions += [
                 transaction_factory(
-                    sync=True,
-                    total_expected=max(len(storage_all_docs), len(args[1]))
-                )
-                for (name, transaction_factory) in self.transaction_factories
-            ] + [
-                DocTrackerTransaction(
-                    self, self.sql,
-                    total_expected=max(len(storage_all_docs), len(args[1]))
+                    sync=True, total_expected=total_expected
                 )
-            ], key=lambda t: -1 * t.priority),
-        ))
-        promise = promise.then(lambda args: sync.Syncer(
-            self.core, names, args[0], args[1], args[2]
+                for (name, transaction_factory)
+                in self.transaction_factories
+            ]
+            transactions.append(DocTrackerTransaction(
+                self, self.sql, total_expected=total_expected,
+                fingerprints=fingerprints[0]
+            ))
+            transactions.sort(key=lambda t: -1 * t.priority)
+            return (*args, transactions)
+
+        promise = promise.then(openpaperwork_core.promise.ThreadedPromise(
+            self.core, make_transactions,
+            priority=openpaperwork_core.thread.PRIORITY_BULK
         ))
         promise = promise.then(openpaperwork_core.promise.ThreadedPromise(
-            self.core, lambda syncer: syncer.run()
+            self.core, lambda args: sync.Syncer(
+                self.core, names, args[0], args[1], args[2], fingerprints[0]
+            ).run(),
+            priority=openpaperwork_core.thread.PRIORITY_BULK
         ))
         promises.append(promise)
 
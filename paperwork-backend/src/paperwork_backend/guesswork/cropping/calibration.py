@@ -81,11 +81,14 @@ class CalibrationTransaction(sync.BaseTransaction):
             # Guess page borders on new pages, but only if we are
             # not currently synchronizing with the work directory
             # (when syncing we don't modify the documents, ever)
-            if not self.sync and change == 'new':
+            modified = (not self.sync and change == 'new')
+            if modified:
                 self._crop_page(
                     doc_id, doc_url, page_idx, page_nb, len(modified_pages)
                 )
-            self.page_tracker.ack_page(doc_id, doc_url, page_idx)
+            self.page_tracker.ack_page(
+                doc_id, doc_url, page_idx, modified=modified
+            )
 
     def add_doc(self, doc_id):
         self._crop_new_pages(doc_id)
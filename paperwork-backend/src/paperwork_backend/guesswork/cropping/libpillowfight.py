@@ -73,12 +73,15 @@ class PillowfightTransaction(sync.BaseTransaction):
             # Guess page borders on new pages, but only if we are
             # not synchronizing with the work directory
             # (when syncing we don't modify the documents, ever)
-            if not self.sync and change == 'new':
+            modified = (not self.sync and change == 'new')
+            if modified:
                 self._guess_page_borders(
                     doc_id, doc_url, page_idx, page_nb, len(modified_pages)
                 )
                 need_end_notification = True
-            self.page_tracker.ack_page(doc_id, doc_url, page_idx)
+            self.page_tracker.ack_page(
+                doc_id, doc_url, page_idx, modified=modified
+            )
 
         if need_end_notification:
             self.notify_progress(
@@ -15,15 +15,16 @@ import threading
 import time
 
 import numpy
-import scipy.sparse
-import sklearn.feature_extraction.text
-import sklearn.naive_bayes
 
 import openpaperwork_core
 import openpaperwork_core.promise
 
 from .... import (_, sync)
 
+# scipy and sklearn take a long time to import and this plugin is loaded
+# by all the applications at startup (even when they won't guess any
+# label): they are only imported when actually used.
+
 
 LOGGER = logging.getLogger(__name__)
 ID = "label_guesser"
@@ -56,21 +57,207 @@ CREATE_TABLES = [
 ]
 
 
+class SparseFeatureVector(object):
+    """
+    Feature vector of a document, as stored in the database: only the
+    non-zero features are kept (indices + float32 values). `size` is the
+    number of features the vector had when it was computed (vocabulary size
+    at that time).
+
+    On-disk format (little-endian):
+    - magic (b"PWSV") + format version (1 byte)
+    - size (uint32) + number of non-zero features (uint32)
+    - indices (uint32 * nnz) + values (float32 * nnz)
+
+    Header length is 13 bytes, so blobs in this format always have a length
+    such as `length % 8 == 5`. Blobs in the previous format (dense float64
+    arrays) always have a length such as `length % 8 == 0`.
+    """
+    MAGIC = b"PWSV"
+    VERSION = 1
+    HEADER = numpy.dtype([('size', '<u4'), ('nnz', '<u4')])
+    HEADER_LENGTH = len(MAGIC) + 1 + HEADER.itemsize
+
+    def __init__(self, size, indices, values):
+        self.size = size
+        self.indices = numpy.asarray(indices, dtype=numpy.uint32)
+        self.values = numpy.asarray(values, dtype=numpy.float32)
+
+    @staticmethod
+    def from_dense(array):
+        array = numpy.asarray(array).ravel()
+        indices = numpy.flatnonzero(array)
+        return SparseFeatureVector(array.shape[0], indices, array[indices])
+
+    @staticmethod
+    def from_csr(row):
+        """
+        Expects a sparse matrix with a single row.
+        """
+        import scipy.sparse
+        row = scipy.sparse.csr_matrix(row)
+        row.sum_duplicates()
+        row.eliminate_zeros()
+        return SparseFeatureVector(row.shape[1], row.indices, row.data)
+
+    def __len__(self):
+        return self.size
+
+    def to_dense(self):
+        out = numpy.zeros((self.size,))
+        out[self.indices] = self.values
+        return out
+
+    def remap(self, new_indices, new_size):
+        """
+        new_indices: numpy array: old feature index --> new feature index
+        """
+        return SparseFeatureVector(
+            new_size, new_indices[self.indices], self.values
+        )
+
+    @staticmethod
+    def is_current_format(raw):
+        return (
+            raw[:len(SparseFeatureVector.MAGIC)] == SparseFeatureVector.MAGIC
+            and len(raw) % 8 == SparseFeatureVector.HEADER_LENGTH % 8
+        )
+
+    def to_bytes(self):
+        header = numpy.array(
+            [(self.size, len(self.indices))], dtype=self.HEADER
+        )
+        return b"".join([
+            self.MAGIC, bytes([self.VERSION]), header.tobytes(),
+            self.indices.astype('<u4').tobytes(),
+            self.values.astype('<f4').tobytes(),
+        ])
+
+    @staticmethod
+    def from_bytes(raw):
+        if not SparseFeatureVector.is_current_format(raw):
+            # previous format: dense float64 array
+            return SparseFeatureVector.from_dense(numpy.frombuffer(raw))
+        version = raw[len(SparseFeatureVector.MAGIC)]
+        assert version == SparseFeatureVector.VERSION, \
+            "Unsupported feature vector format: {}".format(version)
+        offset = len(SparseFeatureVector.MAGIC) + 1
+        header = numpy.frombuffer(
+            raw, dtype=SparseFeatureVector.HEADER, count=1, offset=offset
+        )[0]
+        nnz = int(header['nnz'])
+        offset += SparseFeatureVector.HEADER.itemsize
+        indices = numpy.frombuffer(
+            raw, dtype='<u4', count=nnz, offset=offset
+        )
+        values = numpy.frombuffer(
+            raw, dtype='<f4', count=nnz, offset=offset + (4 * nnz)
+        )
+        return SparseFeatureVector(int(header['size']), indices, values)
+
+
 class SqliteNumpyArrayHandler(object):
+    """
+    Columns of type NUMPY_ARRAY are always returned as SparseFeatureVector,
+    whatever the format they are stored in.
+    """
     @staticmethod
-    def _to_sqlite(np_array):
-        return np_array.tobytes()
+    def _to_sqlite(vector):
+        return vector.to_bytes()
 
     @staticmethod
     def _from_sqlite(raw):
-        return numpy.frombuffer(raw)
+        return SparseFeatureVector.from_bytes(raw)
 
     @classmethod
     def register(cls):
-        sqlite3.register_adapter(numpy.array, cls._to_sqlite)
+        sqlite3.register_adapter(SparseFeatureVector, cls._to_sqlite)
         sqlite3.register_converter("NUMPY_ARRAY", cls._from_sqlite)
 
 
+def migrate_feature_vectors(core, cursor, chunk_size=200):
+    """
+    Rewrite the feature vectors still stored in the previous format (dense
+    float64 arrays). Must be called outside of any transaction.
+    Returns the number of vectors migrated.
+    """
+    where = (
+        " WHERE vector IS NOT NULL"
+        " AND (substr(vector, 1, {}) != ? OR length(vector) % 8 != {})"
+    ).format(
+        len(SparseFeatureVector.MAGIC), SparseFeatureVector.HEADER_LENGTH % 8
+    )
+    total = list(cursor.execute(
+        "SELECT COUNT(*) FROM features" + where,
+        (SparseFeatureVector.MAGIC,)
+    ))[0][0]
+    if total <= 0:
+        return 0
+
+    LOGGER.info("Migrating %d feature vectors to the sparse format", total)
+    msg = _("Label guesser: Compacting document features ...")
+    done = 0
+    dropped = 0
+    last_doc_id = ""
+    cursor.execute("BEGIN TRANSACTION")
+    try:
+        while True:
+            core.call_all(
+                "on_progress", "label_vector_migration",
+                (done + dropped) / total, msg
+            )
+            # rows are walked by doc_id: a row is never read twice, even if
+            # its rewritten vector still doesn't pass the check above.
+            # Vectors are read as raw blobs (no converter) so a broken one
+            # doesn't prevent reading the others.
+            vectors = list(cursor.execute(
+                "SELECT doc_id, CAST(vector AS BLOB) FROM features" + where +
+                " AND doc_id > ? ORDER BY doc_id LIMIT ?",
+                (SparseFeatureVector.MAGIC, last_doc_id, chunk_size)
+            ))
+            if len(vectors) <= 0:
+                break
+            last_doc_id = vectors[-1][0]
+
+            updates = []
+            for (doc_id, raw) in vectors:
+                try:
+                    # empty blobs (document without text) may be read
+                    # as None
+                    vector = SparseFeatureVector.from_bytes(
+                        raw if raw is not None else b""
+                    )
+                    updates.append((vector, doc_id))
+                except (ValueError, AssertionError) as exc:
+                    # the document will be added back to the features
+                    # next time it is modified
+                    LOGGER.warning(
+                        "Invalid feature vector for document %s (%s)."
+                        " Dropping it", doc_id, exc
+                    )
+                    cursor.execute(
+                        "DELETE FROM features WHERE doc_id = ?", (doc_id,)
+                    )
+                    dropped += 1
+            cursor.executemany(
+                "UPDATE features SET vector = ? WHERE doc_id = ?", updates
+            )
+            done += len(updates)
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+    finally:
+        core.call_all("on_progress", "label_vector_migration", 1.0)
+
+    # give back the space freed to the file system
+    cursor.execute("VACUUM")
+    LOGGER.info(
+        "%d feature vectors migrated, %d dropped", done, dropped
+    )
+    return done
+
+
 class PluginConfig(object):
     SETTINGS = {  # settings --> default value
         'batch_size': 200,
@@ -86,6 +273,9 @@ class PluginConfig(object):
         # put every possible labels on it. --> we ignore documents with too
         # few words / features.
         'min_features': 10,
+
+        # see CLASSIFIERS
+        'classifier': 'gaussian',
     }
 
     def __init__(self, core):
@@ -135,6 +325,8 @@ class UpdatableVectorizer(object):
         self.last_feature_id = max(vocabulary.values(), default=-1)
 
     def partial_fit_transform(self, corpus):
+        import sklearn.feature_extraction.text
+
         # A bit hackish: We just need the analyzer, so instantiating a full
         # TfidVectorizer() is probably overkill, but meh.
         tokenizer = sklearn.feature_extraction.text.TfidfVectorizer(
@@ -163,6 +355,9 @@ class UpdatableVectorizer(object):
         return self.transform(corpus)
 
     def transform(self, corpus):
+        import scipy.sparse
+        import sklearn.feature_extraction.text
+
         # IMPORTANT: we must use use_idf=False here because we want the values
         # in each feature vector to be independant from other vectors.
         try:
@@ -176,38 +371,21 @@ class UpdatableVectorizer(object):
             LOGGER.warning("Failed to extract features", exc_info=exc)
             return scipy.sparse.csr_matrix((0, 0))
 
-    def _find_unused(self):
+    def _find_used(self):
+        """
+        Returns a boolean array: feature --> used by at least one document
+        """
         doc_features = self.db_cursor.execute(
             "SELECT vector FROM features"
         )
-        sum_features = None
+        used = numpy.zeros((self.last_feature_id + 1,), dtype=bool)
         for (doc_vector,) in doc_features:
             if doc_vector is None:
                 continue
-            required_padding = (
-                self.last_feature_id + 1 - doc_vector.shape[0]
-            )
-            if required_padding > 0:
-                doc_vector = numpy.hstack([
-                    doc_vector, numpy.zeros((required_padding,))
-                ])
-            if sum_features is None:
-                sum_features = doc_vector
-            else:
-                sum_features = sum_features + doc_vector
-
-        if sum_features is None:
-            return ([], 0)
-
-        return (
-            [f for (f, v) in enumerate(sum_features) if v == 0.0],
-            len(sum_features)
-        )
-
-    def _get_all_doc_ids(self):
-        doc_ids = self.db_cursor.execute("SELECT doc_id FROM features")
-        doc_ids = [doc_id[0] for doc_id in doc_ids]
-        return doc_ids
+            if len(doc_vector) > used.shape[0]:
+                used.resize((len(doc_vector),))
+            used[doc_vector.indices] = True
+        return used
 
     def gc(self):
         """
@@ -216,61 +394,64 @@ class UpdatableVectorizer(object):
         IMPORTANT: After this call, the vectorizer must no be used
         (this method doesn't update the internal state of the vectorizer)
         """
-        # we work in the main thread so we don't have to load all the feature
-        # vectors all at once in memory (we just need their sum)
         LOGGER.info("Garbage collecting unused features ...")
-        (to_drop, total) = self._find_unused()
-        if len(to_drop) <= 0:
+        used = self._find_used()
+        total = used.shape[0]
+        nb_to_drop = total - int(numpy.count_nonzero(used))
+        if nb_to_drop <= 0:
             LOGGER.info("No features to garbage collect (total=%d)", total)
             return
         LOGGER.info(
             "%d/%d features will be removed from the database",
-            len(to_drop), total
+            nb_to_drop, total
         )
 
-        doc_ids = self._get_all_doc_ids()
+        # old feature index --> new feature index (only meaningful for the
+        # features we keep)
+        new_indices = numpy.cumsum(used, dtype=numpy.int64) - 1
+        # old vector size --> new vector size
+        new_sizes = numpy.concatenate([[0], new_indices + 1])
 
-        # first we reduce the document feature vectors
+        # Remap the document feature vectors in a single pass. Vectors are
+        # sparse, so we can afford loading them all in memory.
         msg = _(
             "Label guesser: Garbage-collecting unused document features ..."
         )
         self.core.call_all("on_progress", "label_vector_gc", 0.0, msg)
-        for (idx, doc_id) in enumerate(doc_ids):
-            self.core.call_all(
-                "on_progress", "label_vector_gc", idx / len(doc_ids), msg
-            )
-            doc_vector = self.db_cursor.execute(
-                "SELECT vector FROM features WHERE doc_id = ? LIMIT 1",
-                (doc_id,)
-            )
-            doc_vector = list(doc_vector)
-            doc_vector = doc_vector[0][0]
+        doc_vectors = list(self.db_cursor.execute(
+            "SELECT doc_id, vector FROM features"
+        ))
+        updates = []
+        for (doc_id, doc_vector) in doc_vectors:
             if doc_vector is None:
                 # may happen according to bug report #478
-                doc_vector = numpy.array([])
-
-            to_drop_for_this_doc = [f for f in to_drop if f < len(doc_vector)]
-            doc_vector = numpy.delete(doc_vector, to_drop_for_this_doc)
-            self.db_cursor.execute(
-                "UPDATE features SET vector = ? WHERE doc_id = ?",
-                (doc_vector, doc_id)
-            )
+                doc_vector = SparseFeatureVector(0, [], [])
+            updates.append((
+                doc_vector.remap(new_indices, int(new_sizes[len(doc_vector)])),
+                doc_id
+            ))
+        doc_vectors = None
+        self.db_cursor.executemany(
+            "UPDATE features SET vector = ? WHERE doc_id = ?", updates
+        )
+        updates = None
         self.core.call_all("on_progress", "label_vector_gc", 1.0)
 
-        # then we reduce the vocabulary accordingly
+        # then we rewrite the vocabulary accordingly
         msg = _("Label guesser: Garbage-collecting unused words ...")
         self.core.call_all("on_progress", "label_vocabulary_gc", 0.0, msg)
-        for (idx, f) in enumerate(to_drop):
-            self.core.call_all(
-                "on_progress", "label_vocabulary_gc", idx / len(to_drop), msg
-            )
-            self.db_cursor.execute(
-                "DELETE FROM vocabulary WHERE feature = ?", (f,)
-            )
-            self.db_cursor.execute(
-                "UPDATE vocabulary SET feature = feature - 1"
-                " WHERE feature >= ?", (f,)
+        vocabulary = list(self.db_cursor.execute(
+            "SELECT word, feature FROM vocabulary"
+        ))
+        self.db_cursor.execute("DELETE FROM vocabulary")
+        self.db_cursor.executemany(
+            "INSERT INTO vocabulary (word, feature) VALUES (?, ?)",
+            (
+                (word, int(new_indices[feature]))
+                for (word, feature) in vocabulary
+                if feature < total and used[feature]
             )
+        )
         self.core.call_all("on_progress", "label_vocabulary_gc", 1.0, )
 
     def copy(self):
@@ -292,10 +473,10 @@ class BatchIterator(object):
         return self
 
     def __next__(self):
-        batch_corpus = self.features[self.b:self.b + self.batch_size]
-        if len(batch_corpus) <= 0:
+        if self.b >= self.features.shape[0]:
             raise StopIteration()
-        batch_corpus = scipy.sparse.vstack(batch_corpus).toarray()
+        batch_corpus = self.features[self.b:self.b + self.batch_size]
+        batch_corpus = batch_corpus.toarray()
         batch_targets = self.targets[self.b:self.b + self.batch_size]
         self.b += self.batch_size
         return (batch_corpus, batch_targets)
@@ -320,28 +501,28 @@ class Corpus(object):
     Make sure we train the document in the best order possible, so even
     if the training is interrupted (time limit), we still have some training
     for most labels.
+
+    - `features` is a sparse matrix (CSR): one row per document, one column
+      per feature
+    - `targets` is a label-indicator matrix: one row per document, one column
+      per label (see `labels`)
     """
-    def __init__(self, config, doc_ids, features, targets):
+    # Maximum number of parameters in a single SQL query
+    # (SQLITE_MAX_VARIABLE_NUMBER is 999 on old versions of SQLite)
+    MAX_QUERY_PARAMS = 500
+
+    def __init__(self, config, doc_ids, features, labels, targets):
         self.config = config
         self.doc_ids = doc_ids
         self.features = features
+        self.labels = labels
         self.targets = targets
 
     def standardize_feature_vectors(self, vectorizer):
-        for idx in range(0, len(self.features)):
-            doc_vector = self.features[idx]
-            required_padding = (
-                vectorizer.last_feature_id + 1 - doc_vector.shape[0]
-            )
-            assert required_padding >= 0
-            if required_padding > 0:
-                doc_vector = scipy.sparse.hstack([
-                    scipy.sparse.csr_matrix(doc_vector),
-                    numpy.zeros((required_padding,))
-                ])
-            else:
-                doc_vector = scipy.sparse.csr_matrix(doc_vector)
-            self.features[idx] = doc_vector
+        nb_features = vectorizer.last_feature_id + 1
+        assert nb_features >= self.features.shape[1]
+        if nb_features > self.features.shape[1]:
+            self.features.resize((self.features.shape[0], nb_features))
 
     def reduce_corpus_words(self):
         """
@@ -351,30 +532,19 @@ class Corpus(object):
         """
         max_words = self.config.get("max_words")
 
-        word_freq_sums = sum(self.features).toarray()[0]
+        word_freq_sums = numpy.asarray(self.features.sum(axis=0))[0]
         word_count = word_freq_sums.shape[0]
         LOGGER.info("Total word count before reduction: %d", word_count)
         if word_count <= max_words:
             LOGGER.info("No reduction to do")
             return DummyFeatureReductor()
 
-        threshold = sorted(word_freq_sums, reverse=True)[max_words]
+        threshold = -numpy.partition(-word_freq_sums, max_words)[max_words]
         LOGGER.info("Word frequency threshold: %f", threshold)
 
-        features_to_drop = []
-        for (idx, freq) in enumerate(word_freq_sums):
-            if freq > threshold:
-                continue
-            features_to_drop.append(idx)
-
-        reductor = FeatureReductor(features_to_drop)
-
-        for idx in range(0, len(self.features)):
-            self.features[idx] = scipy.sparse.csr_matrix(
-                reductor.reduce_features(
-                    self.features[idx].toarray()[0]
-                )
-            )
+        to_keep = word_freq_sums > threshold
+        reductor = FeatureReductor(numpy.flatnonzero(~to_keep))
+        self.features = self.features[:, to_keep]
 
         LOGGER.info(
             "Total word count after reduction: %d",
@@ -383,13 +553,16 @@ class Corpus(object):
         return reductor
 
     def get_doc_count(self):
-        return len(self.features)
+        return self.features.shape[0]
 
     def get_labels(self):
-        return self.targets.keys()
+        return self.labels
 
     def get_batches(self, label):
-        return BatchIterator(self.config, self.features, self.targets[label])
+        return BatchIterator(
+            self.config, self.features,
+            self.targets[:, self.labels.index(label)]
+        )
 
     @staticmethod
     def _add_doc_ids(max_doc_backlog, doc_weights, doc_ids):
@@ -401,6 +574,57 @@ class Corpus(object):
             doc_weights[doc_id] += weigth
             weigth -= 1
 
+    @staticmethod
+    def _load_vectors(cursor, doc_ids):
+        """
+        Returns the feature vectors of the given documents:
+        {doc_id: vector}
+        """
+        out = {}
+        for idx in range(0, len(doc_ids), Corpus.MAX_QUERY_PARAMS):
+            chunk = doc_ids[idx:idx + Corpus.MAX_QUERY_PARAMS]
+            vectors = cursor.execute(
+                "SELECT doc_id, vector FROM features"
+                " WHERE doc_id IN ({})".format(",".join(["?"] * len(chunk))),
+                chunk
+            )
+            for (doc_id, vector) in vectors:
+                # documents without text have an empty vector (and older
+                # versions of Paperwork stored empty blobs, read as None)
+                if vector is None or len(vector) <= 0:
+                    continue
+                out[doc_id] = vector
+        return out
+
+    @staticmethod
+    def _to_csr(vectors):
+        """
+        Build a sparse matrix out of the feature vectors (see
+        SparseFeatureVector). Vectors may have different sizes (new words may
+        have been added to the vocabulary after some of them have been
+        computed). Missing features are considered to be 0.
+        """
+        import scipy.sparse
+
+        indptr = numpy.zeros((len(vectors) + 1,), dtype=numpy.int64)
+        numpy.cumsum(
+            [len(vector.indices) for vector in vectors], out=indptr[1:]
+        )
+        nb_features = max((len(vector) for vector in vectors), default=0)
+        if len(vectors) > 0:
+            indices = numpy.concatenate(
+                [vector.indices for vector in vectors]
+            ).astype(numpy.int32)
+            data = numpy.concatenate(
+                [vector.values for vector in vectors]
+            ).astype(numpy.float64)
+        else:
+            indices = numpy.zeros((0,), dtype=numpy.int32)
+            data = numpy.zeros((0,))
+        return scipy.sparse.csr_matrix(
+            (data, indices, indptr), shape=(len(vectors), nb_features)
+        )
+
     @staticmethod
     def load(config, cursor):
         start = time.time()
@@ -408,8 +632,18 @@ class Corpus(object):
         # doc_id --> weigth
         doc_weights = collections.defaultdict(lambda: 0)
 
-        all_labels = cursor.execute("SELECT DISTINCT label FROM labels")
-        all_labels = {label[0] for label in all_labels}
+        # label --> doc_ids (most recent first)
+        label_docs = collections.defaultdict(list)
+        # doc_id --> labels
+        doc_labels = collections.defaultdict(set)
+        all_labels = cursor.execute(
+            "SELECT doc_id, label FROM labels ORDER BY doc_id DESC"
+        )
+        for (doc_id, label) in all_labels:
+            label_docs[label].append(doc_id)
+            doc_labels[doc_id].add(label)
+        all_labels = sorted(label_docs.keys())
+
         all_docs = cursor.execute(
             "SELECT doc_id FROM features ORDER BY doc_id DESC"
         )
@@ -418,13 +652,9 @@ class Corpus(object):
         max_doc_backlog = config.get("max_doc_backlog")
 
         for label in all_labels:
-            ds = cursor.execute(
-                "SELECT doc_id FROM labels WHERE label = ?"
-                " ORDER BY doc_id DESC LIMIT {}".format(max_doc_backlog),
-                (label,)
-            )
             Corpus._add_doc_ids(
-                max_doc_backlog, doc_weights, [d[0] for d in ds]
+                max_doc_backlog, doc_weights,
+                label_docs[label][:max_doc_backlog]
             )
 
         # label --> number of doc without this label
@@ -433,18 +663,15 @@ class Corpus(object):
         for doc_id in all_docs:
             if len(no_label_counts) <= 0:
                 break
-            doc_labels = cursor.execute(
-                "SELECT label FROM labels WHERE doc_id = ?", (doc_id,)
-            )
+            labels = doc_labels.get(doc_id, ())
             for label in list(no_label_counts.keys()):
-                if label in doc_labels:
+                if label in labels:
                     continue
                 no_label_docids[label].append(doc_id)
                 no_label_counts[label] += 1
                 if no_label_counts[label] >= max_doc_backlog:
                     no_label_counts.pop(label)
         for doc_ids in no_label_docids.values():
-            doc_ids.sort(reverse=True)
             Corpus._add_doc_ids(max_doc_backlog, doc_weights, doc_ids)
 
         LOGGER.info(
@@ -452,49 +679,32 @@ class Corpus(object):
             len(doc_weights), len(all_labels)
         )
 
-        all_features = {}
-        for doc_id in doc_weights.keys():
-            vectors = cursor.execute(
-                "SELECT vector FROM features WHERE doc_id = ? LIMIT 1",
-                (doc_id,)
-            )
-            for vector in vectors:
-                vector = vector[0]
-                if vector is None:
-                    continue
-                all_features[doc_id] = vector
+        all_features = Corpus._load_vectors(cursor, list(doc_weights.keys()))
 
-        all_features = [
-            [weight, doc_id, all_features[doc_id]]
-            for (doc_id, weight) in doc_weights.items()
-            if doc_id in all_features
-        ]
-        all_features.sort(reverse=True)
         doc_ids = [
-            doc_id
-            for (weight, doc_id, features) in all_features
-        ]
-        features = [
-            features
-            for (weight, doc_id, features) in all_features
+            doc_id for (doc_id, weight) in doc_weights.items()
+            if doc_id in all_features
         ]
+        doc_ids.sort(key=lambda doc_id: (doc_weights[doc_id], doc_id))
+        doc_ids.reverse()
+
+        features = Corpus._to_csr([all_features[d] for d in doc_ids])
+        all_features = None
 
         # Load labels
-        targets = collections.defaultdict(list)
+        label_idxs = {label: idx for (idx, label) in enumerate(all_labels)}
+        targets = numpy.zeros(
+            (len(doc_ids), len(all_labels)), dtype=numpy.int8
+        )
         for (idx, doc_id) in enumerate(doc_ids):
-            doc_labels = cursor.execute(
-                "SELECT label FROM labels WHERE doc_id = ?",
-                (doc_id,)
-            )
-            doc_labels = [label[0] for label in doc_labels]
-            for label in all_labels:
-                present = label in doc_labels
-                targets[label].append(1 if present else 0)
+            for label in doc_labels.get(doc_id, ()):
+                targets[idx, label_idxs[label]] = 1
 
         corpus = Corpus(
             config=config,
             doc_ids=doc_ids,
             features=features,
+            labels=all_labels,
             targets=targets
         )
 
@@ -508,6 +718,154 @@ class Corpus(object):
         return corpus
 
 
+class GaussianClassifiers(object):
+    """
+    One GaussianNB classifier per label. They are trained on dense batches of
+    documents (see BatchIterator), label after label, until all the
+    documents have been used or until 'max_time' is reached.
+    """
+    def __init__(self, core, config):
+        self.core = core
+        self.config = config
+        self.classifiers = {}
+
+    def fit(self, corpus):
+        import sklearn.naive_bayes
+
+        classifiers = collections.defaultdict(
+            sklearn.naive_bayes.GaussianNB
+        )
+
+        batch_iterators = [
+            (label, corpus.get_batches(label))
+            for label in corpus.get_labels()
+        ]
+        done = 0
+        total = len(batch_iterators) * corpus.get_doc_count()
+
+        loop_nb = 0
+        timeout = False
+
+        max_time = self.config.get("max_time")
+        fit_start = time.time()
+        try:
+            while not timeout:
+                for (label, batch_iterator) in batch_iterators:
+                    now = time.time()
+                    if loop_nb > 0 and now - fit_start > max_time:
+                        timeout = True
+                        LOGGER.warning(
+                            "Training is taking too long (%dms > %dms)."
+                            " Interrupting",
+                            (now - fit_start) * 1000, max_time * 1000
+                        )
+                        break
+
+                    (batch_corpus, batch_targets) = next(batch_iterator)
+                    self.core.call_all(
+                        "on_progress", "label_classifiers", done / total,
+                        _("Label guessing: Training ...")
+                    )
+                    classifiers[label].partial_fit(
+                        batch_corpus, batch_targets,
+                        classes=[0, 1]
+                    )
+                    done += len(batch_corpus)
+
+                loop_nb += 1
+        except StopIteration:
+            pass
+
+        self.classifiers = classifiers
+        return done / total if total > 0 else 1.0
+
+    def predict(self, vector):
+        """
+        Returns the labels of a document, based on its dense feature vector.
+        """
+        for (label, classifier) in self.classifiers.items():
+            predicted = classifier.predict([vector])[0]
+            if predicted:
+                yield label
+
+
+class SparseClassifiers(object):
+    """
+    A single one-vs-rest classifier, trained at once for all the labels
+    directly on the sparse feature matrix.
+    """
+    def __init__(self, core, config, estimator_factory):
+        self.core = core
+        self.config = config
+        self.estimator_factory = estimator_factory
+        self.labels = []
+        self.classifier = None
+
+    def fit(self, corpus):
+        import sklearn.multiclass
+
+        self.labels = list(corpus.get_labels())
+        if len(self.labels) <= 0:
+            return 1.0
+        self.core.call_all(
+            "on_progress", "label_classifiers", 0.0,
+            _("Label guessing: Training ...")
+        )
+        self.classifier = sklearn.multiclass.OneVsRestClassifier(
+            self.estimator_factory()
+        )
+        self.classifier.fit(corpus.features, corpus.targets)
+        return 1.0
+
+    def predict(self, vector):
+        """
+        Returns the labels of a document, based on its dense feature vector.
+        """
+        if self.classifier is None:
+            return
+        import scipy.sparse
+        predicted = self.classifier.predict(
+            scipy.sparse.csr_matrix(vector)
+        )
+        for label_idx in numpy.flatnonzero(predicted[0]):
+            yield self.labels[label_idx]
+
+
+def _complement_nb():
+    import sklearn.naive_bayes
+    return sklearn.naive_bayes.ComplementNB()
+
+
+def _logistic_regression():
+    import sklearn.linear_model
+    return sklearn.linear_model.LogisticRegression(solver='liblinear')
+
+
+# config value --> classifiers factory(core, config)
+CLASSIFIERS = {
+    'gaussian': GaussianClassifiers,
+    'complement_nb': lambda core, config: SparseClassifiers(
+        core, config, _complement_nb
+    ),
+    'logistic_regression': lambda core, config: SparseClassifiers(
+        core, config, _logistic_regression
+    ),
+}
+DEFAULT_CLASSIFIER = 'gaussian'
+
+
+def get_classifiers(core, config, name=None):
+    if name is None:
+        name = config.get("classifier")
+    if name not in CLASSIFIERS:
+        LOGGER.warning(
+            "Unknown label guessing classifier: %s. Using %s",
+            name, DEFAULT_CLASSIFIER
+        )
+        name = DEFAULT_CLASSIFIER
+    return CLASSIFIERS[name](core, config)
+
+
 class LabelGuesserTransaction(sync.BaseTransaction):
     def __init__(self, plugin, guess_labels=False, total_expected=-1):
         super().__init__(plugin.core, total_expected)
@@ -641,9 +999,9 @@ class LabelGuesserTransaction(sync.BaseTransaction):
 
         vector = self.vectorizer.partial_fit_transform([doc_txt])
         if vector.shape[0] <= 0 or vector.shape[1] <= 0:
-            vector = numpy.array([])
+            vector = SparseFeatureVector(0, [], [])
         else:
-            vector = vector[0].toarray()
+            vector = SparseFeatureVector.from_csr(vector[0])
 
         self.cursor.execute(
             "INSERT INTO features (doc_id, vector) VALUES (?, ?)",
@@ -887,6 +1245,9 @@ class Plugin(openpaperwork_core.PluginBase):
                     detect_types=sqlite3.PARSE_DECLTYPES,
                 )
                 try:
+                    # databases written by older versions of Paperwork
+                    migrate_feature_vectors(self.core, cursor)
+
                     cursor.execute("BEGIN TRANSACTION")
                     self.vectorizer = UpdatableVectorizer(self.core, cursor)
                     (
@@ -919,8 +1280,10 @@ class Plugin(openpaperwork_core.PluginBase):
             LOGGER.info("Training classifiers ...")
             start = time.time()
 
+            classifiers = get_classifiers(self.core, self.config)
+
             if corpus.get_doc_count() <= 1:
-                return (DummyFeatureReductor(), {})
+                return (DummyFeatureReductor(), classifiers)
 
             corpus.standardize_feature_vectors(vectorizer)
             # no need to train on all the words. Only the most used words
@@ -933,49 +1296,8 @@ class Plugin(openpaperwork_core.PluginBase):
             # --> free as much memory as possible now
             gc.collect()
 
-            classifiers = collections.defaultdict(
-                sklearn.naive_bayes.GaussianNB
-            )
-
-            batch_iterators = [
-                (label, corpus.get_batches(label))
-                for label in corpus.get_labels()
-            ]
-            done = 0
-            total = len(batch_iterators) * corpus.get_doc_count()
-
-            loop_nb = 0
-            timeout = False
-
-            max_time = self.config.get("max_time")
             fit_start = time.time()
-            try:
-                while not timeout:
-                    for (label, batch_iterator) in batch_iterators:
-                        now = time.time()
-                        if loop_nb > 0 and now - fit_start > max_time:
-                            timeout = True
-                            LOGGER.warning(
-                                "Training is taking too long (%dms > %dms)."
-                                " Interrupting",
-                                (now - fit_start) * 1000, max_time * 1000
-                            )
-                            break
-
-                        (batch_corpus, batch_targets) = next(batch_iterator)
-                        self.core.call_all(
-                            "on_progress", "label_classifiers", done / total,
-                            _("Label guessing: Training ...")
-                        )
-                        classifiers[label].partial_fit(
-                            batch_corpus, batch_targets,
-                            classes=[0, 1]
-                        )
-                        done += len(batch_corpus)
-
-                    loop_nb += 1
-            except StopIteration:
-                pass
+            completion = classifiers.fit(corpus)
 
             stop = time.time()
             LOGGER.info(
@@ -983,7 +1305,7 @@ class Plugin(openpaperwork_core.PluginBase):
                 " Training completed at %d%%",
                 (stop - start) * 1000,
                 (stop - fit_start) * 1000,
-                done * 100 / total
+                completion * 100
             )
 
             # Jflesch> This is a very memory-intensive process. The Glib may
@@ -1033,10 +1355,7 @@ class Plugin(openpaperwork_core.PluginBase):
 
         LOGGER.info("Documents contains %d features", nb_features)
 
-        for (label, classifier) in classifiers.items():
-            predicted = classifier.predict([vector])[0]
-            if predicted:
-                yield label
+        yield from classifiers.predict(vector)
 
     def _set_guessed_labels(self, doc_url):
         # self.classifiers_cond must locked
@@ -0,0 +1,223 @@
+"""
+Compare the accuracy and the speed of the label guessing classifiers
+(see CLASSIFIERS) on the user's documents.
+
+To use it:
+
+```sh
+paperwork-cli plugins add \
+    paperwork_backend.guesswork.label.sklearn.compare_classifiers
+paperwork-cli compare_sklearn_label_guessing_classifiers
+```
+"""
+
+import time
+
+import numpy
+import sklearn.feature_extraction.text
+
+import openpaperwork_core
+
+from . import (
+    CLASSIFIERS,
+    Corpus,
+    PluginConfig,
+    get_classifiers,
+)
+
+
+# one document out of TEST_RATIO is used for testing, the others are used
+# for training
+TEST_RATIO = 5
+
+
+class Plugin(openpaperwork_core.PluginBase):
+    def __init__(self):
+        super().__init__()
+        self.interactive = False
+
+    def get_interfaces(self):
+        return [
+            'shell',
+        ]
+
+    def get_deps(self):
+        return [
+            {
+                'interface': 'config',
+                'defaults': ['openpaperwork_core.config'],
+            },
+            {
+                'interface': 'document_storage',
+                'defaults': ['paperwork_backend.model.workdir'],
+            },
+            {
+                'interface': 'doc_labels',
+                'defaults': ['paperwork_backend.model.labels'],
+            },
+            {
+                'interface': 'doc_text',
+                'defaults': [
+                    'paperwork_backend.model.hocr',
+                    'paperwork_backend.model.pdf',
+                ],
+            },
+            {
+                'interface': 'i18n',
+                'defaults': ['openpaperwork_core.i18n.python'],
+            },
+        ]
+
+    def cmd_set_interactive(self, interactive):
+        self.interactive = interactive
+
+    def cmd_complete_argparse(self, parser):
+        p = parser.add_parser('compare_sklearn_label_guessing_classifiers')
+        p.add_argument(
+            '--classifiers', '-c', type=str,
+            default=",".join(CLASSIFIERS.keys()),
+            help="Comma-separated list of classifiers to compare"
+        )
+
+    def _load_all(self):
+        """
+        Returns [(doc_id, text, labels), ...]
+        """
+        docs = []
+        self.core.call_all("storage_get_all_docs", docs)
+        docs.sort(reverse=True)
+        total = len(docs)
+        out = []
+        for (idx, (doc_id, doc_url)) in enumerate(docs):
+            self.core.call_all(
+                "on_progress", "load_docs",
+                idx / total, "Loading document %s" % doc_id
+            )
+            text = []
+            self.core.call_all("doc_get_text_by_url", text, doc_url)
+            text = "\n\n".join(text).strip()
+            if len(text) <= 0:
+                continue
+
+            labels = set()
+            self.core.call_all("doc_get_labels_by_url", labels, doc_url)
+            labels = {label[0] for label in labels}
+            out.append((doc_id, text, labels))
+        self.core.call_all("on_progress", "load_docs", 1.0)
+        return out
+
+    @staticmethod
+    def _make_corpus(config, docs, vectorizer, labels):
+        features = vectorizer.transform([doc[1] for doc in docs])
+        targets = numpy.array(
+            [
+                [1 if label in doc[2] else 0 for label in labels]
+                for doc in docs
+            ], dtype=numpy.int8
+        ).reshape((len(docs), len(labels)))
+        return Corpus(
+            config=config,
+            doc_ids=[doc[0] for doc in docs],
+            features=features,
+            labels=labels,
+            targets=targets
+        )
+
+    def _compare(self, config, name, train, test):
+        classifiers = get_classifiers(self.core, config, name)
+
+        start = time.time()
+        completion = classifiers.fit(train)
+        fit_time = time.time() - start
+
+        # same metric as compute_threshold: ratio of (document, label)
+        # pairs correctly guessed
+        success = 0
+        true_positives = 0
+        false_positives = 0
+        false_negatives = 0
+        start = time.time()
+        for doc_idx in range(0, test.get_doc_count()):
+            vector = test.features[doc_idx].toarray()[0]
+            guessed = set(classifiers.predict(vector))
+            for (label_idx, label) in enumerate(test.get_labels()):
+                expected = bool(test.targets[doc_idx, label_idx])
+                if (label in guessed) == expected:
+                    success += 1
+                if label in guessed and expected:
+                    true_positives += 1
+                elif label in guessed:
+                    false_positives += 1
+                elif expected:
+                    false_negatives += 1
+        predict_time = time.time() - start
+
+        nb_pairs = test.get_doc_count() * len(test.get_labels())
+        return {
+            "accuracy": success / nb_pairs if nb_pairs > 0 else 0,
+            "precision": (
+                true_positives / (true_positives + false_positives)
+                if true_positives + false_positives > 0 else 0
+            ),
+            "recall": (
+                true_positives / (true_positives + false_negatives)
+                if true_positives + false_negatives > 0 else 0
+            ),
+            "training_completion": completion,
+            "fit_time": fit_time,
+            "predict_time_per_doc": (
+                predict_time / test.get_doc_count()
+                if test.get_doc_count() > 0 else 0
+            ),
+        }
+
+    def cmd_run(self, args):
+        if args.command != 'compare_sklearn_label_guessing_classifiers':
+            return None
+
+        config = PluginConfig(self.core)
+        if self.core.call_success(
+                    "config_get", "label_guessing_max_time"
+                ) is None:
+            config.register()
+
+        docs = self._load_all()
+        train = [d for (idx, d) in enumerate(docs) if idx % TEST_RATIO != 0]
+        test = [d for (idx, d) in enumerate(docs) if idx % TEST_RATIO == 0]
+        labels = sorted({label for doc in train for label in doc[2]})
+        if self.interactive:
+            print(
+                "{} documents for training, {} for testing, {} labels".format(
+                    len(train), len(test), len(labels)
+                )
+            )
+
+        # IMPORTANT: use_idf=False, like UpdatableVectorizer
+        vectorizer = sklearn.feature_extraction.text.TfidfVectorizer(
+            use_idf=False
+        )
+        vectorizer.fit([doc[1] for doc in train])
+        train = self._make_corpus(config, train, vectorizer, labels)
+        test = self._make_corpus(config, test, vectorizer, labels)
+
+        out = {}
+        for name in args.classifiers.split(","):
+            name = name.strip()
+            if name not in CLASSIFIERS:
+                if self.interactive:
+                    print("Unknown classifier: {}".format(name))
+                continue
+            out[name] = self._compare(config, name, train, test)
+            if self.interactive:
+                r = out[name]
+                print(
+                    "{}: accuracy={:.4f} precision={:.4f} recall={:.4f}"
+                    " training completed at {:.0f}% ; fit: {:.3f}s ;"
+                    " prediction: {:.1f}ms/doc".format(
+                        name, r['accuracy'], r['precision'], r['recall'],
+                        r['training_completion'] * 100, r['fit_time'],
+                        r['predict_time_per_doc'] * 1000
+                    )
+                )
+
+        return out
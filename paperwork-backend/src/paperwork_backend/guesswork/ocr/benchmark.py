@@ -0,0 +1,114 @@
+"""
+Measure the OCR throughput (pages/minute) depending on the number of OCR
+workers. Pages are generated to look like real scans (text and noise, see
+`docscan.fake.generate_page()`), or loaded from an image file.
+
+To use it:
+
+```sh
+paperwork-cli plugins add paperwork_backend.guesswork.ocr.benchmark
+paperwork-cli benchmark_ocr --pages 50 --workers 1,2,4,8
+```
+"""
+
+import multiprocessing
+import time
+
+import PIL.Image
+
+import openpaperwork_core
+
+from . import pyocr
+from ...docscan import fake
+
+
+DEFAULT_NB_PAGES = 20
+# A4 at 300dpi
+DEFAULT_PAGE_SIZE = "2480x3508"
+
+
+def get_default_workers():
+    out = [1]
+    while out[-1] * 2 <= multiprocessing.cpu_count():
+        out.append(out[-1] * 2)
+    return ",".join([str(w) for w in out])
+
+
+class Plugin(openpaperwork_core.PluginBase):
+    def __init__(self):
+        super().__init__()
+        self.interactive = False
+
+    def get_interfaces(self):
+        return [
+            'shell',
+        ]
+
+    def get_deps(self):
+        return [
+            {
+                'interface': 'ocr_settings',
+                'defaults': ['paperwork_backend.pyocr'],
+            },
+        ]
+
+    def cmd_set_interactive(self, interactive):
+        self.interactive = interactive
+
+    def cmd_complete_argparse(self, parser):
+        p = parser.add_parser('benchmark_ocr')
+        p.add_argument(
+            '--pages', '-p', type=int, default=DEFAULT_NB_PAGES,
+            help="Number of pages to OCR for each worker count"
+        )
+        p.add_argument(
+            '--workers', '-w', type=str, default=get_default_workers(),
+            help="Comma-separated list of worker counts to try"
+        )
+        p.add_argument(
+            '--size', '-s', type=str, default=DEFAULT_PAGE_SIZE,
+            help="Size of the generated pages (WIDTHxHEIGHT)"
+        )
+        p.add_argument(
+            '--image', '-i', type=str, default=None,
+            help="Image to use instead of the generated pages"
+        )
+
+    def _get_imgs(self, nb_pages, size, img_path=None):
+        if img_path is not None:
+            img = PIL.Image.open(img_path)
+            img.load()
+        else:
+            img = fake.generate_page(size)
+        return [img] * nb_pages
+
+    def cmd_run(self, args):
+        if args.command != 'benchmark_ocr':
+            return None
+
+        size = tuple(int(x) for x in args.size.split("x"))
+        imgs = self._get_imgs(args.pages, size, args.image)
+        workers = [int(w) for w in args.workers.split(",")]
+
+        out = {}
+        for nb_workers in workers:
+            engine = pyocr.OcrEngine(self.core, nb_workers)
+            try:
+                start = time.time()
+                futures = [engine.submit_img(img) for img in imgs]
+                for future in futures:
+                    future.result()
+                stop = time.time()
+            finally:
+                engine.shutdown()
+
+            pages_per_minute = len(imgs) * 60 / (stop - start)
+            out[nb_workers] = pages_per_minute
+            if self.interactive:
+                print(
+                    "{} workers: {} pages in {:.3f}s: {:.1f} pages/min".format(
+                        nb_workers, len(imgs), stop - start, pages_per_minute
+                    )
+                )
+
+        return out
@@ -1,4 +1,7 @@
+import collections
+import concurrent.futures
 import logging
+import threading
 
 import pyocr
 import pyocr.builders
@@ -12,6 +15,62 @@ LOGGER = logging.getLogger(__name__)
 
 ID = "ocr"
 
+# Maximum number of pages queued for OCR in a transaction, for each OCR
+# worker. Pages are queued across documents, so the workers don't wait
+# for the OCR of a document to be done before starting on the next one.
+PENDING_PAGES_PER_WORKER = 2
+
+
+class OcrEngine(object):
+    """
+    Runs OCR on many pages at once, whatever document they belong to.
+
+    Tesseract is run as an external process (or through libtesseract, which
+    releases the GIL), so a bounded pool of threads is enough to keep
+    all the CPU cores busy without having to pickle images.
+    """
+    def __init__(self, core, nb_workers):
+        self.core = core
+        self.nb_workers = nb_workers
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=nb_workers, thread_name_prefix="paperwork_ocr"
+        )
+
+    def _ocr_img(self, img):
+        ocr_tool = pyocr.get_available_tools()[0]
+        ocr_langs = self.core.call_success("ocr_get_active_langs")
+        return ocr_tool.image_to_string(
+            img, lang="+".join(ocr_langs),
+            builder=pyocr.builders.LineBoxBuilder()
+        )
+
+    def _ocr_page(self, doc_url, page_idx):
+        page_img_url = self.core.call_success(
+            "page_get_img_url", doc_url, page_idx
+        )
+        LOGGER.info(
+            "Running OCR on %s p%d (%s)", doc_url, page_idx, page_img_url
+        )
+        img = self.core.call_success("url_to_pillow", page_img_url)
+        return self._ocr_img(img)
+
+    def submit_img(self, img):
+        """
+        Returns a future. Its result will be the line boxes found on the
+        image.
+        """
+        return self.executor.submit(self._ocr_img, img)
+
+    def submit_page(self, doc_url, page_idx):
+        """
+        Returns a future. Its result will be the line boxes found on the
+        page.
+        """
+        return self.executor.submit(self._ocr_page, doc_url, page_idx)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
 
 class OcrTransaction(sync.BaseTransaction):
     def __init__(self, plugin, sync, total_expected=-1):
@@ -27,15 +86,35 @@ class OcrTransaction(sync.BaseTransaction):
         # and must be re-OCRed, and which have not been changed.
         self.page_tracker = self.core.call_success("page_tracker_get", ID)
 
+        # Pages of the documents added or updated, in the order in which
+        # they must be stored and acked:
+        # [(doc_id, doc_url, page_idx, page_nb, total_pages, future), ...]
+        # future is None if the page doesn't need OCR (only an ack).
+        self.pending = collections.deque()
+        # Pages not queued in the OCR engine yet (too many pending pages):
+        # [(doc_id, doc_url, page_idx, page_nb, total_pages, ocr,
+        #   wordless_only), ...]
+        self.waiting = collections.deque()
+        # number of futures in self.pending
+        self.nb_queued = 0
+        nb_workers = self.core.call_success("ocr_get_nb_workers")
+        if nb_workers is None:
+            nb_workers = 1
+        self.max_queued = max(1, nb_workers * PENDING_PAGES_PER_WORKER)
+        self.nb_ocr = 0
+
     def __enter__(self):
         pass
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.cancel()
 
-    def _run_ocr_on_page(
+    def _submit_ocr_on_page(
             self, doc_id, doc_url, page_idx, page_nb, total_pages,
             wordless_only=False):
+        """
+        Returns a future, or None if no OCR is required on this page.
+        """
         if wordless_only:
             has_text = self.core.call_success(
                 "page_has_text_by_url", doc_url, page_idx
@@ -50,39 +129,87 @@ class OcrTransaction(sync.BaseTransaction):
                     ).format(doc_id=doc_id, page_idx=(page_idx + 1)),
                     page_nb=page_nb, total_pages=total_pages
                 )
-                return
+                return None
+
+        return self.plugin.ocr_submit_page_by_url(doc_url, page_idx)
+
+    def _queue(self):
+        while len(self.waiting) > 0 and self.nb_queued < self.max_queued:
+            (
+                doc_id, doc_url, page_idx, page_nb, total_pages,
+                ocr, wordless_only
+            ) = self.waiting.popleft()
+            future = None
+            if ocr:
+                future = self._submit_ocr_on_page(
+                    doc_id, doc_url, page_idx, page_nb, total_pages,
+                    wordless_only
+                )
+            if future is not None:
+                self.nb_queued += 1
+            self.pending.append(
+                (doc_id, doc_url, page_idx, page_nb, total_pages, future)
+            )
 
-        self.notify_progress(
-            ID,
-            _("Running OCR on document {doc_id} p{page_idx}").format(
-                doc_id=doc_id, page_idx=(page_idx + 1)
-            ),
-            page_nb=page_nb, total_pages=total_pages
+    def _collect_next(self):
+        """
+        Store the result of the OCR of the next pending page (waits for it
+        if required) and ack the page. Pages are acked only once their
+        boxes have been stored, so if we are interrupted, the remaining
+        pages will be OCR-ed again next time.
+        """
+        (doc_id, doc_url, page_idx, page_nb, total_pages, future) = (
+            self.pending.popleft()
+        )
+        if future is not None:
+            self.nb_queued -= 1
+            self.notify_progress(
+                ID,
+                _("Running OCR on document {doc_id} p{page_idx}").format(
+                    doc_id=doc_id, page_idx=(page_idx + 1)
+                ),
+                page_nb=page_nb, total_pages=total_pages
+            )
+            self.plugin.ocr_collect_page_by_url(doc_url, page_idx, future)
+            self.nb_ocr += 1
+        self.page_tracker.ack_page(
+            doc_id, doc_url, page_idx, modified=(future is not None)
         )
-        self.plugin.ocr_page_by_url(doc_url, page_idx)
+        self._queue()
+
+    def _collect(self, wait):
+        """
+        Collect the pending pages in order. If `wait` is False, stops at the
+        first page whose OCR is not done yet.
+        """
+        while len(self.pending) > 0:
+            future = self.pending[0][-1]
+            if not wait and future is not None and not future.done():
+                return
+            self._collect_next()
 
     def _run_ocr_on_modified_pages(self, doc_id, wordless_only=False):
         doc_url = self.core.call_success("doc_id_to_url", doc_id)
 
-        need_end_notification = False
         modified_pages = list(self.page_tracker.find_changes(doc_id, doc_url))
+
         for (page_nb, (change, page_idx)) in enumerate(modified_pages):
             # Run OCR on modified pages, but only if we are not synchronizing
             # with the work directory (--> if the user just added or modified
             # a document)
-            if not self.sync and (change == 'new' or change == 'upd'):
-                self._run_ocr_on_page(
-                    doc_id, doc_url, page_idx, page_nb, len(modified_pages),
-                    wordless_only
-                )
-                need_end_notification = True
-            self.page_tracker.ack_page(doc_id, doc_url, page_idx)
-
-        if need_end_notification:
-            self.notify_progress(
-                ID, _("Running OCR"),
-                page_nb=len(modified_pages), total_pages=len(modified_pages)
-            )
+            ocr = not self.sync and (change == 'new' or change == 'upd')
+            self.waiting.append((
+                doc_id, doc_url, page_idx, page_nb, len(modified_pages),
+                ocr, wordless_only
+            ))
+
+        # The OCR of this document runs in the background while the next
+        # documents are given to us (see flush()). We only wait for some
+        # pages to be done when too many of them are pending.
+        self._queue()
+        while len(self.waiting) > 0:
+            self._collect_next()
+        self._collect(wait=False)
 
     def add_doc(self, doc_id):
         self._run_ocr_on_modified_pages(doc_id, wordless_only=True)
@@ -93,14 +220,39 @@ class OcrTransaction(sync.BaseTransaction):
         super().upd_doc(doc_id)
 
     def del_doc(self, doc_id):
+        if any(page[0] == doc_id for page in self.pending):
+            self._collect(wait=True)
         self.page_tracker.delete_doc(doc_id)
         super().del_doc(doc_id)
 
+    def flush(self):
+        self._collect(wait=True)
+        if self.nb_ocr > 0:
+            self.notify_progress(
+                ID, _("Running OCR"), page_nb=self.nb_ocr,
+                total_pages=self.nb_ocr
+            )
+            self.nb_ocr = 0
+
     def cancel(self):
+        self.waiting.clear()
+        for page in self.pending:
+            future = page[-1]
+            if future is not None:
+                future.cancel()
+        while len(self.pending) > 0:
+            (doc_id, doc_url, page_idx, page_nb, total_pages, future) = (
+                self.pending.popleft()
+            )
+            # the OCR of some pages may be already running: their boxes are
+            # stored, but the pages are not acked
+            self.plugin.ocr_collect_page_by_url(doc_url, page_idx, future)
+        self.nb_queued = 0
         self.page_tracker.cancel()
         self.notify_done(ID)
 
     def commit(self):
+        self.flush()
         self.page_tracker.commit()
         self.notify_done(ID)
 
@@ -108,6 +260,11 @@ class OcrTransaction(sync.BaseTransaction):
 class Plugin(openpaperwork_core.PluginBase):
     PRIORITY = 1000
 
+    def __init__(self):
+        super().__init__()
+        self.engine = None
+        self.engine_lock = threading.Lock()
+
     def get_interfaces(self):
         return [
             "ocr",
@@ -157,12 +314,32 @@ class Plugin(openpaperwork_core.PluginBase):
             )
         )
 
-    def ocr_page_by_url(self, doc_url, page_idx):
+    def _get_engine(self):
+        nb_workers = self.core.call_success("ocr_get_nb_workers")
+        if nb_workers is None:
+            nb_workers = 1
+        with self.engine_lock:
+            if (self.engine is not None
+                    and self.engine.nb_workers != nb_workers):
+                self.engine.shutdown()
+                self.engine = None
+            if self.engine is None:
+                LOGGER.info("Starting OCR engine (%d workers)", nb_workers)
+                self.engine = OcrEngine(self.core, nb_workers)
+            return self.engine
+
+    def ocr_submit_page_by_url(self, doc_url, page_idx):
+        """
+        Queue a page for OCR and return immediately. Pages from any document
+        may be queued at the same time: they are all run in parallel on a
+        bounded number of workers (see `ocr_get_nb_workers()`).
+
+        Returns a future that must be given to `ocr_collect_page_by_url()`,
+        or None if OCR is disabled.
+        """
         if self.core.call_success("ocr_is_enabled") is None:
             LOGGER.info("OCR is disabled")
-            return
-
-        LOGGER.info("Running OCR on page %d of %s", page_idx, doc_url)
+            return None
 
         doc_id = self.core.call_success("doc_url_to_id", doc_url)
         if doc_id is not None:
@@ -170,27 +347,24 @@ class Plugin(openpaperwork_core.PluginBase):
                 "mainloop_schedule", self.core.call_all,
                 "on_page_modification_start", doc_id, page_idx
             )
-        try:
-            page_img_url = self.core.call_success(
-                "page_get_img_url", doc_url, page_idx
-            )
-            ocr_tool = pyocr.get_available_tools()[0]
-            LOGGER.info(
-                "Will use tool '%s' on %s p%d (%s)",
-                ocr_tool.get_name(), doc_url, page_idx, page_img_url
-            )
+        return self._get_engine().submit_page(doc_url, page_idx)
 
-            ocr_langs = self.core.call_success("ocr_get_active_langs")
+    def ocr_collect_page_by_url(self, doc_url, page_idx, future):
+        """
+        Wait for the OCR of a page queued with `ocr_submit_page_by_url()`
+        to be done and store the resulting boxes (nothing is stored if the
+        future has been cancelled).
+        """
+        if future is None:
+            return None
 
-            img = self.core.call_success("url_to_pillow", page_img_url)
-
-            boxes = ocr_tool.image_to_string(
-                img, lang="+".join(ocr_langs),
-                builder=pyocr.builders.LineBoxBuilder()
-            )
-            self.core.call_all(
-                "page_set_boxes_by_url", doc_url, page_idx, boxes
-            )
+        doc_id = self.core.call_success("doc_url_to_id", doc_url)
+        try:
+            if not future.cancelled():
+                boxes = future.result()
+                self.core.call_all(
+                    "page_set_boxes_by_url", doc_url, page_idx, boxes
+                )
         except Exception as exc:
             LOGGER.error("OCR FAILED", exc_info=exc)
         finally:
@@ -201,3 +375,31 @@ class Plugin(openpaperwork_core.PluginBase):
                 )
 
         return True
+
+    def ocr_pages_by_url(self, pages):
+        """
+        Run OCR on many pages, possibly from many documents, in parallel.
+        Boxes are stored in the order of the given list.
+
+        Arguments:
+            pages -- [(doc_url, page_idx), (doc_url, page_idx), ...]
+        """
+        futures = [
+            (doc_url, page_idx, self.ocr_submit_page_by_url(doc_url, page_idx))
+            for (doc_url, page_idx) in pages
+        ]
+        for (doc_url, page_idx, future) in futures:
+            self.ocr_collect_page_by_url(doc_url, page_idx, future)
+        return True
+
+    def ocr_page_by_url(self, doc_url, page_idx):
+        future = self.ocr_submit_page_by_url(doc_url, page_idx)
+        if future is None:
+            return None
+        return self.ocr_collect_page_by_url(doc_url, page_idx, future)
+
+    def on_quit(self):
+        with self.engine_lock:
+            if self.engine is not None:
+                self.engine.shutdown()
+                self.engine = None
@@ -65,12 +65,15 @@ class OrientationTransaction(sync.BaseTransaction):
         for (page_nb, (change, page_idx)) in enumerate(modified_pages):
             # Guess page orientation on new pages, but only if we are
             # not synchronizing with the work directory
-            if not self.sync and change == 'new':
+            modified = (not self.sync and change == 'new')
+            if modified:
                 self._guess_page_orientation(
                     doc_id, doc_url, page_idx, page_nb, len(modified_pages)
                 )
                 need_end_notification = True
-            self.page_tracker.ack_page(doc_id, doc_url, page_idx)
+            self.page_tracker.ack_page(
+                doc_id, doc_url, page_idx, modified=modified
+            )
 
         if need_end_notification:
             self.notify_progress(
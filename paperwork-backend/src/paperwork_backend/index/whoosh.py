@@ -1,5 +1,9 @@
+import collections
+import concurrent.futures
 import datetime
 import logging
+import os
+import threading
 import time
 
 import whoosh.fields
@@ -7,15 +11,41 @@ import whoosh.index
 import whoosh.qparser
 import whoosh.query
 import whoosh.sorting
+import whoosh.writing
 
 import openpaperwork_core
+import openpaperwork_core.thread
 
-from .. import (_, sync)
+from .. import (_, sync, util)
 
 
 LOGGER = logging.getLogger(__name__)
 ID = "index"
 
+# Full rebuilds of the index: number of threads extracting the documents
+# content, number of processes used by Whoosh to index them, and memory
+# allowed to each of these processes (MB)
+DEFAULT_REBUILD_THREADS = min(8, os.cpu_count() or 1)
+DEFAULT_REBUILD_PROCS = min(4, os.cpu_count() or 1)
+DEFAULT_REBUILD_LIMITMB = 256
+
+# Number of search results kept in cache (see index_search())
+DEFAULT_SEARCH_CACHE_SIZE = 64
+# Default number of results per page (see index_search_page())
+DEFAULT_SEARCH_PAGE_LEN = 50
+
+# Where index_search_page() is in the results of a query. Opaque to the
+# callers.
+SearchCursor = collections.namedtuple(
+    'SearchCursor', [
+        'query', 'search_type', 'sort', 'page_len',
+        # index of the query parser that returned results
+        'parser_idx',
+        # next page to return (1-based)
+        'page_num',
+    ]
+)
+
 WHOOSH_SCHEMA = whoosh.fields.Schema(
     docid=whoosh.fields.ID(stored=True, unique=True, sortable=True),
     docfilehash=whoosh.fields.ID(),
@@ -23,6 +53,9 @@ WHOOSH_SCHEMA = whoosh.fields.Schema(
     label=whoosh.fields.KEYWORD(commas=True, scorable=True),
     date=whoosh.fields.DATETIME(sortable=True),
     last_read=whoosh.fields.DATETIME(stored=True),
+    # [(label, color), ...] as on the document (the 'label' field only
+    # contains the label names, without accents)
+    labels=whoosh.fields.STORED(),
 )
 
 
@@ -37,6 +70,53 @@ class CustomFuzzySearch(whoosh.qparser.query.FuzzyTerm):
         )
 
 
+def get_doc_fields(core, doc_id):
+    """
+    Collect infos on the document. Returns the fields to store in the index.
+    Thread-safe.
+    """
+    doc_url = core.call_success("doc_id_to_url", doc_id)
+
+    doc_mtime = core.call_success("doc_get_mtime_by_url", doc_url)
+    if doc_mtime is None:
+        doc_mtime = 0
+    doc_mtime = datetime.datetime.fromtimestamp(doc_mtime)
+
+    doc_hash = core.call_success("doc_get_hash_by_url", doc_url)
+    if doc_hash is None:
+        # we get a hash only for PDF documents, not image documents.
+        doc_hash = "undefined"
+    else:
+        doc_hash = ("%X" % doc_hash)
+
+    doc_text = []
+    core.call_all("doc_get_text_by_url", doc_text, doc_url)
+    doc_text = "\n\n".join(doc_text)
+    doc_text = core.call_success("i18n_strip_accents", doc_text)
+
+    doc_labels = set()
+    core.call_all("doc_get_labels_by_url", doc_labels, doc_url)
+    doc_labels = sorted(doc_labels)
+    doc_label_names = ",".join([label[0] for label in doc_labels])
+    doc_label_names = core.call_success(
+        "i18n_strip_accents", doc_label_names
+    )
+
+    doc_date = core.call_success("doc_get_date_by_id", doc_id)
+    if doc_date is None:
+        doc_date = datetime.datetime(year=1970, month=1, day=1)
+
+    return {
+        'docid': doc_id,
+        'docfilehash': doc_hash,
+        'content': doc_text,
+        'label': doc_label_names,
+        'date': doc_date,
+        'last_read': doc_mtime,
+        'labels': doc_labels,
+    }
+
+
 class WhooshTransaction(sync.BaseTransaction):
     """
     Transaction to apply on the index. Methods may be slow but they
@@ -48,6 +128,7 @@ class WhooshTransaction(sync.BaseTransaction):
         self.priority = plugin.PRIORITY
 
         LOGGER.debug("Starting Whoosh index transaction")
+        self.plugin = plugin
         self.core = plugin.core
         self.writer = None
         self.modified = 0
@@ -67,45 +148,9 @@ class WhooshTransaction(sync.BaseTransaction):
         """
         Collect infos on the document and add/update a document in the index
         """
-        doc_url = self.core.call_success("doc_id_to_url", doc_id)
-
-        doc_mtime = self.core.call_success("doc_get_mtime_by_url", doc_url)
-        if doc_mtime is None:
-            doc_mtime = 0
-        doc_mtime = datetime.datetime.fromtimestamp(doc_mtime)
-
-        doc_hash = self.core.call_success("doc_get_hash_by_url", doc_url)
-        if doc_hash is None:
-            # we get a hash only for PDF documents, not image documents.
-            doc_hash = "undefined"
-        else:
-            doc_hash = ("%X" % doc_hash)
-
-        doc_text = []
-        self.core.call_all("doc_get_text_by_url", doc_text, doc_url)
-        doc_text = "\n\n".join(doc_text)
-        doc_text = self.core.call_success("i18n_strip_accents", doc_text)
-
-        doc_labels = set()
-        self.core.call_all("doc_get_labels_by_url", doc_labels, doc_url)
-        doc_labels = ",".join([label[0] for label in doc_labels])
-        doc_labels = self.core.call_success("i18n_strip_accents", doc_labels)
-
-        doc_date = self.core.call_success("doc_get_date_by_id", doc_id)
-        if doc_date is None:
-            doc_date = datetime.datetime(year=1970, month=1, day=1)
-
-        query = whoosh.query.Term("docid", doc_id)
-        self.writer.delete_by_query(query)
-
-        self.writer.update_document(
-            docid=doc_id,
-            docfilehash=doc_hash,
-            content=doc_text,
-            label=doc_labels,
-            date=doc_date,
-            last_read=doc_mtime
-        )
+        # docid is a unique field: update_document() takes care of removing
+        # the previous version of the document, if any.
+        self.writer.update_document(**get_doc_fields(self.core, doc_id))
 
     def add_doc(self, doc_id):
         LOGGER.info("Adding document '%s' to index", doc_id)
@@ -179,6 +224,9 @@ class WhooshTransaction(sync.BaseTransaction):
             )
             self.writer.commit()
             self.writer = None
+            # don't wait for on_index_commit_end: searches may happen
+            # before the main loop gets to it.
+            self.plugin._refresh_searcher()
         self.notify_done(ID)
         self.core.call_success(
             "mainloop_schedule", self.core.call_all,
@@ -186,6 +234,112 @@ class WhooshTransaction(sync.BaseTransaction):
         )
 
 
+class IndexRebuild(object):
+    """
+    Rebuild the whole index from scratch, much faster than with a
+    transaction: the documents content is extracted by a pool of threads,
+    and Whoosh indexes them with multiple processes, each one writing its
+    own segment. Since the index is rebuilt from scratch, documents are
+    simply added (no need to look for a previous version of each document
+    in the index). Until the commit, the current index remains usable.
+    """
+    def __init__(
+            self, plugin, nb_threads=DEFAULT_REBUILD_THREADS,
+            procs=DEFAULT_REBUILD_PROCS, limitmb=DEFAULT_REBUILD_LIMITMB):
+        self.plugin = plugin
+        self.core = plugin.core
+        self.nb_threads = nb_threads
+        self.procs = procs
+        self.limitmb = limitmb
+
+    def _notify_progress(self, nb_done, total):
+        self.core.call_one(
+            "mainloop_schedule", self.core.call_all,
+            "on_progress", ID, nb_done / max(total, 1),
+            _("Rebuilding the index (%d/%d) ...") % (nb_done, total)
+        )
+
+    def run(self, *args, **kwargs):
+        """
+        Returns a dict with some statistics about the rebuild.
+        """
+        all_docs = []
+        self.core.call_all("storage_get_all_docs", all_docs)
+        doc_ids = sorted({doc[0] for doc in all_docs})
+        total = len(doc_ids)
+
+        LOGGER.info(
+            "Rebuilding the index: %d documents"
+            " (threads=%d, procs=%d, limitmb=%d) ...",
+            total, self.nb_threads, self.procs, self.limitmb
+        )
+        start = time.time()
+
+        writer = self.plugin.index.writer(
+            procs=self.procs, limitmb=self.limitmb,
+            multisegment=(self.procs > 1)
+        )
+        try:
+            # limit the number of documents extracted in advance, so we
+            # don't keep the content of the whole work directory in memory
+            max_pending = 4 * self.nb_threads
+            pending = collections.deque()
+            nb_done = 0
+            with concurrent.futures.ThreadPoolExecutor(
+                        max_workers=self.nb_threads,
+                        thread_name_prefix="index_rebuild"
+                    ) as executor:
+                for doc_id in doc_ids:
+                    pending.append(
+                        executor.submit(get_doc_fields, self.core, doc_id)
+                    )
+                    while len(pending) >= max_pending:
+                        writer.add_document(**pending.popleft().result())
+                        nb_done += 1
+                        if nb_done % 100 == 0:
+                            self._notify_progress(nb_done, total)
+                while len(pending) > 0:
+                    writer.add_document(**pending.popleft().result())
+                    nb_done += 1
+        except BaseException:
+            LOGGER.error("Failed to rebuild the index")
+            writer.cancel()
+            self.core.call_one(
+                "mainloop_schedule", self.core.call_all, "on_progress", ID, 1.0
+            )
+            raise
+
+        self.core.call_one(
+            "mainloop_schedule", self.core.call_all, 'on_index_commit_start'
+        )
+        self.core.call_one(
+            "mainloop_schedule", self.core.call_all,
+            "on_progress", ID, 0.99, _("Committing changes in the index ...")
+        )
+        # drop all the segments of the previous index
+        writer.commit(mergetype=whoosh.writing.CLEAR)
+        self.plugin.rebuild_needed = False
+        self.plugin._refresh_searcher()
+
+        elapsed = time.time() - start
+        docs_per_second = total / elapsed if elapsed > 0 else 0.0
+        LOGGER.info(
+            "Index rebuilt: %d documents in %.1fs (%.1f documents/s)",
+            total, elapsed, docs_per_second
+        )
+        self.core.call_one(
+            "mainloop_schedule", self.core.call_all, "on_progress", ID, 1.0
+        )
+        self.core.call_one(
+            "mainloop_schedule", self.core.call_all, 'on_index_commit_end'
+        )
+        return {
+            'nb_docs': total,
+            'elapsed': elapsed,
+            'docs_per_second': docs_per_second,
+        }
+
+
 class Plugin(openpaperwork_core.PluginBase):
     def __init__(self):
         super().__init__()
@@ -198,6 +352,22 @@ class Plugin(openpaperwork_core.PluginBase):
 
         self.local_dir = None
         self.index_dir = None
+        # True if the index has just been created (or recreated) and is
+        # therefore empty
+        self.rebuild_needed = False
+
+        # Searcher shared by all the searches. Only refreshed after commits.
+        # Whoosh searchers are not thread-safe --> protected by the lock
+        self.searcher = None
+        self.searcher_lock = threading.RLock()
+        # Incremented each time the searcher is refreshed (protected by the
+        # searcher lock)
+        self.searcher_generation = 0
+        # (query, search_type, limit) --> [(doc_id, doc_url), ...]
+        # Emptied each time the index is modified. Entries are versioned
+        # with the searcher generation: a result computed with a searcher
+        # that has been refreshed in the meantime is never returned.
+        self.search_cache = util.LRUCache(DEFAULT_SEARCH_CACHE_SIZE)
 
     def get_interfaces(self):
         return [
@@ -301,6 +471,7 @@ class Plugin(openpaperwork_core.PluginBase):
                 )
                 new_index.close()
                 LOGGER.info("Index '%s' created", self.index_dir)
+                self.rebuild_needed = True
 
         self.query_parsers = {
             'fuzzy': [
@@ -327,6 +498,12 @@ class Plugin(openpaperwork_core.PluginBase):
 
     def _close(self):
         LOGGER.info("Closing Whoosh index")
+        with self.searcher_lock:
+            if self.searcher is not None:
+                self.searcher.close()
+            self.searcher = None
+            self.searcher_generation += 1
+            self.search_cache.clear()
         if self.index is not None:
             self.index.close()
         self.index = None
@@ -341,45 +518,289 @@ class Plugin(openpaperwork_core.PluginBase):
     def doc_transaction_start(self, out: list, total_expected=-1):
         out.append(WhooshTransaction(self, total_expected))
 
-    def index_search(self, out: list, query, limit=None, search_type='fuzzy'):
-        start = time.time()
+    def _refresh_searcher(self):
+        with self.searcher_lock:
+            if self.searcher is not None:
+                # Whoosh reuses the segments that haven't changed
+                self.searcher = self.searcher.refresh()
+            self.searcher_generation += 1
+            self.search_cache.clear()
+
+    def on_index_commit_end(self):
+        self._refresh_searcher()
 
-        out_set = set()
+    def _get_searcher(self):
+        """
+        Must be called with the searcher lock held.
+        """
+        if self.searcher is None:
+            self.searcher = self.index.searcher()
+        return self.searcher
 
-        query = query.strip()
-        query = self.core.call_success("i18n_strip_accents", query)
+    def _normalize_query(self, query):
+        query = " ".join(query.split())
+        return self.core.call_success("i18n_strip_accents", query)
+
+    def _parse_query(self, query, search_type):
         if query == "":
-            queries = [whoosh.query.Every()]
-        else:
-            queries = []
-            for parser in self.query_parsers[search_type]:
-                queries.append(parser.parse(query))
+            return [whoosh.query.Every()]
+        return [
+            parser.parse(query)
+            for parser in self.query_parsers[search_type]
+        ]
 
-        with self.index.searcher() as searcher:
+    def _resolve_urls(self, hits, limit=None):
+        """
+        hits: [(doc_id, extra), ...] --> [(doc_id, doc_url, extra), ...]
+        """
+        out = []
+        known = set()
+        for (doc_id, extra) in hits:
+            if doc_id in known:
+                continue
+            doc_url = self.core.call_success("doc_id_to_url", doc_id)
+            if doc_url is None:
+                continue
+            known.add(doc_id)
+            out.append((doc_id, doc_url, extra))
+            if limit is not None and len(out) >= limit:
+                break
+        return out
+
+    def _search(self, query, limit, search_type):
+        queries = self._parse_query(query, search_type)
+
+        with self.searcher_lock:
+            searcher = self._get_searcher()
             for q in queries:
                 facet = whoosh.sorting.FieldFacet("docid", reverse=True)
                 results = searcher.search(q, limit=limit, sortedby=facet)
-                has_results = False
-                for result in results:
-                    has_results = True
-                    doc_id = result['docid']
-                    doc_url = self.core.call_success("doc_id_to_url", doc_id)
-                    if doc_url is None:
-                        continue
-                    out_set.add((doc_id, doc_url))
-                    if limit is not None and len(out_set) >= limit:
-                        break
-                if has_results:
+                doc_ids = [result['docid'] for result in results]
+                if len(doc_ids) > 0:
                     break
+            else:
+                doc_ids = []
 
-        out += out_set
+        # URLs are resolved only once for each query, and only for the
+        # results actually returned
+        return [
+            (doc_id, doc_url)
+            for (doc_id, doc_url, extra) in self._resolve_urls(
+                ((doc_id, None) for doc_id in doc_ids), limit
+            )
+        ]
+
+    def index_search(self, out: list, query, limit=None, search_type='fuzzy'):
+        """
+        Results are ordered (most recent documents first) and cached until
+        the next change in the index.
+        """
+        start = time.time()
+
+        query = self._normalize_query(query)
+
+        key = (query, search_type, limit)
+        # read before searching: if the searcher is refreshed during the
+        # search, the result is stored with an outdated generation and
+        # will never be returned
+        generation = self.searcher_generation
+        results = self.search_cache.get(key, version=generation)
+        cached = results is not None
+        if not cached:
+            results = self._search(query, limit, search_type)
+            self.search_cache.put(key, results, version=generation)
+
+        out += results
 
         stop = time.time()
         LOGGER.info(
-            "Search [%s] took %dms (limit=%s, type=%s)",
-            query, (stop - start) * 1000, limit, search_type
+            "Search [%s] took %dms (limit=%s, type=%s, cached=%s)",
+            query, (stop - start) * 1000, limit, search_type, cached
         )
 
+    def _search_all_pages(self, searcher, cursor):
+        """
+        Must be called with the searcher lock held.
+
+        Returns `(parser_idx, [(score, docnum), ...])` for all the results of
+        the query of the cursor. Computed once for the first page and then
+        reused for the following ones: `searcher.search_page()` would run
+        the whole search again up to the requested page each time.
+        Document numbers are only valid for the current searcher, so the
+        cache entry is versioned with the searcher generation.
+        """
+        key = ('pages', cursor.query, cursor.search_type, cursor.sort)
+        all_hits = self.search_cache.get(
+            key, version=self.searcher_generation
+        )
+        if all_hits is not None:
+            return all_hits
+
+        queries = self._parse_query(cursor.query, cursor.search_type)
+        if cursor.parser_idx is not None:
+            queries = [(cursor.parser_idx, queries[cursor.parser_idx])]
+        else:
+            # like index_search(): the first parser giving results wins
+            queries = list(enumerate(queries))
+
+        if cursor.sort == 'date':
+            sortedby = whoosh.sorting.FieldFacet("docid", reverse=True)
+        else:
+            sortedby = None
+
+        all_hits = (None, [])
+        for (parser_idx, q) in queries:
+            results = searcher.search(q, limit=None, sortedby=sortedby)
+            if len(results.top_n) <= 0:
+                continue
+            all_hits = (parser_idx, list(results.top_n))
+            break
+
+        self.search_cache.put(key, all_hits, version=self.searcher_generation)
+        return all_hits
+
+    def _search_page(self, cursor):
+        start = (cursor.page_num - 1) * cursor.page_len
+        end = start + cursor.page_len
+
+        with self.searcher_lock:
+            searcher = self._get_searcher()
+            (parser_idx, all_hits) = self._search_all_pages(searcher, cursor)
+            hits = [
+                (searcher.stored_fields(docnum)['docid'], score)
+                for (score, docnum) in all_hits[start:end]
+            ]
+
+        next_cursor = None
+        if end < len(all_hits):
+            next_cursor = cursor._replace(
+                parser_idx=parser_idx, page_num=cursor.page_num + 1
+            )
+        return (self._resolve_urls(hits), next_cursor)
+
+    def index_search_page(
+            self, query, cursor=None, page_len=DEFAULT_SEARCH_PAGE_LEN,
+            search_type='fuzzy', sort='relevance'):
+        """
+        Returns one page of results: `(hits, cursor)`, with
+        `hits = [(doc_id, doc_url, score), ...]`. Hits are ordered by
+        decreasing score (`sort='relevance'`) or with the most recent
+        documents first (`sort='date'`, scores are then meaningless).
+
+        To get the next page, call this method again with the returned
+        cursor (the other arguments are then ignored). The returned cursor
+        is None once the last page has been returned. Unlike
+        `index_search()`, only the document numbers of all the results are
+        kept in memory: the documents are loaded page by page, so callers
+        can display them as they come.
+        """
+        start = time.time()
+
+        if cursor is None:
+            cursor = SearchCursor(
+                query=self._normalize_query(query), search_type=search_type,
+                sort=sort, page_len=page_len, parser_idx=None, page_num=1
+            )
+
+        key = ('page',) + tuple(cursor)
+        generation = self.searcher_generation
+        result = self.search_cache.get(key, version=generation)
+        cached = result is not None
+        if not cached:
+            result = self._search_page(cursor)
+            self.search_cache.put(key, result, version=generation)
+
+        stop = time.time()
+        LOGGER.info(
+            "Search page [%s] #%d took %dms (type=%s, sort=%s, cached=%s)",
+            cursor.query, cursor.page_num, (stop - start) * 1000,
+            cursor.search_type, cursor.sort, cached
+        )
+        return (list(result[0]), result[1])
+
+    def _get_facets(self):
+        labels = collections.Counter()
+        label_colors = {}
+        label_pairs = collections.Counter()
+        dates = collections.Counter()
+        nb_docs = 0
+
+        # the facets are computed after each commit and go through all the
+        # documents: they use their own searcher so they don't hold the
+        # searcher lock (and block the searches) for the whole pass.
+        with self.index.searcher() as searcher:
+            reader = searcher.reader()
+            doc_dates = reader.column_reader("date")
+            # iter_docs() only returns the documents that haven't been
+            # deleted, in the order in which they are stored
+            for (docnum, fields) in reader.iter_docs():
+                nb_docs += 1
+                doc_date = doc_dates[docnum]
+                dates[(doc_date.year, doc_date.month)] += 1
+                doc_labels = fields.get('labels', [])
+                for (label, color) in doc_labels:
+                    labels[label] += 1
+                    label_colors[label] = color
+                names = sorted({label[0] for label in doc_labels})
+                for (idx, label_a) in enumerate(names):
+                    for label_b in names[idx + 1:]:
+                        label_pairs[(label_a, label_b)] += 1
+
+        return {
+            'nb_docs': nb_docs,
+            'labels': dict(labels),
+            'label_colors': label_colors,
+            'label_pairs': dict(label_pairs),
+            'dates': dict(dates),
+        }
+
+    def index_get_facets(self):
+        """
+        Returns statistics about the indexed documents, computed from the
+        index in a single pass (no document file is read):
+
+        - 'nb_docs': number of documents
+        - 'labels': {label: number of documents}
+        - 'label_colors': {label: color}
+        - 'label_pairs': {(label_a, label_b): number of documents with both
+          labels} (label_a < label_b)
+        - 'dates': {(year, month): number of documents}
+
+        Returns None if the index is not usable yet (being rebuilt).
+        The result is cached until the next change in the index and must
+        not be modified.
+        """
+        if self.rebuild_needed:
+            return None
+        start = time.time()
+        generation = self.searcher_generation
+        facets = self.search_cache.get(('facets',), version=generation)
+        if facets is None:
+            facets = self._get_facets()
+            self.search_cache.put(('facets',), facets, version=generation)
+        stop = time.time()
+        LOGGER.info(
+            "Facets of %d documents computed in %dms",
+            facets['nb_docs'], (stop - start) * 1000
+        )
+        return facets
+
+    def perfcheck_get_counters(self, out: dict):
+        out.update(self.search_cache.get_counters("index_search_cache"))
+
+    def index_rebuild(
+            self, promises: list, nb_threads=DEFAULT_REBUILD_THREADS,
+            procs=DEFAULT_REBUILD_PROCS, limitmb=DEFAULT_REBUILD_LIMITMB):
+        """
+        Rebuild the whole index from scratch (see `IndexRebuild`). The
+        promise returns some statistics about the rebuild. It should be
+        run with `transaction_schedule()`.
+        """
+        rebuild = IndexRebuild(self, nb_threads, procs, limitmb)
+        promises.append(openpaperwork_core.promise.ThreadedPromise(
+            self.core, rebuild.run
+        ))
+
     def index_get_doc_id_by_hash(self, doc_hash):
         doc_hash = "%X" % doc_hash
         with self.index.searcher() as searcher:
@@ -394,7 +815,8 @@ class Plugin(openpaperwork_core.PluginBase):
         query_parser = self.query_parsers['strict'][0]
         query = query_parser.parse(sentence)
 
-        with self.index.searcher() as searcher:
+        with self.searcher_lock:
+            searcher = self._get_searcher()
             corrected = searcher.correct_query(
                 query, sentence, correctors={
                     'content': searcher.corrector("content"),
@@ -410,14 +832,40 @@ class Plugin(openpaperwork_core.PluginBase):
         and updates the index accordingly.
 
         This call is asynchronous and use the main loop to do its job.
+
+        If the index has just been (re)created, it is rebuilt in bulk
+        instead (see `index_rebuild()`).
         """
+        if self.rebuild_needed:
+            LOGGER.info("Index has been recreated --> full rebuild")
+            rebuild = IndexRebuild(self)
+            promise = openpaperwork_core.promise.ThreadedPromise(
+                self.core, rebuild.run,
+                priority=openpaperwork_core.thread.PRIORITY_BULK
+            )
+            promise = promise.then(lambda *args, **kwargs: None)
+            promises.append(promise)
+            return
+
         storage_all_docs = []
 
-        promise = openpaperwork_core.promise.ThreadedPromise(
-            self.core, self.core.call_all,
-            args=("storage_get_all_docs", storage_all_docs,)
-        )
-        promise = promise.then(lambda *args, **kwargs: None)
+        # The fingerprints and mtimes are the ones stored by the doc
+        # tracker. Its synchronization always runs before this one, so its
+        # fingerprints are up-to-date.
+        # The sync mode must be evaluated now: it is only known during the
+        # call to transaction_sync_all().
+        incremental = self.core.call_success("transaction_sync_is_full")
+        incremental = (incremental is not None and not incremental)
+        fingerprints = []
+
+        def get_fingerprints():
+            known = self.core.call_success("doc_tracker_get_fingerprints")
+            if known is not None:
+                fingerprints.append(
+                    sync.Fingerprints(known, incremental=incremental)
+                )
+            else:
+                fingerprints.append(None)
 
         class IndexDoc(object):
             def __init__(s, index_result):
@@ -435,27 +883,38 @@ class Plugin(openpaperwork_core.PluginBase):
                 index_all_docs = [IndexDoc(r) for r in index_all_docs]
             return index_all_docs
 
-        promise = promise.then(
-            lambda: (
+        # All the steps are run in the same worker thread, one after the
+        # other (see ThreadedPromise): they never have to wait for the main
+        # loop.
+        promise = openpaperwork_core.promise.ThreadedPromise(
+            self.core, self.core.call_all,
+            args=("storage_get_all_docs", storage_all_docs,),
+            priority=openpaperwork_core.thread.PRIORITY_BULK
+        )
+        promise = promise.then(openpaperwork_core.promise.ThreadedPromise(
+            self.core, lambda *args, **kwargs: get_fingerprints(),
+            priority=openpaperwork_core.thread.PRIORITY_BULK
+        ))
+        promise = promise.then(openpaperwork_core.promise.ThreadedPromise(
+            self.core, lambda: (
                 [
-                    sync.StorageDoc(self.core, doc[0], doc[1])
+                    sync.StorageDoc(
+                        self.core, doc[0], doc[1], fingerprints[0]
+                    )
                     for doc in storage_all_docs
                 ],
                 get_index_docs()
-            )
-        )
-        promise = promise.then(
-            lambda args: (
-                args[0], args[1],
-                [WhooshTransaction(
-                    self, max(len(storage_all_docs), len(args[1]))
-                )]
-            )
-        )
-        promise = promise.then(lambda args: sync.Syncer(
-            self.core, ["whoosh"], args[0], args[1], args[2]
+            ),
+            priority=openpaperwork_core.thread.PRIORITY_BULK
         ))
         promise = promise.then(openpaperwork_core.promise.ThreadedPromise(
-            self.core, lambda syncer: syncer.run()
+            self.core, lambda args: sync.Syncer(
+                self.core, ["whoosh"], args[0], args[1],
+                [WhooshTransaction(
+                    self, max(len(storage_all_docs), len(args[1]))
+                )],
+                fingerprints[0]
+            ).run(),
+            priority=openpaperwork_core.thread.PRIORITY_BULK
         ))
         promises.append(promise)
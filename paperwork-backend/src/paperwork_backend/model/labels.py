@@ -33,19 +33,30 @@ COLOR_NAMES = [
 
 class LabelLoader(object):
     """
-    Go through all the documents to figure out what labels exist.
+    Figure out what labels exist. If the label catalogue or an index is
+    available, they are obtained from it. Otherwise, we go through all the
+    documents (and the label catalogue is filled in for the next times).
     """
     def __init__(self, plugin):
         self.plugin = plugin
         self.core = plugin.core
         self.all_docs = []
+        self.catalogue = None
+        self.facets = None
+
+    def get_all_docs(self):
+        self.catalogue = self.core.call_success("labels_catalogue_get_all")
+        if self.catalogue is not None:
+            return
+        self.facets = self.core.call_success("index_get_facets")
+        if self.facets is not None:
+            return
+        self.core.call_all("storage_get_all_docs", self.all_docs)
 
     def get_promise(self):
         promise = openpaperwork_core.promise.ThreadedPromise(
-            self.core, self.core.call_all,
-            args=("storage_get_all_docs", self.all_docs)
+            self.core, self.get_all_docs
         )
-        promise = promise.then(lambda *args, **kwargs: None)
         promise = promise.then(
             self.core.call_all, "on_label_loading_start",
         )
@@ -62,9 +73,28 @@ class LabelLoader(object):
         return promise
 
     def load_labels(self, *args, **kwargs):
+        if self.catalogue is not None:
+            self.plugin.all_labels.update(self.catalogue)
+            self.core.call_all("on_progress", "label_loading", 1.0)
+            LOGGER.info(
+                "%d labels loaded from the label catalogue",
+                len(self.plugin.all_labels)
+            )
+            return
+
+        if self.facets is not None:
+            self.plugin.all_labels.update(self.facets['label_colors'])
+            self.core.call_all("on_progress", "label_loading", 1.0)
+            LOGGER.info(
+                "%d labels loaded from the index (%d documents)",
+                len(self.plugin.all_labels), self.facets['nb_docs']
+            )
+            return
+
         nb_docs = len(self.all_docs)
 
         LOGGER.info("Loading labels from %d documents", nb_docs)
+        doc_labels = []
         for (doc_idx, (doc_id, doc_url)) in enumerate(self.all_docs):
             self.core.call_all(
                 "on_progress", "label_loading",
@@ -75,11 +105,13 @@ class LabelLoader(object):
             self.plugin.doc_get_labels_by_url(labels, doc_url)
             for label in labels:
                 self.plugin.all_labels[label[0]] = label[1]
+                doc_labels.append((doc_id, label[0], label[1]))
         self.core.call_all("on_progress", "label_loading", 1.0)
         LOGGER.info(
             "%d labels loaded from %d documents",
             len(self.plugin.all_labels), nb_docs
         )
+        self.core.call_all("labels_catalogue_fill", doc_labels)
 
 
 class Plugin(openpaperwork_core.PluginBase):
@@ -201,6 +233,7 @@ class Plugin(openpaperwork_core.PluginBase):
         if label not in self.all_labels:
             self.all_labels[label] = color
 
+        self.core.call_all("labels_catalogue_update_doc", doc_url)
         return True
 
     def doc_remove_label_by_url(self, doc_url, label):
@@ -232,6 +265,8 @@ class Plugin(openpaperwork_core.PluginBase):
         with self.core.call_success("fs_open", labels_url, "w") as file_desc:
             for (label, color) in labels:
                 file_desc.write("{},{}\n".format(label, color))
+
+        self.core.call_all("labels_catalogue_update_doc", doc_url)
         return True
 
     def labels_get_all(self, out: set):
@@ -304,3 +339,16 @@ class Plugin(openpaperwork_core.PluginBase):
 
     def sync(self, promises: list):
         self.label_load_all(promises)
+
+    def _update_labels_from_index(self):
+        facets = self.core.call_success("index_get_facets")
+        if facets is None:
+            return
+        self.all_labels.update(facets['label_colors'])
+
+    def on_index_commit_end(self):
+        # documents modified outside of Paperwork may have brought new
+        # labels
+        self.core.call_success(
+            "thread_start", self._update_labels_from_index
+        )
@@ -0,0 +1,348 @@
+"""
+Keeps track of the labels of each document in a small database, so that
+the labels don't have to be loaded from every single document at startup.
+
+The catalogue is filled in the first time the labels are loaded from the
+documents (see `model.labels`), and kept up-to-date afterwards by the
+document tracker and when labels are added or removed. As long as it hasn't
+been filled in (labels loaded from the index instead), it is not the source
+of truth and it is not maintained.
+"""
+
+import logging
+import threading
+
+import openpaperwork_core
+import openpaperwork_core.sqlite
+
+from .. import (_, sync)
+
+LOGGER = logging.getLogger(__name__)
+
+CREATE_TABLES = [
+    (
+        "CREATE TABLE IF NOT EXISTS doc_labels ("
+        " doc_id TEXT NOT NULL,"
+        " label TEXT NOT NULL,"
+        " color TEXT NOT NULL,"
+        " PRIMARY KEY (doc_id, label)"
+        ")"
+    ),
+    (
+        "CREATE TABLE IF NOT EXISTS catalogue_state ("
+        " key TEXT PRIMARY KEY,"
+        " value TEXT NOT NULL"
+        ")"
+    ),
+]
+
+ID = "labels_catalogue"
+
+
+class LabelsCatalogueTransaction(sync.BaseTransaction):
+    def __init__(
+            self, plugin, sql, total_expected=-1,
+            batch_size=openpaperwork_core.sqlite.DEFAULT_BATCH_SIZE):
+        super().__init__(plugin.core, total_expected)
+        self.priority = -10000
+        self.plugin = plugin
+        # documents examined while the catalogue is incomplete (see
+        # `commit()`)
+        self.doc_ids = set()
+        # documents updated with `labels_catalogue_update_doc()` while this
+        # transaction was open
+        self.updated_doc_urls = set()
+
+        self.sql = None
+        self.batch = None
+        if not plugin.complete:
+            return
+
+        self.sql = self.core.call_one(
+            "sqlite_execute", sql.cursor
+        )
+        self.core.call_one(
+            "sqlite_execute", self.sql.execute, "BEGIN TRANSACTION"
+        )
+        self.batch = openpaperwork_core.sqlite.WriteBatch(
+            self.core, self.sql, batch_size
+        )
+        plugin._set_transaction(self)
+
+    def update_doc(self, doc_url, queries):
+        """
+        Called by `labels_catalogue_update_doc()` while this transaction is
+        open: the connection is in the middle of a transaction, so the
+        queries must go through the batch.
+        """
+        self.updated_doc_urls.add(doc_url)
+        for query in queries:
+            self.batch.execute(*query)
+
+    def _upd_doc(self, doc_id):
+        if self.batch is None:
+            self.doc_ids.add(doc_id)
+            return
+        for query in self.plugin._get_update_queries(doc_id):
+            self.batch.execute(*query)
+
+    def add_doc(self, doc_id):
+        self.notify_progress(
+            ID, _("Updating label catalogue: {}").format(doc_id)
+        )
+        self._upd_doc(doc_id)
+        super().add_doc(doc_id)
+
+    def upd_doc(self, doc_id):
+        self.notify_progress(
+            ID, _("Updating label catalogue: {}").format(doc_id)
+        )
+        self._upd_doc(doc_id)
+        super().upd_doc(doc_id)
+
+    def del_doc(self, doc_id):
+        self.notify_progress(
+            ID, _("Updating label catalogue: {}").format(doc_id)
+        )
+        if self.batch is None:
+            self.doc_ids.add(doc_id)
+        else:
+            self.batch.execute(
+                "DELETE FROM doc_labels WHERE doc_id = ?", (doc_id,)
+            )
+        super().del_doc(doc_id)
+
+    def cancel(self):
+        if self.batch is None:
+            self.notify_done(ID)
+            return
+        updated_doc_urls = self.plugin._set_transaction(None)
+        self.batch.clear()
+        self.core.call_one("sqlite_execute", self.sql.execute, "ROLLBACK")
+        self.core.call_one("sqlite_execute", self.sql.close)
+        # the label changes made meanwhile are not related to this
+        # transaction: they must not be lost
+        for doc_url in updated_doc_urls:
+            self.plugin.labels_catalogue_update_doc(doc_url)
+        self.notify_done(ID)
+
+    def commit(self):
+        if self.batch is None:
+            if self.plugin.complete:
+                # the catalogue has been filled in meanwhile, maybe before
+                # our changes
+                self.plugin._update_docs(self.doc_ids)
+            self.notify_done(ID)
+            return
+        self.plugin._set_transaction(None)
+        self.batch.flush(self.sql.execute, "COMMIT")
+        self.core.call_one("sqlite_execute", self.sql.close)
+        self.notify_done(ID)
+
+
+class Plugin(openpaperwork_core.PluginBase):
+    def __init__(self):
+        super().__init__()
+        self.sql = None
+        # True once the catalogue has been filled in
+        self.complete = False
+        # transaction currently open on self.sql, if any
+        self.transaction = None
+        self.transaction_lock = threading.Lock()
+
+    def get_interfaces(self):
+        return ['labels_catalogue']
+
+    def get_deps(self):
+        return [
+            {
+                'interface': 'data_dir_handler',
+                'defaults': ['paperwork_backend.datadirhandler'],
+            },
+            {
+                'interface': 'doc_labels',
+                'defaults': ['paperwork_backend.model.labels'],
+            },
+            {
+                'interface': 'doc_tracking',
+                'defaults': ['paperwork_backend.doctracker'],
+            },
+            {
+                'interface': 'document_storage',
+                'defaults': ['paperwork_backend.model.workdir'],
+            },
+            {
+                'interface': 'fs',
+                'defaults': ['openpaperwork_gtk.fs.gio'],
+            },
+            {
+                'interface': 'sqlite',
+                'defaults': ['openpaperwork_core.sqlite'],
+            },
+        ]
+
+    def init(self, core):
+        super().init(core)
+        self._init()
+        self.core.call_all(
+            "doc_tracker_register", ID,
+            lambda sync, total_expected=-1: LabelsCatalogueTransaction(
+                self, self.sql, total_expected
+            )
+        )
+
+    def _init(self):
+        paperwork_dir = self.core.call_success(
+            "data_dir_handler_get_individual_data_dir"
+        )
+        sql_file = self.core.call_success(
+            "fs_join", paperwork_dir, 'labels.db'
+        )
+        self.sql = self.core.call_one(
+            "sqlite_execute",
+            self.core.call_success,
+            "sqlite_open", sql_file
+        )
+        for query in CREATE_TABLES:
+            self.core.call_one("sqlite_execute", self.sql.execute, query)
+        self.complete = self.core.call_one(
+            "sqlite_execute", lambda: len(list(self.sql.execute(
+                "SELECT value FROM catalogue_state WHERE key = 'complete'"
+            ))) > 0
+        )
+
+    def on_quit(self):
+        LOGGER.info("Closing label catalogue ...")
+        self.core.call_one(
+            "sqlite_execute",
+            self.core.call_success,
+            "sqlite_close", self.sql
+        )
+        self.sql = None
+
+    def on_data_dir_changed(self):
+        self.on_quit()
+        self._init()
+
+    def _get_update_queries(self, doc_id):
+        queries = [
+            ("DELETE FROM doc_labels WHERE doc_id = ?", (doc_id,)),
+        ]
+        doc_url = self.core.call_success("doc_id_to_url", doc_id)
+        if doc_url is None:
+            return queries
+        labels = set()
+        self.core.call_all("doc_get_labels_by_url", labels, doc_url)
+        for (label, color) in labels:
+            queries.append((
+                "INSERT OR REPLACE INTO doc_labels (doc_id, label, color)"
+                " VALUES (?, ?, ?)",
+                (doc_id, label, color)
+            ))
+        return queries
+
+    def labels_catalogue_get_all(self):
+        """
+        Returns all the known labels ({label: color}), or None if the
+        catalogue hasn't been filled in yet.
+        """
+        if not self.complete:
+            return None
+
+        def get_all():
+            return {
+                label: color
+                for (label, color) in self.sql.execute(
+                    "SELECT label, MAX(color) FROM doc_labels GROUP BY label"
+                )
+            }
+
+        return self.core.call_one("sqlite_execute", get_all)
+
+    def labels_catalogue_fill(self, doc_labels):
+        """
+        Replace the whole content of the catalogue.
+
+        Arguments:
+            doc_labels -- labels of all the documents:
+                [(doc_id, label, color), ...]
+        """
+        def fill():
+            self.sql.execute("BEGIN TRANSACTION")
+            self.sql.execute("DELETE FROM doc_labels")
+            self.sql.executemany(
+                "INSERT OR REPLACE INTO doc_labels (doc_id, label, color)"
+                " VALUES (?, ?, ?)",
+                doc_labels
+            )
+            self.sql.execute(
+                "INSERT OR REPLACE INTO catalogue_state (key, value)"
+                " VALUES ('complete', '1')"
+            )
+            self.sql.execute("COMMIT")
+
+        LOGGER.info(
+            "Filling in the label catalogue (%d document labels)",
+            len(doc_labels)
+        )
+        self.core.call_one("sqlite_execute", fill)
+        self.complete = True
+
+    def _set_transaction(self, transaction):
+        """
+        Returns the URLs of the documents updated during the previous
+        transaction.
+        """
+        with self.transaction_lock:
+            previous = self.transaction
+            self.transaction = transaction
+        if previous is None:
+            return set()
+        return previous.updated_doc_urls
+
+    def _execute(self, queries):
+        """
+        Run the queries outside of any transaction.
+        """
+        def execute():
+            for query in queries:
+                self.sql.execute(*query)
+            self.sql.commit()
+
+        self.core.call_one("sqlite_execute", execute)
+
+    def _update_docs(self, doc_ids):
+        queries = []
+        for doc_id in doc_ids:
+            queries += self._get_update_queries(doc_id)
+        self._execute(queries)
+
+    def labels_catalogue_update_doc(self, doc_url):
+        if not self.complete:
+            return
+        doc_id = self.core.call_success("doc_url_to_id", doc_url)
+        if doc_id is None:
+            return
+        queries = self._get_update_queries(doc_id)
+
+        with self.transaction_lock:
+            transaction = self.transaction
+            if transaction is not None:
+                # labels may be changed during a transaction (label
+                # guessing during an import for instance): committing here
+                # would commit the transaction halfway through
+                transaction.update_doc(doc_url, queries)
+                return
+
+        self._execute(queries)
+
+    def labels_get_doc_counts(self, out: dict):
+        """
+        Number of documents for each label: {label: nb_docs}
+        """
+        rows = self.core.call_one(
+            "sqlite_execute", lambda: list(self.sql.execute(
+                "SELECT label, COUNT(*) FROM doc_labels GROUP BY label"
+            ))
+        )
+        out.update(dict(rows))
@@ -6,6 +6,8 @@ import math
 import openpaperwork_core
 import openpaperwork_core.deps
 
+from .. import util
+
 
 LOGGER = logging.getLogger(__name__)
 
@@ -14,6 +16,12 @@ PASSWD_FILENAME = 'passwd.txt'
 
 PDF_RENDER_FACTOR = 4
 
+# Default maximum number of documents for which we keep the hash, the number
+# of pages, the page mapping, etc
+DEFAULT_CACHE_MAX_DOCS = 500
+# Default maximum number of pages for which we keep the text or the boxes
+DEFAULT_CACHE_MAX_PAGES = 1000
+
 
 def minmax_rects(rects):
     (mx1, my1, mx2, my2) = (math.inf, math.inf, 0, 0)
@@ -182,6 +190,12 @@ class PdfPageMapping(object):
                 self.reverse_mapping[target_page_idx] = orig_page_idx
 
     def save(self):
+        self._write()
+        # we are up-to-date with the file we just wrote: no need to reload
+        # it (page mtimes would be lost)
+        self.plugin._cache_page_mapping(self.doc_url, self)
+
+    def _write(self):
         if self.core.call_success("fs_isdir", self.doc_url) is None:
             return
 
@@ -326,14 +340,21 @@ class Plugin(openpaperwork_core.PluginBase):
 
     def __init__(self):
         super().__init__()
-        # we cache the hash of PDF files since they never change
-        self.cache_hash = {}
-        # we cache the number of pages in PDF files since they never change
-        # (real number before mapping)
-        self.cache_nb_pages = {}
-
-        self.cache_mappings = {}
-        self.cache_passwords = {}
+        # doc_url --> hash of the PDF file
+        # (version: mtime of the PDF file)
+        self.cache_hash = util.LRUCache(DEFAULT_CACHE_MAX_DOCS)
+        # doc_url --> number of pages in the PDF file (real number before
+        # mapping)
+        # (version: mtime of the PDF file)
+        self.cache_nb_pages = util.LRUCache(DEFAULT_CACHE_MAX_DOCS)
+        # doc_url --> PdfPageMapping
+        # (version: (mtime of the PDF file, mtime of the mapping file))
+        self.cache_mappings = util.LRUCache(DEFAULT_CACHE_MAX_DOCS)
+        self.cache_passwords = util.LRUCache(DEFAULT_CACHE_MAX_DOCS)
+
+        # (pdf_url, original page index, 'text'|'boxes') --> text or boxes
+        # (version: mtime of the PDF file)
+        self.cache_pages = util.LRUCache(DEFAULT_CACHE_MAX_PAGES)
 
     def get_interfaces(self):
         return [
@@ -350,6 +371,10 @@ class Plugin(openpaperwork_core.PluginBase):
 
     def get_deps(self):
         return [
+            {
+                'interface': 'config',
+                'defaults': ['openpaperwork_core.config'],
+            },
             {
                 'interface': 'fs',
                 'defaults': ['openpaperwork_gtk.fs.gio'],
@@ -375,12 +400,54 @@ class Plugin(openpaperwork_core.PluginBase):
                 'interface': 'poppler',
                 'defaults': ['paperwork_backend.poppler.memory'],
             },
+            {
+                'interface': 'poppler_pool',
+                'defaults': ['paperwork_backend.poppler.pool'],
+            },
             {
                 'interface': 'urls',
                 'defaults': ['openpaperwork_core.urls'],
             },
         ]
 
+    def init(self, core):
+        super().init(core)
+        for (setting, default) in (
+                    ('cache_max_docs', DEFAULT_CACHE_MAX_DOCS),
+                    ('cache_max_pages', DEFAULT_CACHE_MAX_PAGES),
+                ):
+            self.core.call_all(
+                "config_register", "pdf_" + setting,
+                self.core.call_success(
+                    "config_build_simple", "pdf", setting,
+                    lambda default=default: default
+                )
+            )
+            self.core.call_all(
+                "config_add_observer", "pdf_" + setting,
+                self._on_cache_config_changed
+            )
+        self._on_cache_config_changed()
+
+    def _on_cache_config_changed(self):
+        max_docs = int(
+            self.core.call_success("config_get", "pdf_cache_max_docs")
+        )
+        for cache in (
+                    self.cache_hash, self.cache_nb_pages,
+                    self.cache_mappings, self.cache_passwords
+                ):
+            cache.set_max_size(max_docs)
+        self.cache_pages.set_max_size(
+            int(self.core.call_success("config_get", "pdf_cache_max_pages"))
+        )
+
+    def perfcheck_get_counters(self, out: dict):
+        out.update(self.cache_hash.get_counters("pdf_hash_cache"))
+        out.update(self.cache_nb_pages.get_counters("pdf_nb_pages_cache"))
+        out.update(self.cache_mappings.get_counters("pdf_mapping_cache"))
+        out.update(self.cache_pages.get_counters("pdf_page_cache"))
+
     def _get_pdf_url(self, doc_url):
         if doc_url.endswith(".pdf"):
             return doc_url
@@ -400,16 +467,39 @@ class Plugin(openpaperwork_core.PluginBase):
         if self.core.call_success("fs_exists", passwd_url):
             with self.core.call_success("fs_open", passwd_url, "r") as fd:
                 password = fd.read().strip()
-        self.cache_passwords[doc_url] = password
+        self.cache_passwords.put(doc_url, password)
         return password
 
+    def _get_pdf_mtime(self, pdf_url):
+        if pdf_url is None:
+            return None
+        return self.core.call_success("fs_get_mtime", pdf_url)
+
+    def _get_page_mapping_version(self, doc_url):
+        map_url = self.core.call_success(
+            "fs_join", doc_url, PdfPageMapping.MAPPING_FILE
+        )
+        map_mtime = None
+        if self.core.call_success("fs_exists", map_url) is not None:
+            map_mtime = self.core.call_success("fs_get_mtime", map_url)
+        return (self._get_pdf_mtime(self._get_pdf_url(doc_url)), map_mtime)
+
     def _get_page_mapping(self, doc_url):
-        if doc_url in self.cache_mappings:
-            return self.cache_mappings[doc_url]
+        mapping = self.cache_mappings.get(
+            doc_url, version=self._get_page_mapping_version(doc_url)
+        )
+        if mapping is not None:
+            return mapping
         mapping = PdfPageMapping(self, doc_url)
-        self.cache_mappings[doc_url] = mapping
+        self._cache_page_mapping(doc_url, mapping)
         return mapping
 
+    def _cache_page_mapping(self, doc_url, mapping):
+        self.cache_mappings.put(
+            doc_url, mapping,
+            version=self._get_page_mapping_version(doc_url)
+        )
+
     def _open_pdf(self, doc_url):
         pdf_url = self._get_pdf_url(doc_url)
         if pdf_url is None:
@@ -418,10 +508,24 @@ class Plugin(openpaperwork_core.PluginBase):
         password = self._get_pdf_password(doc_url)
         LOGGER.info("Opening %s (password=%s)", pdf_url, bool(password))
         doc = self.core.call_success(
-            "poppler_open", pdf_url, password=password
+            "poppler_pool_open", pdf_url, password=password
         )
         return (pdf_url, doc)
 
+    def _poppler_execute(self, doc_url, cb, *args, **kwargs):
+        """
+        Poppler is not thread-safe: all the calls related to a given document
+        are run on the same thread of the Poppler pool (see
+        paperwork_backend.poppler.pool). Calls related to different
+        documents may run in parallel.
+        """
+        pdf_url = self._get_pdf_url(doc_url)
+        return self.core.call_one(
+            "poppler_pool_execute",
+            pdf_url if pdf_url is not None else doc_url,
+            cb, *args, **kwargs
+        )
+
     def is_doc(self, doc_url):
         pdf_url = self._get_pdf_url(doc_url)
         if pdf_url is None:
@@ -438,17 +542,26 @@ class Plugin(openpaperwork_core.PluginBase):
         self.cache_passwords.pop(doc_url, None)
         self.cache_mappings.pop(doc_url, None)
         self.cache_nb_pages.pop(doc_url, None)
+        pdf_url = self._get_pdf_url(doc_url)
+        if pdf_url is not None:
+            self.cache_pages.pop_if(lambda key: key[0] == pdf_url)
+            self.core.call_all("poppler_pool_forget", pdf_url)
 
     def doc_get_hash_by_url(self, doc_url):
         pdf_url = self._get_pdf_url(doc_url)
         if pdf_url is None:
             return
 
+        return self._get_pdf_hash(doc_url, pdf_url)
+
+    def _get_pdf_hash(self, doc_url, pdf_url):
         # cache the hash of doc.pdf to speed up imports
-        if doc_url not in self.cache_hash:
+        mtime = self._get_pdf_mtime(pdf_url)
+        h = self.cache_hash.get(doc_url, version=mtime)
+        if h is None:
             h = self.core.call_success("fs_hash", pdf_url)
-            self.cache_hash[doc_url] = h
-        return self.cache_hash[doc_url]
+            self.cache_hash.put(doc_url, h, version=mtime)
+        return h
 
     def page_internal_get_hash_by_url(self, out: list, doc_url, page_idx):
         pdf_url = self._get_pdf_url(doc_url)
@@ -461,11 +574,7 @@ class Plugin(openpaperwork_core.PluginBase):
             return
         out.append(page_hash)
 
-        # cache the hash of doc.pdf to speed up imports
-        if doc_url not in self.cache_hash:
-            h = self.core.call_success("fs_hash", pdf_url)
-            self.cache_hash[doc_url] = h
-        out.append(self.cache_hash[doc_url])
+        out.append(self._get_pdf_hash(doc_url, pdf_url))
 
     def doc_internal_get_mtime_by_url(self, out: list, doc_url):
         pdf_url = self._get_pdf_url(doc_url)
@@ -514,15 +623,14 @@ class Plugin(openpaperwork_core.PluginBase):
                 mapping.load()
             return mapping.nb_pages
 
-        if doc_url in self.cache_nb_pages:
-            r = self.cache_nb_pages[doc_url]
-        else:
-            # Poppler is not thread-safe
-            r = self.core.call_one(
-                "mainloop_execute", self._doc_get_real_nb_pages_by_url, doc_url
+        mtime = self._get_pdf_mtime(self._get_pdf_url(doc_url))
+        r = self.cache_nb_pages.get(doc_url, version=mtime)
+        if r is None:
+            r = self._poppler_execute(
+                doc_url, self._doc_get_real_nb_pages_by_url, doc_url
             )
             if r is not None:
-                self.cache_nb_pages[doc_url] = r
+                self.cache_nb_pages.put(doc_url, r, version=mtime)
         return r if r is not None else 0
 
     def doc_internal_get_nb_pages_by_url(self, out: list, doc_url):
@@ -594,68 +702,84 @@ class Plugin(openpaperwork_core.PluginBase):
                 rects.append(rect)
             yield (letters, rects)
 
-    def _doc_get_text_by_url(self, out: list, doc_url):
-        task = "pdf_get_text_by_url({})".format(doc_url)
-        self.core.call_all("on_perfcheck_start", task)
-
-        (pdf_url, pdf) = self._open_pdf(doc_url)
-        if pdf is None:
-            self.core.call_all("on_perfcheck_stop", task)
-            return
-        mapping = self._get_page_mapping(doc_url)
-
-        for page_idx in range(0, pdf.get_n_pages()):
-            if not mapping.has_original_page_idx(page_idx):
-                continue
-            page = pdf.get_page(page_idx)
-            # some PDF are really badly damaged
-            if page is None:
-                continue
-            try:
-                txt = page.get_text()
-                txt = txt.strip()
-            except UnicodeDecodeError as exc:
-                LOGGER.warning(
-                    "%s p%d: UnicodeDecodeError: Assuming page has no text",
-                    doc_url, page_idx, exc_info=exc
-                )
-                continue
-            if txt == "":
-                continue
-            out.append(txt)
-        self.core.call_all(
-            "on_perfcheck_stop", task, nb_pages=pdf.get_n_pages()
+    def _page_exists(self, doc_url, page_idx):
+        nb_pages = self.cache_nb_pages.get(
+            doc_url, version=self._get_pdf_mtime(self._get_pdf_url(doc_url))
         )
-        return True
+        return nb_pages is None or page_idx < nb_pages
 
-    def doc_get_text_by_url(self, out: list, doc_url):
-        # Poppler is not thread-safe
-        return self.core.call_one(
-            "mainloop_execute",
-            self._doc_get_text_by_url, out, doc_url
-        )
+    def _get_page_cache_key(self, doc_url, page_idx, what):
+        """
+        Returns ((pdf_url, page_idx, what), pdf_mtime)
+        """
+        pdf_url = self._get_pdf_url(doc_url)
+        mtime = self.core.call_success("fs_get_mtime", pdf_url)
+        return ((pdf_url, page_idx, what), mtime)
 
-    def _page_has_text_by_url(self, doc_url, page_idx):
-        if doc_url in self.cache_nb_pages:
-            if page_idx >= self.cache_nb_pages[doc_url]:
-                return None
+    def _get_page_text(self, doc_url, page_idx):
+        """
+        Returns the text of the page 'page_idx' (index in the PDF file).
+        Returns None if there is no such page, or False if its text cannot
+        be read.
+        Must be run on the Poppler pool (see _poppler_execute()).
+        """
+        if not self._page_exists(doc_url, page_idx):
+            return None
+
+        (key, mtime) = self._get_page_cache_key(doc_url, page_idx, 'text')
+        txt = self.cache_pages.get(key, version=mtime)
+        if txt is not None:
+            return txt
 
         (pdf_url, pdf) = self._open_pdf(doc_url)
         if pdf is None:
             return None
 
         page = pdf.get_page(page_idx)
+        # some PDF are really badly damaged
         if page is None:
             return None
 
         try:
-            return len(page.get_text().strip()) > 0
+            txt = page.get_text().strip()
         except UnicodeDecodeError as exc:
             LOGGER.warning(
                 "%s p%d: UnicodeDecodeError: Assuming page has no text",
                 doc_url, page_idx, exc_info=exc
             )
-            return False
+            txt = False
+        self.cache_pages.put(key, txt, version=mtime)
+        return txt
+
+    def _doc_get_text_by_url(self, out: list, doc_url):
+        task = "pdf_get_text_by_url({})".format(doc_url)
+        self.core.call_all("on_perfcheck_start", task)
+
+        nb_pages = self._doc_internal_get_nb_pages_by_url(
+            doc_url, mapping=False
+        )
+        mapping = self._get_page_mapping(doc_url)
+
+        for page_idx in range(0, nb_pages):
+            if not mapping.has_original_page_idx(page_idx):
+                continue
+            txt = self._get_page_text(doc_url, page_idx)
+            if not txt:
+                continue
+            out.append(txt)
+        self.core.call_all("on_perfcheck_stop", task, nb_pages=nb_pages)
+        return True if nb_pages > 0 else None
+
+    def doc_get_text_by_url(self, out: list, doc_url):
+        return self._poppler_execute(
+            doc_url, self._doc_get_text_by_url, out, doc_url
+        )
+
+    def _page_has_text_by_url(self, doc_url, page_idx):
+        txt = self._get_page_text(doc_url, page_idx)
+        if txt is None:
+            return None
+        return bool(txt)
 
     def page_has_text_by_url(self, doc_url, page_idx):
         pdf_url = self._get_pdf_url(doc_url)
@@ -665,32 +789,12 @@ class Plugin(openpaperwork_core.PluginBase):
         page_idx = mapping.get_original_page_idx(page_idx)
         if page_idx is None:
             return None
-        # Poppler is not thread-safe
-        return self.core.call_one(
-            "mainloop_execute", self._page_has_text_by_url, doc_url, page_idx
+        return self._poppler_execute(
+            doc_url, self._page_has_text_by_url, doc_url, page_idx
         )
 
     def _page_get_text_by_url(self, doc_url, page_idx):
-        if doc_url in self.cache_nb_pages:
-            if page_idx >= self.cache_nb_pages[doc_url]:
-                return None
-
-        (pdf_url, pdf) = self._open_pdf(doc_url)
-        if pdf is None:
-            return None
-
-        page = pdf.get_page(page_idx)
-        if page is None:
-            return None
-
-        try:
-            return page.get_text().strip()
-        except UnicodeDecodeError as exc:
-            LOGGER.warning(
-                "%s p%d: UnicodeDecodeError: Assuming page has no text",
-                doc_url, page_idx, exc_info=exc
-            )
-            return False
+        return self._get_page_text(doc_url, page_idx)
 
     def page_get_text_by_url(self, doc_url, page_idx):
         pdf_url = self._get_pdf_url(doc_url)
@@ -700,16 +804,25 @@ class Plugin(openpaperwork_core.PluginBase):
         page_idx = mapping.get_original_page_idx(page_idx)
         if page_idx is None:
             return None
-        # Poppler is not thread-safe
-        return self.core.call_one(
-            "mainloop_execute", self._page_get_text_by_url, doc_url, page_idx
+        return self._poppler_execute(
+            doc_url, self._page_get_text_by_url, doc_url, page_idx
         )
 
     def _page_get_boxes_by_url(self, doc_url, page_idx):
-        if doc_url in self.cache_nb_pages:
-            if page_idx >= self.cache_nb_pages[doc_url]:
+        if not self._page_exists(doc_url, page_idx):
+            return None
+
+        (key, mtime) = self._get_page_cache_key(doc_url, page_idx, 'boxes')
+        line_boxes = self.cache_pages.get(key, version=mtime)
+        if line_boxes is None:
+            line_boxes = self._get_page_boxes(doc_url, page_idx)
+            if line_boxes is None:
                 return None
+            self.cache_pages.put(key, line_boxes, version=mtime)
+        # the caller may modify the list
+        return list(line_boxes)
 
+    def _get_page_boxes(self, doc_url, page_idx):
         (pdf_url, pdf) = self._open_pdf(doc_url)
         if pdf is None:
             return
@@ -755,9 +868,8 @@ class Plugin(openpaperwork_core.PluginBase):
         page_idx = mapping.get_original_page_idx(page_idx)
         if page_idx is None:
             return None
-        # Poppler is not thread-safe
-        return self.core.call_one(
-            "mainloop_execute", self._page_get_boxes_by_url, doc_url, page_idx
+        return self._poppler_execute(
+            doc_url, self._page_get_boxes_by_url, doc_url, page_idx
         )
 
     def doc_pdf_import(self, src_file_uri, password=None, target_doc_id=None):
@@ -821,9 +933,8 @@ class Plugin(openpaperwork_core.PluginBase):
         mapping.save()
 
     def _page_get_paper_size_by_url(self, doc_url, page_idx):
-        if doc_url in self.cache_nb_pages:
-            if page_idx >= self.cache_nb_pages[doc_url]:
-                return None
+        if not self._page_exists(doc_url, page_idx):
+            return None
 
         (pdf_url, pdf) = self._open_pdf(doc_url)
         if pdf is None:
@@ -850,10 +961,8 @@ class Plugin(openpaperwork_core.PluginBase):
         page_idx = mapping.get_original_page_idx(page_idx)
         if page_idx is None:
             return None
-        # Poppler is not thread-safe
-        return self.core.call_one(
-            "mainloop_execute",
-            self._page_get_paper_size_by_url, doc_url, page_idx
+        return self._poppler_execute(
+            doc_url, self._page_get_paper_size_by_url, doc_url, page_idx
         )
 
     def page_move_by_url(
@@ -7,6 +7,7 @@ import PIL.Image
 
 import openpaperwork_core
 import openpaperwork_core.promise
+import openpaperwork_core.thread
 
 from . import util
 
@@ -56,7 +57,8 @@ class Plugin(openpaperwork_core.PluginBase):
 
     def thumbnail_get_doc_promise(self, doc_url):
         return openpaperwork_core.promise.ThreadedPromise(
-            self.core, self.thumbnail_get_doc, args=(doc_url,)
+            self.core, self.thumbnail_get_doc, args=(doc_url,),
+            priority=openpaperwork_core.thread.PRIORITY_INTERACTIVE
         )
 
     def thumbnail_from_img(self, img):
@@ -136,7 +138,8 @@ class Plugin(openpaperwork_core.PluginBase):
 
     def thumbnail_get_page_promise(self, doc_url, page_idx):
         return openpaperwork_core.promise.ThreadedPromise(
-            self.core, self.thumbnail_get_page, args=(doc_url, page_idx)
+            self.core, self.thumbnail_get_page, args=(doc_url, page_idx),
+            priority=openpaperwork_core.thread.PRIORITY_INTERACTIVE
         )
 
     def page_delete_by_url(self, doc_url, page_idx):
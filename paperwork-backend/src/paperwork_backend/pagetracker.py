@@ -5,63 +5,163 @@ to track pages that have not yet being treated in each document.
 For instance, when a document is notified as updated (see transactions), the
 OCR plugin needs to know which pages of this document have already been
 OCR-ed and which haven't.
+
+All the page trackers (OCR, orientation, cropping, etc) store their state in
+the same database, and all the trackers of a batch of transactions share
+the same session: the same batch of SQL writes and the same snapshot of the
+page hashes. Computing a page hash means reading the page files, so the
+hash of a page is computed only once and then reused by all the trackers,
+instead of once per tracker. A tracker modifying a page (for instance
+cropping it) says so when acknowledging it: only then the hash is computed
+again, and the snapshot updated for the following trackers.
+
+The session is started when a batch of transactions starts (see
+`page_tracker_session_start()`) and ended once all its transactions have
+been committed or cancelled: the writes are then committed. Cancelling a
+tracker only reverts its own changes.
 """
 import logging
+import sqlite3
+import threading
 
 import openpaperwork_core
+import openpaperwork_core.sqlite
+
+from . import sync
 
 
 LOGGER = logging.getLogger(__name__)
 
+SQL_FILE_NAME = "page_tracking.db"
+# Prior to the consolidation, each tracker had its own database
+OLD_SQL_FILE_PREFIX = "page_tracking_"
+OLD_SQL_FILE_SUFFIX = ".db"
+
 CREATE_TABLES = [
     (
         "CREATE TABLE IF NOT EXISTS pages ("
+        " tracking_id TEXT NOT NULL,"
         " doc_id TEXT NOT NULL,"
         " page INTEGER NOT NULL,"
         " hash TEXT NOT NULL,"
-        " PRIMARY KEY (doc_id, page)"
+        " PRIMARY KEY (tracking_id, doc_id, page)"
         ")"
     ),
 ]
 
 
-class PageTracker(object):
-    def __init__(self, core, sql_url):
-        self.core = core
-        self.sql = self.core.call_one(
-            "sqlite_execute",
-            self.core.call_success,
-            "sqlite_open", sql_url
-        )
-        for query in CREATE_TABLES:
-            self.core.call_one("sqlite_execute", self.sql.execute, query)
+class Session(object):
+    """
+    Shared by all the page trackers of a batch of transactions: the writes
+    of the trackers, and one snapshot of the page hashes.
+    """
+    def __init__(self, plugin, batch_size):
+        self.plugin = plugin
+        self.core = plugin.core
+        self.sql = plugin.sql
 
-        self.core.call_one(
-            "sqlite_execute", self.sql.execute, "BEGIN TRANSACTION"
+        # writes are buffered and only run when the batch is full, when
+        # we need to read from the DB, or when the session ends
+        self.batch = openpaperwork_core.sqlite.WriteBatch(
+            self.core, self.sql, batch_size
         )
 
-    def _close(self):
-        LOGGER.info("Closing page tracker db ...")
-        self.core.call_one(
-            "sqlite_execute",
-            self.core.call_success,
-            "sqlite_close", self.sql
+        # (doc_url, page_idx) --> page hash
+        self.page_hashes = {}
+        self.lock = threading.Lock()
+
+        # True if the session is ended by a SessionTransaction, False if it
+        # must be ended with `page_tracker_session_end()`
+        self.in_batch = False
+
+    def get_page_hash(self, doc_url, page_idx):
+        key = (doc_url, page_idx)
+        with self.lock:
+            page_hash = self.page_hashes.get(key)
+        if page_hash is not None:
+            self.plugin.nb_hashes_shared += 1
+            return page_hash
+        page_hash = self.core.call_success(
+            "page_get_hash_by_url", doc_url, page_idx
         )
-        self.sql = None
+        self.plugin.nb_hashes_computed += 1
+        with self.lock:
+            self.page_hashes[key] = page_hash
+        return page_hash
+
+    def invalidate_page(self, doc_url, page_idx):
+        with self.lock:
+            self.page_hashes.pop((doc_url, page_idx), None)
+
+
+class SessionTransaction(sync.BaseTransaction):
+    """
+    Ends the session of a batch of transactions once all the other
+    transactions (and therefore the page trackers) have been committed or
+    cancelled.
+    """
+    def __init__(self, plugin, session, total_expected=-1):
+        super().__init__(plugin.core, total_expected)
+        # lower than all the other transactions
+        self.priority = -1000000
+        self.plugin = plugin
+        self.session = session
 
     def cancel(self):
-        if self.sql is None:
-            return
-        self.core.call_one(
-            "sqlite_execute", self.sql.execute, "ROLLBACK"
-        )
-        self._close()
+        super().cancel()
+        self.plugin._end_session(self.session)
 
     def commit(self):
-        if self.sql is None:
+        super().commit()
+        self.plugin._end_session(self.session)
+
+
+class PageTracker(object):
+    def __init__(self, plugin, session, tracking_id):
+        self.plugin = plugin
+        self.core = plugin.core
+        self.session = session
+        self.tracking_id = tracking_id
+        # Content of the database for the documents modified by this
+        # tracker, before the modifications, so they can be reverted if the
+        # tracker is cancelled: doc_id --> {page_idx: page hash}
+        self.original = {}
+
+    def cancel(self):
+        if self.session is None:
             return
-        self.core.call_one("sqlite_execute", self.sql.execute, "COMMIT")
-        self._close()
+        for (doc_id, db_pages) in self.original.items():
+            self.session.batch.execute(
+                "DELETE FROM pages WHERE tracking_id = ? AND doc_id = ?",
+                (self.tracking_id, doc_id)
+            )
+            for (page_idx, page_hash) in db_pages.items():
+                self.session.batch.execute(
+                    "INSERT INTO pages (tracking_id, doc_id, page, hash)"
+                    " VALUES (?, ?, ?, ?)",
+                    (self.tracking_id, doc_id, page_idx, page_hash)
+                )
+        self.original = {}
+        self.session = None
+
+    def commit(self):
+        # the changes are written when the session ends
+        self.original = {}
+        self.session = None
+
+    def _get_db_pages(self, doc_id):
+        sql = self.session.sql
+        db_pages = self.session.batch.flush(lambda: {
+            r[0]: r[1]
+            for r in sql.execute(
+                "SELECT page, hash FROM pages"
+                " WHERE tracking_id = ? AND doc_id = ?",
+                (self.tracking_id, doc_id)
+            )
+        })
+        if doc_id not in self.original:
+            self.original[doc_id] = dict(db_pages)
+        return db_pages
 
     def find_changes(self, doc_id, doc_url):
         """
@@ -72,16 +172,10 @@ class PageTracker(object):
 
         out = []
 
-        db_pages = self.core.call_one(
-            "sqlite_execute", self.sql.execute,
-            "SELECT page, hash FROM pages"
-            " WHERE doc_id = ?",
-            (doc_id,)
-        )
-        db_pages = self.core.call_one(
-            "sqlite_execute",
-            lambda pages: {r[0]: int(r[1], 16) for r in pages}, db_pages
-        )
+        db_pages = {
+            page_idx: int(page_hash, 16)
+            for (page_idx, page_hash) in self._get_db_pages(doc_id).items()
+        }
         db_hashes = set(db_pages.values())
 
         fs_nb_pages = self.core.call_success(
@@ -89,9 +183,7 @@ class PageTracker(object):
         )
         fs_pages = {}
         for page_idx in range(0, fs_nb_pages):
-            fs_pages[page_idx] = self.core.call_success(
-                "page_get_hash_by_url", doc_url, page_idx
-            )
+            fs_pages[page_idx] = self.session.get_page_hash(doc_url, page_idx)
 
         for (page_idx, fs_page_hash) in fs_pages.items():
             if page_idx not in db_pages:
@@ -106,41 +198,57 @@ class PageTracker(object):
                         out.append(('upd', page_idx))
 
         for (db_page_idx, h) in db_pages.items():
-            self.core.call_one(
-                "sqlite_execute", self.sql.execute,
+            self.session.batch.execute(
                 "DELETE FROM pages"
-                " WHERE doc_id = ? AND page = ?",
-                (doc_id, db_page_idx)
+                " WHERE tracking_id = ? AND doc_id = ? AND page = ?",
+                (self.tracking_id, doc_id, db_page_idx)
             )
 
         return out
 
-    def ack_page(self, doc_id, doc_url, page_idx):
+    def ack_page(self, doc_id, doc_url, page_idx, modified=False):
         """
-        Mark the page update has handled.
+        Mark the page update has handled. `modified` must be True if the
+        caller may have modified the page (its hash is then computed
+        again).
         """
-        page_hash = self.core.call_success(
-            "page_get_hash_by_url", doc_url, page_idx
-        )
-        self.core.call_one(
-            "sqlite_execute", self.sql.execute,
+        if doc_id not in self.original:
+            self._get_db_pages(doc_id)
+        if modified:
+            self.plugin._invalidate_page(doc_url, page_idx)
+        page_hash = self.session.get_page_hash(doc_url, page_idx)
+        self.session.batch.execute(
             "INSERT OR REPLACE"
-            " INTO pages (doc_id, page, hash)"
-            " VALUES (?, ?, ?)",
-            (doc_id, page_idx, format(page_hash, 'x'))
+            " INTO pages (tracking_id, doc_id, page, hash)"
+            " VALUES (?, ?, ?, ?)",
+            (self.tracking_id, doc_id, page_idx, format(page_hash, 'x'))
         )
 
     def delete_doc(self, doc_id):
-        self.core.call_one(
-            "sqlite_execute", self.sql.execute,
-            "DELETE FROM pages WHERE doc_id = ?",
-            (doc_id,)
+        if doc_id not in self.original:
+            self._get_db_pages(doc_id)
+        self.session.batch.execute(
+            "DELETE FROM pages WHERE tracking_id = ? AND doc_id = ?",
+            (self.tracking_id, doc_id)
         )
 
 
 class Plugin(openpaperwork_core.PluginBase):
+    # doc_transaction_start() must start the session before the page
+    # trackers are created (see doctracker)
+    PRIORITY = 100000
+
     def __init__(self):
-        pass
+        super().__init__()
+        self.sql = None
+        # all the sessions not ended yet. They all share the same SQL
+        # connection and transaction.
+        self.sessions = set()
+        # session used by the page trackers requested now
+        self.session = None
+        self.lock = threading.Lock()
+        self.nb_hashes_computed = 0
+        self.nb_hashes_shared = 0
 
     def get_interfaces(self):
         return ['page_tracking']
@@ -176,12 +284,186 @@ class Plugin(openpaperwork_core.PluginBase):
             },
         ]
 
-    def page_tracker_get(self, tracking_id):
+    def _migrate(self, sql, paperwork_dir):
+        """
+        Move the content of the old per-tracker databases into the shared
+        one.
+        """
+        old_files = self.core.call_success("fs_listdir", paperwork_dir)
+        if old_files is None:
+            return
+        for old_file in list(old_files):
+            name = self.core.call_success("fs_basename", old_file)
+            if (not name.startswith(OLD_SQL_FILE_PREFIX) or
+                    not name.endswith(OLD_SQL_FILE_SUFFIX)):
+                continue
+            tracking_id = name[
+                len(OLD_SQL_FILE_PREFIX):-len(OLD_SQL_FILE_SUFFIX)
+            ]
+            LOGGER.info(
+                "Migrating page tracking '%s' (%s) ...", tracking_id, old_file
+            )
+            try:
+                old_sql = self.core.call_success("sqlite_open", old_file)
+                try:
+                    rows = [
+                        (tracking_id, r[0], r[1], r[2])
+                        for r in old_sql.execute(
+                            "SELECT doc_id, page, hash FROM pages"
+                        )
+                    ]
+                finally:
+                    self.core.call_success(
+                        "sqlite_close", old_sql, optimize=False
+                    )
+            except sqlite3.Error as exc:
+                # worst case, the pages will be examined again
+                LOGGER.warning(
+                    "Failed to migrate %s. Ignoring it", old_file,
+                    exc_info=exc
+                )
+                rows = []
+            sql.execute("BEGIN TRANSACTION")
+            sql.executemany(
+                "INSERT OR IGNORE"
+                " INTO pages (tracking_id, doc_id, page, hash)"
+                " VALUES (?, ?, ?, ?)",
+                rows
+            )
+            sql.execute("COMMIT")
+            for suffix in ("", "-wal", "-shm"):
+                self.core.call_success(
+                    "fs_unlink", old_file + suffix, trash=False
+                )
+            LOGGER.info(
+                "%d pages migrated from page tracking '%s'",
+                len(rows), tracking_id
+            )
+
+    def _open_db(self):
         paperwork_dir = self.core.call_success(
             "data_dir_handler_get_individual_data_dir"
         )
         sql_file = self.core.call_success(
-            "fs_join", paperwork_dir,
-            'page_tracking_{}.db'.format(tracking_id)
+            "fs_join", paperwork_dir, SQL_FILE_NAME
         )
-        return PageTracker(self.core, sql_file)
+        sql = self.core.call_success("sqlite_open", sql_file)
+        for query in CREATE_TABLES:
+            sql.execute(query)
+        self._migrate(sql, paperwork_dir)
+        return sql
+
+    def _start_session(self, batch_size, in_batch):
+        def start():
+            with self.lock:
+                if not in_batch and self.session is not None:
+                    return self.session
+            if self.sql is None:
+                self.sql = self._open_db()
+                self.sql.execute("BEGIN TRANSACTION")
+            session = Session(self, batch_size)
+            session.in_batch = in_batch
+            with self.lock:
+                self.sessions.add(session)
+                self.session = session
+            return session
+
+        # the sessions are only started and ended from the main loop (like
+        # all the other SQL calls)
+        return self.core.call_one("sqlite_execute", start)
+
+    def _end_session(self, session):
+        """
+        Write the changes of the trackers of the session (those of the
+        cancelled trackers have already been reverted) and commit them.
+        The changes written by the other sessions so far are committed
+        too: they are only acknowledgements of pages already handled.
+        """
+        def end():
+            with self.lock:
+                if session not in self.sessions:
+                    # already ended
+                    return
+                self.sessions.remove(session)
+                nb_sessions = len(self.sessions)
+            self.sql.execute("COMMIT")
+            if nb_sessions > 0:
+                self.sql.execute("BEGIN TRANSACTION")
+                return
+            LOGGER.info("Closing page tracker db ...")
+            self.core.call_success("sqlite_close", self.sql)
+            self.sql = None
+
+        with self.lock:
+            if self.session is session:
+                self.session = None
+        session.batch.flush(end)
+
+    def doc_transaction_start(self, out: list, total_expected=-1):
+        self.page_tracker_session_start(out, total_expected)
+
+    def page_tracker_session_start(self, out: list, total_expected=-1):
+        """
+        A batch of transactions starts: all the page trackers requested
+        until the next batch share the same session. The session is ended
+        by the transaction added to `out`, once all the other transactions
+        of the batch have been committed or cancelled.
+        """
+        self.page_tracker_session_end()
+
+        session = self._start_session(
+            openpaperwork_core.sqlite.DEFAULT_BATCH_SIZE, in_batch=True
+        )
+        out.append(SessionTransaction(self, session, total_expected))
+
+    def page_tracker_get(
+            self, tracking_id,
+            batch_size=openpaperwork_core.sqlite.DEFAULT_BATCH_SIZE):
+        """
+        Returns a page tracker. The caller must call its method `commit()`
+        or `cancel()` once done. Trackers share the session of the current
+        batch of transactions (database writes and page hashes).
+
+        Outside of a batch of transactions, a new session is started (with
+        the given `batch_size`) and the caller must end it with
+        `page_tracker_session_end()` once all its trackers are done.
+        """
+        with self.lock:
+            session = self.session
+        if session is None:
+            session = self._start_session(batch_size, in_batch=False)
+        return PageTracker(self, session, tracking_id)
+
+    def page_tracker_session_end(self):
+        """
+        End the session started by `page_tracker_get()` outside of any batch
+        of transactions, if any. Changes of its page trackers not committed
+        nor cancelled yet are written too.
+        """
+        with self.lock:
+            session = self.session
+        if session is not None and not session.in_batch:
+            self._end_session(session)
+
+    def on_page_modification_end(self, doc_id, page_idx):
+        # modified outside of the page trackers (user page edit, etc)
+        doc_url = self.core.call_success("doc_id_to_url", doc_id)
+        if doc_url is None:
+            return
+        self._invalidate_page(doc_url, page_idx)
+
+    def _invalidate_page(self, doc_url, page_idx):
+        with self.lock:
+            sessions = list(self.sessions)
+        for session in sessions:
+            session.invalidate_page(doc_url, page_idx)
+
+    def on_quit(self):
+        with self.lock:
+            sessions = list(self.sessions)
+        for session in sessions:
+            self._end_session(session)
+
+    def perfcheck_get_counters(self, out: dict):
+        out['page_tracker_hashes_computed'] = self.nb_hashes_computed
+        out['page_tracker_hashes_shared'] = self.nb_hashes_shared
@@ -1,37 +1,105 @@
 import io
 import logging
+import sys
 
 import PIL
 import PIL.Image
+import PIL.ImageChops
 
 import openpaperwork_core
 import openpaperwork_core.deps
 
 
+CAIRO_AVAILABLE = False
+
+try:
+    import cairo
+    CAIRO_AVAILABLE = True
+except (ImportError, ValueError):
+    pass
+
+
 LOGGER = logging.getLogger(__name__)
 
 
-def surface2image(core, surface):
+def _surface2image_buffer(core, surface):
     """
-    Convert a cairo surface into a PIL image
+    Convert a cairo surface into a PIL image by reading directly the memory
+    of the surface. Returns None if the surface can't be read this way.
     """
-    # XXX(Jflesch): Python 3 problem
-    # cairo.ImageSurface.get_data() raises NotImplementedYet ...
-
-    # import PIL.ImageDraw
-    #
-    # if surface is None:
-    #     return None
-    # dimension = (surface.get_width(), surface.get_height())
-    # img = PIL.Image.frombuffer("RGBA", dimension,
-    #                            surface.get_data(), "raw", "BGRA", 0, 1)
-    #
-    # background = PIL.Image.new("RGB", img.size, (255, 255, 255))
-    # background.paste(img, mask=img.split()[3])  # 3 is the alpha channel
-    # return background
+    if not CAIRO_AVAILABLE:
+        return None
+    surface = surface.surface
+    fmt = surface.get_format()
+    if fmt == cairo.FORMAT_ARGB32:
+        has_alpha = True
+    elif fmt == cairo.FORMAT_RGB24:
+        has_alpha = False
+    else:
+        return None
 
-    core.call_all("on_perfcheck_start", "surface2image")
+    size = (surface.get_width(), surface.get_height())
+    if (PIL.Image.MAX_IMAGE_PIXELS is not None and
+            size[0] * size[1] > 2 * PIL.Image.MAX_IMAGE_PIXELS):
+        # same limit than PIL.Image.open()
+        LOGGER.warning("Cairo surface is too big: %s", size)
+        return core.call_success("pillow_get_error", "too_big")
+
+    surface.flush()
+    try:
+        data = surface.get_data()
+    except NotImplementedError:
+        # old versions of Pycairo
+        return None
+
+    img = buffer2image(
+        data, size, surface.get_stride(), has_alpha, sys.byteorder
+    )
+    core.call_all("on_objref_track", img)
+    return img
+
+
+def buffer2image(data, size, stride, has_alpha, byteorder="little"):
+    """
+    Convert the content of a Cairo surface (FORMAT_ARGB32 or FORMAT_RGB24)
+    into a RGB PIL image. Transparent pixels are drawn on a white background.
+
+    Pixels are native-endian 32bits integers, so on little-endian systems
+    they are stored as BGRA in memory. In FORMAT_ARGB32, colors are
+    premultiplied by the alpha channel: drawn over a white background, each
+    color becomes `color + (255 - alpha)`.
+    """
+    if byteorder == "little":
+        (rawmode, rawmode_no_alpha) = ("BGRA", "BGRX")
+    else:
+        (rawmode, rawmode_no_alpha) = ("ARGB", "XRGB")
+
+    if not has_alpha:
+        return PIL.Image.frombuffer(
+            "RGB", size, data, "raw", rawmode_no_alpha, stride, 1
+        )
 
+    # the data are copied here: the surface is usually destroyed
+    # right after the conversion
+    img = PIL.Image.frombuffer("RGBA", size, data, "raw", rawmode, stride, 1)
+    alpha = img.getchannel("A")
+    (min_alpha, max_alpha) = alpha.getextrema()
+    img_no_alpha = img.convert("RGB")
+    if min_alpha >= 255:
+        # fully opaque (pages are rendered on a white background)
+        return img_no_alpha
+    transparency = PIL.ImageChops.invert(alpha)
+    return PIL.ImageChops.add(
+        img_no_alpha,
+        PIL.Image.merge("RGB", (transparency, transparency, transparency))
+    )
+
+
+def _surface2image_png(core, surface):
+    """
+    Convert a cairo surface into a PIL image by encoding it as PNG and
+    decoding it with PIL. Slow, but works with any surface.
+    """
     img_io = io.BytesIO()
     surface.surface.write_to_png(img_io)
     img_io.seek(0)
@@ -44,18 +112,28 @@ def surface2image(core, surface):
     img.load()
 
     if "A" not in img.getbands():
-        core.call_all("on_perfcheck_stop", "surface2image", size=img.size)
         return img
 
     img_no_alpha = PIL.Image.new("RGB", img.size, (255, 255, 255))
     core.call_all("on_objref_track", img_no_alpha)
     img_no_alpha.paste(img, mask=img.split()[3])  # 3 is the alpha channel
-    core.call_all(
-        "on_perfcheck_stop", "surface2image", size=img_no_alpha.size
-    )
     return img_no_alpha
 
 
+def surface2image(core, surface, use_buffer=True):
+    """
+    Convert a cairo surface into a PIL image
+    """
+    core.call_all("on_perfcheck_start", "surface2image")
+    img = None
+    if use_buffer:
+        img = _surface2image_buffer(core, surface)
+    if img is None:
+        img = _surface2image_png(core, surface)
+    core.call_all("on_perfcheck_stop", "surface2image", size=img.size)
+    return img
+
+
 class Plugin(openpaperwork_core.PluginBase):
     FILE_EXTENSION = ".pdf"
 
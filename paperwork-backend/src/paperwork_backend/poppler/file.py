@@ -53,7 +53,13 @@ class Plugin(openpaperwork_core.PluginBase):
         if not POPPLER_AVAILABLE:
             out['poppler'] = openpaperwork_core.deps.POPPLER
 
-    def poppler_open(self, url, password=None):
+    def poppler_open(self, url, password=None, in_mainloop=True):
+        """
+        Poppler is not thread-safe: by default, the document is opened on
+        the main loop. Callers that make sure a document is only used by a
+        single thread (see paperwork_backend.poppler.pool) may set
+        `in_mainloop=False`.
+        """
         if os.name == "nt":
             # WORKAROUND(Jflesch):
             # Disabled for now on Windows: There is a file descriptor leak
@@ -63,9 +69,12 @@ class Plugin(openpaperwork_core.PluginBase):
             return None
 
         gio_file = Gio.File.new_for_uri(url)
-        doc = self.core.call_one(
-            "mainloop_execute", Poppler.Document.new_from_gfile,
-            gio_file, password=password
-        )
+        if in_mainloop:
+            doc = self.core.call_one(
+                "mainloop_execute", Poppler.Document.new_from_gfile,
+                gio_file, password=password
+            )
+        else:
+            doc = Poppler.Document.new_from_gfile(gio_file, password=password)
         self.core.call_all("on_objref_track", doc)
         return doc
@@ -58,7 +58,13 @@ class Plugin(openpaperwork_core.PluginBase):
         if not POPPLER_AVAILABLE:
             out['poppler'] = openpaperwork_core.deps.POPPLER
 
-    def poppler_open(self, url, password=None):
+    def poppler_open(self, url, password=None, in_mainloop=True):
+        """
+        Poppler is not thread-safe: by default, the document is opened on
+        the main loop. Callers that make sure a document is only used by a
+        single thread (see paperwork_backend.poppler.pool) may set
+        `in_mainloop=False`.
+        """
         # Poppler.Document.new_from_data() expects .. a string
         # Poppler.Document.new_from_bytes() only exist starting with 0.82
         with self.core.call_success("fs_open", url, "rb") as fd:
@@ -70,8 +76,13 @@ class Plugin(openpaperwork_core.PluginBase):
         # --> use Gio.MemoryInputStream.new_from_bytes() instead
         data = Gio.MemoryInputStream.new_from_bytes(data)
         self.core.call_all("on_objref_track", data)
-        doc = self.core.call_one(
-            "mainloop_execute", Poppler.Document.new_from_stream,
-            data, ldata, password=password
-        )
+        if in_mainloop:
+            doc = self.core.call_one(
+                "mainloop_execute", Poppler.Document.new_from_stream,
+                data, ldata, password=password
+            )
+        else:
+            doc = Poppler.Document.new_from_stream(
+                data, ldata, password=password
+            )
         return doc
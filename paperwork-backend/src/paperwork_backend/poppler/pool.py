@@ -0,0 +1,223 @@
+"""
+Poppler is not thread-safe: a Poppler document must not be used from
+multiple threads at the same time. So far, all the calls to Poppler were
+run on the main loop, meaning that indexing, OCR checks and search previews
+all had to wait for the UI (and the UI for them).
+
+This plugin runs Poppler calls on a pool of worker threads instead.
+A given document is always handled by the same worker thread (chosen based
+on its URL), so each `Poppler.Document` is only ever used by the thread
+that opened it. Calls related to different documents may run in parallel.
+
+Each worker keeps the last documents it opened (LRU), validated with their
+modification time. The number of documents kept by each worker can be
+configured ('poppler_cache_max_docs').
+"""
+
+import concurrent.futures
+import logging
+import os
+import queue
+import threading
+
+import openpaperwork_core
+
+from .. import util
+
+
+LOGGER = logging.getLogger(__name__)
+
+NB_THREADS = min(4, os.cpu_count() or 1)
+# Default number of opened documents kept by each worker thread
+DEFAULT_MAX_OPEN_DOCS_PER_THREAD = 8
+
+
+class Request(object):
+    def __init__(self, cb, args, kwargs):
+        self.cb = cb
+        self.args = args
+        self.kwargs = kwargs
+        self.future = concurrent.futures.Future()
+
+    def do(self):
+        try:
+            self.future.set_result(self.cb(*self.args, **self.kwargs))
+        except Exception as exc:
+            self.future.set_exception(exc)
+
+
+class Thread(threading.Thread):
+    def __init__(self, plugin, thread_idx):
+        super().__init__(name="poppler_pool_{}".format(thread_idx))
+        self.plugin = plugin
+        self.core = plugin.core
+        self.daemon = True
+        self.requests = queue.Queue()
+        # url --> Poppler document (version: mtime)
+        # Only used by this thread: documents are never released by another
+        # thread.
+        self.docs = util.LRUCache(plugin.max_docs)
+
+    def run(self):
+        LOGGER.info("Poppler thread %s ready", self.name)
+        while True:
+            request = self.requests.get()
+            if request is None:
+                break
+            request.do()
+        self.docs.clear()
+        LOGGER.info("Poppler thread %s stopped", self.name)
+
+    def open(self, url, password):
+        if self.docs.max_size != self.plugin.max_docs:
+            self.docs.set_max_size(self.plugin.max_docs)
+
+        mtime = self.core.call_success("fs_get_mtime", url)
+        doc = self.docs.get(url, version=mtime)
+        if doc is not None:
+            return doc
+
+        doc = self.core.call_success(
+            "poppler_open", url, password=password, in_mainloop=False
+        )
+        if doc is None:
+            return None
+        self.docs.put(url, doc, version=mtime)
+        return doc
+
+    def forget(self, url):
+        self.docs.pop(url)
+
+
+class Plugin(openpaperwork_core.PluginBase):
+    def __init__(self):
+        super().__init__()
+        self.threads = None
+        self.lock = threading.Lock()
+        self.max_docs = DEFAULT_MAX_OPEN_DOCS_PER_THREAD
+        # counters of the threads that have been stopped
+        self.stopped_counters = {}
+
+    def get_interfaces(self):
+        return ['poppler_pool']
+
+    def get_deps(self):
+        return [
+            {
+                'interface': 'config',
+                'defaults': ['openpaperwork_core.config'],
+            },
+            {
+                'interface': 'fs',
+                'defaults': ['openpaperwork_gtk.fs.gio'],
+            },
+            {
+                'interface': 'poppler',
+                'defaults': ['paperwork_backend.poppler.memory'],
+            },
+        ]
+
+    def init(self, core):
+        super().init(core)
+        setting = self.core.call_success(
+            "config_build_simple", "poppler", "cache_max_docs",
+            lambda: DEFAULT_MAX_OPEN_DOCS_PER_THREAD
+        )
+        self.core.call_all(
+            "config_register", "poppler_cache_max_docs", setting
+        )
+        self.core.call_all(
+            "config_add_observer", "poppler_cache_max_docs",
+            self._on_config_changed
+        )
+        self._on_config_changed()
+
+    def _on_config_changed(self):
+        # applied by each thread the next time it opens a document
+        self.max_docs = int(
+            self.core.call_success("config_get", "poppler_cache_max_docs")
+        )
+
+    def _get_thread(self, url):
+        with self.lock:
+            if self.threads is None:
+                self.threads = [
+                    Thread(self, idx) for idx in range(0, NB_THREADS)
+                ]
+                for thread in self.threads:
+                    thread.start()
+            # always the same thread for a given document
+            return self.threads[hash(url) % len(self.threads)]
+
+    def poppler_pool_execute(self, url, cb, *args, **kwargs):
+        """
+        Run the callback on the worker thread in charge of the document
+        `url` and wait for its result. The callback can then use
+        `poppler_pool_open()` to get the Poppler document.
+        """
+        if isinstance(threading.current_thread(), Thread):
+            # we are already on a worker thread: don't wait for ourselves
+            return cb(*args, **kwargs)
+        request = Request(cb, args, kwargs)
+        self._get_thread(url).requests.put(request)
+        return request.future.result()
+
+    def poppler_pool_open(self, url, password=None):
+        """
+        Must be called from a callback run with `poppler_pool_execute()`.
+        The returned document must not be used outside of this callback.
+        """
+        thread = threading.current_thread()
+        assert isinstance(thread, Thread), \
+            "poppler_pool_open() called outside of the Poppler threads"
+        return thread.open(url, password)
+
+    def poppler_pool_forget(self, url):
+        """
+        Close the document `url` if it is currently opened.
+        """
+        with self.lock:
+            threads = self.threads
+        if threads is None:
+            return
+        thread = threads[hash(url) % len(threads)]
+        if thread is threading.current_thread():
+            thread.forget(url)
+            return
+        request = Request(thread.forget, (url,), {})
+        thread.requests.put(request)
+        request.future.result()
+
+    def _get_counters(self, threads):
+        counters = {}
+        for thread in threads:
+            thread_counters = thread.docs.get_counters("poppler_doc_cache")
+            for (k, v) in thread_counters.items():
+                counters[k] = counters.get(k, 0) + v
+        return counters
+
+    def perfcheck_get_counters(self, out: dict):
+        with self.lock:
+            threads = self.threads
+        counters = dict(self.stopped_counters)
+        if threads is not None:
+            for (k, v) in self._get_counters(threads).items():
+                counters[k] = counters.get(k, 0) + v
+        out.update(counters)
+
+    def on_quit(self):
+        with self.lock:
+            threads = self.threads
+            self.threads = None
+        if threads is None:
+            return
+        for thread in threads:
+            thread.requests.put(None)
+        for thread in threads:
+            thread.join()
+        for (k, v) in self._get_counters(threads).items():
+            if not k.endswith("_size"):
+                self.stopped_counters[k] = self.stopped_counters.get(k, 0) + v
+
+    def tests_cleanup(self):
+        self.on_quit()
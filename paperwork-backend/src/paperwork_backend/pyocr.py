@@ -1,6 +1,7 @@
 import glob
 import locale
 import logging
+import multiprocessing
 import os
 
 import pycountry
@@ -133,6 +134,11 @@ def get_default_ocr_langs(allow_none=False):
     return None if allow_none else [DEFAULT_OCR_LANG]
 
 
+def get_default_nb_workers():
+    # Tesseract is run as an external process: one process per core is enough
+    return max(1, multiprocessing.cpu_count())
+
+
 class Plugin(openpaperwork_core.PluginBase):
     def __init__(self):
         super().__init__()
@@ -169,6 +175,12 @@ class Plugin(openpaperwork_core.PluginBase):
         )
         self.core.call_all("config_register", "ocr_langs", ocr_langs)
 
+        ocr_workers = self.core.call_success(
+            "config_build_simple",
+            "OCR", "Workers", get_default_nb_workers
+        )
+        self.core.call_all("config_register", "ocr_workers", ocr_workers)
+
     def chkdeps(self, out: dict):
         ocr_tools = pyocr.get_available_tools()
         if len(ocr_tools) <= 0:
@@ -205,6 +217,15 @@ class Plugin(openpaperwork_core.PluginBase):
             return True
         return None
 
+    def ocr_get_nb_workers(self):
+        """
+        Number of pages on which OCR can be run in parallel.
+        """
+        return max(1, int(self.core.call_success("config_get", "ocr_workers")))
+
+    def ocr_set_nb_workers(self, nb_workers):
+        return self.core.call_success("config_put", "ocr_workers", nb_workers)
+
     def ocr_add_observer_on_enabled(self, callback):
         self.core.call_all("config_add_observer", "ocr_langs", callback)
 
@@ -1,9 +1,11 @@
+import collections
 import datetime
 import logging
 import time
 
 import openpaperwork_core
 import openpaperwork_core.promise
+import openpaperwork_core.thread
 
 
 LOGGER = logging.getLogger(__name__)
@@ -58,6 +60,16 @@ class BaseTransaction(object):
     def unchanged_doc(self, doc_id):
         self.processed += 1
 
+    def flush(self):
+        """
+        Called once all the documents have been given to this transaction,
+        before they are given to the transactions with a lower priority
+        (and before `commit()`). Transactions running some work in the
+        background must wait for it here, so the following transactions
+        see the documents as modified by this one.
+        """
+        pass
+
     def cancel(self):
         self._current_doc = None
         self._current_doc_pages = -1
@@ -114,16 +126,89 @@ def diff_lists(list_old, list_new):
             yield ('deleted', obj_old.key)
 
 
+def get_doc_fingerprint(core, doc_url):
+    """
+    Returns a cheap fingerprint of a document: the mtime of its directory,
+    the number of files in it and the most recent mtime of these files.
+    Adding, removing, renaming or modifying a file changes it (unless the
+    tool modifying it preserves its mtime).
+    Returns None if the fingerprint cannot be computed.
+    """
+    try:
+        mtime = core.call_success("fs_get_mtime", doc_url)
+        files = core.call_success("fs_listdir", doc_url)
+        if mtime is None or files is None:
+            return None
+        files = list(files)
+        files_mtime = 0
+        for file_url in files:
+            file_mtime = core.call_success("fs_get_mtime", file_url)
+            if file_mtime is None:
+                return None
+            files_mtime = max(files_mtime, file_mtime)
+    except OSError:
+        return None
+    return "{}:{}:{}".format(mtime, len(files), files_mtime)
+
+
+class Fingerprints(object):
+    """
+    Last known document fingerprints (see `get_doc_fingerprint()`) and the
+    document mtimes that were computed along with them.
+
+    In incremental mode, if the fingerprint of a document hasn't changed,
+    its last known mtime is used instead of looking at all its files again.
+    In full mode, the fingerprints are never trusted, but they are still
+    recomputed.
+    """
+    def __init__(self, known, incremental=True):
+        # known = {doc_id: (fingerprint, mtime), ...}
+        self.known = known
+        self.incremental = incremental
+        self.updates = []  # [(doc_id, fingerprint, mtime), ...]
+        self.nb_hits = 0
+        self.nb_misses = 0
+
+    def get_mtime(self, doc_id, fingerprint):
+        if not self.incremental or fingerprint is None:
+            return None
+        known = self.known.get(doc_id)
+        if known is None or known[0] != fingerprint:
+            self.nb_misses += 1
+            return None
+        self.nb_hits += 1
+        return known[1]
+
+    def update(self, doc_id, fingerprint, mtime):
+        if fingerprint is None:
+            return
+        known = self.known.get(doc_id)
+        if known is not None and known == (fingerprint, mtime):
+            return
+        self.updates.append((doc_id, fingerprint, mtime))
+
+
 class StorageDoc(object):
-    def __init__(self, core, doc_id, doc_url):
+    def __init__(self, core, doc_id, doc_url, fingerprints=None):
         self.core = core
         self.key = doc_id
         self.doc_url = doc_url
+        self.fingerprints = fingerprints
 
     def get_mtime(self):
+        fingerprint = None
+        if self.fingerprints is not None:
+            fingerprint = get_doc_fingerprint(self.core, self.doc_url)
+            mtime = self.fingerprints.get_mtime(self.key, fingerprint)
+            if mtime is not None:
+                return datetime.datetime.fromtimestamp(mtime)
+
         mtime = self.core.call_success("doc_get_mtime_by_url", self.doc_url)
         if mtime is None:
             mtime = 0
+
+        if self.fingerprints is not None:
+            self.fingerprints.update(self.key, fingerprint, mtime)
         return datetime.datetime.fromtimestamp(mtime)
 
     extra = property(get_mtime)
@@ -138,28 +223,48 @@ class Syncer(object):
     Useful to handle calls to 'sync' (see interface 'syncable').
     """
 
-    def __init__(self, core, names, new_all, old_all, transactions):
+    def __init__(
+            self, core, names, new_all, old_all, transactions,
+            fingerprints=None):
         self.core = core
         self.names = names
         self.new_all = new_all
         self.old_all = old_all
         self.transactions = transactions
+        self.fingerprints = fingerprints
         self.diff_generator = None
         self.start = None
         self.nb_compared = 0
+        self.nb_actions = collections.Counter()
 
     def get_promise(self):
         return openpaperwork_core.promise.ThreadedPromise(
-            self.core, self.run
+            self.core, self.run,
+            priority=openpaperwork_core.thread.PRIORITY_BULK
         )
 
     def run(self):
         self.start = time.time()
         self.diff_generator = diff_lists(self.old_all, self.new_all)
 
+        # time spent examining the documents (diff_lists()) and time spent
+        # in the transactions
+        compare_time = 0
+        transactions_time = 0
+
         try:
-            for (action, key) in self.diff_generator:
+            while True:
+                t = time.time()
+                try:
+                    (action, key) = next(self.diff_generator)
+                except StopIteration:
+                    break
+                finally:
+                    compare_time += time.time() - t
                 self.nb_compared += 1
+                self.nb_actions[action] += 1
+
+                t = time.time()
                 if action != 'unchanged':
                     LOGGER.info("Sync: %s, %s", action, key)
                     for name in self.names:
@@ -195,16 +300,25 @@ class Syncer(object):
                             transaction.unchanged_doc, key
                         )
                         transaction.unchanged_doc(key)
+                transactions_time += time.time() - t
+        except Exception as exc:
+            LOGGER.error(
+                "%s: Fail to sync. Cancelling transactions",
+                self.names, exc_info=exc
+            )
+            for transaction in self.transactions:
+                transaction.cancel()
+            return
 
+        try:
             LOGGER.info("Sync: Committing ...")
+            t = time.time()
+            for transaction in self.transactions:
+                transaction.flush()
             for transaction in self.transactions:
                 transaction.commit()
+            commit_time = time.time() - t
             LOGGER.info("Sync: Committed")
-            stop = time.time()
-            LOGGER.info(
-                "%s: Has compared %d objects in %.3fs",
-                self.names, self.nb_compared, stop - self.start
-            )
         except Exception as exc:
             LOGGER.error(
                 "%s: Fail to sync. Cancelling transactions",
@@ -212,6 +326,29 @@ class Syncer(object):
             )
             for transaction in self.transactions:
                 transaction.cancel()
+            return
+
+        stop = time.time()
+        LOGGER.info(
+            "%s: Has compared %d objects in %.3fs"
+            " (comparing: %.3fs ; transactions: %.3fs ; commit: %.3fs)",
+            self.names, self.nb_compared, stop - self.start,
+            compare_time, transactions_time, commit_time
+        )
+        LOGGER.info(
+            "%s: %d added, %d updated, %d deleted, %d unchanged",
+            self.names, self.nb_actions['added'],
+            self.nb_actions['updated'], self.nb_actions['deleted'],
+            self.nb_actions['unchanged']
+        )
+        if self.fingerprints is not None:
+            LOGGER.info(
+                "%s: %s sync: %d documents skipped thanks to their"
+                " fingerprint, %d examined",
+                self.names,
+                "Incremental" if self.fingerprints.incremental else "Full",
+                self.fingerprints.nb_hits, self.fingerprints.nb_misses
+            )
 
 
 class Plugin(openpaperwork_core.PluginBase):
@@ -226,10 +363,21 @@ class Plugin(openpaperwork_core.PluginBase):
             },
         ]
 
+    def __init__(self):
+        super().__init__()
+        self.full_sync = True
+
     def init(self, core):
         super().init(core)
         self.core.call_all("work_queue_create", "transactions")
 
+    def transaction_sync_is_full(self):
+        """
+        Only meaningful while `transaction_sync_all()` calls the
+        'sync' methods.
+        """
+        return self.full_sync
+
     def transaction_schedule(self, promise):
         """
         Transactions should never be run in parrallel (even if on the same
@@ -250,13 +398,20 @@ class Plugin(openpaperwork_core.PluginBase):
         transactions.sort(key=lambda transaction: -transaction.priority)
 
         try:
+            actual_changes = []
             for (change, doc_id) in changes:
                 doc_url = self.core.call_success("doc_id_to_url", doc_id)
                 if doc_url is None:
                     change = 'del'
                 elif self.core.call_success("is_doc", doc_url) is None:
                     change = 'del'
-                for transaction in transactions:
+                actual_changes.append((change, doc_id))
+
+            # all the documents are given to a transaction before going to
+            # the next one: some transactions can then work on many
+            # documents at once (see `BaseTransaction.flush()`)
+            for transaction in transactions:
+                for (change, doc_id) in actual_changes:
                     if change == 'add':
                         transaction.add_doc(doc_id)
                     elif change == 'upd':
@@ -265,6 +420,7 @@ class Plugin(openpaperwork_core.PluginBase):
                         transaction.del_doc(doc_id)
                     else:
                         raise Exception("Unknown change type: %s" % change)
+                transaction.flush()
 
             for transaction in transactions:
                 transaction.commit()
@@ -280,7 +436,8 @@ class Plugin(openpaperwork_core.PluginBase):
         'transaction_schedule()'.
         """
         return openpaperwork_core.promise.ThreadedPromise(
-            self.core, self._transaction_simple, args=(changes,)
+            self.core, self._transaction_simple, args=(changes,),
+            priority=openpaperwork_core.thread.PRIORITY_BULK
         )
 
     def transaction_simple(self, changes: list):
@@ -300,13 +457,21 @@ class Plugin(openpaperwork_core.PluginBase):
             self.transaction_simple_promise(changes)
         )
 
-    def transaction_sync_all(self):
+    def transaction_sync_all(self, full=False):
         """
         Make sure all the plugins synchronize their databases with the work
         directory.
+
+        By default, the synchronization is incremental: documents whose
+        fingerprint (see `get_doc_fingerprint()`) hasn't changed are not
+        examined. `full=True` forces all the documents to be examined.
         """
         promises = []
-        self.core.call_all("sync", promises)
+        self.full_sync = full
+        try:
+            self.core.call_all("sync", promises)
+        finally:
+            self.full_sync = True
         promise = promises[0]
         for p in promises[1:]:
             promise = promise.then(p)
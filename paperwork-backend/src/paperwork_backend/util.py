@@ -14,8 +14,10 @@
 #    You should have received a copy of the GNU General Public License
 #    along with Paperwork.  If not, see <http://www.gnu.org/licenses/>
 
+import collections
 import logging
 import os
+import threading
 
 
 LOGGER = logging.getLogger(__name__)
@@ -64,3 +66,84 @@ def levenshtein_distance(
         # replace character
         levenshtein_distance(str_a, str_b, str_a_idx + 1, str_b_idx + 1),
     )
+
+
+class LRUCache(object):
+    """
+    Thread-safe dictionary keeping at most `max_size` entries: the least
+    recently used entries are dropped first.
+
+    Each entry may come with a version (for instance the modification time
+    of the file the value comes from): when looking up an entry, if the
+    version doesn't match, the entry is considered outdated and dropped.
+
+    Counts hits and misses (see `get_counters()`).
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        # key --> (version, value)
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
+
+    def get(self, key, default=None, version=None):
+        with self.lock:
+            entry = self.entries.get(key, None)
+            if entry is not None and entry[0] != version:
+                self.entries.pop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, value, version=None):
+        with self.lock:
+            self.entries[key] = (version, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > max(self.max_size, 0):
+                self.entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            return entry[1] if entry is not None else default
+
+    def pop_if(self, condition):
+        """
+        Drop all the entries for which `condition(key)` returns True.
+        """
+        with self.lock:
+            for key in [k for k in self.entries.keys() if condition(k)]:
+                self.entries.pop(key)
+
+    def set_max_size(self, max_size):
+        with self.lock:
+            self.max_size = max_size
+            while len(self.entries) > max(self.max_size, 0):
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def get_counters(self, prefix):
+        """
+        Returns the counters of this cache, ready to be used by
+        'perfcheck_get_counters()'.
+        """
+        return {
+            prefix + "_hits": self.hits,
+            prefix + "_misses": self.misses,
+            prefix + "_size": len(self.entries),
+        }
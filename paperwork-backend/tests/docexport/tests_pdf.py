@@ -0,0 +1,90 @@
+import threading
+import time
+import unittest
+
+import PIL.Image
+
+import openpaperwork_core
+import openpaperwork_core.thread.tests
+
+import paperwork_backend.docexport
+import paperwork_backend.docexport.pdf
+
+
+class FakePage(paperwork_backend.docexport.ExportData):
+    def __init__(self, test, page_idx):
+        super().__init__(
+            paperwork_backend.docexport.ExportDataType.PAGE, page_idx
+        )
+        self.expanded = True
+        self.test = test
+
+    def get_children(self):
+        with self.test.lock:
+            self.test.loaded += 1
+            self.test.max_in_memory = max(
+                self.test.max_in_memory,
+                self.test.loaded - self.test.consumed
+            )
+        # first pages are the slowest to load
+        time.sleep((10 - self.data) / 500)
+        img = PIL.Image.new("RGB", (100, 200), (self.data, 0, 0))
+        yield paperwork_backend.docexport.ExportData(
+            paperwork_backend.docexport.ExportDataType.IMG_BOXES,
+            (img, ["boxes {}".format(self.data)])
+        )
+
+
+class TestPdfExport(unittest.TestCase):
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.loaded = 0
+        self.consumed = 0
+        self.max_in_memory = 0
+
+        self.core = openpaperwork_core.Core(auto_load_dependencies=True)
+        self.core._load_module(
+            "dummy_mainloop", openpaperwork_core.thread.tests.DummyMainloop()
+        )
+        self.core.load("openpaperwork_core.thread.pool")
+        self.core.init()
+        self.core.call_all("on_mainloop_start")
+
+        self.pipe = paperwork_backend.docexport.pdf.PagesToPdfUrlExportPipe(
+            core=self.core
+        )
+        self.pipe.nb_workers = 4
+        self.pipe.max_prefetch = 3
+        self.pipe.quality = 0.5
+
+    def tearDown(self):
+        self.core.call_all("on_mainloop_quit")
+
+    def test_prefetch(self):
+        data = paperwork_backend.docexport.ExportData.build_pages(
+            "some_doc_id", "file:///some_doc", []
+        )
+        (doc_set, doc) = next(
+            data.iter(paperwork_backend.docexport.ExportDataType.DOCUMENT)
+        )
+        doc.set_children([FakePage(self, idx) for idx in range(0, 10)])
+
+        out = []
+        for (doc, page) in self.pipe._iter_loaded_pages(
+                    data.iter(paperwork_backend.docexport.ExportDataType.PAGE)
+                ):
+            with self.lock:
+                self.consumed += 1
+            self.assertEqual(doc.data, ("some_doc_id", "file:///some_doc"))
+            out += page
+
+        # pages are returned in order, resized
+        self.assertEqual(
+            [boxes for (size, img, boxes) in out],
+            [["boxes {}".format(idx)] for idx in range(0, 10)]
+        )
+        for (size, img, boxes) in out:
+            self.assertEqual(size, (100, 200))
+            self.assertEqual(img.size, (50, 100))
+        # never too many pages in memory
+        self.assertLessEqual(self.max_in_memory, 3)
@@ -36,6 +36,12 @@ class TestImgImport(unittest.TestCase):
             def unchanged_doc(s, doc_id):
                 pass
 
+            def flush(s):
+                pass
+
+            def cancel(s):
+                pass
+
             def commit(s):
                 self.nb_commits += 1
 
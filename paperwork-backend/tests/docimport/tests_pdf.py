@@ -32,6 +32,12 @@ class TestPdfImport(unittest.TestCase):
             def unchanged_doc(s, doc_id):
                 pass
 
+            def flush(s):
+                pass
+
+            def cancel(s):
+                pass
+
             def commit(s):
                 self.nb_commits += 1
 
@@ -207,6 +213,12 @@ class TestRecursivePdfImport(unittest.TestCase):
             def unchanged_doc(s, doc_id):
                 pass
 
+            def flush(s):
+                pass
+
+            def cancel(s):
+                pass
+
             def commit(s):
                 self.nb_commits += 1
 
@@ -373,6 +385,12 @@ class TestPasswordPdfImport(unittest.TestCase):
             def unchanged_doc(s, doc_id):
                 pass
 
+            def flush(s):
+                pass
+
+            def cancel(s):
+                pass
+
             def commit(s):
                 self.nb_commits += 1
 
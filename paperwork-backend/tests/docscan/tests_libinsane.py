@@ -45,6 +45,32 @@ class TestImageAssembler(unittest.TestCase):
             b"abcdefhijklmnabcdefhij"
         )
 
+    def test_assembler_preallocated(self):
+        assembler = paperwork_backend.docscan.libinsane.ImageAssembler(
+            line_width=4, expected_size=16
+        )
+        assembler.MIN_CHUNK_SIZE = 8
+        buf = assembler.buffer
+
+        assembler.add_piece(b"abcdefghi")
+        chunk = assembler.get_last_chunk()
+        self.assertEqual(chunk, b"abcdefgh")
+
+        assembler.add_piece(b"jklmnop")
+        self.assertEqual(assembler.get_image(), b"abcdefghijklmnop")
+        # no copy: everything was written in the preallocated buffer
+        self.assertIs(assembler.buffer, buf)
+        self.assertIs(assembler.get_last_chunk().obj, buf)
+
+        # the scanner lied about the image size
+        assembler.add_piece(b"qrstuvwx")
+        self.assertEqual(
+            assembler.get_image(), b"abcdefghijklmnopqrstuvwx"
+        )
+        self.assertEqual(assembler.get_last_chunk(), b"qrstuvwx")
+        # chunks given before are still valid
+        self.assertEqual(chunk, b"abcdefgh")
+
 
 class TestLibinsane(unittest.TestCase):
     def setUp(self):
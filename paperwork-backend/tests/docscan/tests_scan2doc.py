@@ -1,7 +1,12 @@
+import time
 import unittest
 
+import PIL.Image
+
 import openpaperwork_core
 
+import paperwork_backend.docscan.scan2doc
+
 
 class TestScan2Doc(unittest.TestCase):
     def setUp(self):
@@ -13,6 +18,8 @@ class TestScan2Doc(unittest.TestCase):
         self.fs = self.core.get_by_name("openpaperwork_core.fs.fake")
         self.results = []
         self.pillowed = []
+        self.registered = []
+        self.unlinked = []
         self.transaction_type = None
         self.nb_commits = 0
 
@@ -33,6 +40,12 @@ class TestScan2Doc(unittest.TestCase):
             def unchanged_doc(s, doc_id):
                 pass
 
+            def flush(s):
+                pass
+
+            def cancel(s):
+                pass
+
             def commit(s):
                 self.nb_commits += 1
 
@@ -77,9 +90,21 @@ class TestScan2Doc(unittest.TestCase):
                     return ('new_doc_id', 'file:///new_doc')
 
                 def pillow_to_url(s, img, url):
+                    if img.size[0] <= 0:
+                        raise ValueError("Invalid image")
+                    # encoding takes longer for the first pages
+                    time.sleep(img.size[0] / 1000)
                     self.pillowed.append(url)
                     return url
 
+                def fs_unlink(s, url, **kwargs):
+                    self.unlinked.append(url)
+                    return True
+
+                def on_scan2doc_page_scanned(
+                        s, scan_id, doc_id, doc_url, page_idx):
+                    self.registered.append(page_idx)
+
         self.core._load_module("fake_module", FakeModule())
         self.core.init()
 
@@ -120,3 +145,49 @@ class TestScan2Doc(unittest.TestCase):
         self.assertEqual(self.pillowed, [
             'file:///some_existing_doc/paper.10.jpg'
         ])
+
+    def _run_pipeline(self, imgs):
+        pipeline = paperwork_backend.docscan.scan2doc.ScanPipeline(
+            self.core, 0, 'new_doc_id', 'file:///new_doc',
+            nb_encoders=4, max_pending=2
+        )
+        return pipeline.run(iter(imgs))
+
+    def test_pipeline(self):
+        imgs = [
+            PIL.Image.new("RGB", (w, 10), (0, 0, 0))
+            for w in (50, 40, 30, 20, 10, 1)
+        ]
+        nb = self._run_pipeline(imgs)
+        self.core.call_all("mainloop_quit_graceful")
+        self.core.call_one("mainloop")
+
+        self.assertEqual(nb, 6)
+        self.assertEqual(sorted(self.pillowed), [
+            'file:///new_doc/paper.{}.jpg'.format(idx)
+            for idx in range(1, 7)
+        ])
+        # pages must be registered in order, even if they have been
+        # written in a different order
+        self.assertEqual(self.registered, [0, 1, 2, 3, 4, 5])
+
+    def test_pipeline_error(self):
+        imgs = [
+            PIL.Image.new("RGB", (50, 10), (0, 0, 0)),
+            PIL.Image.new("RGB", (0, 10), (0, 0, 0)),
+            PIL.Image.new("RGB", (10, 10), (0, 0, 0)),
+            PIL.Image.new("RGB", (5, 10), (0, 0, 0)),
+            PIL.Image.new("RGB", (1, 10), (0, 0, 0)),
+        ]
+        with self.assertRaises(ValueError):
+            self._run_pipeline(imgs)
+        self.core.call_all("mainloop_quit_graceful")
+        self.core.call_one("mainloop")
+        self.assertEqual(self.registered, [0])
+        # the pages written after the failure must have been removed
+        first_page_url = 'file:///new_doc/paper.1.jpg'
+        self.assertIn(first_page_url, self.pillowed)
+        self.assertCountEqual(
+            self.unlinked,
+            [url for url in self.pillowed if url != first_page_url]
+        )
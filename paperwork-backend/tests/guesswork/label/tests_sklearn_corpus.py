@@ -0,0 +1,395 @@
+import logging
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+
+import numpy
+import scipy.sparse
+
+import openpaperwork_core
+
+import paperwork_backend.guesswork.label.sklearn as label_sklearn
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class FakeConfig(object):
+    def __init__(self, **settings):
+        self.settings = dict(label_sklearn.PluginConfig.SETTINGS)
+        self.settings.update(settings)
+
+    def get(self, key):
+        return self.settings[key]
+
+
+def make_synthetic_db(
+        db_path, nb_docs, nb_labels, nb_words, max_labels_per_doc=3,
+        seed=0, legacy_format=False):
+    """
+    Creates a label guesser database with random labels and features.
+    Feature vectors have various lengths, as if words had been added to the
+    vocabulary over time.
+    If `legacy_format` is True, feature vectors are stored like older versions
+    of Paperwork did (dense float64 arrays).
+    Returns {doc_id: set(labels)}.
+    """
+    rng = random.Random(seed)
+    np_rng = numpy.random.default_rng(seed)
+
+    label_sklearn.SqliteNumpyArrayHandler.register()
+    sql = sqlite3.connect(db_path, detect_types=sqlite3.PARSE_DECLTYPES)
+    for query in label_sklearn.CREATE_TABLES:
+        sql.execute(query)
+
+    sql.executemany(
+        "INSERT INTO vocabulary (word, feature) VALUES (?, ?)",
+        [("word{}".format(w), w) for w in range(0, nb_words)]
+    )
+
+    labels = ["label{}".format(label) for label in range(0, nb_labels)]
+    out = {}
+    for doc_idx in range(0, nb_docs):
+        doc_id = "2020{:08d}".format(doc_idx)
+        doc_labels = set(rng.sample(
+            labels, rng.randint(0, min(max_labels_per_doc, nb_labels))
+        ))
+        out[doc_id] = doc_labels
+        sql.executemany(
+            "INSERT INTO labels (doc_id, label) VALUES (?, ?)",
+            [(doc_id, label) for label in doc_labels]
+        )
+
+        vector_len = nb_words * (doc_idx + 1) // nb_docs
+        vector = numpy.zeros((vector_len,))
+        nb_doc_words = min(vector_len, 50)
+        words = np_rng.choice(vector_len, nb_doc_words, replace=False)
+        vector[words] = np_rng.random(nb_doc_words)
+        if legacy_format:
+            vector = vector.tobytes()
+        else:
+            vector = label_sklearn.SparseFeatureVector.from_dense(vector)
+        sql.execute(
+            "INSERT INTO features (doc_id, vector) VALUES (?, ?)",
+            (doc_id, vector)
+        )
+
+    sql.commit()
+    sql.close()
+    return out
+
+
+class TestFeatureVectors(unittest.TestCase):
+    def setUp(self):
+        self.core = openpaperwork_core.Core(auto_load_dependencies=True)
+        self.core.load("openpaperwork_core.fs.python")
+        self.core.init()
+
+        self.tmp_dir = tempfile.mkdtemp(prefix="paperwork_backend_labels")
+        self.db_path = os.path.join(self.tmp_dir, "label_guesser.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _connect(self):
+        sql = sqlite3.connect(
+            self.db_path, detect_types=sqlite3.PARSE_DECLTYPES
+        )
+        return sql
+
+    def test_format(self):
+        dense = numpy.array([0.0, 0.25, 0.0, 0.0, 0.5, 0.0])
+        vector = label_sklearn.SparseFeatureVector.from_dense(dense)
+        raw = vector.to_bytes()
+        # 2 non-zero features: 13 bytes of header + 2 * (4 + 4) bytes
+        self.assertEqual(len(raw), 29)
+
+        for raw in (raw, dense.tobytes()):  # current format, legacy format
+            loaded = label_sklearn.SparseFeatureVector.from_bytes(raw)
+            self.assertEqual(len(loaded), 6)
+            self.assertEqual(list(loaded.indices), [1, 4])
+            self.assertTrue(numpy.array_equal(loaded.to_dense(), dense))
+
+        loaded = label_sklearn.SparseFeatureVector.from_bytes(b"")
+        self.assertEqual(len(loaded), 0)
+
+    def test_migration(self):
+        make_synthetic_db(
+            self.db_path, nb_docs=50, nb_labels=5, nb_words=100,
+            legacy_format=True
+        )
+        sql = self._connect()
+        try:
+            # document without text
+            sql.execute(
+                "INSERT INTO features (doc_id, vector) VALUES (?, ?)",
+                ("empty_doc", b"")
+            )
+            sql.commit()
+            expected = {
+                doc_id: (
+                    vector.to_dense() if vector is not None
+                    else numpy.array([])
+                )
+                for (doc_id, vector) in sql.execute(
+                    "SELECT doc_id, vector FROM features"
+                )
+            }
+            size_before = os.stat(self.db_path).st_size
+
+            r = label_sklearn.migrate_feature_vectors(
+                self.core, sql, chunk_size=7
+            )
+            self.assertEqual(r, 51)
+            self.assertEqual(
+                label_sklearn.migrate_feature_vectors(self.core, sql), 0
+            )
+
+            for (doc_id, raw) in sql.execute(
+                        "SELECT doc_id, CAST(vector AS BLOB) FROM features"
+                    ):
+                self.assertTrue(
+                    label_sklearn.SparseFeatureVector.is_current_format(raw)
+                )
+            for (doc_id, vector) in sql.execute(
+                        "SELECT doc_id, vector FROM features"
+                    ):
+                # values are stored as float32
+                self.assertTrue(numpy.allclose(
+                    vector.to_dense(), expected[doc_id]
+                ))
+        finally:
+            sql.close()
+        self.assertLess(os.stat(self.db_path).st_size, size_before)
+
+    def test_migration_invalid_vector(self):
+        make_synthetic_db(
+            self.db_path, nb_docs=10, nb_labels=2, nb_words=20,
+            legacy_format=True
+        )
+        sql = self._connect()
+        try:
+            # neither a dense float64 array nor a sparse vector
+            sql.execute(
+                "INSERT INTO features (doc_id, vector) VALUES (?, ?)",
+                ("broken_doc", b"\x01\x02\x03")
+            )
+            sql.commit()
+
+            r = label_sklearn.migrate_feature_vectors(
+                self.core, sql, chunk_size=3
+            )
+            self.assertEqual(r, 10)
+            self.assertEqual(
+                label_sklearn.migrate_feature_vectors(self.core, sql), 0
+            )
+            self.assertEqual(list(sql.execute(
+                "SELECT COUNT(*) FROM features WHERE doc_id = 'broken_doc'"
+            )), [(0,)])
+            self.assertEqual(list(sql.execute(
+                "SELECT COUNT(*) FROM features"
+            )), [(10,)])
+        finally:
+            sql.close()
+
+    def test_gc(self):
+        label_sklearn.SqliteNumpyArrayHandler.register()
+        sql = self._connect()
+        try:
+            for query in label_sklearn.CREATE_TABLES:
+                sql.execute(query)
+            sql.executemany(
+                "INSERT INTO vocabulary (word, feature) VALUES (?, ?)",
+                [("word{}".format(w), w) for w in range(0, 6)]
+            )
+            # words 0, 2 and 5 are not used anymore
+            vectors = {
+                "doc_a": [0.0, 0.1, 0.0],
+                "doc_b": [0.0, 0.0, 0.0, 0.3, 0.4],
+            }
+            sql.executemany(
+                "INSERT INTO features (doc_id, vector) VALUES (?, ?)",
+                [
+                    (
+                        doc_id,
+                        label_sklearn.SparseFeatureVector.from_dense(vector)
+                    )
+                    for (doc_id, vector) in vectors.items()
+                ]
+            )
+
+            vectorizer = label_sklearn.UpdatableVectorizer(
+                self.core, sql.cursor()
+            )
+            vectorizer.gc()
+
+            self.assertEqual(
+                sorted(sql.execute("SELECT word, feature FROM vocabulary")),
+                [("word1", 0), ("word3", 1), ("word4", 2)]
+            )
+            vectors = {
+                doc_id: list(vector.to_dense())
+                for (doc_id, vector) in sql.execute(
+                    "SELECT doc_id, vector FROM features"
+                )
+            }
+            self.assertEqual(vectors, {
+                "doc_a": [numpy.float32(0.1)],
+                "doc_b": [0.0, numpy.float32(0.3), numpy.float32(0.4)],
+            })
+        finally:
+            sql.close()
+
+
+class TestCorpus(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="paperwork_backend_labels")
+        self.db_path = os.path.join(self.tmp_dir, "label_guesser.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _load(self, config):
+        sql = sqlite3.connect(
+            self.db_path, detect_types=sqlite3.PARSE_DECLTYPES
+        )
+        try:
+            start = time.time()
+            corpus = label_sklearn.Corpus.load(config, sql.cursor())
+            stop = time.time()
+        finally:
+            sql.close()
+        return (corpus, stop - start)
+
+    def test_load(self):
+        doc_labels = make_synthetic_db(
+            self.db_path, nb_docs=50, nb_labels=5, nb_words=100
+        )
+        config = FakeConfig(max_doc_backlog=100)
+        (corpus, _) = self._load(config)
+
+        # backlog is bigger than the number of documents --> all the
+        # documents must be loaded
+        self.assertEqual(corpus.get_doc_count(), 50)
+        self.assertEqual(sorted(corpus.doc_ids), sorted(doc_labels.keys()))
+        self.assertEqual(
+            list(corpus.get_labels()),
+            sorted({label for ls in doc_labels.values() for label in ls})
+        )
+        self.assertEqual(corpus.features.shape, (50, 100))
+
+        for (doc_idx, doc_id) in enumerate(corpus.doc_ids):
+            for (label_idx, label) in enumerate(corpus.get_labels()):
+                self.assertEqual(
+                    corpus.targets[doc_idx, label_idx],
+                    1 if label in doc_labels[doc_id] else 0
+                )
+
+        sql = sqlite3.connect(
+            self.db_path, detect_types=sqlite3.PARSE_DECLTYPES
+        )
+        try:
+            for (doc_idx, doc_id) in enumerate(corpus.doc_ids):
+                vector = list(sql.execute(
+                    "SELECT vector FROM features WHERE doc_id = ?", (doc_id,)
+                ))[0][0].to_dense()
+                loaded = corpus.features[doc_idx].toarray()[0]
+                self.assertTrue(
+                    numpy.array_equal(loaded[:vector.shape[0]], vector)
+                )
+                self.assertFalse(loaded[vector.shape[0]:].any())
+        finally:
+            sql.close()
+
+    def test_backlog(self):
+        doc_labels = make_synthetic_db(
+            self.db_path, nb_docs=200, nb_labels=2, nb_words=100
+        )
+        config = FakeConfig(max_doc_backlog=10)
+        (corpus, _) = self._load(config)
+
+        # we need the 10 most recent documents with each label and the 10
+        # most recent documents without each label.
+        expected = set()
+        for label in ("label0", "label1"):
+            with_label = [
+                doc_id for doc_id in sorted(doc_labels.keys(), reverse=True)
+                if label in doc_labels[doc_id]
+            ]
+            without_label = [
+                doc_id for doc_id in sorted(doc_labels.keys(), reverse=True)
+                if label not in doc_labels[doc_id]
+            ]
+            expected.update(with_label[:10])
+            expected.update(without_label[:10])
+        self.assertEqual(set(corpus.doc_ids), expected)
+
+    def test_load_benchmark(self):
+        nb_docs = 5000
+        nb_labels = 300
+        make_synthetic_db(
+            self.db_path, nb_docs=nb_docs, nb_labels=nb_labels,
+            nb_words=10000
+        )
+        (corpus, elapsed) = self._load(FakeConfig())
+        LOGGER.info(
+            "Corpus: %d documents / %d labels in DB: %d documents loaded"
+            " in %.3fs",
+            nb_docs, nb_labels, corpus.get_doc_count(), elapsed
+        )
+        self.assertGreater(corpus.get_doc_count(), 0)
+
+
+class TestClassifiers(unittest.TestCase):
+    def setUp(self):
+        self.core = openpaperwork_core.Core(auto_load_dependencies=True)
+        self.core.load("openpaperwork_core.fs.python")
+        self.core.init()
+        self.config = FakeConfig()
+
+        # documents with the label 'a' contain the words 0-4, documents with
+        # the label 'b' contain the words 5-9, all documents contain words
+        # 10-19
+        np_rng = numpy.random.default_rng(0)
+        doc_ids = []
+        features = numpy.zeros((60, 20))
+        targets = numpy.zeros((60, 2), dtype=numpy.int8)
+        for doc_idx in range(0, 60):
+            doc_ids.append("doc{}".format(doc_idx))
+            features[doc_idx, 10:] = np_rng.random(10)
+            if doc_idx % 3 == 0:
+                features[doc_idx, 0:5] = np_rng.random(5) + 1
+                targets[doc_idx, 0] = 1
+            elif doc_idx % 3 == 1:
+                features[doc_idx, 5:10] = np_rng.random(5) + 1
+                targets[doc_idx, 1] = 1
+        self.corpus = label_sklearn.Corpus(
+            self.config, doc_ids, scipy.sparse.csr_matrix(features),
+            ['a', 'b'], targets
+        )
+
+    def test_classifiers(self):
+        vector_a = numpy.zeros((20,))
+        vector_a[0:5] = 1.5
+        vector_a[10:] = 0.5
+        vector_b = numpy.zeros((20,))
+        vector_b[5:10] = 1.5
+        vector_b[10:] = 0.5
+
+        for name in label_sklearn.CLASSIFIERS.keys():
+            classifiers = label_sklearn.get_classifiers(
+                self.core, self.config, name
+            )
+            self.assertEqual(classifiers.fit(self.corpus), 1.0)
+            self.assertEqual(list(classifiers.predict(vector_a)), ['a'])
+            self.assertEqual(list(classifiers.predict(vector_b)), ['b'])
+
+    def test_unknown_classifier(self):
+        classifiers = label_sklearn.get_classifiers(
+            self.core, self.config, "nope"
+        )
+        self.assertIsInstance(classifiers, label_sklearn.GaussianClassifiers)
@@ -79,6 +79,54 @@ class TestPyocr(unittest.TestCase):
             "by Flesch\n"
         )
 
+    def test_ocr_many_pages(self):
+        self.core.call_all("ocr_set_nb_workers", 2)
+        self.model.docs = [
+            {
+                "id": 'some_id',
+                "url": 'file:///some_work_dir/some_doc_id',
+                "mtime": 12345,
+                "labels": [],
+                "page_boxes": [],
+                "page_imgs": [
+                    ("file:///some_image.png", self.test_img),
+                    ("file:///some_image_2.png", self.test_img),
+                ],
+                "page_hashes": [
+                    ("file:///some_image.png", 0),
+                    ("file:///some_image_2.png", 1),
+                ]
+            },
+            {
+                "id": 'some_id_2',
+                "url": 'file:///some_work_dir/some_doc_id_2',
+                "mtime": 12345,
+                "labels": [],
+                "page_boxes": [],
+                "page_imgs": [
+                    ("file:///some_image_3.png", self.test_img)
+                ],
+                "page_hashes": [
+                    ("file:///some_image_3.png", 2),
+                ]
+            },
+        ]
+
+        self.core.call_all("ocr_pages_by_url", [
+            ("file:///some_work_dir/some_doc_id", 0),
+            ("file:///some_work_dir/some_doc_id_2", 0),
+            ("file:///some_work_dir/some_doc_id", 1),
+        ])
+
+        self.assertEqual(len(self.model.docs[0]['page_boxes']), 2)
+        self.assertEqual(len(self.model.docs[1]['page_boxes']), 1)
+        self.assertEqual(
+            self.model.docs[1]['text'],
+            "This is a test\n"
+            "image created\n"
+            "by Flesch\n"
+        )
+
     def test_transaction(self):
         self.model.docs = [
             {
@@ -220,3 +268,60 @@ class TestPyocr(unittest.TestCase):
             "image created\n"  # modified page
             "by Flesch\n"  # modified page
         )
+
+    def test_transaction_many_docs(self):
+        # with 1 worker, at most 2 pages are queued at once: pages of
+        # the following documents are queued while the OCR of the
+        # previous ones is still running
+        self.core.call_all("ocr_set_nb_workers", 1)
+        self.model.docs = [
+            {
+                "id": 'some_doc_{}'.format(doc_idx),
+                "url": 'file:///some_work_dir/some_doc_{}'.format(doc_idx),
+                "mtime": 12345,
+                "labels": [],
+                "page_boxes": [],
+                "page_imgs": [
+                    (
+                        "file:///some_image_{}_{}.png".format(
+                            doc_idx, page_idx
+                        ),
+                        self.test_img
+                    )
+                    for page_idx in range(0, 2)
+                ],
+                "page_hashes": [
+                    (
+                        "file:///some_image_{}_{}.png".format(
+                            doc_idx, page_idx
+                        ),
+                        doc_idx * 2 + page_idx
+                    )
+                    for page_idx in range(0, 2)
+                ],
+            }
+            for doc_idx in range(0, 3)
+        ]
+
+        transactions = []
+        self.core.call_all("doc_transaction_start", transactions)
+        transactions.sort(key=lambda transaction: -transaction.priority)
+        for t in transactions:
+            for doc in self.model.docs:
+                t.add_doc(doc['id'])
+            t.flush()
+        for t in transactions:
+            t.commit()
+
+        for doc in self.model.docs:
+            self.assertEqual(len(doc['page_boxes']), 2)
+            self.assertEqual(
+                doc['text'],
+                "This is a test\n"
+                "image created\n"
+                "by Flesch\n"
+                "\n\n"
+                "This is a test\n"
+                "image created\n"
+                "by Flesch\n"
+            )
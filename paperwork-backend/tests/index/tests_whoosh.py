@@ -1,6 +1,8 @@
 import shutil
 import tempfile
+import threading
 import unittest
+import unittest.mock
 
 import openpaperwork_core
 
@@ -10,6 +12,21 @@ class TestIndex(unittest.TestCase):
         self.tmp_index_dir = tempfile.mkdtemp(prefix="paperwork_backend_index")
 
         self.core = openpaperwork_core.Core(auto_load_dependencies=True)
+
+        class FakeModule(object):
+            class Plugin(openpaperwork_core.PluginBase):
+                PRIORITY = 999999999999999999999
+
+                def get_interfaces(s):
+                    return ['data_dir_handler']
+
+                def data_dir_handler_get_individual_data_dir(s):
+                    # each test gets its own index
+                    return openpaperwork_core.fs.CommonFsPluginBase.fs_safe(
+                        self.tmp_index_dir
+                    )
+
+        self.core._load_module("fake_module", FakeModule)
         self.core.load("paperwork_backend.model.fake")
         self.core.load("paperwork_backend.index.whoosh")
 
@@ -101,6 +118,298 @@ class TestIndex(unittest.TestCase):
             ]
         )
 
+    def _rebuild(self, **kwargs):
+        core = self.core
+        stats = []
+
+        promises = []
+        self.core.call_all('index_rebuild', promises, **kwargs)
+        promise = promises[0]
+        promise = promise.then(stats.append)
+        promise = promise.then(core.call_all, "mainloop_quit_graceful")
+        promise.schedule()
+
+        self.core.call_one('mainloop')
+        return stats[0]
+
+    def test_rebuild(self):
+        self.fake_storage.docs = [
+            {
+                'id': 'old_doc',
+                'url': 'file:///somewhere/old_doc',
+                'mtime': 123,
+                'text': 'Flesch',
+                'labels': set(),
+            }
+        ]
+
+        transactions = []
+        self.core.call_all('doc_transaction_start', transactions)
+        for transaction in transactions:
+            transaction.add_doc('old_doc')
+        for transaction in transactions:
+            transaction.commit()
+
+        self.fake_storage.docs = [
+            {
+                'id': 'test_doc_{}'.format(idx),
+                'url': 'file:///somewhere/test_doc_{}'.format(idx),
+                'mtime': 123,
+                'text': 'Whoosh and Flesch are\nthe best {}'.format(idx),
+                'labels': set(),
+            }
+            for idx in range(0, 50)
+        ]
+
+        for procs in (1, 2):
+            stats = self._rebuild(nb_threads=4, procs=procs, limitmb=32)
+            self.assertEqual(stats['nb_docs'], 50)
+            self.assertGreater(stats['docs_per_second'], 0)
+
+            results = []
+            self.core.call_all("index_search", results, "flesch")
+            results.sort()
+            self.assertEqual(
+                results, sorted([
+                    (doc['id'], doc['url'])
+                    for doc in self.fake_storage.docs
+                ])
+            )
+
+    def _add_docs(self, doc_ids):
+        transactions = []
+        self.core.call_all('doc_transaction_start', transactions)
+        for transaction in transactions:
+            for doc_id in doc_ids:
+                transaction.add_doc(doc_id)
+        for transaction in transactions:
+            transaction.commit()
+
+    def test_search_cache(self):
+        self.fake_storage.docs = [
+            {
+                'id': 'test_doc_{}'.format(idx),
+                'url': 'file:///somewhere/test_doc_{}'.format(idx),
+                'mtime': 123,
+                'text': 'Whoosh and Flesch are\nthe best',
+                'labels': set(),
+            }
+            for idx in range(0, 3)
+        ]
+        self._add_docs(['test_doc_0', 'test_doc_1'])
+
+        expected = [
+            ('test_doc_1', 'file:///somewhere/test_doc_1'),
+            ('test_doc_0', 'file:///somewhere/test_doc_0'),
+        ]
+        for query in ("flesch", "  Flesch ", "flesch"):
+            results = []
+            self.core.call_all("index_search", results, query)
+            self.assertEqual(results, expected)
+
+        counters = {}
+        self.core.call_all("perfcheck_get_counters", counters)
+        self.assertEqual(counters['index_search_cache_misses'], 2)
+        self.assertEqual(counters['index_search_cache_hits'], 1)
+
+        # the cache must be invalidated as soon as the index is modified
+        self._add_docs(['test_doc_2'])
+        results = []
+        self.core.call_all("index_search", results, "flesch")
+        self.assertEqual(
+            results,
+            [('test_doc_2', 'file:///somewhere/test_doc_2')] + expected
+        )
+
+    def test_search_cache_concurrent_commit(self):
+        self.fake_storage.docs = [
+            {
+                'id': 'test_doc_{}'.format(idx),
+                'url': 'file:///somewhere/test_doc_{}'.format(idx),
+                'mtime': 123,
+                'text': 'Whoosh and Flesch are\nthe best',
+                'labels': set(),
+            }
+            for idx in range(0, 2)
+        ]
+        self._add_docs(['test_doc_0'])
+
+        plugin = self.core.get_by_name("paperwork_backend.index.whoosh")
+        search = plugin._search
+
+        def search_and_commit(*args, **kwargs):
+            # the index is modified right after the search: the result
+            # is outdated before it is stored in the cache
+            r = search(*args, **kwargs)
+            plugin._search = search
+            self._add_docs(['test_doc_1'])
+            return r
+
+        plugin._search = search_and_commit
+        results = []
+        self.core.call_all("index_search", results, "flesch")
+        self.assertEqual(
+            results, [('test_doc_0', 'file:///somewhere/test_doc_0')]
+        )
+
+        results = []
+        self.core.call_all("index_search", results, "flesch")
+        self.assertEqual(results, [
+            ('test_doc_1', 'file:///somewhere/test_doc_1'),
+            ('test_doc_0', 'file:///somewhere/test_doc_0'),
+        ])
+
+    def test_search_page(self):
+        self.fake_storage.docs = [
+            {
+                'id': 'test_doc_{}'.format(idx),
+                'url': 'file:///somewhere/test_doc_{}'.format(idx),
+                'mtime': 123,
+                # the more 'flesch', the better the score
+                'text': 'Whoosh ' + ' '.join(['flesch'] * (5 - idx)),
+                'labels': set(),
+            }
+            for idx in range(0, 5)
+        ]
+        self._add_docs([doc['id'] for doc in self.fake_storage.docs])
+
+        for (sort, expected) in (
+                    ('relevance', [0, 1, 2, 3, 4]),
+                    ('date', [4, 3, 2, 1, 0]),
+                ):
+            pages = []
+            cursor = None
+            while True:
+                (hits, cursor) = self.core.call_success(
+                    "index_search_page", "flesch", cursor=cursor,
+                    page_len=2, sort=sort
+                )
+                pages.append([hit[0] for hit in hits])
+                for (doc_id, doc_url, score) in hits:
+                    self.assertEqual(
+                        doc_url, 'file:///somewhere/' + doc_id
+                    )
+                if cursor is None:
+                    break
+            expected = ['test_doc_{}'.format(idx) for idx in expected]
+            self.assertEqual(pages, [expected[0:2], expected[2:4], [
+                expected[4]
+            ]])
+
+        (hits, cursor) = self.core.call_success(
+            "index_search_page", "flesch", sort='relevance'
+        )
+        scores = [hit[2] for hit in hits]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        self.assertGreater(scores[0], scores[-1])
+        self.assertIsNone(cursor)
+
+        (hits, cursor) = self.core.call_success(
+            "index_search_page", "nothing"
+        )
+        self.assertEqual(hits, [])
+        self.assertIsNone(cursor)
+
+        # the search is run only once, for the first page. The following
+        # pages are taken from its results
+        plugin = self.core.get_by_name("paperwork_backend.index.whoosh")
+        searcher = plugin._get_searcher()
+        with unittest.mock.patch.object(
+                    searcher, "search", wraps=searcher.search
+                ) as search:
+            nb_hits = 0
+            cursor = None
+            while True:
+                (hits, cursor) = self.core.call_success(
+                    "index_search_page", "whoosh", cursor=cursor, page_len=2
+                )
+                nb_hits += len(hits)
+                if cursor is None:
+                    break
+        self.assertEqual(nb_hits, 5)
+        self.assertEqual(search.call_count, 1)
+
+    def test_facets(self):
+        self.fake_storage.docs = [
+            {
+                'id': '20200102_1234_12_1',
+                'url': 'file:///somewhere/20200102_1234_12_1',
+                'mtime': 123,
+                'text': 'Whoosh',
+                'labels': {('Médical', '#aaaabbbbcccc')},
+            },
+            {
+                'id': '20200115_1234_12_1',
+                'url': 'file:///somewhere/20200115_1234_12_1',
+                'mtime': 123,
+                'text': 'Whoosh',
+                'labels': {
+                    ('Médical', '#aaaabbbbcccc'),
+                    ('bills', '#ccccbbbbaaaa'),
+                },
+            },
+            {
+                'id': '20210304_1234_12_1',
+                'url': 'file:///somewhere/20210304_1234_12_1',
+                'mtime': 123,
+                'text': 'Whoosh',
+                'labels': set(),
+            },
+        ]
+        # the index is empty until it has been rebuilt
+        self.assertIsNone(self.core.call_success("index_get_facets"))
+        self._rebuild(procs=1)
+
+        facets = self.core.call_success("index_get_facets")
+        self.assertEqual(facets['nb_docs'], 3)
+        self.assertEqual(facets['labels'], {'Médical': 2, 'bills': 1})
+        self.assertEqual(facets['label_colors'], {
+            'Médical': '#aaaabbbbcccc',
+            'bills': '#ccccbbbbaaaa',
+        })
+        self.assertEqual(facets['label_pairs'], {('Médical', 'bills'): 1})
+        self.assertEqual(facets['dates'], {(2020, 1): 2, (2021, 3): 1})
+
+        # the facets must follow the changes in the index
+        transactions = []
+        self.core.call_all('doc_transaction_start', transactions)
+        for transaction in transactions:
+            transaction.del_doc('20200115_1234_12_1')
+        for transaction in transactions:
+            transaction.commit()
+        facets = self.core.call_success("index_get_facets")
+        self.assertEqual(facets['nb_docs'], 2)
+        self.assertEqual(facets['labels'], {'Médical': 1})
+        self.assertEqual(facets['label_pairs'], {})
+
+    def test_facets_no_searcher_lock(self):
+        self.fake_storage.docs = [
+            {
+                'id': '20200102_1234_12_1',
+                'url': 'file:///somewhere/20200102_1234_12_1',
+                'mtime': 123,
+                'text': 'Whoosh',
+                'labels': {('bills', '#ccccbbbbaaaa')},
+            },
+        ]
+        self._rebuild(procs=1)
+
+        # the facets are computed after each commit: they must not wait for
+        # the searches running at the same time
+        whoosh_plugin = self.core.get_by_name("paperwork_backend.index.whoosh")
+        facets = []
+        thread = threading.Thread(
+            target=lambda: facets.append(
+                self.core.call_success("index_get_facets")
+            )
+        )
+        with whoosh_plugin.searcher_lock:
+            thread.start()
+            thread.join(timeout=10)
+            self.assertFalse(thread.is_alive())
+        facets = facets[0]
+        self.assertEqual(facets['labels'], {'bills': 1})
+
     def test_suggestion(self):
         results = []
         self.core.call_all("suggestion_get", results, "flesch")
@@ -1,6 +1,15 @@
+import os
+import shutil
+import tempfile
 import unittest
 
 import openpaperwork_core
+import openpaperwork_core.fs
+
+import paperwork_backend.model.labels
+from paperwork_backend.model.labels_catalogue import (
+    LabelsCatalogueTransaction
+)
 
 
 class TestLabels(unittest.TestCase):
@@ -202,3 +211,193 @@ class TestLabels(unittest.TestCase):
                 ("label B", "#ccccbbbbaaaa"),
             ]
         )
+
+
+class TestLabelCatalogue(unittest.TestCase):
+    def setUp(self):
+        self.tmp_paperwork_dir = tempfile.mkdtemp(
+            prefix="paperwork_backend_tests"
+        )
+        self.tmp_work_dir = tempfile.mkdtemp(
+            prefix="paperwork_backend_tests"
+        )
+        self.docs = {}
+        for (doc_id, labels) in [
+                    ("doc_a", "label A,#aaaabbbbcccc\n"),
+                    ("doc_b", (
+                        "label A,#aaaabbbbcccc\n"
+                        "label B,#ccccbbbbaaaa\n"
+                    )),
+                ]:
+            doc_path = os.path.join(self.tmp_work_dir, doc_id)
+            os.mkdir(doc_path)
+            with open(os.path.join(doc_path, "labels"), "w") as fd:
+                fd.write(labels)
+            self.docs[doc_id] = (
+                openpaperwork_core.fs.CommonFsPluginBase.fs_safe(doc_path)
+            )
+
+        self.core = openpaperwork_core.Core(auto_load_dependencies=True)
+
+        class FakeModule(object):
+            class Plugin(openpaperwork_core.PluginBase):
+                PRIORITY = 999999999999999999999
+
+                def get_interfaces(s):
+                    return ['data_dir_handler', 'document_storage']
+
+                def data_dir_handler_get_individual_data_dir(s):
+                    return openpaperwork_core.fs.CommonFsPluginBase.fs_safe(
+                        self.tmp_paperwork_dir
+                    )
+
+                def storage_get_all_docs(s, out: list):
+                    out += sorted(self.docs.items())
+
+                def doc_id_to_url(s, doc_id, existing=True):
+                    return self.docs.get(doc_id)
+
+                def doc_url_to_id(s, doc_url):
+                    for (doc_id, url) in self.docs.items():
+                        if url == doc_url:
+                            return doc_id
+                    return None
+
+        self.core._load_module("fake_module", FakeModule)
+        self.core.load("openpaperwork_core.config.fake")
+        self.core.load("openpaperwork_core.fs.python")
+        self.core.load("openpaperwork_core.mainloop.asyncio")
+        self.core.load("paperwork_backend.model.labels_catalogue")
+        self.core.init()
+
+        self.plugin = self.core.get_by_name("paperwork_backend.model.labels")
+        self.catalogue = self.core.get_by_name(
+            "paperwork_backend.model.labels_catalogue"
+        )
+
+    def tearDown(self):
+        self.core.call_all("on_quit")
+        shutil.rmtree(self.tmp_paperwork_dir)
+        shutil.rmtree(self.tmp_work_dir)
+
+    def _load_labels(self):
+        loader = paperwork_backend.model.labels.LabelLoader(self.plugin)
+        self.plugin.all_labels = {}
+        loader.get_all_docs()
+        loader.load_labels()
+        return loader
+
+    def _get_doc_counts(self):
+        counts = {}
+        self.core.call_all("labels_get_doc_counts", counts)
+        return counts
+
+    def test_catalogue(self):
+        # first load: we have to go through all the documents, and the
+        # catalogue is filled in
+        loader = self._load_labels()
+        self.assertIsNone(loader.catalogue)
+        self.assertEqual(len(loader.all_docs), 2)
+        self.assertEqual(self.plugin.all_labels, {
+            "label A": "#aaaabbbbcccc",
+            "label B": "#ccccbbbbaaaa",
+        })
+        self.assertEqual(self._get_doc_counts(), {
+            "label A": 2,
+            "label B": 1,
+        })
+
+        # next loads: documents are not examined anymore
+        loader = self._load_labels()
+        self.assertEqual(loader.all_docs, [])
+        self.assertEqual(self.plugin.all_labels, {
+            "label A": "#aaaabbbbcccc",
+            "label B": "#ccccbbbbaaaa",
+        })
+
+    def test_incomplete(self):
+        # labels not loaded from the documents yet (or loaded from the
+        # index): the catalogue is not maintained
+        transaction = LabelsCatalogueTransaction(
+            self.catalogue, self.catalogue.sql
+        )
+        transaction.upd_doc("doc_a")
+        self.core.call_success(
+            "doc_add_label_by_url", self.docs['doc_b'], "label C",
+            color="#000000000000"
+        )
+        transaction.commit()
+        self.assertEqual(self._get_doc_counts(), {})
+        self.assertIsNone(self.core.call_success("labels_catalogue_get_all"))
+
+        # the catalogue is filled in while a transaction is running
+        transaction = LabelsCatalogueTransaction(
+            self.catalogue, self.catalogue.sql
+        )
+        self._load_labels()
+        path = self.core.call_success("fs_unsafe", self.docs['doc_a'])
+        with open(os.path.join(path, "labels"), "w") as fd:
+            fd.write("label D,#ddddddddddddd\n")
+        transaction.upd_doc("doc_a")
+        transaction.commit()
+        self.assertEqual(self._get_doc_counts(), {
+            "label A": 1,
+            "label B": 1,
+            "label C": 1,
+            "label D": 1,
+        })
+
+    def test_label_changes(self):
+        self._load_labels()
+
+        self.core.call_success(
+            "doc_add_label_by_url", self.docs['doc_a'], "label C",
+            color="#000000000000"
+        )
+        self.core.call_success(
+            "doc_remove_label_by_url", self.docs['doc_b'], "label A"
+        )
+        self.assertEqual(self._get_doc_counts(), {
+            "label A": 1,
+            "label B": 1,
+            "label C": 1,
+        })
+
+    def test_transaction(self):
+        self._load_labels()
+
+        # document modified outside of Paperwork
+        path = self.core.call_success("fs_unsafe", self.docs['doc_a'])
+        with open(os.path.join(path, "labels"), "w") as fd:
+            fd.write("label D,#ddddddddddddd\n")
+
+        transaction = LabelsCatalogueTransaction(
+            self.catalogue, self.catalogue.sql
+        )
+        transaction.upd_doc("doc_a")
+        transaction.del_doc("doc_b")
+        transaction.commit()
+
+        self.assertEqual(self._get_doc_counts(), {"label D": 1})
+        self._load_labels()
+        self.assertEqual(
+            self.plugin.all_labels, {"label D": "#ddddddddddddd"}
+        )
+
+    def test_label_changes_during_transaction(self):
+        self._load_labels()
+
+        for end in ("commit", "cancel"):
+            transaction = LabelsCatalogueTransaction(
+                self.catalogue, self.catalogue.sql
+            )
+            transaction.upd_doc("doc_b")
+            # for instance, labels guessed during an import
+            self.core.call_success(
+                "doc_add_label_by_url", self.docs['doc_a'], "label " + end,
+                color="#000000000000"
+            )
+            getattr(transaction, end)()
+
+            counts = self._get_doc_counts()
+            self.assertEqual(counts["label " + end], 1)
@@ -0,0 +1,170 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import openpaperwork_core
+
+
+class FakePopplerPage(object):
+    def __init__(self, doc, page_idx):
+        self.doc = doc
+        self.page_idx = page_idx
+
+    def get_text(self):
+        self.doc.nb_get_text += 1
+        return " page {} \n".format(self.page_idx)
+
+
+class FakePopplerDocument(object):
+    def __init__(self, nb_pages=3):
+        self.nb_get_text = 0
+        self.nb_pages = nb_pages
+
+    def get_n_pages(self):
+        return self.nb_pages
+
+    def get_page(self, page_idx):
+        if page_idx >= self.nb_pages:
+            return None
+        return FakePopplerPage(self, page_idx)
+
+
+class TestPdfCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="paperwork_backend_tests")
+        self.opened = []
+        self.nb_pages = 3
+
+        class FakeModule(object):
+            class Plugin(openpaperwork_core.PluginBase):
+                PRIORITY = 999999999
+
+                def get_interfaces(s):
+                    return ['poppler']
+
+                def poppler_open(s, url, password=None, in_mainloop=True):
+                    doc = FakePopplerDocument(self.nb_pages)
+                    self.opened.append(doc)
+                    return doc
+
+        self.core = openpaperwork_core.Core(auto_load_dependencies=True)
+        self.core._load_module("fake_module", FakeModule())
+        self.core.load("openpaperwork_core.fs.python")
+        self.core.load("openpaperwork_core.mainloop.asyncio")
+        self.core.load("openpaperwork_core.config.fake")
+        self.core.load("paperwork_backend.model.pdf")
+        self.core.init()
+
+        self.doc_url = self.core.call_success("fs_safe", self.tmp_dir)
+        self.pdf_path = os.path.join(self.tmp_dir, "doc.pdf")
+        with open(self.pdf_path, "w") as fd:
+            fd.write("not really a PDF")
+
+    def tearDown(self):
+        self.core.call_all("tests_cleanup")
+        shutil.rmtree(self.tmp_dir)
+
+    def _get_counters(self):
+        counters = {}
+        self.core.call_all("perfcheck_get_counters", counters)
+        return counters
+
+    def test_page_text(self):
+        for _ in range(0, 3):
+            self.assertEqual(
+                self.core.call_success(
+                    "page_get_text_by_url", self.doc_url, 1
+                ),
+                "page 1"
+            )
+            self.assertTrue(
+                self.core.call_success(
+                    "page_has_text_by_url", self.doc_url, 1
+                )
+            )
+
+        # the document is opened once to count the pages and the text of
+        # the page is extracted only once
+        self.assertEqual(len(self.opened), 1)
+        self.assertEqual(self.opened[0].nb_get_text, 1)
+
+        counters = self._get_counters()
+        self.assertEqual(counters['pdf_page_cache_misses'], 1)
+        self.assertEqual(counters['pdf_page_cache_hits'], 5)
+        self.assertEqual(counters['poppler_doc_cache_misses'], 1)
+
+    def test_doc_text(self):
+        out = []
+        self.core.call_all("doc_get_text_by_url", out, self.doc_url)
+        self.assertEqual(out, ["page 0", "page 1", "page 2"])
+        self.assertEqual(
+            self.core.call_success("page_get_text_by_url", self.doc_url, 2),
+            "page 2"
+        )
+        self.assertEqual(self.opened[0].nb_get_text, 3)
+
+    def test_modified(self):
+        self.core.call_success("page_get_text_by_url", self.doc_url, 0)
+        st = os.stat(self.pdf_path)
+        os.utime(self.pdf_path, (st.st_atime + 10, st.st_mtime + 10))
+        self.core.call_success("page_get_text_by_url", self.doc_url, 0)
+        # the file has been reopened and the text extracted again
+        self.assertEqual(len(self.opened), 2)
+        self.assertEqual(self.opened[1].nb_get_text, 1)
+
+    def test_max_size(self):
+        self.core.call_all("config_put", "pdf_cache_max_pages", 1)
+        self.core.call_success("page_get_text_by_url", self.doc_url, 0)
+        self.core.call_success("page_get_text_by_url", self.doc_url, 1)
+        self.core.call_success("page_get_text_by_url", self.doc_url, 0)
+        self.assertEqual(self.opened[0].nb_get_text, 3)
+        self.assertEqual(self._get_counters()['pdf_page_cache_size'], 1)
+
+    def _touch(self, path):
+        st = os.stat(path)
+        os.utime(path, (st.st_atime + 10, st.st_mtime + 10))
+
+    def test_doc_modified(self):
+        h = self.core.call_success("doc_get_hash_by_url", self.doc_url)
+        self.assertEqual(
+            self.core.call_success("doc_get_nb_pages_by_url", self.doc_url), 3
+        )
+
+        # doc.pdf replaced outside of Paperwork
+        with open(self.pdf_path, "w") as fd:
+            fd.write("another PDF")
+        self._touch(self.pdf_path)
+        self.nb_pages = 2
+        self.core.call_all("poppler_pool_forget", self.doc_url + "/doc.pdf")
+
+        self.assertNotEqual(
+            self.core.call_success("doc_get_hash_by_url", self.doc_url), h
+        )
+        self.assertEqual(
+            self.core.call_success("doc_get_nb_pages_by_url", self.doc_url), 2
+        )
+
+        # page mapping written outside of Paperwork
+        with open(os.path.join(self.tmp_dir, "page_map.csv"), "w") as fd:
+            fd.write("original_page_index,target_page_index\n")
+            fd.write("0,-1\n1,0\n")
+        self.assertEqual(
+            self.core.call_success("doc_get_nb_pages_by_url", self.doc_url), 1
+        )
+
+    def test_mapping_saved(self):
+        self.assertEqual(
+            self.core.call_success("doc_get_nb_pages_by_url", self.doc_url), 3
+        )
+        self.core.call_all("page_delete_by_url", self.doc_url, 0)
+        misses = self._get_counters()['pdf_mapping_cache_misses']
+
+        # the mapping we just wrote is still up-to-date: no need to reload
+        # it
+        self.assertEqual(
+            self.core.call_success("doc_get_nb_pages_by_url", self.doc_url), 2
+        )
+        self.assertEqual(
+            self._get_counters()['pdf_mapping_cache_misses'], misses
+        )
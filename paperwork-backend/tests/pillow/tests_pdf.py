@@ -1,11 +1,29 @@
+import logging
 import os
+import time
 import unittest
 
 import PIL.Image
+import PIL.ImageChops
 
 import openpaperwork_core
 import openpaperwork_core.fs
 
+import paperwork_backend.cairo.pillow
+import paperwork_backend.pillow.pdf
+
+
+CAIRO_AVAILABLE = False
+
+try:
+    import cairo
+    CAIRO_AVAILABLE = True
+except (ImportError, ValueError):
+    pass
+
+
+LOGGER = logging.getLogger(__name__)
+
 
 class TestPillowPdf(unittest.TestCase):
     def setUp(self):
@@ -28,3 +46,53 @@ class TestPillowPdf(unittest.TestCase):
         pdf_as_img = self.core.call_success("url_to_pillow", self.pdf_url)
         ref_img = PIL.Image.open(self.img_path)
         self.assertEqual(ref_img.size, pdf_as_img.size)
+
+    def _make_surface(self, dpi):
+        # A4 page, white background, with some semi-transparent drawings
+        (width, height) = (int(8.27 * dpi), int(11.69 * dpi))
+        surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+        ctx = cairo.Context(surface)
+        ctx.set_source_rgb(1.0, 1.0, 1.0)
+        ctx.rectangle(0, 0, width, height // 2)
+        ctx.fill()
+        for idx in range(0, 20):
+            ctx.set_source_rgba(0.1 * (idx % 10), 0.2, 0.5, 0.05 * idx)
+            ctx.rectangle(
+                idx * width / 40, idx * height / 40, width / 4, height / 4
+            )
+            ctx.fill()
+        return paperwork_backend.cairo.pillow.ImgSurface(surface)
+
+    @unittest.skipUnless(CAIRO_AVAILABLE, reason="Cairo not available")
+    def test_surface2image(self):
+        surface = self._make_surface(50)
+        direct = paperwork_backend.pillow.pdf.surface2image(
+            self.core, surface
+        )
+        png = paperwork_backend.pillow.pdf.surface2image(
+            self.core, surface, use_buffer=False
+        )
+        self.assertEqual(direct.mode, "RGB")
+        self.assertEqual(direct.size, png.size)
+        # PNG are not premultiplied: we may get rounding differences
+        diff = PIL.ImageChops.difference(direct, png)
+        self.assertLessEqual(max(e[1] for e in diff.getextrema()), 2)
+
+    @unittest.skipUnless(CAIRO_AVAILABLE, reason="Cairo not available")
+    def test_surface2image_benchmark(self):
+        nb_pages = 5
+        for dpi in (150, 300):
+            surface = self._make_surface(dpi)
+            timings = {}
+            for use_buffer in (False, True):
+                start = time.time()
+                for _ in range(0, nb_pages):
+                    paperwork_backend.pillow.pdf.surface2image(
+                        self.core, surface, use_buffer=use_buffer
+                    )
+                timings[use_buffer] = (time.time() - start) * 1000 / nb_pages
+            LOGGER.info(
+                "surface2image() at %d dpi: PNG: %.1fms/page ;"
+                " direct: %.1fms/page",
+                dpi, timings[False], timings[True]
+            )
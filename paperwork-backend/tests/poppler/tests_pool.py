@@ -0,0 +1,117 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import openpaperwork_core
+
+
+class FakePopplerDocument(object):
+    def __init__(self, url):
+        self.url = url
+        self.thread = threading.current_thread()
+
+
+class TestPopplerPool(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="paperwork_backend_tests")
+        self.opened = []
+
+        class FakeModule(object):
+            class Plugin(openpaperwork_core.PluginBase):
+                def get_interfaces(s):
+                    return ['poppler']
+
+                def poppler_open(s, url, password=None, in_mainloop=True):
+                    self.assertFalse(in_mainloop)
+                    self.opened.append(url)
+                    return FakePopplerDocument(url)
+
+        self.core = openpaperwork_core.Core(auto_load_dependencies=True)
+        self.core._load_module("fake_module", FakeModule())
+        self.core.load("openpaperwork_core.fs.python")
+        self.core.load("paperwork_backend.poppler.pool")
+        self.core.init()
+
+        self.urls = []
+        for idx in range(0, 8):
+            path = os.path.join(self.tmp_dir, "doc{}.pdf".format(idx))
+            with open(path, "w") as fd:
+                fd.write("not really a PDF")
+            self.urls.append(self.core.call_success("fs_safe", path))
+
+    def tearDown(self):
+        self.core.call_all("tests_cleanup")
+        shutil.rmtree(self.tmp_dir)
+
+    def _open(self, url):
+        doc = self.core.call_success("poppler_pool_open", url)
+        return (doc, threading.current_thread())
+
+    def test_same_thread(self):
+        (doc_a, thread_a) = self.core.call_one(
+            "poppler_pool_execute", self.urls[0], self._open, self.urls[0]
+        )
+        (doc_b, thread_b) = self.core.call_one(
+            "poppler_pool_execute", self.urls[0], self._open, self.urls[0]
+        )
+        self.assertIsNot(thread_a, threading.current_thread())
+        self.assertIs(thread_a, thread_b)
+        # the document must have been opened only once, by the thread that
+        # uses it
+        self.assertIs(doc_a, doc_b)
+        self.assertIs(doc_a.thread, thread_a)
+        self.assertEqual(self.opened, [self.urls[0]])
+
+    def test_parallel(self):
+        results = {}
+
+        def run(url):
+            results[url] = self.core.call_one(
+                "poppler_pool_execute", url, self._open, url
+            )
+
+        threads = [
+            threading.Thread(target=run, args=(url,)) for url in self.urls
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(results.keys()), sorted(self.urls))
+        for (url, (doc, thread)) in results.items():
+            self.assertEqual(doc.url, url)
+            self.assertIs(doc.thread, thread)
+
+    def test_modified(self):
+        self.core.call_one(
+            "poppler_pool_execute", self.urls[0], self._open, self.urls[0]
+        )
+        path = self.core.call_success("fs_unsafe", self.urls[0])
+        st = os.stat(path)
+        os.utime(path, (st.st_atime + 10, st.st_mtime + 10))
+        self.core.call_one(
+            "poppler_pool_execute", self.urls[0], self._open, self.urls[0]
+        )
+        self.assertEqual(self.opened, [self.urls[0], self.urls[0]])
+
+    def test_forget(self):
+        self.core.call_one(
+            "poppler_pool_execute", self.urls[0], self._open, self.urls[0]
+        )
+        self.core.call_all("poppler_pool_forget", self.urls[0])
+        self.core.call_one(
+            "poppler_pool_execute", self.urls[0], self._open, self.urls[0]
+        )
+        self.assertEqual(self.opened, [self.urls[0], self.urls[0]])
+
+    def test_exception(self):
+        def fail():
+            raise ValueError("nope")
+
+        with self.assertRaises(ValueError):
+            self.core.call_one(
+                "poppler_pool_execute", self.urls[0], fail
+            )
@@ -1,8 +1,17 @@
+import logging
+import os
 import shutil
+import sqlite3
 import tempfile
+import threading
+import time
 import unittest
 
 import openpaperwork_core
+import openpaperwork_core.sqlite
+
+
+LOGGER = logging.getLogger(__name__)
 
 
 class TestPageTracker(unittest.TestCase):
@@ -23,6 +32,8 @@ class TestPageTracker(unittest.TestCase):
                     )
 
         self.core._load_module("fake_module", FakeModule)
+        self.core.load("openpaperwork_core.fs.python")
+        self.core.load("openpaperwork_core.mainloop.asyncio")
         self.core.load("paperwork_backend.model.fake")
         self.core.load("paperwork_backend.pagetracker")
 
@@ -69,6 +80,7 @@ class TestPageTracker(unittest.TestCase):
         tracker.ack_page('test_doc_2', 'file:///somewhere/test_doc_2', 1)
         tracker.ack_page('test_doc_2', 'file:///somewhere/test_doc_2', 2)
         tracker.commit()
+        self.core.call_all("page_tracker_session_end")
 
         self.fake_storage.docs = [
             {
@@ -89,3 +101,285 @@ class TestPageTracker(unittest.TestCase):
         tracker.ack_page('test_doc', 'file:///somewhere/test_doc', 2)
         tracker.delete_doc('test_doc_2')
         tracker.commit()
+        self.core.call_all("page_tracker_session_end")
+
+    def test_cancel(self):
+        self.fake_storage.docs = [
+            {
+                'id': 'test_doc',
+                'url': 'file:///somewhere/test_doc',
+                'page_hashes': [
+                    ('file:///somewhere/test_doc/0.jpeg', 123),
+                ],
+            },
+        ]
+
+        tracker = self.core.call_success("page_tracker_get", 'test_tracking')
+        out = tracker.find_changes('test_doc', 'file:///somewhere/test_doc')
+        self.assertEqual(out, [('new', 0)])
+        tracker.ack_page('test_doc', 'file:///somewhere/test_doc', 0)
+        tracker.cancel()
+
+        tracker = self.core.call_success("page_tracker_get", 'test_tracking')
+        out = tracker.find_changes('test_doc', 'file:///somewhere/test_doc')
+        self.assertEqual(out, [('new', 0)])
+        tracker.commit()
+
+    def test_shared_session(self):
+        self.fake_storage.docs = [
+            {
+                'id': 'test_doc',
+                'url': 'file:///somewhere/test_doc',
+                'page_hashes': [
+                    ('file:///somewhere/test_doc/0.jpeg', 123),
+                    ('file:///somewhere/test_doc/1.jpeg', 124),
+                ],
+            },
+        ]
+        trackers = [
+            self.core.call_success("page_tracker_get", tracking_id)
+            for tracking_id in ('tracker_a', 'tracker_b', 'tracker_c')
+        ]
+        for tracker in trackers:
+            out = tracker.find_changes(
+                'test_doc', 'file:///somewhere/test_doc'
+            )
+            self.assertEqual(out, [('new', 0), ('new', 1)])
+        # the hashes have been computed only once for all the trackers
+        counters = {}
+        self.core.call_all("perfcheck_get_counters", counters)
+        self.assertEqual(counters['page_tracker_hashes_computed'], 2)
+        self.assertEqual(counters['page_tracker_hashes_shared'], 4)
+
+        # the first tracker modifies the page 1
+        self.fake_storage.docs[0]['page_hashes'][1] = (
+            'file:///somewhere/test_doc/1.jpeg', 200
+        )
+        trackers[0].ack_page('test_doc', 'file:///somewhere/test_doc', 0)
+        trackers[0].ack_page(
+            'test_doc', 'file:///somewhere/test_doc', 1, modified=True
+        )
+        # only the modified page is hashed again
+        self.core.call_all("perfcheck_get_counters", counters)
+        self.assertEqual(counters['page_tracker_hashes_computed'], 3)
+        for tracker in trackers:
+            tracker.commit()
+        self.core.call_all("page_tracker_session_end")
+
+        tracker = self.core.call_success("page_tracker_get", 'tracker_a')
+        out = tracker.find_changes('test_doc', 'file:///somewhere/test_doc')
+        self.assertEqual(out, [])
+        tracker.commit()
+        tracker = self.core.call_success("page_tracker_get", 'tracker_b')
+        out = tracker.find_changes('test_doc', 'file:///somewhere/test_doc')
+        self.assertEqual(out, [('new', 0), ('new', 1)])
+        tracker.commit()
+
+    def test_shared_session_cancel(self):
+        self.fake_storage.docs = [
+            {
+                'id': 'test_doc',
+                'url': 'file:///somewhere/test_doc',
+                'page_hashes': [
+                    ('file:///somewhere/test_doc/0.jpeg', 123),
+                ],
+            },
+        ]
+
+        tracker_a = self.core.call_success("page_tracker_get", 'tracker_a')
+        tracker_b = self.core.call_success("page_tracker_get", 'tracker_b')
+        for tracker in (tracker_a, tracker_b):
+            tracker.find_changes('test_doc', 'file:///somewhere/test_doc')
+            tracker.ack_page('test_doc', 'file:///somewhere/test_doc', 0)
+        tracker_a.commit()
+        tracker_b.cancel()
+        self.core.call_all("page_tracker_session_end")
+
+        # only the changes of the cancelled tracker are dropped
+        tracker = self.core.call_success("page_tracker_get", 'tracker_a')
+        out = tracker.find_changes('test_doc', 'file:///somewhere/test_doc')
+        self.assertEqual(out, [])
+        tracker.commit()
+        tracker = self.core.call_success("page_tracker_get", 'tracker_b')
+        out = tracker.find_changes('test_doc', 'file:///somewhere/test_doc')
+        self.assertEqual(out, [('new', 0)])
+        tracker.commit()
+        self.core.call_all("page_tracker_session_end")
+
+    def test_cancel_restore(self):
+        self.fake_storage.docs = [
+            {
+                'id': 'test_doc',
+                'url': 'file:///somewhere/test_doc',
+                'page_hashes': [
+                    ('file:///somewhere/test_doc/0.jpeg', 123),
+                    ('file:///somewhere/test_doc/1.jpeg', 124),
+                ],
+            },
+        ]
+
+        tracker = self.core.call_success("page_tracker_get", 'tracker_a')
+        tracker.find_changes('test_doc', 'file:///somewhere/test_doc')
+        tracker.ack_page('test_doc', 'file:///somewhere/test_doc', 0)
+        tracker.commit()
+        self.core.call_all("page_tracker_session_end")
+
+        tracker = self.core.call_success("page_tracker_get", 'tracker_a')
+        tracker.ack_page('test_doc', 'file:///somewhere/test_doc', 1)
+        tracker.delete_doc('test_doc')
+        tracker.cancel()
+        self.core.call_all("page_tracker_session_end")
+
+        # the state before the cancelled tracker is restored
+        tracker = self.core.call_success("page_tracker_get", 'tracker_a')
+        out = tracker.find_changes('test_doc', 'file:///somewhere/test_doc')
+        self.assertEqual(out, [('new', 1)])
+        tracker.commit()
+        self.core.call_all("page_tracker_session_end")
+
+    def test_transaction_session(self):
+        self.fake_storage.docs = [
+            {
+                'id': 'test_doc',
+                'url': 'file:///somewhere/test_doc',
+                'page_hashes': [
+                    ('file:///somewhere/test_doc/0.jpeg', 123),
+                ],
+            },
+        ]
+        plugin = self.core.get_by_name("paperwork_backend.pagetracker")
+
+        transactions = []
+        self.core.call_all("doc_transaction_start", transactions, 1)
+        self.assertEqual(len(transactions), 1)
+        tracker = self.core.call_success("page_tracker_get", 'tracker_a')
+        tracker.find_changes('test_doc', 'file:///somewhere/test_doc')
+        tracker.ack_page('test_doc', 'file:///somewhere/test_doc', 0)
+        # the tracker is never committed nor cancelled: the session is
+        # still ended with the batch of transactions
+        for transaction in transactions:
+            transaction.commit()
+        self.assertEqual(len(plugin.sessions), 0)
+        self.assertIsNone(plugin.sql)
+
+        tracker = self.core.call_success("page_tracker_get", 'tracker_a')
+        out = tracker.find_changes('test_doc', 'file:///somewhere/test_doc')
+        self.assertEqual(out, [])
+        tracker.commit()
+        self.core.call_all("on_quit")
+        self.assertEqual(len(plugin.sessions), 0)
+
+    def test_migration(self):
+        old_db = os.path.join(self.tmp_paperwork_dir, "page_tracking_ocr.db")
+        sql = sqlite3.connect(old_db)
+        sql.execute(
+            "CREATE TABLE pages ("
+            " doc_id TEXT NOT NULL,"
+            " page INTEGER NOT NULL,"
+            " hash TEXT NOT NULL,"
+            " PRIMARY KEY (doc_id, page)"
+            ")"
+        )
+        sql.execute(
+            "INSERT INTO pages (doc_id, page, hash) VALUES (?, ?, ?)",
+            ('test_doc', 0, format(123, 'x'))
+        )
+        sql.commit()
+        sql.close()
+
+        self.fake_storage.docs = [
+            {
+                'id': 'test_doc',
+                'url': 'file:///somewhere/test_doc',
+                'page_hashes': [
+                    ('file:///somewhere/test_doc/0.jpeg', 123),
+                    ('file:///somewhere/test_doc/1.jpeg', 124),
+                ],
+            },
+        ]
+
+        tracker = self.core.call_success("page_tracker_get", 'ocr')
+        out = tracker.find_changes('test_doc', 'file:///somewhere/test_doc')
+        self.assertEqual(out, [('new', 1)])
+        tracker.commit()
+        self.assertFalse(os.path.exists(old_db))
+
+    def _benchmark(self, tracking_id, batch_size, nb_docs, nb_pages):
+        """
+        Tracker calls are made from a thread while the main loop is running,
+        like in the sync transactions. Returns the number of rows written
+        per second.
+        """
+        elapsed = None
+
+        def run():
+            nonlocal elapsed
+            try:
+                tracker = self.core.call_success(
+                    "page_tracker_get", tracking_id, batch_size=batch_size
+                )
+                start = time.time()
+                for doc in self.fake_storage.docs:
+                    tracker.find_changes(doc['id'], doc['url'])
+                    for page_idx in range(0, nb_pages):
+                        tracker.ack_page(doc['id'], doc['url'], page_idx)
+                tracker.commit()
+                self.core.call_all("page_tracker_session_end")
+                elapsed = time.time() - start
+            finally:
+                self.core.call_one(
+                    "mainloop_schedule", self.core.call_all,
+                    "mainloop_quit_graceful"
+                )
+
+        thread = threading.Thread(target=run)
+        # start the thread only once the main loop is running
+        self.core.call_one("mainloop_schedule", thread.start)
+        self.core.call_one("mainloop")
+        thread.join()
+
+        self.assertIsNotNone(elapsed)
+        return nb_docs * nb_pages / elapsed
+
+    @unittest.skipUnless(
+        os.environ.get("OPENPAPERWORK_BENCHMARK"),
+        reason="Benchmark: set OPENPAPERWORK_BENCHMARK=1 to run it"
+    )
+    def test_batch_benchmark(self):
+        nb_docs = 200
+        nb_pages = 10
+        self.fake_storage.docs = [
+            {
+                'id': 'test_doc_{}'.format(doc_idx),
+                'url': 'file:///somewhere/test_doc_{}'.format(doc_idx),
+                'page_hashes': [
+                    (
+                        'file:///somewhere/test_doc_{}/{}.jpeg'.format(
+                            doc_idx, page_idx
+                        ),
+                        (doc_idx * nb_pages) + page_idx
+                    )
+                    for page_idx in range(0, nb_pages)
+                ],
+            }
+            for doc_idx in range(0, nb_docs)
+        ]
+
+        # batch_size=1 --> one round trip to the main loop per row, as
+        # without batching
+        unbatched = self._benchmark('unbatched', 1, nb_docs, nb_pages)
+        batched = self._benchmark(
+            'batched', openpaperwork_core.sqlite.DEFAULT_BATCH_SIZE,
+            nb_docs, nb_pages
+        )
+        LOGGER.info(
+            "Page tracker: %.1f rows/s without batching,"
+            " %.1f rows/s with batching",
+            unbatched, batched
+        )
+
+        tracker = self.core.call_success("page_tracker_get", 'batched')
+        for doc in self.fake_storage.docs:
+            self.assertEqual(tracker.find_changes(doc['id'], doc['url']), [])
+        tracker.commit()
+        self.core.call_all("page_tracker_session_end")
@@ -12,3 +12,28 @@ class TestUtil(unittest.TestCase):
         self.assertEqual(levensthein("abc", "ab"), 1)  # delete
         self.assertEqual(levensthein("abc", "abd"), 1)  # replace
         self.assertEqual(levensthein("abc", "defg"), 4)  # combo
+
+    def test_lru_cache(self):
+        cache = paperwork_backend.util.LRUCache(max_size=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.put("c", 3)  # "b" is the least recently used
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(cache.get_counters("test"), {
+            "test_hits": 3, "test_misses": 1, "test_size": 2,
+        })
+
+        cache.set_max_size(1)
+        self.assertEqual(len(cache), 1)
+        self.assertIn("c", cache)
+
+    def test_lru_cache_version(self):
+        cache = paperwork_backend.util.LRUCache(max_size=10)
+        cache.put("a", 1, version=123)
+        self.assertEqual(cache.get("a", version=123), 1)
+        # outdated
+        self.assertIsNone(cache.get("a", version=456))
+        self.assertNotIn("a", cache)
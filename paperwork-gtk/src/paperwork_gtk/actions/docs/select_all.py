@@ -55,6 +55,9 @@ class Plugin(openpaperwork_core.PluginBase):
     def on_search_results(self, query, docs):
         self.visible_docs = docs
 
+    def on_search_results_more(self, query, docs):
+        self.visible_docs = self.visible_docs + docs
+
     def _select_all(self, action, parameter):
         for doc in self.visible_docs:
             self.core.call_all("doc_selection_add", *doc)
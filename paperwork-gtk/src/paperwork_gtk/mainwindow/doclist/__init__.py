@@ -367,6 +367,11 @@ class Plugin(openpaperwork_core.PluginBase):
     def on_search_results(self, query, docs):
         self.doclist_show(docs, show_new=(query == ""))
 
+    def on_search_results_more(self, query, docs):
+        self.docs = self.docs + docs
+        if self.doc_visibles < NB_DOCS_PER_PAGE:
+            self.doclist_extend(NB_DOCS_PER_PAGE - self.doc_visibles)
+
     def doc_close(self):
         self.active_doc = (None, None)
 
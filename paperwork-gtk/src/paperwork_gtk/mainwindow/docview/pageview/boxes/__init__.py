@@ -13,6 +13,7 @@ except (ImportError, ValueError):
 import openpaperwork_core
 import openpaperwork_core.deps
 import openpaperwork_core.promise
+import openpaperwork_core.thread
 
 from ..... import _
 
@@ -187,10 +188,12 @@ class Plugin(openpaperwork_core.PluginBase):
         promise = promise.then(lambda *args, **kwargs: None)
         promise = promise.then(openpaperwork_core.promise.ThreadedPromise(
             self.core, self.core.call_success,
-            args=("page_get_boxes_by_url", page.doc_url, page.page_idx,)
+            args=("page_get_boxes_by_url", page.doc_url, page.page_idx,),
+            priority=openpaperwork_core.thread.PRIORITY_INTERACTIVE
         ))
         promise = promise.then(openpaperwork_core.promise.ThreadedPromise(
-            self.core, lambda boxes=[]: self._index_boxes(boxes)
+            self.core, lambda boxes=[]: self._index_boxes(boxes),
+            priority=openpaperwork_core.thread.PRIORITY_INTERACTIVE
         ))
         promise = promise.then(lambda boxes: self._set_boxes(boxes, page))
         promise = promise.then(lambda boxes: self.core.call_all(
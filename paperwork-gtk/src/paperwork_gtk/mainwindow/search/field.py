@@ -2,6 +2,7 @@ import logging
 
 import openpaperwork_core
 import openpaperwork_core.promise
+import openpaperwork_core.thread
 import paperwork_backend.sync
 
 
@@ -105,20 +106,17 @@ class Plugin(openpaperwork_core.PluginBase):
     def search_by_keywords(self, query):
         self.core.call_all("work_queue_cancel_all", "doc_search")
         self.core.call_all("on_search_start", query)
-        if query == "":
-            out = []
-            promise = openpaperwork_core.promise.ThreadedPromise(
-                self.core, lambda: self.core.call_all(
-                    "storage_get_all_docs", out
-                )
-            )
-        else:
-            out = []
-            promise = openpaperwork_core.promise.ThreadedPromise(
-                self.core, lambda: self.core.call_all(
-                    "index_search", out, query
-                )
-            )
+        if query != "":
+            self._search_page(query)
+            return
+
+        out = []
+        promise = openpaperwork_core.promise.ThreadedPromise(
+            self.core, lambda: self.core.call_all(
+                "storage_get_all_docs", out
+            ),
+            priority=openpaperwork_core.thread.PRIORITY_INTERACTIVE
+        )
         promise = promise.then(lambda *args, **kwargs: out)
         promise = promise.then(lambda docs: sorted(docs, reverse=True))
 
@@ -133,6 +131,37 @@ class Plugin(openpaperwork_core.PluginBase):
 
         self.core.call_all("work_queue_add_promise", "doc_search", promise)
 
+    def _search_page(self, query, cursor=None):
+        """
+        Search results are displayed page by page, as they come: the first
+        page with 'on_search_results', the following ones with
+        'on_search_results_more'.
+        """
+        promise = openpaperwork_core.promise.ThreadedPromise(
+            self.core, self.core.call_success,
+            args=("index_search_page", query),
+            kwargs={'cursor': cursor, 'sort': 'date'},
+            priority=openpaperwork_core.thread.PRIORITY_INTERACTIVE
+        )
+
+        def show_if_query_still_valid(result):
+            # While we were looking for the documents, the query may have
+            # changed (user tying). No point in displaying obsolete results.
+            if query != self.search_entry.get_text():
+                return
+            (hits, next_cursor) = result
+            docs = [(doc_id, doc_url) for (doc_id, doc_url, score) in hits]
+            if cursor is None:
+                self.core.call_all("on_search_results", query, docs)
+            else:
+                self.core.call_all("on_search_results_more", query, docs)
+            if next_cursor is not None:
+                self._search_page(query, next_cursor)
+
+        promise = promise.then(show_if_query_still_valid)
+
+        self.core.call_all("work_queue_add_promise", "doc_search", promise)
+
     def search_stop(self):
         self.core.call_all("work_queue_cancel_all", "doc_search")
 
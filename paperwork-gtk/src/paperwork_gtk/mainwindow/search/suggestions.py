@@ -2,6 +2,7 @@ import logging
 
 import openpaperwork_core
 import openpaperwork_core.promise
+import openpaperwork_core.thread
 
 
 LOGGER = logging.getLogger(__name__)
@@ -91,7 +92,8 @@ class Plugin(openpaperwork_core.PluginBase):
             return
 
         promise = openpaperwork_core.promise.ThreadedPromise(
-            self.core, self._get_suggestions, args=(query,)
+            self.core, self._get_suggestions, args=(query,),
+            priority=openpaperwork_core.thread.PRIORITY_INTERACTIVE
         )
         promise = promise.then(self._show_suggestions, query)
         self.core.call_success(
@@ -169,6 +169,9 @@ class Plugin(openpaperwork_core.PluginBase):
 
         if workdir != self.workdir:
             LOGGER.info("Work directory has been changed --> Synchronizing")
-            self.core.call_all("transaction_sync_all")
+            # the fingerprints stored in the databases describe the
+            # documents of the previous work directory: none of them can
+            # be trusted
+            self.core.call_all("transaction_sync_all", full=True)
 
         self.workdir = workdir
@@ -36,12 +36,24 @@ class Plugin(openpaperwork_core.PluginBase):
             default_value_func=lambda: True
         )
         self.core.call_all("config_register", "sync_on_start", setting)
+        # incremental synchronizations only examine the documents whose
+        # fingerprint has changed. If the user can't trust them (work
+        # directory modified by tools preserving mtimes, etc), they can
+        # request full synchronizations instead.
+        setting = self.core.call_success(
+            "config_build_simple", "GUI", "sync_on_start_full",
+            default_value_func=lambda: False
+        )
+        self.core.call_all("config_register", "sync_on_start_full", setting)
 
     def on_initialized(self):
         r = self.core.call_success("config_get", "sync_on_start")
         if r:
-            LOGGER.info("Starting synchronization ...")
-            self.core.call_all("transaction_sync_all")
+            full = bool(self.core.call_success(
+                "config_get", "sync_on_start_full"
+            ))
+            LOGGER.info("Starting synchronization (full=%s) ...", full)
+            self.core.call_all("transaction_sync_all", full=full)
         else:
             LOGGER.info(
                 "Synchronization on start is disabled --> Just loading labels"
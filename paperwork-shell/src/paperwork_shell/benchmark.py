@@ -0,0 +1,79 @@
+"""
+Measure how long paperwork-cli takes to run a command, with and without
+on-demand plugin loading (see PAPERWORK_LAZY_PLUGINS in main.py). Each
+command is run in a new process, so the measurement includes imports and
+plugin initialization.
+
+To use it:
+
+```sh
+python3 -m paperwork_shell.benchmark -n 10 "plugins list" "search foo"
+```
+
+The first run of each command (not counted) generates the plugin manifest.
+"""
+
+import argparse
+import os
+import shlex
+import statistics
+import subprocess
+import sys
+import time
+
+
+DEFAULT_COMMANDS = [
+    "plugins list",
+    "config show",
+    "search test",
+]
+DEFAULT_NB_RUNS = 5
+
+
+def run(command, lazy):
+    env = dict(os.environ)
+    env['PAPERWORK_LAZY_PLUGINS'] = "1" if lazy else "0"
+    start = time.time()
+    subprocess.run(
+        [sys.executable, "-m", "paperwork_shell.main"] + shlex.split(command),
+        env=env, check=True,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    return time.time() - start
+
+
+def benchmark(command, nb_runs):
+    out = {}
+    for lazy in (False, True):
+        run(command, lazy)  # warm up: disk cache, plugin manifest, etc
+        out[lazy] = [run(command, lazy) for _ in range(0, nb_runs)]
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure paperwork-cli startup time"
+    )
+    parser.add_argument(
+        '--runs', '-n', type=int, default=DEFAULT_NB_RUNS,
+        help="Number of runs for each command"
+    )
+    parser.add_argument(
+        'commands', nargs='*', default=DEFAULT_COMMANDS,
+        help="paperwork-cli commands to run"
+    )
+    args = parser.parse_args()
+
+    for command in args.commands:
+        timings = benchmark(command, args.runs)
+        eager = statistics.median(timings[False])
+        lazy = statistics.median(timings[True])
+        print(
+            "{}: all plugins: {:.3f}s ; on-demand: {:.3f}s ({:+.1f}%)".format(
+                command, eager, lazy, (lazy - eager) * 100 / eager
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
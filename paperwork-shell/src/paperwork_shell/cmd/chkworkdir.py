@@ -114,7 +114,9 @@ class Plugin(openpaperwork_core.PluginBase):
             print(_("All fixed !"))
             print(_("Synchronizing with work directory ..."))
 
-        self.core.call_all("transaction_sync_all")
+        # the fixes may have modified files without changing the document
+        # fingerprints
+        self.core.call_all("transaction_sync_all", full=True)
         self.core.call_all("mainloop_quit_graceful")
         self.core.call_one("mainloop")
         if self.interactive:
@@ -84,7 +84,18 @@ class Plugin(openpaperwork_core.PluginBase):
 
         out = []
 
-        for page_idx in pages:
+        # queue all the pages first so they are OCR-ed in parallel
+        futures = [
+            (
+                page_idx,
+                self.core.call_success(
+                    "ocr_submit_page_by_url", doc_url, page_idx
+                )
+            )
+            for page_idx in pages
+        ]
+
+        for (page_idx, future) in futures:
             if self.interactive:
                 sys.stdout.write(
                     _(
@@ -96,7 +107,9 @@ class Plugin(openpaperwork_core.PluginBase):
                 )
                 sys.stdout.flush()
 
-            self.core.call_all("ocr_page_by_url", doc_url, page_idx)
+            self.core.call_all(
+                "ocr_collect_page_by_url", doc_url, page_idx, future
+            )
 
             if self.interactive:
                 sys.stdout.write(_("Done") + "\n")
@@ -0,0 +1,96 @@
+#    Paperwork - Using OCR to grep dead trees the easy way
+#    Copyright (C) 2012-2019  Jerome Flesch
+#
+#    Paperwork is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Paperwork is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Paperwork.  If not, see <http://www.gnu.org/licenses/>.
+import openpaperwork_core
+
+import paperwork_backend.index.whoosh
+
+from .. import _
+
+
+class Plugin(openpaperwork_core.PluginBase):
+    def __init__(self):
+        super().__init__()
+        self.interactive = True
+
+    def get_interfaces(self):
+        return ['shell']
+
+    def get_deps(self):
+        return [
+            {
+                "interface": "index",
+                "defaults": ["paperwork_backend.index.whoosh"],
+            },
+            {
+                'interface': 'transaction_manager',
+                'defaults': ['paperwork_backend.sync'],
+            },
+        ]
+
+    def cmd_set_interactive(self, interactive):
+        self.interactive = interactive
+
+    def cmd_complete_argparse(self, parser):
+        p = parser.add_parser('reindex', help=_(
+            "Rebuild the index from scratch"
+        ))
+        p.add_argument(
+            '--threads', '-t', type=int,
+            default=paperwork_backend.index.whoosh.DEFAULT_REBUILD_THREADS,
+            help=_("Number of threads extracting the documents content")
+        )
+        p.add_argument(
+            '--procs', '-p', type=int,
+            default=paperwork_backend.index.whoosh.DEFAULT_REBUILD_PROCS,
+            help=_("Number of processes indexing the documents")
+        )
+        p.add_argument(
+            '--limitmb', '-m', type=int,
+            default=paperwork_backend.index.whoosh.DEFAULT_REBUILD_LIMITMB,
+            help=_("Maximum memory used by each indexing process (MB)")
+        )
+
+    def cmd_run(self, args):
+        if args.command != 'reindex':
+            return None
+
+        if self.interactive:
+            print(_("Rebuilding the index ..."))
+
+        stats = {}
+
+        promises = []
+        self.core.call_all(
+            "index_rebuild", promises, nb_threads=args.threads,
+            procs=args.procs, limitmb=args.limitmb
+        )
+        promise = promises[0]
+        promise = promise.then(stats.update)
+        self.core.call_one("transaction_schedule", promise)
+        self.core.call_all("mainloop_quit_graceful")
+        self.core.call_one("mainloop")
+
+        if self.interactive and len(stats) > 0:
+            print(
+                _(
+                    "{} documents indexed in {:.1f}s ({:.1f} documents/s)"
+                ).format(
+                    stats['nb_docs'], stats['elapsed'],
+                    stats['docs_per_second']
+                )
+            )
+            print(_("All done !"))
+        return stats
@@ -23,6 +23,9 @@ from .. import _
 
 LOGGER = logging.getLogger(__name__)
 
+# Number of results requested to the index at once
+DEFAULT_PAGE_LEN = 20
+
 
 class Plugin(openpaperwork_core.PluginBase):
     def __init__(self):
@@ -66,6 +69,11 @@ class Plugin(openpaperwork_core.PluginBase):
             '--limit', '-l', type=int, default=50,
             help=_("Maximum number of results (default: 50)")
         )
+        p.add_argument(
+            '--sort', '-s', choices=['relevance', 'date'],
+            default='relevance',
+            help=_("Order of the results (default: relevance)")
+        )
         p.add_argument(
             'keywords', nargs='*', default=[],
             help=_("Search keywords (none means all documents)")
@@ -77,10 +85,6 @@ class Plugin(openpaperwork_core.PluginBase):
 
         keywords = " ".join(args.keywords)
 
-        docs = []
-        self.core.call_all("index_search", docs, keywords, args.limit)
-        docs.sort(reverse=True)
-
         if self.interactive:
             renderers = []
             self.core.call_all("doc_renderer_get", renderers)
@@ -88,27 +92,42 @@ class Plugin(openpaperwork_core.PluginBase):
         else:
             renderer = None
 
-        if self.interactive:
-            for (doc_id, doc_url) in docs:
-                header = _("Document id: %s") % doc_id
-                self.core.call_all("print", header + "\n")
-
-                doc_date = self.core.call_success("doc_get_date_by_id", doc_id)
-                doc_date = self.core.call_success("i18n_date_short", doc_date)
-                header = _("Document date: %s") % doc_date
-                self.core.call_all("print", header + "\n")
-
-                if renderer is None:
-                    continue
-                if doc_url is None:
-                    LOGGER.warning("Failed to get URL of document %s", doc_id)
-                    continue
-                lines = renderer.get_preview_output(
-                    doc_id, doc_url, shutil.get_terminal_size()
-                )
-                for line in lines:
-                    self.core.call_all("print", line + "\n")
-                self.core.call_all("print", "\n")
-            self.core.call_all("print_flush")
-
-        return [doc[0] for doc in docs]
+        # results are displayed page by page, as they come
+        out = []
+        cursor = None
+        while len(out) < args.limit:
+            (hits, cursor) = self.core.call_success(
+                "index_search_page", keywords, cursor=cursor,
+                page_len=min(args.limit, DEFAULT_PAGE_LEN), sort=args.sort
+            )
+            hits = hits[:args.limit - len(out)]
+            out += [hit[0] for hit in hits]
+            if self.interactive:
+                self._print_hits(renderer, hits)
+            if cursor is None:
+                break
+
+        return out
+
+    def _print_hits(self, renderer, hits):
+        for (doc_id, doc_url, score) in hits:
+            header = _("Document id: %s") % doc_id
+            self.core.call_all("print", header + "\n")
+
+            doc_date = self.core.call_success("doc_get_date_by_id", doc_id)
+            doc_date = self.core.call_success("i18n_date_short", doc_date)
+            header = _("Document date: %s") % doc_date
+            self.core.call_all("print", header + "\n")
+
+            if renderer is None:
+                continue
+            if doc_url is None:
+                LOGGER.warning("Failed to get URL of document %s", doc_id)
+                continue
+            lines = renderer.get_preview_output(
+                doc_id, doc_url, shutil.get_terminal_size()
+            )
+            for line in lines:
+                self.core.call_all("print", line + "\n")
+            self.core.call_all("print", "\n")
+        self.core.call_all("print_flush")
@@ -53,9 +53,16 @@ class Plugin(openpaperwork_core.PluginBase):
         self.interactive = interactive
 
     def cmd_complete_argparse(self, parser):
-        parser.add_parser('sync', help=_(
+        p = parser.add_parser('sync', help=_(
             "Synchronize the index(es) with the content of the work directory"
         ))
+        p.add_argument(
+            '--full', '-f', action='store_true', default=False,
+            help=_(
+                "Examine all the documents, including the ones that look"
+                " unchanged"
+            )
+        )
 
     def on_sync(self, name, status, key):
         self.changes[name][status].append(key)
@@ -72,7 +79,7 @@ class Plugin(openpaperwork_core.PluginBase):
             lambda: collections.defaultdict(list)
         )
 
-        self.core.call_all("transaction_sync_all")
+        self.core.call_all("transaction_sync_all", full=args.full)
         self.core.call_all("mainloop_quit_graceful")
         self.core.call_one("mainloop")
         if self.interactive:
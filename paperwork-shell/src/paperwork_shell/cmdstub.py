@@ -0,0 +1,205 @@
+"""
+Command plugins loaded on demand (see `openpaperwork_core.manifest`).
+
+The command line arguments of each command plugin are recorded in the plugin
+manifest. On the following runs, a stub adds them to the command line parser
+instead of the plugin: the plugin is only imported and initialized if its
+command is the one requested.
+"""
+
+import argparse
+import logging
+import os
+
+import openpaperwork_core
+
+
+LOGGER = logging.getLogger(__name__)
+
+# argument types that can be recorded in the manifest
+TYPES = {t.__name__: t for t in (int, float, str)}
+
+
+class NotRecordableException(Exception):
+    pass
+
+
+def _get_manifest_key():
+    # help strings are translated: they are recorded for each language
+    # (same environment variables as gettext)
+    for env_var in ('LANGUAGE', 'LC_ALL', 'LC_MESSAGES', 'LANG'):
+        lang = os.getenv(env_var)
+        if lang:
+            return "argparse_" + lang
+    return "argparse"
+
+
+def _check_value(value):
+    if isinstance(value, (list, tuple)):
+        for v in value:
+            _check_value(v)
+        return
+    if value is not None and not isinstance(value, (bool, int, float, str)):
+        raise NotRecordableException(value)
+
+
+def _kwargs_to_json(kwargs):
+    out = {}
+    for (k, v) in kwargs.items():
+        if k == 'type':
+            if TYPES.get(getattr(v, '__name__', None)) is not v:
+                raise NotRecordableException(v)
+            v = v.__name__
+        else:
+            _check_value(v)
+        out[k] = v
+    return out
+
+
+def _kwargs_from_json(kwargs):
+    kwargs = dict(kwargs)
+    if 'type' in kwargs:
+        kwargs['type'] = TYPES[kwargs['type']]
+    return kwargs
+
+
+class ParserRecorder(object):
+    """
+    Wraps an argparse parser and records the calls made to it.
+    """
+    def __init__(self, parser, calls):
+        self.parser = parser
+        self.calls = calls
+
+    def add_argument(self, *args, **kwargs):
+        self.calls.append(
+            ['add_argument', list(args), _kwargs_to_json(kwargs)]
+        )
+        return self.parser.add_argument(*args, **kwargs)
+
+    def add_subparsers(self, **kwargs):
+        calls = []
+        self.calls.append(
+            ['add_subparsers', [], _kwargs_to_json(kwargs), calls]
+        )
+        return SubParsersRecorder(self.parser.add_subparsers(**kwargs), calls)
+
+    def __getattr__(self, name):
+        # argument groups, defaults, etc
+        raise NotRecordableException(name)
+
+
+class SubParsersRecorder(object):
+    """
+    Wraps the object returned by `ArgumentParser.add_subparsers()` and
+    records the calls made to it.
+    """
+    def __init__(self, subparsers, calls):
+        self.subparsers = subparsers
+        self.calls = calls
+
+    def add_parser(self, name, **kwargs):
+        calls = []
+        self.calls.append(
+            ['add_parser', [name], _kwargs_to_json(kwargs), calls]
+        )
+        return ParserRecorder(
+            self.subparsers.add_parser(name, **kwargs), calls
+        )
+
+    def __getattr__(self, name):
+        raise NotRecordableException(name)
+
+
+def record(plugin):
+    """
+    Returns the calls made by the plugin to build its command line parser,
+    or None if they can't be recorded.
+    """
+    calls = []
+    subparsers = argparse.ArgumentParser().add_subparsers()
+    try:
+        plugin.cmd_complete_argparse(SubParsersRecorder(subparsers, calls))
+    except NotRecordableException as exc:
+        LOGGER.info(
+            "Command line arguments of %s can't be recorded (%s)",
+            type(plugin), exc
+        )
+        return None
+    return calls
+
+
+def replay(calls, target):
+    for call in calls:
+        (method, args, kwargs) = call[:3]
+        r = getattr(target, method)(*args, **_kwargs_from_json(kwargs))
+        if len(call) > 3:
+            replay(call[3], r)
+
+
+class CommandStub(openpaperwork_core.PluginBase):
+    """
+    Stands for a command plugin that is not loaded yet. Loads it only if its
+    command is requested.
+    """
+    def __init__(self, core, module_name, calls):
+        super().__init__()
+        self.core = core
+        self.module_name = module_name
+        self.calls = calls
+        self.commands = set()
+        for call in calls:
+            if call[0] != 'add_parser':
+                continue
+            self.commands.add(call[1][0])
+            self.commands.update(call[2].get('aliases', []))
+        self.interactive = None
+
+    def cmd_complete_argparse(self, parser):
+        replay(self.calls, parser)
+
+    def cmd_set_interactive(self, interactive):
+        self.interactive = interactive
+
+    def cmd_run(self, args):
+        if args.command not in self.commands:
+            return None
+        plugin = self.core.get_by_name(self.module_name)
+        if (self.interactive is not None
+                and hasattr(plugin, 'cmd_set_interactive')):
+            plugin.cmd_set_interactive(self.interactive)
+        return plugin.cmd_run(args)
+
+
+def complete_argparse(core, manifest, parser):
+    """
+    Same as `core.call_all("cmd_complete_argparse", parser)`, but command
+    plugins not loaded yet are replaced by stubs when their arguments are
+    known.
+    """
+    key = _get_manifest_key()
+
+    for (module_name, entry) in sorted(core.get_lazy_plugins().items()):
+        if 'cmd_complete_argparse' not in entry['callbacks']:
+            continue
+        calls = manifest.get_data(module_name, key)
+        if calls is None:
+            # arguments unknown yet: the plugin has to be loaded once to
+            # record them (see below)
+            core.get_by_name(module_name)
+            continue
+        core.add_lazy_stub(module_name, CommandStub(core, module_name, calls))
+
+    for (module_name, plugin) in core.get_plugins().items():
+        entry = manifest.get(module_name)
+        if entry is None or not entry['lazy']:
+            continue
+        if not hasattr(plugin, 'cmd_complete_argparse'):
+            continue
+        if manifest.get_data(module_name, key) is not None:
+            continue
+        calls = record(plugin)
+        if calls is not None:
+            manifest.set_data(module_name, key, calls)
+
+    core.call_all("cmd_complete_argparse", parser)
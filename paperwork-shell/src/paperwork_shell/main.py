@@ -1,9 +1,11 @@
 import argparse
 import json
+import os
 import sys
 import traceback
 
 import openpaperwork_core
+import openpaperwork_core.manifest
 
 import paperwork_backend
 
@@ -11,6 +13,7 @@ import paperwork_backend
 # this import must be non-relative due to cx_freeze running this .py
 # as an independant Python script
 from paperwork_shell import _
+from paperwork_shell import cmdstub
 
 
 DEFAULT_SHELL_PLUGINS = paperwork_backend.DEFAULT_PLUGINS + [
@@ -24,6 +27,7 @@ DEFAULT_SHELL_PLUGINS = paperwork_backend.DEFAULT_PLUGINS + [
     'paperwork_shell.cmd.label',
     'paperwork_shell.cmd.move',
     'paperwork_shell.cmd.ocr',
+    'paperwork_shell.cmd.reindex',
     'paperwork_shell.cmd.rename',
     'paperwork_shell.cmd.reset',
     'paperwork_shell.cmd.scan',
@@ -45,6 +49,27 @@ DEFAULT_CLI_PLUGINS = DEFAULT_SHELL_PLUGINS + [
 ]
 DEFAULT_JSON_PLUGINS = DEFAULT_SHELL_PLUGINS
 
+# Set PAPERWORK_LAZY_PLUGINS=0 to load and initialize all the plugins
+# at startup, even those that the command doesn't need.
+LAZY_PLUGINS = os.getenv("PAPERWORK_LAZY_PLUGINS", "1") != "0"
+
+
+def enable_lazy_loading(core):
+    """
+    Plugins that don't need to be initialized at startup are only loaded
+    when the command actually uses them. What each plugin provides is
+    cached in a manifest in the data directory.
+    """
+    data_dir = core.call_success("paths_get_data_dir")
+    manifest_path = core.call_success(
+        "fs_unsafe", core.call_success(
+            "fs_join", data_dir, "plugins_manifest.json"
+        )
+    )
+    manifest = openpaperwork_core.manifest.PluginManifest(manifest_path)
+    core.enable_lazy_loading(manifest)
+    return manifest
+
 
 def main_main(in_args, application_name, default_plugins, interactive):
     # To load the plugins, we need first to load the configuration plugin
@@ -60,6 +85,10 @@ def main_main(in_args, application_name, default_plugins, interactive):
     core.init()
     core.call_all("init_logs", application_name, "warning")
 
+    manifest = None
+    if LAZY_PLUGINS:
+        manifest = enable_lazy_loading(core)
+
     core.call_all("config_load")
     core.call_all("config_load_plugins", application_name, default_plugins)
 
@@ -68,7 +97,12 @@ def main_main(in_args, application_name, default_plugins, interactive):
         help=_('command'), dest='command', required=True
     )
 
-    core.call_all("cmd_complete_argparse", cmd_parser)
+    if manifest is not None:
+        # only the plugin of the requested command will be loaded
+        cmdstub.complete_argparse(core, manifest, cmd_parser)
+        manifest.save()
+    else:
+        core.call_all("cmd_complete_argparse", cmd_parser)
     args = parser.parse_args(in_args)
 
     core.call_all("cmd_set_interactive", interactive)
@@ -0,0 +1,98 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import openpaperwork_core
+import openpaperwork_core.manifest
+
+import paperwork_shell.cmdstub
+
+
+MODULE_NAME = "cmdstub_test_cmd"
+MODULE = """
+import openpaperwork_core
+
+
+class Plugin(openpaperwork_core.PluginBase):
+    def __init__(self):
+        super().__init__()
+        self.interactive = False
+
+    def cmd_set_interactive(self, interactive):
+        self.interactive = interactive
+
+    def cmd_complete_argparse(self, parser):
+        p = parser.add_parser('test_cmd', help="Test command")
+        p.add_argument('--count', '-c', type=int, default=1)
+        subparser = p.add_subparsers(dest='sub_command', required=True)
+        p = subparser.add_parser('run')
+        p.add_argument('names', nargs='*', default=[])
+
+    def cmd_run(self, args):
+        if args.command != 'test_cmd':
+            return None
+        return (self.interactive, args.sub_command, args.count, args.names)
+"""
+
+
+class TestCmdStub(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="paperwork_shell_tests")
+        path = os.path.join(self.tmp_dir, MODULE_NAME + ".py")
+        with open(path, "w") as fd:
+            fd.write(MODULE)
+        sys.path.insert(0, self.tmp_dir)
+        self.manifest_path = os.path.join(self.tmp_dir, "manifest.json")
+
+    def tearDown(self):
+        sys.path.remove(self.tmp_dir)
+        sys.modules.pop(MODULE_NAME, None)
+        shutil.rmtree(self.tmp_dir)
+
+    def _parse(self, in_args):
+        manifest = openpaperwork_core.manifest.PluginManifest(
+            self.manifest_path
+        )
+        core = openpaperwork_core.Core()
+        core.enable_lazy_loading(manifest)
+        core.load(MODULE_NAME)
+        core.init()
+
+        parser = argparse.ArgumentParser()
+        cmd_parser = parser.add_subparsers(dest='command', required=True)
+        paperwork_shell.cmdstub.complete_argparse(core, manifest, cmd_parser)
+        manifest.save()
+        return (core, parser.parse_args(in_args))
+
+    def test_stub(self):
+        # first run: the plugin is loaded and its arguments recorded
+        (core, args) = self._parse(['test_cmd', '-c', '2', 'run', 'a', 'b'])
+        core.call_all("cmd_set_interactive", True)
+        self.assertEqual(
+            core.call_success("cmd_run", args), (True, 'run', 2, ['a', 'b'])
+        )
+        sys.modules.pop(MODULE_NAME)
+
+        # following runs: the plugin is loaded only if its command is run
+        (core, args) = self._parse(['test_cmd', 'run'])
+        self.assertNotIn(MODULE_NAME, sys.modules)
+        core.call_all("cmd_set_interactive", True)
+        self.assertIsNone(
+            core.call_success("cmd_run", argparse.Namespace(command='other'))
+        )
+        self.assertNotIn(MODULE_NAME, sys.modules)
+        self.assertEqual(
+            core.call_success("cmd_run", args), (True, 'run', 1, [])
+        )
+        self.assertIn(MODULE_NAME, sys.modules)
+
+    def test_not_recordable(self):
+        class Plugin(object):
+            def cmd_complete_argparse(self, parser):
+                p = parser.add_parser('test_cmd')
+                p.add_argument('--path', type=os.path.abspath)
+
+        self.assertIsNone(paperwork_shell.cmdstub.record(Plugin()))